@@ -14,10 +14,15 @@ import warnings
 import numpy as np
 
 from .sortinganalyzer import AnalyzerExtension, register_result_extension
-from .waveform_tools import extract_waveforms_to_single_buffer, estimate_templates_with_accumulator
+from .waveform_tools import (
+    extract_waveforms_to_single_buffer,
+    estimate_templates_with_accumulator,
+    compress_waveforms_by_unit,
+    decompress_waveforms_one_unit,
+)
 from .recording_tools import get_noise_levels
 from .template import Templates
-from .sorting_tools import random_spikes_selection
+from .sorting_tools import random_spikes_selection, unit_indices_to_csr_index
 
 
 class ComputeRandomSpikes(AnalyzerExtension):
@@ -45,6 +50,13 @@ class ComputeRandomSpikes(AnalyzerExtension):
     -------
     random_spike_indices: np.array
         The indices of the selected spikes
+
+    Notes
+    -----
+    A per unit index (CSR like: "random_spikes_unit_order" + "random_spikes_unit_offsets") is also stored, so that
+    the rows of one unit in the random spikes vector (and so in per random spike extensions like "waveforms" or
+    "principal_components") are retrieved with a slice instead of a mask over all spikes.
+    See `get_unit_spike_rows()`.
     """
 
     extension_name = "random_spikes"
@@ -60,6 +72,14 @@ class ComputeRandomSpikes(AnalyzerExtension):
             num_samples=self.sorting_analyzer.rec_attributes["num_samples"],
             **self.params,
         )
+        spikes = self.sorting_analyzer.sorting.to_spike_vector()
+        some_unit_indices = spikes["unit_index"][self.data["random_spikes_indices"]]
+        self.data.update(self._make_unit_index(some_unit_indices, self.sorting_analyzer.get_num_units()))
+
+    @staticmethod
+    def _make_unit_index(some_unit_indices, num_units):
+        order, offsets = unit_indices_to_csr_index(some_unit_indices, num_units)
+        return dict(random_spikes_unit_order=order, random_spikes_unit_offsets=offsets)
 
     def _set_params(self, method="uniform", max_spikes_per_unit=500, margin_size=None, seed=None):
         params = dict(method=method, max_spikes_per_unit=max_spikes_per_unit, margin_size=margin_size, seed=seed)
@@ -78,6 +98,11 @@ class ComputeRandomSpikes(AnalyzerExtension):
 
         new_data = dict()
         new_data["random_spikes_indices"] = np.flatnonzero(selected_mask[keep_spike_mask])
+
+        # unit indices are re-numbered in the new sorting
+        some_unit_indices = spikes["unit_index"][keep_spike_mask][new_data["random_spikes_indices"]]
+        some_unit_indices = np.searchsorted(keep_unit_indices, some_unit_indices)
+        new_data.update(self._make_unit_index(some_unit_indices, keep_unit_indices.size))
         return new_data
 
     def _merge_extension_data(
@@ -92,6 +117,10 @@ class ComputeRandomSpikes(AnalyzerExtension):
             selected_mask = np.zeros(spikes.size, dtype=bool)
             selected_mask[random_spikes_indices] = True
             new_data["random_spikes_indices"] = np.flatnonzero(selected_mask[keep_mask])
+
+        new_spikes = new_sorting_analyzer.sorting.to_spike_vector()
+        some_unit_indices = new_spikes["unit_index"][new_data["random_spikes_indices"]]
+        new_data.update(self._make_unit_index(some_unit_indices, new_sorting_analyzer.get_num_units()))
         return new_data
 
     def _get_data(self):
@@ -105,6 +134,35 @@ class ComputeRandomSpikes(AnalyzerExtension):
             self._some_spikes = spikes[self.data["random_spikes_indices"]]
         return self._some_spikes
 
+    def get_unit_spike_rows(self, unit_id=None, unit_index=None):
+        """
+        Return the positions of the spikes of one unit in the random spikes vector.
+
+        These positions are the rows of this unit in every extension computed on the random spikes
+        (for instance "waveforms" or "principal_components").
+
+        Parameters
+        ----------
+        unit_id : int | str | None, default: None
+            The unit id
+        unit_index : int | None, default: None
+            The unit index, can be given instead of unit_id
+
+        Returns
+        -------
+        rows : np.array
+            The sorted positions of the unit spikes in the random spikes vector
+        """
+        if unit_index is None:
+            unit_index = self.sorting_analyzer.sorting.id_to_index(unit_id)
+        if "random_spikes_unit_offsets" not in self.data:
+            # analyzer computed before the per unit index existed : build it in memory
+            some_spikes = self.get_random_spikes()
+            self.data.update(self._make_unit_index(some_spikes["unit_index"], self.sorting_analyzer.get_num_units()))
+        order = self.data["random_spikes_unit_order"]
+        offsets = self.data["random_spikes_unit_offsets"]
+        return order[offsets[unit_index] : offsets[unit_index + 1]]
+
     def get_selected_indices_in_spike_train(self, unit_id, segment_index):
         # useful for WaveformExtractor backwards compatibility
         # In Waveforms extractor "selected_spikes" was a dict (key: unit_id) of list (segment_index) of indices of spikes in spiketrain
@@ -141,6 +199,19 @@ class ComputeWaveforms(AnalyzerExtension):
         The number of ms to extract after the spike events
     dtype : None | dtype, default: None
         The dtype of the waveforms. If None, the dtype of the recording is used.
+    storage : "raw" | "compressed", default: "raw"
+        How waveforms are stored.
+          * "raw" : one single buffer (memmap "waveforms.npy" for the "binary_folder" format)
+          * "compressed" : waveforms are quantized to int16 and compressed unit by unit with a lossless
+            compressor, so that `get_waveforms_one_unit()` only decodes the chunk of the requested unit.
+            Note that the waveforms are first extracted uncompressed in a single buffer (a temporary
+            "waveforms_uncompressed.npy" file for the "binary_folder" format, shared memory otherwise) which is
+            removed after the compression: the peak footprint is the one of "raw" plus the compressed buffer.
+    scale_mode : "spike" | "unit", default: "spike"
+        For storage="compressed", the int16 quantization scale is estimated for each spike or for each unit.
+        Ignored when the waveforms dtype is int8, uint8, int16 or uint16 which are stored without loss.
+    compressor : numcodecs.abc.Codec | None, default: None
+        For storage="compressed", the lossless compressor. If None, Blosc with zstd is used.
 
     Returns
     -------
@@ -153,6 +224,7 @@ class ComputeWaveforms(AnalyzerExtension):
     need_recording = True
     use_nodepipeline = False
     need_job_kwargs = True
+    per_spike_data = dict(waveforms="random_spikes")
 
     @property
     def nbefore(self):
@@ -162,6 +234,15 @@ class ComputeWaveforms(AnalyzerExtension):
     def nafter(self):
         return int(self.params["ms_after"] * self.sorting_analyzer.sampling_frequency / 1000.0)
 
+    @property
+    def is_compressed(self):
+        return self.params.get("storage", "raw") == "compressed"
+
+    def _get_compressor(self):
+        import numcodecs
+
+        return numcodecs.get_codec(self.params["compressor"])
+
     def _run(self, verbose=False, **job_kwargs):
         self.data.clear()
 
@@ -174,13 +255,18 @@ class ComputeWaveforms(AnalyzerExtension):
 
         if self.format == "binary_folder":
             # in that case waveforms are extacted directly in files
-            file_path = self._get_binary_extension_folder() / "waveforms.npy"
+            # when compressed, this file is only temporary
+            if self.is_compressed:
+                file_path = self._get_binary_extension_folder() / "waveforms_uncompressed.npy"
+            else:
+                file_path = self._get_binary_extension_folder() / "waveforms.npy"
             mode = "memmap"
             copy = False
         else:
             file_path = None
             mode = "shared_memory"
-            copy = True
+            # when compressed, the shared memory is compressed directly and not copied
+            copy = not self.is_compressed
 
         if self.sparsity is None:
             sparsity_mask = None
@@ -204,13 +290,71 @@ class ComputeWaveforms(AnalyzerExtension):
             **job_kwargs,
         )
 
-        self.data["waveforms"] = all_waveforms
+        if self.is_compressed:
+            if mode == "shared_memory":
+                all_waveforms, wf_array_info = all_waveforms
+            self.data.update(self._compress(all_waveforms, some_spikes, unit_ids.size, sparsity_mask))
+            # release the memmap or the shared memory before removing the temporary buffer
+            del all_waveforms
+            if file_path is not None:
+                file_path.unlink()
+            elif wf_array_info["shm"] is not None:
+                wf_array_info["shm"].close()
+                wf_array_info["shm"].unlink()
+        else:
+            self.data["waveforms"] = all_waveforms
+
+    def _run_from_dense_waveforms(self, dense_waveforms, nbefore, file_path=None, dense_rows=None):
+        """
+        Set the data from dense waveforms already extracted for the random spikes, with a window starting
+        `nbefore` samples before the spike (larger or equal to the extension window).
+        `dense_rows` optionally gives the row of each random spike in `dense_waveforms`.
+        This is used by `create_sorting_analyzer(..., bootstrap=...)` to avoid another read of the recording.
+        """
+        self.data.clear()
+
+        random_spikes_ext = self.sorting_analyzer.get_extension("random_spikes")
+        some_spikes = random_spikes_ext.get_random_spikes()
+        num_units = self.sorting_analyzer.get_num_units()
+        sample_slice = slice(nbefore - self.nbefore, nbefore + self.nafter)
+
+        if self.sparsity is None:
+            sparsity_mask = None
+        else:
+            sparsity_mask = self.sparsity.mask
+
+        shape = (some_spikes.size, self.nbefore + self.nafter, self._get_num_stored_channels())
+        dtype = np.dtype(self.params["dtype"])
+        if file_path is None:
+            all_waveforms = np.zeros(shape, dtype=dtype)
+        else:
+            all_waveforms = np.lib.format.open_memmap(file_path, mode="w+", dtype=dtype, shape=shape)
+
+        for unit_index in range(num_units):
+            rows = random_spikes_ext.get_unit_spike_rows(unit_index=unit_index)
+            if dense_rows is None:
+                wfs = dense_waveforms[rows, sample_slice, :]
+            else:
+                wfs = dense_waveforms[dense_rows[rows], sample_slice, :]
+            if sparsity_mask is None:
+                all_waveforms[rows, :, :] = wfs
+            else:
+                channel_indices = np.flatnonzero(sparsity_mask[unit_index, :])
+                all_waveforms[rows, :, : channel_indices.size] = wfs[:, :, channel_indices]
+
+        if self.is_compressed:
+            self.data.update(self._compress(all_waveforms, some_spikes, num_units, sparsity_mask))
+        else:
+            self.data["waveforms"] = all_waveforms
 
     def _set_params(
         self,
         ms_before: float = 1.0,
         ms_after: float = 2.0,
         dtype=None,
+        storage="raw",
+        scale_mode="spike",
+        compressor=None,
     ):
         recording = self.sorting_analyzer.recording
         if dtype is None:
@@ -221,13 +365,79 @@ class ComputeWaveforms(AnalyzerExtension):
 
         dtype = np.dtype(dtype)
 
+        assert storage in ("raw", "compressed"), "storage must be 'raw' or 'compressed'"
+        assert scale_mode in ("spike", "unit"), "scale_mode must be 'spike' or 'unit'"
+
+        if storage == "compressed":
+            if compressor is None:
+                from .zarrextractors import get_default_zarr_compressor
+
+                compressor = get_default_zarr_compressor()
+            compressor = compressor.get_config()
+        else:
+            compressor = None
+
         params = dict(
             ms_before=float(ms_before),
             ms_after=float(ms_after),
             dtype=dtype.str,
+            storage=storage,
+            scale_mode=scale_mode,
+            compressor=compressor,
         )
         return params
 
+    def _compress(self, all_waveforms, some_spikes, num_units, sparsity_mask):
+        buffer, chunk_offsets, scales = compress_waveforms_by_unit(
+            all_waveforms,
+            some_spikes,
+            num_units,
+            sparsity_mask=sparsity_mask,
+            scale_mode=self.params["scale_mode"],
+            compressor=self._get_compressor(),
+        )
+        return dict(waveforms_buffer=buffer, waveforms_chunk_offsets=chunk_offsets, waveforms_scales=scales)
+
+    def _get_num_stored_channels(self, unit_index=None):
+        sparsity = self.sorting_analyzer.sparsity
+        if sparsity is None:
+            return self.sorting_analyzer.get_num_channels()
+        elif unit_index is None:
+            # width of the single buffer
+            return int(np.max(np.sum(sparsity.mask, axis=1)))
+        else:
+            return int(np.sum(sparsity.mask[unit_index, :]))
+
+    def _decompress_one_unit(self, unit_index, rows):
+        if self.params["scale_mode"] == "spike":
+            scales = self.data["waveforms_scales"][rows]
+        else:
+            scales = self.data["waveforms_scales"][unit_index]
+        return decompress_waveforms_one_unit(
+            self.data["waveforms_buffer"],
+            self.data["waveforms_chunk_offsets"],
+            unit_index,
+            rows.size,
+            self.nbefore + self.nafter,
+            self._get_num_stored_channels(unit_index),
+            scales,
+            self._get_compressor(),
+            self.params["dtype"],
+        )
+
+    def _decompress_all(self):
+        random_spikes_ext = self.sorting_analyzer.get_extension("random_spikes")
+        num_spikes = random_spikes_ext.data["random_spikes_indices"].size
+        num_channels = self._get_num_stored_channels()
+        waveforms = np.zeros(
+            (num_spikes, self.nbefore + self.nafter, num_channels), dtype=np.dtype(self.params["dtype"])
+        )
+        for unit_index in range(self.sorting_analyzer.get_num_units()):
+            rows = random_spikes_ext.get_unit_spike_rows(unit_index=unit_index)
+            wfs = self._decompress_one_unit(unit_index, rows)
+            waveforms[rows, :, : wfs.shape[2]] = wfs
+        return waveforms
+
     def _select_extension_data(self, unit_ids):
         # random_spikes_indices = self.sorting_analyzer.get_extension("random_spikes").get_data()
         some_spikes = self.sorting_analyzer.get_extension("random_spikes").get_random_spikes()
@@ -238,7 +448,22 @@ class ComputeWaveforms(AnalyzerExtension):
         keep_spike_mask = np.isin(some_spikes["unit_index"], keep_unit_indices)
 
         new_data = dict()
-        new_data["waveforms"] = self.data["waveforms"][keep_spike_mask, :, :]
+        if self.is_compressed:
+            # unit chunks are independent so they are copied without decoding
+            buffer = self.data["waveforms_buffer"]
+            chunk_offsets = self.data["waveforms_chunk_offsets"]
+            chunk_sizes = np.diff(chunk_offsets)[keep_unit_indices]
+            new_data["waveforms_buffer"] = np.concatenate(
+                [buffer[chunk_offsets[i] : chunk_offsets[i + 1]] for i in keep_unit_indices]
+                + [np.zeros(0, dtype="uint8")]
+            )
+            new_data["waveforms_chunk_offsets"] = np.concatenate([[0], np.cumsum(chunk_sizes)]).astype("int64")
+            if self.params["scale_mode"] == "spike":
+                new_data["waveforms_scales"] = self.data["waveforms_scales"][keep_spike_mask]
+            else:
+                new_data["waveforms_scales"] = self.data["waveforms_scales"][keep_unit_indices]
+        else:
+            new_data["waveforms"] = self.data["waveforms"][keep_spike_mask, :, :]
 
         return new_data
 
@@ -247,7 +472,7 @@ class ComputeWaveforms(AnalyzerExtension):
     ):
         new_data = dict()
 
-        waveforms = self.data["waveforms"]
+        waveforms = self._get_data()
         some_spikes = self.sorting_analyzer.get_extension("random_spikes").get_random_spikes()
         if keep_mask is not None:
             spike_indices = self.sorting_analyzer.get_extension("random_spikes").get_data()
@@ -275,6 +500,14 @@ class ComputeWaveforms(AnalyzerExtension):
             if new_num_chans < old_num_chans:
                 waveforms = waveforms[:, :, :new_num_chans]
 
+        if self.is_compressed:
+            new_some_spikes = new_sorting_analyzer.get_extension("random_spikes").get_random_spikes()
+            if new_sorting_analyzer.sparsity is not None:
+                new_sparsity_mask = new_sorting_analyzer.sparsity.mask
+            else:
+                new_sparsity_mask = None
+            return self._compress(waveforms, new_some_spikes, new_sorting_analyzer.get_num_units(), new_sparsity_mask)
+
         return dict(waveforms=waveforms)
 
     def get_waveforms_one_unit(self, unit_id, force_dense: bool = False):
@@ -297,11 +530,11 @@ class ComputeWaveforms(AnalyzerExtension):
         sorting = self.sorting_analyzer.sorting
         unit_index = sorting.id_to_index(unit_id)
 
-        waveforms = self.data["waveforms"]
-        some_spikes = self.sorting_analyzer.get_extension("random_spikes").get_random_spikes()
-
-        spike_mask = some_spikes["unit_index"] == unit_index
-        wfs = waveforms[spike_mask, :, :]
+        rows = self.sorting_analyzer.get_extension("random_spikes").get_unit_spike_rows(unit_index=unit_index)
+        if self.is_compressed:
+            wfs = self._decompress_one_unit(unit_index, rows)
+        else:
+            wfs = self.data["waveforms"][rows, :, :]
 
         if self.sorting_analyzer.sparsity is not None:
             chan_inds = self.sorting_analyzer.sparsity.unit_id_to_channel_indices[unit_id]
@@ -315,6 +548,8 @@ class ComputeWaveforms(AnalyzerExtension):
         return wfs
 
     def _get_data(self):
+        if self.is_compressed:
+            return self._decompress_all()
         return self.data["waveforms"]
 
 
@@ -457,9 +692,8 @@ class ComputeTemplates(AnalyzerExtension):
         unit_ids = self.sorting_analyzer.unit_ids
         channel_ids = self.sorting_analyzer.channel_ids
         waveforms_extension = self.sorting_analyzer.get_extension("waveforms")
-        waveforms = waveforms_extension.data["waveforms"]
 
-        num_samples = waveforms.shape[1]
+        num_samples = waveforms_extension.nbefore + waveforms_extension.nafter
 
         for operator in operators:
             if isinstance(operator, str) and operator in ("average", "std", "median"):
@@ -478,10 +712,8 @@ class ComputeTemplates(AnalyzerExtension):
         assert self.sorting_analyzer.has_extension(
             "random_spikes"
         ), "compute 'templates' requires the random_spikes extension. You can run sorting_analyzer.compute('random_spikes')"
-        some_spikes = self.sorting_analyzer.get_extension("random_spikes").get_random_spikes()
         for unit_index, unit_id in enumerate(unit_ids):
-            spike_mask = some_spikes["unit_index"] == unit_index
-            wfs = waveforms[spike_mask, :, :]
+            wfs = waveforms_extension.get_waveforms_one_unit(unit_id, force_dense=False)
             if wfs.shape[0] == 0:
                 continue
 
@@ -10,6 +10,7 @@ import warnings
 from spikeinterface.core.core_tools import convert_string_to_bytes, convert_bytes_to_str, convert_seconds_to_str
 
 import sys
+from contextlib import contextmanager
 from tqdm.auto import tqdm
 
 from concurrent.futures import ProcessPoolExecutor
@@ -185,6 +186,28 @@ def ensure_n_jobs(recording, n_jobs=1):
     return n_jobs
 
 
+@contextmanager
+def numba_threads_limit(n_jobs):
+    """
+    Context manager that sets the number of threads used by numba `parallel=True` functions
+    (`numba.prange` loops) and restores the previous value on exit.
+
+    Parameters
+    ----------
+    n_jobs : int
+        Number of threads, already normalized with `fix_job_kwargs()`.
+        It is clipped to the maximum number of threads numba was started with.
+    """
+    import numba
+
+    previous_num_threads = numba.get_num_threads()
+    numba.set_num_threads(max(1, min(int(n_jobs), numba.config.NUMBA_NUM_THREADS)))
+    try:
+        yield
+    finally:
+        numba.set_num_threads(previous_num_threads)
+
+
 def chunk_duration_to_chunk_size(chunk_duration, recording):
     if isinstance(chunk_duration, float):
         chunk_size = int(chunk_duration * recording.get_sampling_frequency())
@@ -526,8 +526,10 @@ def run_node_pipeline(
         The classical job_kwargs
     job_name : str
         The name of the pipeline used for the progress_bar
-    gather_mode : "memory" | "npz"
-
+    gather_mode : "memory" | "npz" | object
+        How outputs are gathered. An object with a `__call__(res)` and a `finalize_buffers(squeeze_output)`
+        method can also be given: it receives the outputs of every chunk and can reduce them on the fly
+        (for instance a motion histogram accumulator) instead of concatenating them.
     gather_kwargs : dict
         OPtions to control the "gather engine". See GatherToMemory or GatherToNpy.
     squeeze_output : bool, default True
@@ -567,6 +569,9 @@ def run_node_pipeline(
         gather_func = GatherToMemory()
     elif gather_mode == "npy":
         gather_func = GatherToNpy(folder, names, **gather_kwargs)
+    elif hasattr(gather_mode, "finalize_buffers"):
+        # custom gather engine
+        gather_func = gather_mode
     else:
         raise ValueError(f"wrong gather_mode : {gather_mode}")
 
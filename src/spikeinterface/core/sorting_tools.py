@@ -152,6 +152,35 @@ def get_numba_vector_to_list_of_spiketrain():
     return vector_to_list_of_spiketrain_numba
 
 
+def unit_indices_to_csr_index(unit_indices: np.array, num_units: int):
+    """
+    Build a CSR like per unit index on a vector of unit indices (for instance `spikes["unit_index"]`).
+
+    With this index the positions of one unit in the vector are a contiguous slice of `order`:
+    `order[offsets[unit_index]:offsets[unit_index + 1]]`, instead of a boolean mask over the full vector.
+    Positions are sorted so the slice keeps the original order of the vector.
+
+    Parameters
+    ----------
+    unit_indices: np.array
+        The unit index of every element
+    num_units: int
+        The number of units
+
+    Returns
+    -------
+    order: np.array
+        The positions in the vector sorted by unit (stable)
+    offsets: np.array
+        The offsets of every unit in `order` with size num_units + 1
+    """
+    unit_indices = np.asarray(unit_indices)
+    order = np.argsort(unit_indices, kind="stable").astype("int64")
+    offsets = np.zeros(num_units + 1, dtype="int64")
+    offsets[1:] = np.cumsum(np.bincount(unit_indices, minlength=num_units)[:num_units])
+    return order, offsets
+
+
 # TODO later : implement other method like "maximum_rate", "by_percent", ...
 def random_spikes_selection(
     sorting: BaseSorting,
@@ -5,10 +5,12 @@ from pathlib import Path
 from itertools import chain
 import os
 import json
+import platform
 import math
 import pickle
 import weakref
 import shutil
+import tempfile
 import warnings
 import importlib
 from copy import copy
@@ -27,12 +29,12 @@ from .basesorting import BaseSorting
 from .base import load_extractor
 from .recording_tools import check_probe_do_not_overlap, get_rec_attributes, do_recording_attributes_match
 from .core_tools import check_json, retrieve_importing_provenance, is_path_remote, clean_zarr_folder_name
-from .sorting_tools import generate_unit_ids_for_merge_group, _get_ids_after_merging
+from .sorting_tools import generate_unit_ids_for_merge_group, _get_ids_after_merging, unit_indices_to_csr_index
 from .job_tools import split_job_kwargs
 from .numpyextractors import NumpySorting
 from .sparsity import ChannelSparsity, estimate_sparsity
 from .sortingfolder import NumpyFolderSorting
-from .zarrextractors import get_default_zarr_compressor, ZarrSortingExtractor
+from .zarrextractors import get_default_zarr_compressor, get_zarr_store, ZarrSortingExtractor
 from .node_pipeline import run_node_pipeline
 
 
@@ -47,6 +49,7 @@ def create_sorting_analyzer(
     return_scaled=True,
     overwrite=False,
     backend_options=None,
+    bootstrap=True,
     **sparsity_kwargs,
 ) -> "SortingAnalyzer":
     """
@@ -87,6 +90,22 @@ def create_sorting_analyzer(
         - storage_options: dict | None (fsspec storage options)
         - saving_options: dict | None (additional saving options for creating and saving datasets,
                                        e.g. compression/filters for zarr)
+        - cache_options: dict | None (local disk cache for remote zarr with "cache_folder", "max_size" and
+                                      "version_ttl" keys, see `get_zarr_store()`)
+    bootstrap : bool | dict, default: True
+        Used only when the sparsity is estimated (sparse=True and sparsity=None).
+        If not False, the recording is read only once to estimate the sparsity and to compute
+        some extensions at the same time, instead of reading again the recording for each of them.
+        If True, the "random_spikes", "noise_levels" and "templates" extensions are computed with default parameters.
+        A dict (like for `SortingAnalyzer.compute()`) can be given with extension names as keys and parameters as
+        values, among "random_spikes", "noise_levels", "waveforms" and "templates".
+        The sparsity is the same as with `bootstrap=False`: it is estimated on the same spikes and in the same units
+        as `estimate_sparsity()`. The "noise_levels" extension is estimated on the same random slices as
+        `compute_noise_levels()` (only the "method" and "random_slices_kwargs" params are handled).
+        When the sparsity method ("snr" or "ptp") needs noise levels, the ones of the "noise_levels" extension are
+        used if it is computed, otherwise they are estimated as in `estimate_sparsity()` (with the "mad" method and a
+        fixed seed) unless `noise_levels` is given.
+        The temporary files are written next to `folder` (or in the system temporary folder for format="memory").
     sparsity_kwargs : keyword arguments
 
     Returns
@@ -133,36 +152,253 @@ def create_sorting_analyzer(
                 else:
                     shutil.rmtree(folder)
 
-    # handle sparsity
-    if sparsity is not None:
-        # some checks
-        assert isinstance(sparsity, ChannelSparsity), "'sparsity' must be a ChannelSparsity object"
-        assert np.array_equal(
-            sorting.unit_ids, sparsity.unit_ids
-        ), "create_sorting_analyzer(): if external sparsity is given unit_ids must correspond"
-        assert np.array_equal(
-            recording.channel_ids, sparsity.channel_ids
-        ), "create_sorting_analyzer(): if external sparsity is given unit_ids must correspond"
-    elif sparse:
-        sparsity = estimate_sparsity(sorting, recording, **sparsity_kwargs)
-    else:
-        sparsity = None
-
     if return_scaled and not recording.has_scaleable_traces() and recording.get_dtype().kind == "i":
         print("create_sorting_analyzer: recording does not have scaling to uV, forcing return_scaled=False")
         return_scaled = False
 
-    sorting_analyzer = SortingAnalyzer.create(
-        sorting,
+    # handle sparsity
+    bootstrap_data = None
+    tmp_folder = None
+    try:
+        if sparsity is not None:
+            # some checks
+            assert isinstance(sparsity, ChannelSparsity), "'sparsity' must be a ChannelSparsity object"
+            assert np.array_equal(
+                sorting.unit_ids, sparsity.unit_ids
+            ), "create_sorting_analyzer(): if external sparsity is given unit_ids must correspond"
+            assert np.array_equal(
+                recording.channel_ids, sparsity.channel_ids
+            ), "create_sorting_analyzer(): if external sparsity is given unit_ids must correspond"
+        elif sparse:
+            if bootstrap is not False and sparsity_kwargs.get("method", "radius") != "by_property":
+                # the temporary files are next to the analyzer folder (and not in the system temporary folder)
+                if format != "memory" and not is_path_remote(folder):
+                    tmp_parent = Path(folder).absolute().parent
+                    tmp_parent.mkdir(parents=True, exist_ok=True)
+                else:
+                    tmp_parent = None
+                tmp_folder = Path(tempfile.mkdtemp(prefix="si_bootstrap_", dir=tmp_parent))
+                sparsity, bootstrap_data = _bootstrap_sorting_analyzer_data(
+                    sorting, recording, bootstrap, return_scaled, tmp_folder, **sparsity_kwargs
+                )
+            else:
+                sparsity = estimate_sparsity(sorting, recording, **sparsity_kwargs)
+        else:
+            sparsity = None
+
+        sorting_analyzer = SortingAnalyzer.create(
+            sorting,
+            recording,
+            format=format,
+            folder=folder,
+            sparsity=sparsity,
+            return_scaled=return_scaled,
+            backend_options=backend_options,
+        )
+
+        if bootstrap_data is not None:
+            _add_bootstrap_extensions(sorting_analyzer, bootstrap_data, tmp_folder)
+    finally:
+        if tmp_folder is not None:
+            # release the memmap before removing the temporary folder
+            bootstrap_data = None
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+
+    return sorting_analyzer
+
+
+_bootstrap_extension_names = ("random_spikes", "noise_levels", "waveforms", "templates")
+
+
+def _bootstrap_sorting_analyzer_data(sorting, recording, bootstrap, return_scaled, tmp_folder, **sparsity_kwargs):
+    """
+    Estimate the sparsity and the data of some extensions with a single read of the recording.
+    See `create_sorting_analyzer(..., bootstrap=...)`.
+
+    Returns
+    -------
+    sparsity : ChannelSparsity
+        The estimated sparsity
+    bootstrap_data : dict
+        Extension params and data to be added to the SortingAnalyzer with `_add_bootstrap_extensions()`
+    """
+    from .sorting_tools import random_spikes_selection
+    from .sparsity import _sparsity_from_templates_array, _get_sparsity_spikes_indices
+    from .waveform_tools import estimate_templates_noise_levels_and_waveforms
+
+    if bootstrap is True:
+        bootstrap = dict(random_spikes=dict(), noise_levels=dict(), templates=dict())
+    assert isinstance(bootstrap, dict), "bootstrap must be a bool or a dict"
+    extensions = {extension_name: dict(params) for extension_name, params in bootstrap.items()}
+    for extension_name in extensions:
+        assert (
+            extension_name in _bootstrap_extension_names
+        ), f"bootstrap can only compute the extensions {_bootstrap_extension_names}, not {extension_name}"
+    # waveforms and templates rely on random_spikes
+    extensions["random_spikes"] = extensions.get("random_spikes", dict())
+
+    sparsity_params, job_kwargs = split_job_kwargs(sparsity_kwargs)
+    num_spikes_for_sparsity = sparsity_params.pop("num_spikes_for_sparsity", 100)
+    sparsity_ms_before = sparsity_params.pop("ms_before", 1.0)
+    sparsity_ms_after = sparsity_params.pop("ms_after", 2.5)
+    noise_levels = sparsity_params.pop("noise_levels", None)
+    method = sparsity_params.get("method", "radius")
+
+    # the traces are read with a window covering every needed window
+    windows_ms = [(sparsity_ms_before, sparsity_ms_after)]
+    if "waveforms" in extensions:
+        windows_ms.append((extensions["waveforms"].get("ms_before", 1.0), extensions["waveforms"].get("ms_after", 2.0)))
+    elif "templates" in extensions:
+        operators = extensions["templates"].get("operators", None) or ["average", "std"]
+        bad_operator_list = [operator for operator in operators if operator not in ("average", "std")]
+        if len(bad_operator_list) > 0:
+            raise ValueError(
+                f"Computing templates with operators {bad_operator_list} requires the 'waveforms' extension"
+            )
+        windows_ms.append((extensions["templates"].get("ms_before", 1.0), extensions["templates"].get("ms_after", 2.0)))
+    fs = recording.sampling_frequency
+    nbefore = max(int(ms_before * fs / 1000.0) for ms_before, _ in windows_ms)
+    nafter = max(int(ms_after * fs / 1000.0) for _, ms_after in windows_ms)
+    sparsity_nbefore = int(sparsity_ms_before * fs / 1000.0)
+    sparsity_nafter = int(sparsity_ms_after * fs / 1000.0)
+
+    num_samples = [recording.get_num_samples(seg_index) for seg_index in range(recording.get_num_segments())]
+    random_spikes_indices = random_spikes_selection(sorting, num_samples, **extensions["random_spikes"])
+    # the sparsity is estimated on the same spikes than estimate_sparsity()
+    sparsity_spikes_indices = _get_sparsity_spikes_indices(
+        sorting, recording, num_spikes_for_sparsity, sparsity_nbefore, sparsity_nafter
+    )
+    assert sparsity_spikes_indices.size > 0, "create_sorting_analyzer(): sparsity estimation needs a non empty sorting"
+
+    # the templates of the sparsity spikes are accumulated in the same read as "virtual" units
+    # with unit_index + num_units
+    num_units = sorting.unit_ids.size
+    all_spikes = sorting.to_spike_vector()
+    sparsity_spikes = all_spikes[sparsity_spikes_indices]
+    sparsity_spikes["unit_index"] += num_units
+    spikes = np.concatenate([all_spikes[random_spikes_indices], sparsity_spikes])
+    order = np.lexsort((spikes["sample_index"], spikes["segment_index"]))
+    spikes = spikes[order]
+    # rows of the random spikes in this spike vector
+    random_spikes_rows = np.empty(order.size, dtype="int64")
+    random_spikes_rows[order] = np.arange(order.size)
+    random_spikes_rows = random_spikes_rows[: random_spikes_indices.size]
+
+    if "noise_levels" in extensions:
+        noise_params = extensions["noise_levels"]
+        unsupported_params = [k for k in noise_params if k not in ("method", "random_slices_kwargs")]
+        assert len(unsupported_params) == 0, f"bootstrap does not handle the noise_levels params {unsupported_params}"
+        noise_kwargs = dict(
+            noise_levels_method=noise_params.get("method", "mad"),
+            noise_random_slices_kwargs=noise_params.get("random_slices_kwargs", dict()),
+        )
+    elif method in ("snr", "ptp") and noise_levels is None:
+        # same as estimate_sparsity()
+        noise_kwargs = dict(noise_levels_method="mad", noise_random_slices_kwargs=dict(seed=2205))
+    else:
+        noise_kwargs = dict(noise_levels_method=None)
+
+    if "waveforms" in extensions:
+        waveforms_file_path = tmp_folder / "dense_waveforms.npy"
+        return_std = False
+    else:
+        waveforms_file_path = None
+        return_std = "templates" in extensions
+
+    outputs = estimate_templates_noise_levels_and_waveforms(
         recording,
-        format=format,
-        folder=folder,
-        sparsity=sparsity,
+        spikes,
+        np.arange(2 * num_units),
+        nbefore,
+        nafter,
         return_scaled=return_scaled,
-        backend_options=backend_options,
+        return_std=return_std,
+        waveforms_file_path=waveforms_file_path,
+        job_name="create_sorting_analyzer",
+        **noise_kwargs,
+        **job_kwargs,
     )
 
-    return sorting_analyzer
+    sample_slice = slice(nbefore - sparsity_nbefore, nbefore + sparsity_nafter)
+    templates_array = outputs["templates"][num_units:, sample_slice, :]
+    outputs["templates"] = outputs["templates"][:num_units]
+    if return_std:
+        outputs["templates_std"] = outputs["templates_std"][:num_units]
+    sparsity_noise_levels = outputs.get("noise_levels", None) if noise_levels is None else noise_levels
+    if return_scaled and recording.has_scaleable_traces():
+        # estimate_sparsity() works on unscaled traces
+        gains = recording.get_channel_gains().astype("float32")
+        offsets = recording.get_channel_offsets().astype("float32")
+        templates_array = (templates_array - offsets) / gains
+        if noise_levels is None and sparsity_noise_levels is not None:
+            sparsity_noise_levels = sparsity_noise_levels / np.abs(gains)
+    sparsity = _sparsity_from_templates_array(
+        templates_array,
+        recording,
+        sorting.unit_ids,
+        sparsity_nbefore,
+        noise_levels=sparsity_noise_levels,
+        **sparsity_params,
+    )
+
+    bootstrap_data = dict(
+        extensions=extensions,
+        nbefore=nbefore,
+        random_spikes_indices=random_spikes_indices,
+        random_spikes_rows=random_spikes_rows,
+        outputs=outputs,
+    )
+    return sparsity, bootstrap_data
+
+
+def _add_bootstrap_extensions(sorting_analyzer, bootstrap_data, tmp_folder):
+    """
+    Add to the SortingAnalyzer the extensions computed by `_bootstrap_sorting_analyzer_data()`.
+    """
+    extensions = bootstrap_data["extensions"]
+    outputs = bootstrap_data["outputs"]
+    nbefore = bootstrap_data["nbefore"]
+
+    for extension_name, extension_params in _sort_extensions_by_dependency(extensions).items():
+        extension_class = get_extension_class(extension_name)
+        extension_instance = extension_class(sorting_analyzer)
+        extension_instance.set_params(save=False, **extension_params)
+
+        if extension_name == "random_spikes":
+            random_spikes_indices = bootstrap_data["random_spikes_indices"]
+            extension_instance.data["random_spikes_indices"] = random_spikes_indices
+            spikes = sorting_analyzer.sorting.to_spike_vector()
+            extension_instance.data.update(
+                extension_class._make_unit_index(
+                    spikes["unit_index"][random_spikes_indices], sorting_analyzer.get_num_units()
+                )
+            )
+        elif extension_name == "noise_levels":
+            extension_instance.data["noise_levels"] = outputs["noise_levels"]
+        elif extension_name == "waveforms":
+            if sorting_analyzer.format == "binary_folder":
+                file_path = tmp_folder / "waveforms.npy"
+            else:
+                file_path = None
+            extension_instance._run_from_dense_waveforms(
+                outputs["waveforms"], nbefore, file_path=file_path, dense_rows=bootstrap_data["random_spikes_rows"]
+            )
+        elif extension_name == "templates":
+            if "waveforms" in extensions:
+                # waveforms are already in the analyzer : the recording is not read again
+                extension_instance._run()
+            else:
+                sample_slice = slice(nbefore - extension_instance.nbefore, nbefore + extension_instance.nafter)
+                extension_instance.data["average"] = outputs["templates"][:, sample_slice, :]
+                if "std" in extension_instance.params["operators"]:
+                    extension_instance.data["std"] = outputs["templates_std"][:, sample_slice, :]
+
+        extension_instance.run_info["run_completed"] = True
+        sorting_analyzer.extensions[extension_name] = extension_instance
+        extension_instance.save()
+        if extension_name == "waveforms" and sorting_analyzer.format == "binary_folder":
+            # data is now saved in the analyzer folder and must not point to the temporary folder anymore
+            extension_instance.load_data()
 
 
 def load_sorting_analyzer(folder, load_extensions=True, format="auto", backend_options=None) -> "SortingAnalyzer":
@@ -185,6 +421,8 @@ def load_sorting_analyzer(folder, load_extensions=True, format="auto", backend_o
         The dictionary can contain the following keys:
         - storage_options: dict | None (fsspec storage options)
         - saving_options: dict | None (additional saving options for creating and saving datasets)
+        - cache_options: dict | None (local disk cache for remote zarr with "cache_folder", "max_size" and
+                                      "version_ttl" keys, see `get_zarr_store()`)
 
     Returns
     -------
@@ -258,7 +496,10 @@ class SortingAnalyzer:
         # - storage_options: dict | None (fsspec storage options)
         # - saving_options: dict | None
         # (additional saving options for creating and saving datasets, e.g. compression/filters for zarr)
+        # - cache_options: dict | None (local disk cache for zarr, see get_zarr_store())
         self._backend_options = {} if backend_options is None else backend_options
+        # zarr stores with disk cache are kept to not re-scan the cache folder
+        self._zarr_cached_stores = dict()
 
         # extensions are not loaded at init
         self.extensions = dict()
@@ -561,6 +802,19 @@ class SortingAnalyzer:
         assert mode in ("r+", "a", "r"), "mode must be 'r+', 'a' or 'r'"
 
         storage_options = self._backend_options.get("storage_options", {})
+        cache_options = self._backend_options.get("cache_options", None)
+        if cache_options is not None:
+            if mode not in self._zarr_cached_stores:
+                self._zarr_cached_stores[mode] = get_zarr_store(
+                    self.folder, mode=mode, storage_options=storage_options, cache_options=cache_options
+                )
+            store = self._zarr_cached_stores[mode]
+            if mode in ("r+", "a"):
+                zarr_root = zarr.open(store, mode=mode)
+            else:
+                zarr_root = zarr.open_consolidated(store, mode=mode)
+            return zarr_root
+
         # we open_consolidated only if we are in read mode
         if mode in ("r+", "a"):
             try:
@@ -662,8 +916,13 @@ class SortingAnalyzer:
 
         backend_options = {} if backend_options is None else backend_options
         storage_options = backend_options.get("storage_options", {})
+        cache_options = backend_options.get("cache_options", None)
 
-        zarr_root = zarr.open_consolidated(str(folder), mode="r", storage_options=storage_options)
+        if cache_options is not None:
+            store = get_zarr_store(folder, mode="r", storage_options=storage_options, cache_options=cache_options)
+            zarr_root = zarr.open_consolidated(store, mode="r")
+        else:
+            zarr_root = zarr.open_consolidated(str(folder), mode="r", storage_options=storage_options)
 
         si_info = zarr_root.attrs["spikeinterface_info"]
         if parse(si_info["version"]) < parse("0.101.1"):
@@ -770,6 +1029,7 @@ class SortingAnalyzer:
         verbose=False,
         new_unit_ids=None,
         backend_options=None,
+        view=False,
         **job_kwargs,
     ) -> "SortingAnalyzer":
         """
@@ -804,6 +1064,9 @@ class SortingAnalyzer:
             - storage_options: dict | None (fsspec storage options)
             - saving_options: dict | None (additional saving options for creating and saving datasets,
                                            e.g. compression/filters for zarr)
+        view : bool, default: False
+            If True, the per spike arrays of the extensions are not copied but referenced from this analyzer folder
+            (plus a row selection). Only possible from "binary_folder" to "binary_folder" without merges.
         job_kwargs : keyword arguments
             Keyword arguments for the job parallelization.
 
@@ -812,6 +1075,12 @@ class SortingAnalyzer:
         new_sorting_analyzer : SortingAnalyzer
             The newly created SortingAnalyzer object.
         """
+        if view:
+            assert (
+                self.format == "binary_folder" and format == "binary_folder"
+            ), "view=True is only possible from a 'binary_folder' SortingAnalyzer to a 'binary_folder' SortingAnalyzer"
+            assert merge_unit_groups is None, "view=True is not possible when merging units"
+
         if self.has_recording():
             recording = self._recording
         elif self.has_temporary_recording():
@@ -929,7 +1198,7 @@ class SortingAnalyzer:
             if merge_unit_groups is None:
                 # copy full or select
                 new_sorting_analyzer.extensions[extension_name] = extension.copy(
-                    new_sorting_analyzer, unit_ids=unit_ids
+                    new_sorting_analyzer, unit_ids=unit_ids, view=view
                 )
             else:
                 # merge
@@ -950,7 +1219,7 @@ class SortingAnalyzer:
 
         return new_sorting_analyzer
 
-    def save_as(self, format="memory", folder=None, backend_options=None) -> "SortingAnalyzer":
+    def save_as(self, format="memory", folder=None, backend_options=None, view=False) -> "SortingAnalyzer":
         """
         Save SortingAnalyzer object into another format.
         Uselful for memory to zarr or memory to binary.
@@ -970,12 +1239,16 @@ class SortingAnalyzer:
             - storage_options: dict | None (fsspec storage options)
             - saving_options: dict | None (additional saving options for creating and saving datasets,
                                            e.g. compression/filters for zarr)
+        view : bool, default: False
+            Only for "binary_folder" to "binary_folder". If True, the big per spike arrays of extensions (waveforms,
+            principal components, spike amplitudes, ...) are not written again but referenced from this folder.
+            See `select_units()`.
         """
         if format == "zarr":
             folder = clean_zarr_folder_name(folder)
-        return self._save_or_select_or_merge(format=format, folder=folder, backend_options=backend_options)
+        return self._save_or_select_or_merge(format=format, folder=folder, backend_options=backend_options, view=view)
 
-    def select_units(self, unit_ids, format="memory", folder=None) -> "SortingAnalyzer":
+    def select_units(self, unit_ids, format="memory", folder=None, view=False) -> "SortingAnalyzer":
         """
         This method is equivalent to `save_as()` but with a subset of units.
         Filters units by creating a new sorting analyzer object in a new folder.
@@ -991,6 +1264,13 @@ class SortingAnalyzer:
         folder : Path | None, deafult: None
             The new folder where the analyzer with selected units is copied if `format` is
             "binary_folder" or "zarr"
+        view : bool, default: False
+            Only when this analyzer and the new one are "binary_folder". If True, the big per spike arrays of
+            extensions (waveforms, principal components, spike amplitudes, ...) are not copied: the new folder only
+            stores a reference to the arrays of this folder plus the selected rows, which makes the creation
+            almost instantaneous. Only the selected rows are read when the new analyzer is loaded.
+            The new analyzer depends on this folder until `materialize()` is called on it: recomputing or
+            deleting these extensions here breaks the view.
 
         Returns
         -------
@@ -1000,9 +1280,9 @@ class SortingAnalyzer:
         # TODO check that unit_ids are in same order otherwise many extension do handle it properly!!!!
         if format == "zarr":
             folder = clean_zarr_folder_name(folder)
-        return self._save_or_select_or_merge(format=format, folder=folder, unit_ids=unit_ids)
+        return self._save_or_select_or_merge(format=format, folder=folder, unit_ids=unit_ids, view=view)
 
-    def remove_units(self, remove_unit_ids, format="memory", folder=None) -> "SortingAnalyzer":
+    def remove_units(self, remove_unit_ids, format="memory", folder=None, view=False) -> "SortingAnalyzer":
         """
         This method is equivalent to `save_as()` but with removal of a subset of units.
         Filters units by creating a new sorting analyzer object in a new folder.
@@ -1018,6 +1298,8 @@ class SortingAnalyzer:
         folder : Path or None, default: None
             The new folder where the analyzer without removed units is copied if `format`
             is "binary_folder" or "zarr"
+        view : bool, default: False
+            If True, per spike arrays of extensions are referenced instead of copied. See `select_units()`.
 
         Returns
         -------
@@ -1028,7 +1310,23 @@ class SortingAnalyzer:
         unit_ids = self.unit_ids[~np.isin(self.unit_ids, remove_unit_ids)]
         if format == "zarr":
             folder = clean_zarr_folder_name(folder)
-        return self._save_or_select_or_merge(format=format, folder=folder, unit_ids=unit_ids)
+        return self._save_or_select_or_merge(format=format, folder=folder, unit_ids=unit_ids, view=view)
+
+    def is_view(self) -> bool:
+        """
+        Return True if some extensions of this analyzer reference arrays of another analyzer folder
+        (see `select_units(..., view=True)`).
+        """
+        return any(len(extension._view_links) > 0 for extension in self.extensions.values() if extension is not None)
+
+    def materialize(self):
+        """
+        For an analyzer created with `view=True`, copy into this folder all the extension arrays that are
+        still referenced from the parent folder. After this, the analyzer does not depend on its parent anymore.
+        """
+        for extension in self.extensions.values():
+            if extension is not None:
+                extension.materialize()
 
     def merge_units(
         self,
@@ -1488,15 +1786,26 @@ extension_params={"waveforms":{"ms_before":1.5, "ms_after": "2.5"}}\
 
             job_name = "Compute : " + " + ".join(extensions_with_pipeline.keys())
 
+            # outputs are written straight to the npy files of the extension folders when possible
+            if save and all(ext._can_gather_to_folder() for ext in extension_instances.values()):
+                gather_kwargs = dict(
+                    gather_mode="npy",
+                    folder=self.folder / "extensions",
+                    names=[f"{extension_name}/{variable_name}" for extension_name, variable_name in result_routage],
+                    gather_kwargs=dict(exist_ok=True),
+                )
+            else:
+                gather_kwargs = dict(gather_mode="memory")
+
             t_start = perf_counter()
             results = run_node_pipeline(
                 self.recording,
                 all_nodes,
                 job_kwargs=job_kwargs,
                 job_name=job_name,
-                gather_mode="memory",
                 squeeze_output=False,
                 verbose=verbose,
+                **gather_kwargs,
             )
             t_end = perf_counter()
             # for pipeline node extensions we can only track the runtime of the run_node_pipeline
@@ -1511,7 +1820,14 @@ extension_params={"waveforms":{"ms_before":1.5, "ms_after": "2.5"}}\
             for extension_name, extension_instance in extension_instances.items():
                 self.extensions[extension_name] = extension_instance
                 if save:
-                    extension_instance.save()
+                    # params are already saved by set_params() and save() would reset the folder
+                    # which can already contain the data
+                    extension_instance._save_run_info()
+                    extension_instance._save_data()
+                    if self.format == "zarr":
+                        import zarr
+
+                        zarr.consolidate_metadata(self._get_zarr_root().store)
 
         # PATCH: the quality metric is computed after the pipeline, since some of the metrics optionally require
         # the output of the pipeline extensions (e.g., spike_amplitudes, spike_locations).
@@ -1847,6 +2163,223 @@ def get_default_analyzer_extension_params(extension_name: str):
     return default_params
 
 
+# target size of the chunks of zarr arrays with one row per unit
+_zarr_unit_chunk_bytes = 1024**2
+
+# version of the layout of the data of a zarr extension, saved in the "format_version" attribute:
+#   * 1 (no attribute): arrays are stored as computed
+#   * 2: per spike arrays are stored in unit order (see AnalyzerExtension._get_zarr_unit_layout())
+_zarr_extension_format_version = 2
+
+
+def _get_file_stamp(file_path):
+    # (modification time in ns, size) of a file or None when the file does not exist
+    file_path = Path(file_path)
+    if not file_path.is_file():
+        return None
+    stat = file_path.stat()
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class LazyPerSpikeArray:
+    """
+    Base class of the read only arrays with one row per spike that read only the selected rows
+    from the disk, so that the data of one unit can be read without loading the full array in memory.
+
+    `np.asarray()` or `copy()` read the full array.
+    These arrays are only used internally in `AnalyzerExtension.data`, `get_data()` returns a numpy array.
+    """
+
+    @property
+    def shape(self):
+        raise NotImplementedError
+
+    @property
+    def dtype(self):
+        raise NotImplementedError
+
+    def _read_all(self, fields=None):
+        raise NotImplementedError
+
+    def _read_spikes(self, spike_indices, other_selection, fields=None):
+        # read the rows of some spikes, spike_indices are positive and valid
+        raise NotImplementedError
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(shape={self.shape}, dtype={self.dtype})"
+
+    def __getitem__(self, item):
+        fields = None
+        if isinstance(item, str) or (isinstance(item, list) and len(item) > 0 and isinstance(item[0], str)):
+            # fields of a structured array
+            fields, item = item, slice(None)
+        if not isinstance(item, tuple):
+            item = (item,)
+        selection, other_selection = item[0], item[1:]
+
+        is_basic = all(isinstance(sel, (slice, int, np.integer)) for sel in other_selection)
+        if not is_basic or selection is Ellipsis or selection is None:
+            # rare cases: done by numpy on the full array
+            return self._read_all(fields=fields)[item]
+        if isinstance(selection, slice) and selection == slice(None):
+            return self._read_all(fields=fields)[(slice(None),) + other_selection]
+
+        num_spikes = self.shape[0]
+        if isinstance(selection, slice):
+            spike_indices = np.arange(*selection.indices(num_spikes))
+        else:
+            spike_indices = np.asarray(selection)
+            if spike_indices.dtype == bool:
+                assert spike_indices.shape == (num_spikes,), "The boolean mask must have one value per spike"
+                spike_indices = np.flatnonzero(spike_indices)
+            else:
+                spike_indices = spike_indices.astype("int64")
+                spike_indices = np.where(spike_indices < 0, spike_indices + num_spikes, spike_indices)
+                if np.any((spike_indices < 0) | (spike_indices >= num_spikes)):
+                    raise IndexError(f"index out of bounds for the {num_spikes} spikes")
+
+        return self._read_spikes(spike_indices, other_selection, fields=fields)
+
+    def __array__(self, dtype=None, copy=None):
+        data = self._read_all()
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        return data
+
+    def copy(self):
+        return self._read_all()
+
+    def astype(self, dtype):
+        return self._read_all().astype(dtype)
+
+
+class ZarrPerSpikeArray(LazyPerSpikeArray):
+    """
+    Lazy array with one row per spike of a zarr extension.
+    Only the chunks of the selected rows are read from the store.
+
+    The rows of arrays stored in unit order (see `AnalyzerExtension._get_zarr_unit_layout()`) are
+    returned in the spike order.
+
+    Parameters
+    ----------
+    zarr_array : zarr.Array
+        The stored array
+    order : np.ndarray | None, default: None
+        The spike index of each stored row, None if the array is stored in spike order
+    """
+
+    def __init__(self, zarr_array, order=None):
+        self._zarr_array = zarr_array
+        self._order = order
+        # stored row of each spike, computed at the first selection
+        self._rows = None
+
+    @property
+    def shape(self):
+        return self._zarr_array.shape
+
+    @property
+    def dtype(self):
+        return self._zarr_array.dtype
+
+    def _get_rows(self):
+        if self._rows is None:
+            self._rows = np.empty(self._order.size, dtype="int64")
+            self._rows[self._order] = np.arange(self._order.size)
+        return self._rows
+
+    def _read_all(self, fields=None):
+        stored_data = self._zarr_array.get_basic_selection(Ellipsis, fields=fields)
+        if self._order is None:
+            return stored_data
+        data = np.empty_like(stored_data)
+        data[self._order] = stored_data
+        return data
+
+    def _read_spikes(self, spike_indices, other_selection, fields=None):
+        stored_rows = spike_indices if self._order is None else self._get_rows()[spike_indices]
+        # zarr reads sorted rows, only the chunks containing them are loaded
+        unique_rows, inverse = np.unique(stored_rows.ravel(), return_inverse=True)
+        data = self._zarr_array.get_orthogonal_selection((unique_rows,) + other_selection, fields=fields)
+        data = data[inverse.reshape(stored_rows.shape)]
+        return data
+
+
+class NpyViewArray(LazyPerSpikeArray):
+    """
+    Lazy array with one row per spike of a view (see `SortingAnalyzer.select_units(view=True)`):
+    the rows are read from the npy file of the parent extension only when they are accessed.
+
+    The file is memmapped at each read (this only parses the header), so that no file handle is
+    kept on the parent folder, which could not be recomputed otherwise on Windows.
+
+    Parameters
+    ----------
+    source_file : Path
+        The npy file of the parent extension
+    rows : np.ndarray | None, default: None
+        The row in the source file of each spike of the view, None for all rows
+    """
+
+    def __init__(self, source_file, rows=None):
+        self._source_file = Path(source_file)
+        self._rows = rows
+        source_data = self._open()
+        self._source_shape = source_data.shape
+        self._dtype = source_data.dtype
+        del source_data
+
+    def _open(self):
+        return np.load(self._source_file, mmap_mode="r")
+
+    @property
+    def shape(self):
+        if self._rows is None:
+            return self._source_shape
+        return (self._rows.size,) + tuple(self._source_shape[1:])
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    def _read_all(self, fields=None):
+        source_data = self._open()
+        if fields is not None:
+            source_data = source_data[fields]
+        if self._rows is None:
+            data = np.array(source_data)
+        else:
+            data = source_data[self._rows]
+        del source_data
+        return data
+
+    def _read_spikes(self, spike_indices, other_selection, fields=None):
+        source_data = self._open()
+        if fields is not None:
+            source_data = source_data[fields]
+        stored_rows = spike_indices if self._rows is None else self._rows[spike_indices]
+        # fancy indexing of the memmap: only the selected rows are read
+        data = source_data[stored_rows][(slice(None),) + other_selection]
+        del source_data
+        return data
+
+
 class AnalyzerExtension:
     """
     This the base class to extend the SortingAnalyzer.
@@ -1891,6 +2424,9 @@ class AnalyzerExtension:
     nodepipeline_variables = None
     need_job_kwargs = False
     need_backward_compatibility_on_load = False
+    # data arrays with one row per spike that a view analyzer can reference instead of copying
+    # (see SortingAnalyzer.select_units(view=True)): data name -> "spikes" or "random_spikes"
+    per_spike_data = {}
 
     def __init__(self, sorting_analyzer):
         self._sorting_analyzer = weakref.ref(sorting_analyzer)
@@ -1898,6 +2434,10 @@ class AnalyzerExtension:
         self.params = None
         self.run_info = self._default_run_info_dict()
         self.data = dict()
+        # data name -> (source npy file, rows or None, source stamp) for arrays referenced from another folder
+        self._view_links = dict()
+        # True while running with save=True in a folder where node pipeline outputs can be written directly
+        self._gather_to_folder = False
 
     def _default_run_info_dict(self):
         return dict(run_completed=False, runtime_s=None)
@@ -2004,6 +2544,39 @@ class AnalyzerExtension:
         extension_folder = self.folder / "extensions" / self.extension_name
         return extension_folder
 
+    def _can_gather_to_folder(self):
+        # on windows an open memmap prevents the folder from being deleted when computing again
+        return (
+            self.format == "binary_folder"
+            and not self.sorting_analyzer.is_read_only()
+            and platform.system() != "Windows"
+        )
+
+    def _can_load_as_memmap(self):
+        # per spike npy files are opened as memmap at load time (writability is not needed for this),
+        # a read-only analyzer can not compute again so the windows limitation does not apply
+        return self.format == "binary_folder" and (
+            self.sorting_analyzer.is_read_only() or platform.system() != "Windows"
+        )
+
+    def _get_pipeline_gather_kwargs(self):
+        """
+        Keyword arguments for `run_node_pipeline()` to gather the outputs of the nodes of the extension.
+
+        When the extension is saved in a "binary_folder", the outputs are written straight to the npy files
+        of the extension folder and opened back as memmap, so they never need to fit in memory.
+        Otherwise they are gathered in memory.
+        """
+        if self._gather_to_folder:
+            return dict(
+                gather_mode="npy",
+                folder=self._get_binary_extension_folder(),
+                names=list(self.nodepipeline_variables),
+                gather_kwargs=dict(exist_ok=True),
+            )
+        else:
+            return dict(gather_mode="memory")
+
     def _get_zarr_extension_group(self, mode="r+"):
         zarr_root = self.sorting_analyzer._get_zarr_root(mode=mode)
         extension_group = zarr_root["extensions"][self.extension_name]
@@ -2085,9 +2658,12 @@ class AnalyzerExtension:
                 elif ext_data_file.suffix == ".npy":
                     # The lazy loading of an extension is complicated because if we compute again
                     # and have a link to the old buffer on windows then it fails
-                    # ext_data = np.load(ext_data_file, mmap_mode="r")
-                    # so we go back to full loading
-                    ext_data = np.load(ext_data_file)
+                    # so we go back to full loading, except for arrays with one row per spike
+                    # which can be too big for memory
+                    if self.per_spike_data.get(ext_data_name, None) == "spikes" and self._can_load_as_memmap():
+                        ext_data = np.load(ext_data_file, mmap_mode="r")
+                    else:
+                        ext_data = np.load(ext_data_file)
                 elif ext_data_file.suffix == ".csv":
                     import pandas as pd
 
@@ -2099,8 +2675,38 @@ class AnalyzerExtension:
                     continue
                 self.data[ext_data_name] = ext_data
 
+            links_file = extension_folder / "view" / "links.json"
+            if links_file.is_file():
+                with links_file.open("r") as f:
+                    links = json.load(f)
+                source_stamps = {name: link.get("source_stamp", None) for name, link in links.items()}
+                stale = [
+                    name
+                    for name, link in links.items()
+                    if source_stamps[name] is not None and _get_file_stamp(link["source"]) != source_stamps[name]
+                ]
+                if len(stale) > 0:
+                    warnings.warn(
+                        f"The parent of the view {self.extension_name} has been recomputed or deleted since the view "
+                        f"was created ({stale}), extension should be re-computed."
+                    )
+                    self.data = dict()
+                    return
+                for ext_data_name, link in links.items():
+                    rows = np.load(extension_folder / "view" / f"{ext_data_name}_rows.npy") if link["rows"] else None
+                    source_file = Path(link["source"])
+                    self._view_links[ext_data_name] = (source_file, rows, source_stamps[ext_data_name])
+                    self.data[ext_data_name] = NpyViewArray(source_file, rows)
+
         elif self.format == "zarr":
             extension_group = self._get_zarr_extension_group(mode="r")
+            format_version = extension_group.attrs.get("format_version", 1)
+            if format_version > _zarr_extension_format_version:
+                warnings.warn(
+                    f"The data of {self.extension_name} was saved with a more recent format (version {format_version}) "
+                    "than the one of this spikeinterface version, extension should be re-computed."
+                )
+                return
             for ext_data_name in extension_group.keys():
                 ext_data_ = extension_group[ext_data_name]
                 if "dict" in ext_data_.attrs:
@@ -2116,6 +2722,13 @@ class AnalyzerExtension:
                     ext_data = ext_data.convert_dtypes()
                 elif "object" in ext_data_.attrs:
                     ext_data = ext_data_[0]
+                elif ext_data_name in self.per_spike_data:
+                    # arrays with one row per spike can be too big for memory : lazy loading
+                    order = None
+                    if "unit_order" in ext_data_.attrs:
+                        # stored in unit order : rows are returned in the spike order
+                        order, _ = self._get_unit_order(ext_data_.attrs["unit_order"])
+                    ext_data = ZarrPerSpikeArray(ext_data_, order=order)
                 else:
                     # this load in memmory
                     ext_data = np.array(ext_data_)
@@ -2124,18 +2737,104 @@ class AnalyzerExtension:
         if len(self.data) == 0:
             warnings.warn(f"Found no data for {self.extension_name}, extension should be re-computed.")
 
-    def copy(self, new_sorting_analyzer, unit_ids=None):
+    def copy(self, new_sorting_analyzer, unit_ids=None, view=False):
         # alessio : please note that this also replace the old select_units!!!
         new_extension = self.__class__(new_sorting_analyzer)
         new_extension.params = self.params.copy()
+        if view:
+            new_extension._view_links = self._get_view_links(unit_ids)
         if unit_ids is None:
             new_extension.data = self.data
+        elif view and len(self.data) > 0 and all(name in new_extension._view_links for name in self.data):
+            # all data are referenced: rows are read only when accessed and only the links are saved
+            new_extension.data = {
+                name: NpyViewArray(source_file, rows)
+                for name, (source_file, rows, _) in new_extension._view_links.items()
+            }
         else:
             new_extension.data = self._select_extension_data(unit_ids)
         new_extension.run_info = copy(self.run_info)
         new_extension.save()
         return new_extension
 
+    def _get_view_links(self, unit_ids=None):
+        # source file and rows of every per spike array, the chain of views is resolved to the original file
+        assert self.format == "binary_folder", "Views can only reference a 'binary_folder' SortingAnalyzer"
+        if unit_ids is not None:
+            keep_unit_indices = np.flatnonzero(np.isin(self.sorting_analyzer.unit_ids, unit_ids))
+
+        view_links = dict()
+        for ext_data_name, spikes_kind in self.per_spike_data.items():
+            if ext_data_name not in self.data:
+                continue
+            if ext_data_name in self._view_links:
+                source_file, rows, source_stamp = self._view_links[ext_data_name]
+            else:
+                source_file, rows = self._get_binary_extension_folder() / f"{ext_data_name}.npy", None
+                if not source_file.is_file():
+                    continue
+                # to detect at load time that the parent has been recomputed since the view was created
+                source_stamp = _get_file_stamp(source_file)
+
+            if unit_ids is not None:
+                if spikes_kind == "random_spikes":
+                    spikes = self.sorting_analyzer.get_extension("random_spikes").get_random_spikes()
+                else:
+                    spikes = self.sorting_analyzer.sorting.to_spike_vector()
+                keep_rows = np.flatnonzero(np.isin(spikes["unit_index"], keep_unit_indices))
+                rows = keep_rows if rows is None else rows[keep_rows]
+
+            view_links[ext_data_name] = (Path(source_file).absolute(), rows, source_stamp)
+        return view_links
+
+    def _get_unit_order(self, spikes_kind):
+        # order of the rows of a per spike array sorted by unit, and the offsets of each unit in this order
+        if spikes_kind == "random_spikes":
+            spikes = self.sorting_analyzer.get_extension("random_spikes").get_random_spikes()
+        else:
+            spikes = self.sorting_analyzer.sorting.to_spike_vector()
+        return unit_indices_to_csr_index(spikes["unit_index"], self.sorting_analyzer.get_num_units())
+
+    def _get_zarr_unit_layout(self, ext_data_name, ext_data):
+        # zarr layout of a data array so that the data of one unit is in a few chunks:
+        #   * per spike arrays are stored in unit order (the original order is restored at load time)
+        #   * arrays with one row per unit are chunked by groups of units
+        num_units = self.sorting_analyzer.get_num_units()
+        spikes_kind = self.per_spike_data.get(ext_data_name, None)
+        if spikes_kind is not None and ext_data.ndim >= 1 and num_units > 0:
+            order, offsets = self._get_unit_order(spikes_kind)
+            if order.size == ext_data.shape[0]:
+                max_count = int(np.max(np.diff(offsets)))
+                chunks = tuple(max(size, 1) for size in (max_count,) + ext_data.shape[1:])
+                return ext_data[order], chunks, spikes_kind
+
+        if ext_data.ndim >= 2 and ext_data.shape[0] == num_units and num_units > 0:
+            unit_nbytes = max(ext_data[0].nbytes, 1)
+            units_per_chunk = int(np.clip(_zarr_unit_chunk_bytes // unit_nbytes, 1, num_units))
+            chunks = tuple(max(size, 1) for size in (units_per_chunk,) + ext_data.shape[1:])
+            return ext_data, chunks, None
+
+        # let zarr guess the chunks
+        return ext_data, True, None
+
+    def materialize(self):
+        """
+        Write in the folder of this extension the arrays that are referenced from another folder (view).
+        """
+        if len(self._view_links) == 0:
+            return
+        self._view_links = dict()
+        # the rows are read from the parent once, the extension does not depend on it anymore
+        self.data = {
+            ext_data_name: np.asarray(ext_data) if isinstance(ext_data, LazyPerSpikeArray) else ext_data
+            for ext_data_name, ext_data in self.data.items()
+        }
+        self._save_data()
+        if self.format == "binary_folder":
+            view_folder = self._get_binary_extension_folder() / "view"
+            if view_folder.is_dir():
+                shutil.rmtree(view_folder)
+
     def merge(
         self,
         new_sorting_analyzer,
@@ -2160,8 +2859,15 @@ class AnalyzerExtension:
             self._save_params()
             self._save_importing_provenance()
 
+        # new data are never a view
+        self._view_links = dict()
+
         t_start = perf_counter()
-        self._run(**kwargs)
+        self._gather_to_folder = save and self._can_gather_to_folder()
+        try:
+            self._run(**kwargs)
+        finally:
+            self._gather_to_folder = False
         t_end = perf_counter()
         self.run_info["runtime_s"] = t_end - t_start
         self.run_info["run_completed"] = True
@@ -2187,6 +2893,12 @@ class AnalyzerExtension:
 
     def _save_data(self):
         if self.format == "memory":
+            # lazy arrays must not depend on the store of another analyzer
+            # (a new dict because copy() can share the dict of the source extension)
+            self.data = {
+                ext_data_name: np.asarray(ext_data) if isinstance(ext_data, LazyPerSpikeArray) else ext_data
+                for ext_data_name, ext_data in self.data.items()
+            }
             return
 
         if self.sorting_analyzer.is_read_only():
@@ -2203,7 +2915,24 @@ class AnalyzerExtension:
         if self.format == "binary_folder":
 
             extension_folder = self._get_binary_extension_folder()
+            if len(self._view_links) > 0:
+                view_folder = extension_folder / "view"
+                view_folder.mkdir(exist_ok=True)
+                links = dict()
+                for ext_data_name, (source_file, rows, source_stamp) in self._view_links.items():
+                    links[ext_data_name] = dict(
+                        source=str(source_file), rows=rows is not None, source_stamp=source_stamp
+                    )
+                    if rows is not None:
+                        np.save(view_folder / f"{ext_data_name}_rows.npy", rows)
+                (view_folder / "links.json").write_text(json.dumps(links, indent=4), encoding="utf8")
+
             for ext_data_name, ext_data in self.data.items():
+                if ext_data_name in self._view_links:
+                    # referenced from another folder
+                    continue
+                if isinstance(ext_data, LazyPerSpikeArray):
+                    ext_data = np.asarray(ext_data)
                 if isinstance(ext_data, dict):
                     with (extension_folder / f"{ext_data_name}.json").open("w") as f:
                         json.dump(ext_data, f)
@@ -2228,12 +2957,16 @@ class AnalyzerExtension:
 
             saving_options = self.sorting_analyzer._backend_options.get("saving_options", {})
             extension_group = self._get_zarr_extension_group(mode="r+")
+            extension_group.attrs["format_version"] = _zarr_extension_format_version
 
             # if compression is not externally given, we use the default
             if "compressor" not in saving_options:
                 saving_options["compressor"] = get_default_zarr_compressor()
 
             for ext_data_name, ext_data in self.data.items():
+                if isinstance(ext_data, LazyPerSpikeArray):
+                    # read before the stored array is deleted
+                    ext_data = np.asarray(ext_data)
                 if ext_data_name in extension_group:
                     del extension_group[ext_data_name]
                 if isinstance(ext_data, dict):
@@ -2241,7 +2974,12 @@ class AnalyzerExtension:
                         name=ext_data_name, data=np.array([ext_data], dtype=object), object_codec=numcodecs.JSON()
                     )
                 elif isinstance(ext_data, np.ndarray):
-                    extension_group.create_dataset(name=ext_data_name, data=ext_data, **saving_options)
+                    ext_data, chunks, unit_order = self._get_zarr_unit_layout(ext_data_name, ext_data)
+                    dataset_options = dict(chunks=chunks)
+                    dataset_options.update(saving_options)
+                    extension_group.create_dataset(name=ext_data_name, data=ext_data, **dataset_options)
+                    if unit_order is not None:
+                        extension_group[ext_data_name].attrs["unit_order"] = unit_order
                 elif HAS_PANDAS and isinstance(ext_data, pd.DataFrame):
                     df_group = extension_group.create_group(ext_data_name)
                     # first we save the index
@@ -2307,6 +3045,7 @@ class AnalyzerExtension:
         self.params = None
         self.run_info = self._default_run_info_dict()
         self.data = dict()
+        self._view_links = dict()
 
     def reset(self):
         """
@@ -2317,6 +3056,7 @@ class AnalyzerExtension:
         self.params = None
         self.run_info = self._default_run_info_dict()
         self.data = dict()
+        self._view_links = dict()
 
     def set_params(self, save=True, **params):
         """
@@ -2398,7 +3138,11 @@ class AnalyzerExtension:
                 "run_completed"
             ], f"You must run the extension {self.extension_name} before retrieving data"
         assert len(self.data) > 0, "Extension has been run but no data found."
-        return self._get_data(*args, **kwargs)
+        data = self._get_data(*args, **kwargs)
+        if isinstance(data, LazyPerSpikeArray):
+            # lazy arrays are internal, the full array is read for the user
+            data = np.asarray(data)
+        return data
 
 
 # this is a hardcoded list to to improve error message and auto_import mechanism
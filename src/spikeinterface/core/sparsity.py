@@ -8,8 +8,7 @@ from .basesorting import BaseSorting
 from .baserecording import BaseRecording
 from .sorting_tools import random_spikes_selection
 from .job_tools import _shared_job_kwargs_doc
-from .waveform_tools import estimate_templates_with_accumulator
-
+from .waveform_tools import estimate_templates_with_accumulator, estimate_templates_noise_levels_and_waveforms
 
 _sparsity_doc = """
     method : str
@@ -711,8 +710,9 @@ def estimate_sparsity(
     """
     Estimate the sparsity without needing a SortingAnalyzer or Templates object.
     In case the sparsity method needs templates, they are computed on-the-fly.
-    For the "snr" method, `noise_levels` must passed with the `noise_levels` argument.
-    These can be computed with the `get_noise_levels()` function.
+    For the "snr" method, `noise_levels` can be passed with the `noise_levels` argument
+    (they can be computed with the `get_noise_levels()` function). Otherwise, the noise levels
+    are estimated in the same read of the recording than the templates.
 
     Contrary to the previous implementation:
       * all units are computed in one read of recording
@@ -735,8 +735,8 @@ def estimate_sparsity(
     ms_after : float, default: 2.5
         Cut out in ms after spike time
     noise_levels : np.array | None, default: None
-        Noise levels required for the "snr" and "energy" methods. You can use the
-        `get_noise_levels()` function to compute them.
+        Noise levels used by the "snr" and "ptp" methods. You can use the
+        `get_noise_levels()` function to compute them. If None, they are estimated on-the-fly (on raw traces).
     {}
 
     Returns
@@ -744,95 +744,63 @@ def estimate_sparsity(
     sparsity : ChannelSparsity
         The estimated sparsity
     """
-    # Can't be done at module because this is a cyclic import, too bad
-    from .template import Templates
-
     assert method in ("radius", "best_channels", "snr", "amplitude", "by_property", "ptp"), (
         f"method={method} is not available for `estimate_sparsity()`. "
         "Available methods are 'radius', 'best_channels', 'snr', 'amplitude', 'by_property', 'ptp' (deprecated)"
     )
 
-    if recording.get_probes() == 1:
-        # standard case
-        probe = recording.get_probe()
-    else:
-        # if many probe or no probe then we use channel location and create a dummy probe with all channels
-        # note that get_channel_locations() is checking that channel are not spatialy overlapping so the radius method is OK.
-        chan_locs = recording.get_channel_locations()
-        probe = recording.create_dummy_probe_from_locations(chan_locs)
-
     if method != "by_property":
         nbefore = int(ms_before * recording.sampling_frequency / 1000.0)
         nafter = int(ms_after * recording.sampling_frequency / 1000.0)
 
-        num_samples = [recording.get_num_samples(seg_index) for seg_index in range(recording.get_num_segments())]
-        random_spikes_indices = random_spikes_selection(
-            sorting,
-            num_samples,
-            method="uniform",
-            max_spikes_per_unit=num_spikes_for_sparsity,
-            margin_size=max(nbefore, nafter),
-            seed=2205,
+        random_spikes_indices = _get_sparsity_spikes_indices(
+            sorting, recording, num_spikes_for_sparsity, nbefore, nafter
         )
         spikes = sorting.to_spike_vector()
         spikes = spikes[random_spikes_indices]
 
-        templates_array = estimate_templates_with_accumulator(
+        if method in ("snr", "ptp") and noise_levels is None:
+            # noise levels are estimated in the same read of the recording than templates
+            assert spikes.size > 0, "estimate_sparsity() need non empty sorting"
+            outputs = estimate_templates_noise_levels_and_waveforms(
+                recording,
+                spikes,
+                sorting.unit_ids,
+                nbefore,
+                nafter,
+                return_scaled=False,
+                noise_levels_method="mad",
+                noise_random_slices_kwargs=dict(seed=2205),
+                job_name="estimate_sparsity",
+                **job_kwargs,
+            )
+            templates_array = outputs["templates"]
+            noise_levels = outputs["noise_levels"]
+        else:
+            templates_array = estimate_templates_with_accumulator(
+                recording,
+                spikes,
+                sorting.unit_ids,
+                nbefore,
+                nafter,
+                return_scaled=False,
+                job_name="estimate_sparsity",
+                **job_kwargs,
+            )
+
+        sparsity = _sparsity_from_templates_array(
+            templates_array,
             recording,
-            spikes,
             sorting.unit_ids,
             nbefore,
-            nafter,
-            return_scaled=False,
-            job_name="estimate_sparsity",
-            **job_kwargs,
-        )
-        templates = Templates(
-            templates_array=templates_array,
-            sampling_frequency=recording.sampling_frequency,
-            nbefore=nbefore,
-            sparsity_mask=None,
-            channel_ids=recording.channel_ids,
-            unit_ids=sorting.unit_ids,
-            probe=probe,
+            method=method,
+            peak_sign=peak_sign,
+            radius_um=radius_um,
+            num_channels=num_channels,
+            threshold=threshold,
+            amplitude_mode=amplitude_mode,
+            noise_levels=noise_levels,
         )
-
-        if method == "best_channels":
-            assert num_channels is not None, "For the 'best_channels' method, 'num_channels' needs to be given"
-            sparsity = ChannelSparsity.from_best_channels(
-                templates, num_channels, peak_sign=peak_sign, amplitude_mode=amplitude_mode
-            )
-        elif method == "radius":
-            assert radius_um is not None, "For the 'radius' method, 'radius_um' needs to be given"
-            sparsity = ChannelSparsity.from_radius(templates, radius_um, peak_sign=peak_sign)
-        elif method == "snr":
-            assert threshold is not None, "For the 'snr' method, 'threshold' needs to be given"
-            assert noise_levels is not None, (
-                "For the 'snr' method, 'noise_levels' needs to be given. You can use the "
-                "`get_noise_levels()` function to compute them."
-            )
-            sparsity = ChannelSparsity.from_snr(
-                templates,
-                threshold,
-                noise_levels=noise_levels,
-                peak_sign=peak_sign,
-                amplitude_mode=amplitude_mode,
-            )
-        elif method == "amplitude":
-            assert threshold is not None, "For the 'amplitude' method, 'threshold' needs to be given"
-            sparsity = ChannelSparsity.from_amplitude(
-                templates, threshold, amplitude_mode=amplitude_mode, peak_sign=peak_sign
-            )
-        elif method == "ptp":
-            # TODO: remove after deprecation
-            assert threshold is not None, "For the 'ptp' method, 'threshold' needs to be given"
-            assert noise_levels is not None, (
-                "For the 'snr' method, 'noise_levels' needs to be given. You can use the "
-                "`get_noise_levels()` function to compute them."
-            )
-            sparsity = ChannelSparsity.from_ptp(templates, threshold, noise_levels=noise_levels)
-        else:
-            raise ValueError(f"compute_sparsity() method={method} does not exists")
     else:
         assert by_property is not None, "For the 'by_property' method, 'by_property' needs to be given"
         sparsity = ChannelSparsity.from_property(sorting, recording, by_property)
@@ -840,4 +808,91 @@ def estimate_sparsity(
     return sparsity
 
 
+def _get_sparsity_spikes_indices(sorting, recording, num_spikes_for_sparsity, nbefore, nafter):
+    """
+    Indices in the spike vector of the spikes used to estimate the templates of `estimate_sparsity()`.
+    """
+    num_samples = [recording.get_num_samples(seg_index) for seg_index in range(recording.get_num_segments())]
+    return random_spikes_selection(
+        sorting,
+        num_samples,
+        method="uniform",
+        max_spikes_per_unit=num_spikes_for_sparsity,
+        margin_size=max(nbefore, nafter),
+        seed=2205,
+    )
+
+
+def _sparsity_from_templates_array(
+    templates_array,
+    recording,
+    unit_ids,
+    nbefore,
+    method="radius",
+    peak_sign="neg",
+    radius_um=100.0,
+    num_channels=5,
+    threshold=5,
+    amplitude_mode="extremum",
+    noise_levels=None,
+):
+    """
+    Make a ChannelSparsity from dense templates estimated on-the-fly (see `estimate_sparsity()`).
+    """
+    # Can't be done at module because this is a cyclic import, too bad
+    from .template import Templates
+
+    if recording.get_probes() == 1:
+        # standard case
+        probe = recording.get_probe()
+    else:
+        # if many probe or no probe then we use channel location and create a dummy probe with all channels
+        # note that get_channel_locations() is checking that channel are not spatialy overlapping so the radius method is OK.
+        chan_locs = recording.get_channel_locations()
+        probe = recording.create_dummy_probe_from_locations(chan_locs)
+
+    templates = Templates(
+        templates_array=templates_array,
+        sampling_frequency=recording.sampling_frequency,
+        nbefore=nbefore,
+        sparsity_mask=None,
+        channel_ids=recording.channel_ids,
+        unit_ids=unit_ids,
+        probe=probe,
+    )
+
+    if method == "best_channels":
+        assert num_channels is not None, "For the 'best_channels' method, 'num_channels' needs to be given"
+        sparsity = ChannelSparsity.from_best_channels(
+            templates, num_channels, peak_sign=peak_sign, amplitude_mode=amplitude_mode
+        )
+    elif method == "radius":
+        assert radius_um is not None, "For the 'radius' method, 'radius_um' needs to be given"
+        sparsity = ChannelSparsity.from_radius(templates, radius_um, peak_sign=peak_sign)
+    elif method == "snr":
+        assert threshold is not None, "For the 'snr' method, 'threshold' needs to be given"
+        assert noise_levels is not None, "For the 'snr' method, 'noise_levels' needs to be given."
+        sparsity = ChannelSparsity.from_snr(
+            templates,
+            threshold,
+            noise_levels=noise_levels,
+            peak_sign=peak_sign,
+            amplitude_mode=amplitude_mode,
+        )
+    elif method == "amplitude":
+        assert threshold is not None, "For the 'amplitude' method, 'threshold' needs to be given"
+        sparsity = ChannelSparsity.from_amplitude(
+            templates, threshold, amplitude_mode=amplitude_mode, peak_sign=peak_sign
+        )
+    elif method == "ptp":
+        # TODO: remove after deprecation
+        assert threshold is not None, "For the 'ptp' method, 'threshold' needs to be given"
+        assert noise_levels is not None, "For the 'ptp' method, 'noise_levels' needs to be given."
+        sparsity = ChannelSparsity.from_ptp(templates, threshold, noise_levels=noise_levels)
+    else:
+        raise ValueError(f"compute_sparsity() method={method} does not exists")
+
+    return sparsity
+
+
 estimate_sparsity.__doc__ = estimate_sparsity.__doc__.format(_shared_job_kwargs_doc)
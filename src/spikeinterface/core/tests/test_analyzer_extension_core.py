@@ -5,7 +5,7 @@ import shutil
 from pathlib import Path
 
 from spikeinterface.core import generate_ground_truth_recording
-from spikeinterface.core import create_sorting_analyzer
+from spikeinterface.core import create_sorting_analyzer, load_sorting_analyzer
 from spikeinterface.core import Templates
 
 from spikeinterface.core.sortinganalyzer import _extension_children, _get_children_dependencies
@@ -89,6 +89,25 @@ def test_ComputeRandomSpikes(format, sparse, create_cache_folder):
     indices = ext.data["random_spikes_indices"]
     assert indices.size == 10 * sorting_analyzer.sorting.unit_ids.size
 
+    some_spikes = ext.get_random_spikes()
+    for unit_index, unit_id in enumerate(sorting_analyzer.unit_ids):
+        rows = ext.get_unit_spike_rows(unit_id)
+        assert np.array_equal(rows, np.flatnonzero(some_spikes["unit_index"] == unit_index))
+
+    if format != "memory":
+        sorting_analyzer_loaded = load_sorting_analyzer(sorting_analyzer.folder)
+        ext_loaded = sorting_analyzer_loaded.get_extension("random_spikes")
+        assert "random_spikes_unit_offsets" in ext_loaded.data
+        assert np.array_equal(ext_loaded.get_unit_spike_rows(unit_id), rows)
+
+    keep_unit_ids = sorting_analyzer.unit_ids[1::2]
+    sorting_analyzer_sub = sorting_analyzer.select_units(keep_unit_ids)
+    ext_sub = sorting_analyzer_sub.get_extension("random_spikes")
+    some_spikes_sub = ext_sub.get_random_spikes()
+    for unit_index, unit_id in enumerate(sorting_analyzer_sub.unit_ids):
+        rows = ext_sub.get_unit_spike_rows(unit_id)
+        assert np.array_equal(rows, np.flatnonzero(some_spikes_sub["unit_index"] == unit_index))
+
     print("Checking results")
     _check_result_extension(sorting_analyzer, "random_spikes", cache_folder)
     print("Delering extension")
@@ -115,6 +134,53 @@ def test_ComputeWaveforms(format, sparse, create_cache_folder):
     _check_result_extension(sorting_analyzer, "waveforms", cache_folder)
 
 
+@pytest.mark.parametrize("format", ["memory", "binary_folder", "zarr"])
+@pytest.mark.parametrize("sparse", [True, False])
+@pytest.mark.parametrize("scale_mode", ["spike", "unit"])
+def test_ComputeWaveforms_compressed(format, sparse, scale_mode, create_cache_folder):
+    cache_folder = create_cache_folder
+    sorting_analyzer = get_sorting_analyzer(cache_folder, format=format, sparse=sparse)
+
+    job_kwargs = dict(n_jobs=2, chunk_duration="1s", progress_bar=False)
+    sorting_analyzer.compute("random_spikes", max_spikes_per_unit=50, seed=2205)
+    ext_raw = sorting_analyzer.compute("waveforms", **job_kwargs)
+    wfs_raw = ext_raw.get_data().copy()
+    wfs_raw_one_unit = {unit_id: ext_raw.get_waveforms_one_unit(unit_id) for unit_id in sorting_analyzer.unit_ids}
+
+    ext = sorting_analyzer.compute("waveforms", storage="compressed", scale_mode=scale_mode, **job_kwargs)
+    assert "waveforms" not in ext.data
+    assert ext.data["waveforms_buffer"].nbytes < wfs_raw.nbytes
+    if format == "binary_folder":
+        assert not (ext._get_binary_extension_folder() / "waveforms_uncompressed.npy").exists()
+
+    wfs = ext.get_data()
+    assert wfs.shape == wfs_raw.shape
+    tolerance = np.max(np.abs(wfs_raw)) / 2**14
+    assert np.allclose(wfs, wfs_raw, atol=tolerance)
+    for unit_id in sorting_analyzer.unit_ids:
+        wfs_one_unit = ext.get_waveforms_one_unit(unit_id)
+        assert wfs_one_unit.shape == wfs_raw_one_unit[unit_id].shape
+        assert np.allclose(wfs_one_unit, wfs_raw_one_unit[unit_id], atol=tolerance)
+
+    sorting_analyzer.compute("templates", operators=["average", "median"])
+
+    if format != "memory":
+        sorting_analyzer2 = load_sorting_analyzer(sorting_analyzer.folder)
+        ext2 = sorting_analyzer2.get_extension("waveforms")
+        assert ext2.is_compressed
+        assert np.array_equal(ext2.get_data(), wfs)
+
+    if format == "memory":
+        # unit chunks are copied without decoding
+        keep_unit_ids = sorting_analyzer.unit_ids[::2]
+        sorting_analyzer3 = sorting_analyzer.select_units(unit_ids=keep_unit_ids)
+        ext3 = sorting_analyzer3.get_extension("waveforms")
+        for unit_id in keep_unit_ids:
+            assert np.array_equal(ext3.get_waveforms_one_unit(unit_id), ext.get_waveforms_one_unit(unit_id))
+
+    _check_result_extension(sorting_analyzer, "waveforms", cache_folder)
+
+
 @pytest.mark.parametrize("format", ["memory", "binary_folder", "zarr"])
 @pytest.mark.parametrize("sparse", [True, False])
 def test_ComputeTemplates(format, sparse, create_cache_folder):
@@ -12,6 +12,7 @@ from spikeinterface.core.sorting_tools import (
     apply_merges_to_sorting,
     _get_ids_after_merging,
     generate_unit_ids_for_merge_group,
+    unit_indices_to_csr_index,
 )
 
 
@@ -78,6 +79,15 @@ def test_random_spikes_selection():
     assert random_spikes_indices.size == spikes.size
 
 
+def test_unit_indices_to_csr_index():
+    unit_indices = np.array([2, 0, 2, 1, 0, 2, 2])
+    order, offsets = unit_indices_to_csr_index(unit_indices, 4)
+    assert np.array_equal(offsets, [0, 2, 3, 7, 7])
+    for unit_index in range(4):
+        rows = order[offsets[unit_index] : offsets[unit_index + 1]]
+        assert np.array_equal(rows, np.flatnonzero(unit_indices == unit_index))
+
+
 def test_apply_merges_to_sorting():
 
     times = np.array([0, 0, 10, 20, 300])
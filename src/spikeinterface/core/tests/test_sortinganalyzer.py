@@ -15,6 +15,8 @@ from spikeinterface.core import (
 from spikeinterface.core.sortinganalyzer import (
     register_result_extension,
     AnalyzerExtension,
+    ZarrPerSpikeArray,
+    NpyViewArray,
     _sort_extensions_by_dependency,
 )
 
@@ -169,6 +171,72 @@ def test_SortingAnalyzer_zarr(tmp_path, dataset):
     )
 
 
+def test_SortingAnalyzer_zarr_cache_and_unit_chunks(tmp_path, dataset):
+    recording, sorting = dataset
+
+    folder = tmp_path / "test_SortingAnalyzer_zarr_cache.zarr"
+    sorting_analyzer = create_sorting_analyzer(
+        sorting, recording, format="zarr", folder=folder, sparse=True, bootstrap=False, overwrite=True
+    )
+    sorting_analyzer.compute(["random_spikes", "waveforms", "templates", "spike_amplitudes"])
+
+    # per spike arrays are stored in unit order and arrays per unit are chunked by units
+    extension_group = sorting_analyzer._get_zarr_root(mode="r")["extensions"]
+    assert extension_group["waveforms"]["waveforms"].attrs["unit_order"] == "random_spikes"
+    assert extension_group["spike_amplitudes"]["amplitudes"].attrs["unit_order"] == "spikes"
+    templates_chunks = extension_group["templates"]["average"].chunks
+    assert templates_chunks[1:] == sorting_analyzer.get_extension("templates").get_data().shape[1:]
+
+    cache_folder = tmp_path / "zarr_cache"
+    backend_options = dict(cache_options=dict(cache_folder=cache_folder, max_size="100M"))
+    cached_analyzer = load_sorting_analyzer(folder, backend_options=backend_options)
+    assert any(file.is_file() for file in cache_folder.rglob("*"))
+    for extension_name, data_name in [
+        ("waveforms", "waveforms"),
+        ("templates", "average"),
+        ("spike_amplitudes", "amplitudes"),
+    ]:
+        # original order is restored at load time
+        np.testing.assert_array_equal(
+            cached_analyzer.get_extension(extension_name).data[data_name],
+            sorting_analyzer.get_extension(extension_name).data[data_name],
+        )
+    # the rows of one unit are contiguous and in a few chunks
+    random_spikes_ext = cached_analyzer.get_extension("random_spikes")
+    unit_offsets = random_spikes_ext.data["random_spikes_unit_offsets"]
+    stored_waveforms = extension_group["waveforms"]["waveforms"]
+    np.testing.assert_array_equal(
+        stored_waveforms[unit_offsets[1] : unit_offsets[2]],
+        cached_analyzer.get_extension("waveforms").get_waveforms_one_unit(sorting.unit_ids[1], force_dense=False),
+    )
+
+    # per spike arrays are loaded lazily
+    amplitudes_ext = cached_analyzer.get_extension("spike_amplitudes")
+    assert isinstance(amplitudes_ext.data["amplitudes"], ZarrPerSpikeArray)
+    assert isinstance(amplitudes_ext.get_data(), np.ndarray)
+    amplitudes_by_unit = cached_analyzer.get_extension("spike_amplitudes").get_data(outputs="by_unit")
+    expected_by_unit = sorting_analyzer.get_extension("spike_amplitudes").get_data(outputs="by_unit")
+    for unit_id in sorting.unit_ids:
+        np.testing.assert_array_equal(amplitudes_by_unit[0][unit_id], expected_by_unit[0][unit_id])
+
+    # writing through the cache
+    cached_analyzer.compute("noise_levels")
+    cached_analyzer = load_sorting_analyzer(folder, backend_options=backend_options)
+    assert cached_analyzer.has_extension("noise_levels")
+
+    # the unit order layout is versioned, a more recent layout is not read
+    import zarr
+
+    assert extension_group["spike_amplitudes"].attrs["format_version"] == 2
+    zarr_root = zarr.open(str(folder), mode="r+")
+    zarr_root["extensions"]["spike_amplitudes"].attrs["format_version"] = 3
+    zarr.consolidate_metadata(zarr_root.store)
+    with pytest.warns(UserWarning, match="more recent format"):
+        sorting_analyzer = load_sorting_analyzer(folder)
+    assert sorting_analyzer.get_extension("spike_amplitudes") is None
+    assert sorting_analyzer.get_extension("waveforms") is not None
+
+
 def test_load_without_runtime_info(tmp_path, dataset):
     import zarr
 
@@ -205,6 +273,225 @@ def test_load_without_runtime_info(tmp_path, dataset):
         sorting_analyzer = load_sorting_analyzer(folder, format="auto")
 
 
+def test_SortingAnalyzer_view(tmp_path, dataset):
+    recording, sorting = dataset
+
+    folder = tmp_path / "test_SortingAnalyzer_view_parent"
+    sorting_analyzer = create_sorting_analyzer(
+        sorting, recording, format="binary_folder", folder=folder, sparse=True, sparsity=None
+    )
+    sorting_analyzer.compute(["random_spikes", "waveforms", "templates", "spike_amplitudes"])
+
+    with pytest.raises(AssertionError):
+        sorting_analyzer.select_units(unit_ids=[1], format="memory", view=True)
+
+    keep_unit_ids = sorting_analyzer.unit_ids[::2]
+    view_folder = tmp_path / "test_SortingAnalyzer_view"
+    # the per spike data of a view are not selected in memory, only the links are saved
+    # and the rows of the parent are not read when the view is created or loaded
+    spike_amplitudes_class = type(sorting_analyzer.get_extension("spike_amplitudes"))
+    num_reads = [0]
+
+    def counting_open(self):
+        num_reads[0] += 1
+        return np.load(self._source_file, mmap_mode="r")
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(spike_amplitudes_class, "_select_extension_data", None)
+        monkeypatch.setattr(NpyViewArray, "_read_all", None)
+        monkeypatch.setattr(NpyViewArray, "_read_spikes", None)
+        view_analyzer = sorting_analyzer.select_units(
+            unit_ids=keep_unit_ids, format="binary_folder", folder=view_folder, view=True
+        )
+        loaded_view_analyzer = load_sorting_analyzer(view_folder)
+    for analyzer in (view_analyzer, loaded_view_analyzer):
+        assert isinstance(analyzer.get_extension("waveforms").data["waveforms"], NpyViewArray)
+        assert isinstance(analyzer.get_extension("spike_amplitudes").data["amplitudes"], NpyViewArray)
+    # the rows are read at access
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(NpyViewArray, "_open", counting_open)
+        unit_id = keep_unit_ids[0]
+        loaded_view_analyzer.get_extension("waveforms").get_waveforms_one_unit(unit_id)
+        assert num_reads[0] == 1
+    assert view_analyzer.is_view()
+    for extension_name, data_name in [("waveforms", "waveforms"), ("spike_amplitudes", "amplitudes")]:
+        extension_folder = view_folder / "extensions" / extension_name
+        assert not (extension_folder / f"{data_name}.npy").exists()
+        assert (extension_folder / "view" / "links.json").exists()
+
+    # a view of a view resolves rows in the original folder
+    view_folder2 = tmp_path / "test_SortingAnalyzer_view2"
+    view_analyzer2 = view_analyzer.remove_units(
+        remove_unit_ids=keep_unit_ids[:1], format="binary_folder", folder=view_folder2, view=True
+    )
+
+    copy_analyzer = sorting_analyzer.select_units(unit_ids=keep_unit_ids[1:], format="memory")
+    for analyzer in (view_analyzer2, load_sorting_analyzer(view_folder2)):
+        assert analyzer.is_view()
+        for unit_id in analyzer.unit_ids:
+            wfs = analyzer.get_extension("waveforms").get_waveforms_one_unit(unit_id)
+            expected_wfs = copy_analyzer.get_extension("waveforms").get_waveforms_one_unit(unit_id)
+            assert np.array_equal(wfs, expected_wfs)
+        assert np.array_equal(
+            analyzer.get_extension("spike_amplitudes").get_data(),
+            copy_analyzer.get_extension("spike_amplitudes").get_data(),
+        )
+
+    view_analyzer2 = load_sorting_analyzer(view_folder2)
+    view_analyzer2.materialize()
+    assert not view_analyzer2.is_view()
+    assert (view_folder2 / "extensions" / "waveforms" / "waveforms.npy").exists()
+    assert not (view_folder2 / "extensions" / "waveforms" / "view").exists()
+
+    # a view is not loaded anymore when the parent has been recomputed
+    stale_folder = tmp_path / "test_SortingAnalyzer_view_stale"
+    sorting_analyzer.select_units(unit_ids=keep_unit_ids, format="binary_folder", folder=stale_folder, view=True)
+    sorting_analyzer.compute("spike_amplitudes", peak_sign="pos")
+    with pytest.warns(UserWarning, match="recomputed"):
+        stale_analyzer = load_sorting_analyzer(stale_folder)
+    assert stale_analyzer.get_extension("spike_amplitudes") is None
+    assert stale_analyzer.get_extension("waveforms") is not None
+
+    del view_analyzer, view_analyzer2
+    shutil.rmtree(view_folder)
+    shutil.rmtree(folder)
+    materialized_analyzer = load_sorting_analyzer(view_folder2)
+    assert not materialized_analyzer.is_view()
+    assert np.array_equal(
+        materialized_analyzer.get_extension("waveforms").get_data(),
+        copy_analyzer.get_extension("waveforms").get_data(),
+    )
+
+
+def test_create_sorting_analyzer_bootstrap(tmp_path, dataset):
+    recording, sorting = dataset
+
+    # default : random_spikes + noise_levels + templates in the same read than the sparsity
+    sorting_analyzer = create_sorting_analyzer(sorting, recording, format="memory", sparse=True)
+    assert sorting_analyzer.sparsity is not None
+    for extension_name in ("random_spikes", "noise_levels", "templates"):
+        assert sorting_analyzer.has_extension(extension_name)
+    templates = sorting_analyzer.get_extension("templates").get_data(operator="average")
+    assert templates.shape == (sorting.unit_ids.size, 48, recording.get_num_channels())
+    noise_levels = sorting_analyzer.get_extension("noise_levels").get_data()
+    assert np.allclose(noise_levels, 5.0, rtol=0.2)
+
+    # same templates than the standard computation with the same random spikes
+    other_templates = sorting_analyzer.compute("templates", save=False).get_data(operator="average")
+    assert np.allclose(templates, other_templates, atol=1e-4)
+
+    # no bootstrap
+    sorting_analyzer = create_sorting_analyzer(sorting, recording, format="memory", sparse=True, bootstrap=False)
+    assert not sorting_analyzer.has_extension("random_spikes")
+
+    # with waveforms and a larger window for the sparsity
+    bootstrap = dict(random_spikes=dict(seed=2205), waveforms=dict(ms_before=1.5), templates=dict())
+    for format in ("memory", "binary_folder", "zarr"):
+        folder = tmp_path / f"bootstrap_{format}" if format != "memory" else None
+        sorting_analyzer = create_sorting_analyzer(
+            sorting, recording, format=format, folder=folder, sparse=True, bootstrap=bootstrap, ms_after=3.0
+        )
+        assert not sorting_analyzer.has_extension("noise_levels")
+        waveforms = sorting_analyzer.get_extension("waveforms").get_data()
+        assert sorting_analyzer.get_extension("templates").params["ms_before"] == 1.5
+
+        reference_waveforms = sorting_analyzer.compute("waveforms", ms_before=1.5, save=False).get_data()
+        assert np.array_equal(waveforms, reference_waveforms)
+
+        if folder is not None:
+            sorting_analyzer = load_sorting_analyzer(sorting_analyzer.folder)
+            assert np.array_equal(sorting_analyzer.get_extension("waveforms").get_data(), reference_waveforms)
+
+    # the temporary folder is removed
+    assert len(list(tmp_path.glob("si_bootstrap_*"))) == 0
+
+
+def test_create_sorting_analyzer_bootstrap_same_as_no_bootstrap(dataset):
+    recording, sorting = dataset
+    # an int16 recording with a different scaling for each channel
+    recording = recording.astype("int16")
+    num_channels = recording.get_num_channels()
+    recording.set_channel_gains(np.linspace(0.5, 2.0, num_channels))
+    recording.set_channel_offsets(np.linspace(-10.0, 10.0, num_channels))
+
+    for sparsity_kwargs in [
+        dict(method="radius", radius_um=50.0),
+        dict(method="best_channels", num_channels=3),
+        dict(method="snr", threshold=3.0, num_spikes_for_sparsity=20),
+        dict(method="amplitude", threshold=20.0, num_spikes_for_sparsity=50),
+    ]:
+        sparsity = create_sorting_analyzer(sorting, recording, bootstrap=False, **sparsity_kwargs).sparsity
+        for bootstrap in (True, dict(random_spikes=dict(), waveforms=dict(), templates=dict())):
+            bootstrap_sparsity = create_sorting_analyzer(
+                sorting, recording, bootstrap=bootstrap, **sparsity_kwargs
+            ).sparsity
+            assert np.array_equal(bootstrap_sparsity.mask, sparsity.mask)
+
+    # the noise levels are the same as compute_noise_levels() with the same params
+    noise_params = dict(method="std", random_slices_kwargs=dict(seed=2205, num_chunks_per_segment=10))
+    bootstrap = dict(random_spikes=dict(), noise_levels=noise_params)
+    sorting_analyzer = create_sorting_analyzer(sorting, recording, bootstrap=bootstrap)
+    noise_levels_ext = sorting_analyzer.get_extension("noise_levels")
+    assert noise_levels_ext.params == noise_params
+    other_noise_levels = sorting_analyzer.compute("noise_levels", save=False, force_recompute=True, **noise_params)
+    assert np.array_equal(noise_levels_ext.get_data(), other_noise_levels.get_data())
+
+
+def test_ZarrPerSpikeArray():
+    import zarr
+
+    class CountingStore(zarr.storage.KVStore):
+        def __init__(self):
+            super().__init__(dict())
+            self.num_chunk_reads = 0
+
+        def __getitem__(self, key):
+            if not key.startswith("."):
+                self.num_chunk_reads += 1
+            return super().__getitem__(key)
+
+    rng = np.random.default_rng(seed=2205)
+    data = rng.normal(size=(100, 3, 2))
+    # stored in unit order : 10 units of 10 spikes
+    unit_indices = rng.permutation(np.repeat(np.arange(10), 10))
+    order = np.argsort(unit_indices, kind="stable")
+    store = CountingStore()
+    zarr_array = zarr.create(shape=data.shape, chunks=(10, 3, 2), dtype=data.dtype, store=store)
+    zarr_array[:] = data[order]
+    lazy_data = ZarrPerSpikeArray(zarr_array, order=order)
+
+    assert lazy_data.shape == data.shape
+    assert lazy_data.dtype == data.dtype
+    assert len(lazy_data) == 100
+    np.testing.assert_array_equal(np.asarray(lazy_data), data)
+    np.testing.assert_array_equal(lazy_data.copy(), data)
+    for item in [
+        5,
+        -1,
+        slice(10, 20),
+        slice(None, None, -3),
+        np.array([3, 3, 50, 1]),
+        data[:, 0, 0] > 0,
+        (np.array([4, 2]), slice(None), 1),
+        (slice(None), 0),
+        (Ellipsis, 1),
+    ]:
+        np.testing.assert_array_equal(lazy_data[item], data[item])
+
+    # only the chunk of one unit is read
+    store.num_chunk_reads = 0
+    spike_indices = np.flatnonzero(unit_indices == 3)
+    np.testing.assert_array_equal(lazy_data[spike_indices], data[spike_indices])
+    assert store.num_chunk_reads == 1
+
+    # spike order on disk and structured arrays
+    locations = np.zeros(100, dtype=[("x", "float64"), ("y", "float64")])
+    locations["x"] = data[:, 0, 0]
+    lazy_locations = ZarrPerSpikeArray(zarr.array(locations, chunks=10))
+    np.testing.assert_array_equal(lazy_locations["x"], locations["x"])
+    np.testing.assert_array_equal(lazy_locations[spike_indices], locations[spike_indices])
+
+
 def test_SortingAnalyzer_tmp_recording(dataset):
     recording, sorting = dataset
     recording_cached = recording.save(mode="memory")
@@ -224,20 +224,20 @@ def test_estimate_sparsity():
         n_jobs=1,
     )
 
-    # snr: fails without noise levels
-    with pytest.raises(AssertionError):
-        sparsity = estimate_sparsity(
-            sorting,
-            recording,
-            num_spikes_for_sparsity=50,
-            ms_before=1.0,
-            ms_after=2.0,
-            method="snr",
-            threshold=5,
-            chunk_duration="1s",
-            progress_bar=True,
-            n_jobs=1,
-        )
+    # snr: without noise levels, they are estimated in the same read than templates
+    sparsity = estimate_sparsity(
+        sorting,
+        recording,
+        num_spikes_for_sparsity=50,
+        ms_before=1.0,
+        ms_after=2.0,
+        method="snr",
+        threshold=5,
+        chunk_duration="1s",
+        progress_bar=True,
+        n_jobs=2,
+    )
+    assert sparsity.mask.shape == (num_units, recording.get_num_channels())
     # snr: works with noise levels
     noise_levels = get_noise_levels(recording)
     sparsity = estimate_sparsity(
@@ -12,6 +12,8 @@ from spikeinterface.core.waveform_tools import (
     split_waveforms_by_units,
     estimate_templates,
     estimate_templates_with_accumulator,
+    compress_waveforms_by_unit,
+    decompress_waveforms_one_unit,
 )
 
 
@@ -224,6 +226,31 @@ def test_estimate_templates():
     # plt.show()
 
 
+def test_compress_waveforms_integer_dtypes():
+    from spikeinterface.core.zarrextractors import get_default_zarr_compressor
+
+    compressor = get_default_zarr_compressor()
+    rng = np.random.default_rng(seed=2205)
+    num_units = 3
+    spikes = np.zeros(60, dtype=[("unit_index", "int64")])
+    spikes["unit_index"] = rng.integers(0, num_units, spikes.size)
+
+    # integer dtypes of 8 and 16 bits are stored without loss, including the full uint16 range
+    for dtype in ("int8", "uint8", "int16", "uint16"):
+        info = np.iinfo(dtype)
+        waveforms = rng.integers(info.min, info.max, size=(spikes.size, 20, 4), endpoint=True).astype(dtype)
+        waveforms[0, 0, 0] = info.max
+        waveforms[0, 0, 1] = info.min
+        buffer, chunk_offsets, scales = compress_waveforms_by_unit(waveforms, spikes, num_units, compressor=compressor)
+        for unit_index in range(num_units):
+            rows = np.flatnonzero(spikes["unit_index"] == unit_index)
+            wfs = decompress_waveforms_one_unit(
+                buffer, chunk_offsets, unit_index, rows.size, 20, 4, scales[rows], compressor, dtype
+            )
+            assert wfs.dtype == np.dtype(dtype)
+            assert np.array_equal(wfs, waveforms[rows])
+
+
 if __name__ == "__main__":
     test_waveform_tools()
     test_estimate_templates_with_accumulator()
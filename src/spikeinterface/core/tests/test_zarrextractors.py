@@ -1,6 +1,8 @@
+import os
 import pytest
 from pathlib import Path
 
+import numpy as np
 import zarr
 
 from spikeinterface.core import (
@@ -10,7 +12,12 @@ from spikeinterface.core import (
     generate_sorting,
     load_extractor,
 )
-from spikeinterface.core.zarrextractors import add_sorting_to_zarr_group, get_default_zarr_compressor
+from spikeinterface.core.zarrextractors import (
+    add_sorting_to_zarr_group,
+    get_default_zarr_compressor,
+    get_zarr_store,
+    ZarrDiskCacheStore,
+)
 
 
 def test_zarr_compression_options(tmp_path):
@@ -79,3 +86,153 @@ if __name__ == "__main__":
     tmp_path = Path("tmp")
     test_zarr_compression_options(tmp_path)
     test_ZarrSortingExtractor(tmp_path)
+
+
+def test_ZarrDiskCacheStore(tmp_path):
+    folder = tmp_path / "cached.zarr"
+    root = zarr.open(str(folder), mode="w")
+    data = np.arange(1000, dtype="float64").reshape(100, 10)
+    root.create_dataset("data", data=data, chunks=(10, 10), compressor=None)
+    zarr.consolidate_metadata(root.store)
+
+    cache_folder = tmp_path / "cache"
+    store = ZarrDiskCacheStore(zarr.DirectoryStore(str(folder)), cache_folder, max_size="5k")
+    cached_root = zarr.open_consolidated(store, mode="r")
+    np.testing.assert_array_equal(cached_root["data"][:20], data[:20])
+    assert store.misses > 0
+    misses = store.misses
+    np.testing.assert_array_equal(cached_root["data"][:20], data[:20])
+    assert store.misses == misses
+
+    # 10 chunks of 800 bytes do not fit in 5k : least recently used are removed
+    np.testing.assert_array_equal(cached_root["data"][:], data)
+    cache_size = sum(file.stat().st_size for file in cache_folder.rglob("*") if file.is_file())
+    assert cache_size <= 5000
+
+    # the cache is persistent
+    store2 = ZarrDiskCacheStore(zarr.DirectoryStore(str(folder)), cache_folder, max_size="5k")
+    np.testing.assert_array_equal(zarr.open_consolidated(store2, mode="r")["data"][90:], data[90:])
+    # the last chunk is read from the cache
+    assert store2.hits >= 1
+
+    # a write invalidates the cached key
+    writable_root = zarr.open(store2, mode="r+")
+    writable_root["data"][90:] = -1
+    np.testing.assert_array_equal(zarr.open_consolidated(store2, mode="r")["data"][90:], -1)
+
+    # one sub folder per zarr folder
+    store3 = get_zarr_store(folder, cache_options=dict(cache_folder=cache_folder, max_size="1M"))
+    assert isinstance(store3, ZarrDiskCacheStore)
+    assert store3.cache_folder.parent == cache_folder
+
+
+class MockEtagStore(zarr.storage.KVStore):
+    # in memory store exposing the fsspec api used to get the etag of the keys, counting the requests
+    def __init__(self):
+        super().__init__(dict())
+        self.fs = self
+        self.map = self
+        self.root = "bucket/analyzer.zarr"
+        self.etags = dict()
+        self.num_requests = 0
+
+    def __getitem__(self, key):
+        self.num_requests += 1
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.etags[key] = self.etags.get(key, 0) + 1
+
+    def _key_to_str(self, key):
+        return f"{self.root}/{key}"
+
+    def _normalize_key(self, key):
+        return key
+
+    def info(self, path):
+        self.num_requests += 1
+        key = path[len(self.root) + 1 :]
+        if key not in self.etags:
+            raise FileNotFoundError(path)
+        return dict(name=path, size=len(self._mutable_mapping[key]), ETag=str(self.etags[key]))
+
+    def find(self, path, detail=False):
+        self.num_requests += 1
+        return {
+            f"{self.root}/{key}": dict(size=len(self._mutable_mapping[key]), ETag=str(etag))
+            for key, etag in self.etags.items()
+        }
+
+
+def test_ZarrDiskCacheStore_invalidation(tmp_path):
+    data = np.arange(1000, dtype="float64").reshape(100, 10)
+
+    # a rewrite done outside of the cache (for instance by another process) is detected with the etag
+    remote_store = MockEtagStore()
+    zarr.open(remote_store, mode="w").create_dataset("data", data=data, chunks=(10, 10), compressor=None)
+    cache_folder = tmp_path / "cache_etag"
+    store = ZarrDiskCacheStore(remote_store, cache_folder)
+    np.testing.assert_array_equal(zarr.open(store, mode="r")["data"][:], data)
+    misses = store.misses
+    np.testing.assert_array_equal(zarr.open(store, mode="r")["data"][:], data)
+    assert store.misses == misses
+
+    zarr.open(remote_store, mode="r+")["data"][:10] = -1
+    # the versions are listed again after version_ttl or on demand
+    store.refresh_versions()
+    cached_data = zarr.open(store, mode="r")["data"][:]
+    np.testing.assert_array_equal(cached_data[:10], -1)
+    np.testing.assert_array_equal(cached_data[10:], data[10:])
+    # only the rewritten chunk is downloaded again
+    assert store.misses == misses + 1
+    # the copy of the previous version is removed
+    assert len([file for file in cache_folder.rglob("data/0.0@*")]) == 1
+
+    # a new session does not re-use a stale copy
+    zarr.open(remote_store, mode="r+")["data"][:10] = -2
+    store2 = ZarrDiskCacheStore(remote_store, cache_folder)
+    np.testing.assert_array_equal(zarr.open(store2, mode="r")["data"][:10], -2)
+
+    # same with the modification time of a local folder
+    folder = tmp_path / "rewritten.zarr"
+    zarr.open(str(folder), mode="w").create_dataset("data", data=data, chunks=(10, 10), compressor=None)
+    store3 = ZarrDiskCacheStore(zarr.DirectoryStore(str(folder)), tmp_path / "cache_folder")
+    np.testing.assert_array_equal(zarr.open(store3, mode="r")["data"][:], data)
+    zarr.open(str(folder), mode="r+")["data"][:10] = -1
+    chunk_file = folder / "data" / "0.0"
+    os.utime(chunk_file, ns=(chunk_file.stat().st_atime_ns, chunk_file.stat().st_mtime_ns + 10**9))
+    np.testing.assert_array_equal(zarr.open(store3, mode="r")["data"][:10], -1)
+
+    # a store without content version is not cached
+    store4 = ZarrDiskCacheStore(zarr.MemoryStore(), tmp_path / "cache_memory")
+    zarr.open(store4, mode="w").create_dataset("data", data=data, chunks=(10, 10), compressor=None)
+    np.testing.assert_array_equal(zarr.open(store4, mode="r")["data"][:], data)
+    assert store4.misses == 0
+    assert len([file for file in (tmp_path / "cache_memory").rglob("*") if file.is_file()]) == 0
+
+
+def test_ZarrDiskCacheStore_remote_requests(tmp_path):
+    data = np.arange(1000, dtype="float64").reshape(100, 10)
+    remote_store = MockEtagStore()
+    root = zarr.open(remote_store, mode="w")
+    root.create_dataset("data", data=data, chunks=(10, 10), compressor=None)
+    zarr.consolidate_metadata(remote_store)
+
+    store = ZarrDiskCacheStore(remote_store, tmp_path / "cache_requests", version_ttl=None)
+    remote_store.num_requests = 0
+    np.testing.assert_array_equal(zarr.open_consolidated(store, mode="r")["data"][:], data)
+    # one listing and one download per key
+    assert remote_store.num_requests <= 1 + 10 + 1
+
+    # cached keys are read without any request to the remote store
+    remote_store.num_requests = 0
+    for _ in range(3):
+        np.testing.assert_array_equal(zarr.open_consolidated(store, mode="r")["data"][:], data)
+    assert remote_store.num_requests == 0
+
+    # with a ttl of 0 the versions are listed again at each read, but the chunks are not downloaded again
+    store = ZarrDiskCacheStore(remote_store, tmp_path / "cache_requests", version_ttl=0.0)
+    remote_store.num_requests = 0
+    np.testing.assert_array_equal(zarr.open_consolidated(store, mode="r")["data"][:], data)
+    assert store.misses == 0
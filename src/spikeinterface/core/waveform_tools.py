@@ -679,6 +679,155 @@ def split_waveforms_by_units(unit_ids, spikes, all_waveforms, sparsity_mask=None
     return waveforms_by_units
 
 
+def compress_waveforms_by_unit(
+    all_waveforms, spikes, num_units, sparsity_mask=None, scale_mode="spike", compressor=None
+):
+    """
+    Quantize a single buffer of waveforms to int16 and compress it unit by unit.
+
+    Each unit is stored as one independent compressed chunk, so that the waveforms of one unit can be
+    decoded without touching the other units (see `decompress_waveforms_one_unit()`).
+    In case of sparsity, only the sparse channels of each unit are stored (the zero padding of the single
+    buffer is dropped).
+
+    Parameters
+    ----------
+    all_waveforms : numpy array
+        Single buffer containing all waveforms (num_spikes, num_samples, num_channels), can be a memmap
+    spikes : numpy array
+        The spike vector corresponding to all_waveforms
+    num_units : int
+        Number of units
+    sparsity_mask : None or numpy array, default: None
+        Optionally the boolean sparsity mask (num_units, num_channels)
+    scale_mode : "spike" | "unit", default: "spike"
+        Quantization scale is estimated for each spike or for each unit
+    compressor : numcodecs.abc.Codec | None, default: None
+        The lossless compressor applied to every unit chunk. If None, `get_default_zarr_compressor()` is used.
+
+    Returns
+    -------
+    buffer : numpy array
+        uint8 buffer with all compressed chunks concatenated
+    chunk_offsets : numpy array
+        int64 vector of size num_units + 1, chunk of unit i is buffer[chunk_offsets[i]:chunk_offsets[i + 1]]
+    scales : numpy array
+        float32 quantization scales with size num_spikes (scale_mode="spike") or num_units (scale_mode="unit")
+    """
+    from .sorting_tools import unit_indices_to_csr_index
+
+    assert scale_mode in ("spike", "unit"), "scale_mode must be 'spike' or 'unit'"
+    if compressor is None:
+        from .zarrextractors import get_default_zarr_compressor
+
+        compressor = get_default_zarr_compressor()
+
+    # integer buffers that fit int16 (uint16 with an offset) are stored losslessly
+    lossless = _is_int16_lossless(all_waveforms.dtype)
+
+    if scale_mode == "spike":
+        scales = np.ones(spikes.size, dtype="float32")
+    else:
+        scales = np.ones(num_units, dtype="float32")
+
+    order, unit_offsets = unit_indices_to_csr_index(spikes["unit_index"], num_units)
+
+    chunks = []
+    chunk_offsets = np.zeros(num_units + 1, dtype="int64")
+    for unit_index in range(num_units):
+        spike_inds = order[unit_offsets[unit_index] : unit_offsets[unit_index + 1]]
+        wfs = all_waveforms[spike_inds, :, :]
+        if sparsity_mask is not None:
+            num_chans = np.sum(sparsity_mask[unit_index, :])
+            wfs = wfs[:, :, :num_chans]
+
+        if lossless:
+            quantized = (wfs.astype("int32") - _get_int16_offset(wfs.dtype)).astype("int16")
+        else:
+            if scale_mode == "spike":
+                unit_scales = np.max(np.abs(wfs), axis=(1, 2)) / np.iinfo("int16").max if wfs.size > 0 else 0.0
+                unit_scales = np.where(unit_scales > 0, unit_scales, 1.0).astype("float32")
+                scales[spike_inds] = unit_scales
+                quantized = np.round(wfs / unit_scales[:, np.newaxis, np.newaxis]).astype("int16")
+            else:
+                unit_scale = np.max(np.abs(wfs)) / np.iinfo("int16").max if wfs.size > 0 else 0.0
+                unit_scale = np.float32(unit_scale if unit_scale > 0 else 1.0)
+                scales[unit_index] = unit_scale
+                quantized = np.round(wfs / unit_scale).astype("int16")
+
+        chunk = np.frombuffer(compressor.encode(np.ascontiguousarray(quantized)), dtype="uint8")
+        chunks.append(chunk)
+        chunk_offsets[unit_index + 1] = chunk_offsets[unit_index] + chunk.size
+
+    if len(chunks) > 0:
+        buffer = np.concatenate(chunks)
+    else:
+        buffer = np.zeros(0, dtype="uint8")
+
+    return buffer, chunk_offsets, scales
+
+
+def _is_int16_lossless(dtype):
+    # int8, uint8 and int16 fit int16, uint16 fits int16 with an offset (see _get_int16_offset())
+    return np.dtype(dtype).str[1:] in ("i1", "u1", "i2", "u2")
+
+
+def _get_int16_offset(dtype):
+    # uint16 is shifted to the int16 range
+    return 2**15 if np.dtype(dtype) == np.dtype("uint16") else 0
+
+
+def decompress_waveforms_one_unit(
+    buffer, chunk_offsets, unit_index, num_spikes, num_samples, num_channels, scales, compressor, dtype
+):
+    """
+    Decode the waveforms of one unit compressed by `compress_waveforms_by_unit()`.
+
+    Only the chunk of this unit is read from the buffer.
+
+    Parameters
+    ----------
+    buffer : numpy array
+        The uint8 buffer of compressed chunks
+    chunk_offsets : numpy array
+        The chunk offsets (num_units + 1)
+    unit_index : int
+        The unit index
+    num_spikes : int
+        Number of waveforms of this unit
+    num_samples : int
+        Number of samples per waveform
+    num_channels : int
+        Number of channels stored for this unit
+    scales : float | numpy array
+        The quantization scale of the unit or the vector of scales of each spike of the unit
+    compressor : numcodecs.abc.Codec
+        The compressor used for encoding
+    dtype : numpy.dtype
+        The dtype of the output
+
+    Returns
+    -------
+    waveforms : numpy array
+        The waveforms (num_spikes, num_samples, num_channels)
+    """
+    dtype = np.dtype(dtype)
+    shape = (num_spikes, num_samples, num_channels)
+    if num_spikes == 0:
+        return np.zeros(shape, dtype=dtype)
+
+    chunk = buffer[chunk_offsets[unit_index] : chunk_offsets[unit_index + 1]]
+    quantized = np.frombuffer(compressor.decode(np.asarray(chunk)), dtype="int16").reshape(shape)
+
+    if _is_int16_lossless(dtype):
+        return (quantized.astype("int32") + _get_int16_offset(dtype)).astype(dtype)
+
+    scales = np.asarray(scales, dtype="float32")
+    if scales.ndim == 1:
+        scales = scales[:, np.newaxis, np.newaxis]
+    return (quantized * scales).astype(dtype)
+
+
 def has_exceeding_spikes(sorting, recording) -> bool:
     """
     Check if the sorting objects has spikes exceeding the recording number of samples, for all segments
@@ -1012,3 +1161,338 @@ def _worker_estimate_templates(segment_index, start_frame, end_frame, worker_ctx
             waveform_accumulator_per_worker[worker_index, unit_index, :, :] += wf
             if waveform_squared_accumulator_per_worker is not None:
                 waveform_squared_accumulator_per_worker[worker_index, unit_index, :, :] += wf**2
+
+
+def estimate_templates_noise_levels_and_waveforms(
+    recording: BaseRecording,
+    spikes: np.ndarray,
+    unit_ids: list | np.ndarray,
+    nbefore: int,
+    nafter: int,
+    return_scaled: bool = True,
+    return_std: bool = False,
+    noise_levels_method: "mad" | "std" | None = "mad",
+    noise_random_slices_kwargs: dict | None = None,
+    waveforms_file_path: str | Path | None = None,
+    waveforms_dtype=None,
+    job_name=None,
+    verbose: bool = False,
+    **job_kwargs,
+) -> dict:
+    """
+    Fused version of `estimate_templates_with_accumulator()`, `get_noise_levels()` and
+    `extract_waveforms_to_single_buffer()` : the recording is read only once, chunk by chunk (and in parallel),
+    and each chunk is used to:
+
+      * accumulate the sum (and squared sum) of the waveforms of the given spikes per unit
+      * estimate the noise levels on the same random slices than `get_noise_levels()`
+      * optionally copy the dense waveforms of the given spikes into a memmap buffer
+
+    This is used to bootstrap a `SortingAnalyzer` (sparsity, noise levels, templates, waveforms)
+    with a single pass over the recording.
+
+    Parameters
+    ----------
+    recording: BaseRecording
+        The recording object
+    spikes: 1d numpy array with several fields
+        Spikes handled as a unique vector.
+        This vector can be obtained with: `spikes = sorting.to_spike_vector()`
+    unit_ids: list ot numpy
+        List of unit_ids
+    nbefore: int
+        Number of samples to cut out before a spike
+    nafter: int
+        Number of samples to cut out after a spike
+    return_scaled: bool, default: True
+        If True, the traces are scaled before averaging, noise estimation and waveforms copy
+    return_std: bool, default: False
+        If True, the standard deviation of the templates is also computed.
+    noise_levels_method: "mad" | "std" | None, default: "mad"
+        The method to estimate noise levels (see `get_noise_levels()`). If None, noise levels are not estimated.
+    noise_random_slices_kwargs: dict | None, default: None
+        Options of `get_random_recording_slices()` for the slices used to estimate the noise levels.
+        The noise levels are the same than `get_noise_levels(recording, method=noise_levels_method,
+        random_slices_kwargs=noise_random_slices_kwargs)` (given a seed). Each slice is read with the chunk
+        of the parallel processing where it starts.
+    waveforms_file_path: str | Path | None, default: None
+        If not None, the dense waveforms are also extracted in a npy memmap file,
+        with shape (num_spikes, nbefore + nafter, num_channels). Spikes near the segment borders are left to 0.
+    waveforms_dtype: numpy.dtype | None, default: None
+        The dtype of the waveforms buffer, by default the recording dtype (or "float32" for an integer recording
+        when return_scaled=True)
+
+    {}
+
+    Returns
+    -------
+    outputs: dict
+        A dict with the keys:
+          * "templates": the average templates with shape (num_units, nbefore + nafter, num_channels)
+          * "templates_std": the standard deviation (only if return_std=True)
+          * "noise_levels": the noise level for each channel (only if noise_levels_method is not None)
+          * "waveforms": the waveforms memmap (only if waveforms_file_path is not None)
+    """
+    from .job_tools import ensure_chunk_size, divide_recording_into_chunks
+    from .recording_tools import get_random_recording_slices
+
+    job_kwargs = fix_job_kwargs(job_kwargs)
+    num_worker = job_kwargs["n_jobs"]
+
+    num_chans = recording.get_num_channels()
+    num_units = len(unit_ids)
+
+    shape = (num_worker, num_units, nbefore + nafter, num_chans)
+    dtype = np.dtype("float32")
+    waveform_accumulator_per_worker, shm = make_shared_array(shape, dtype)
+    shm_name = shm.name
+    if return_std:
+        waveform_squared_accumulator_per_worker, shm_squared = make_shared_array(shape, dtype)
+        shm_squared_name = shm_squared.name
+    else:
+        waveform_squared_accumulator_per_worker = None
+        shm_squared_name = None
+
+    if waveforms_file_path is not None:
+        if waveforms_dtype is None:
+            waveforms_dtype = recording.get_dtype()
+            if return_scaled and np.issubdtype(waveforms_dtype, np.integer):
+                waveforms_dtype = "float32"
+        waveforms_file_path = Path(waveforms_file_path)
+        all_waveforms = np.lib.format.open_memmap(
+            waveforms_file_path,
+            mode="w+",
+            dtype=np.dtype(waveforms_dtype),
+            shape=(spikes.size, nbefore + nafter, num_chans),
+        )
+    else:
+        all_waveforms = None
+
+    chunk_size = ensure_chunk_size(recording, **job_kwargs)
+    recording_slices = divide_recording_into_chunks(recording, chunk_size)
+
+    # segment_index > (start_frames, end_frames, slice indices) of the noise slices, sorted by start frame
+    noise_slices = dict()
+    if noise_levels_method is not None:
+        assert noise_levels_method in ("mad", "std"), "noise_levels_method must be 'mad' or 'std'"
+        if noise_random_slices_kwargs is None:
+            noise_random_slices_kwargs = dict()
+        random_slices = np.array(get_random_recording_slices(recording, **noise_random_slices_kwargs), dtype="int64")
+        for segment_index in range(recording.get_num_segments()):
+            slice_indices = np.flatnonzero(random_slices[:, 0] == segment_index)
+            slice_indices = slice_indices[np.argsort(random_slices[slice_indices, 1], kind="stable")]
+            noise_slices[segment_index] = (
+                random_slices[slice_indices, 1],
+                random_slices[slice_indices, 2],
+                slice_indices,
+            )
+
+    # trick to get the work_index given pid arrays
+    lock = multiprocessing.Lock()
+    array_pid = multiprocessing.Array("i", num_worker)
+    for i in range(num_worker):
+        array_pid[i] = -1
+
+    # slice index > noise levels
+    noise_levels_slices = dict()
+
+    def append_noise_chunk(res):
+        if res is not None:
+            noise_levels_slices.update(res)
+
+    func = _worker_estimate_templates_noise_levels_and_waveforms
+    init_func = _init_worker_estimate_templates_noise_levels_and_waveforms
+
+    init_args = (
+        recording,
+        spikes,
+        shm_name,
+        shm_squared_name,
+        shape,
+        dtype,
+        nbefore,
+        nafter,
+        return_scaled,
+        lock,
+        array_pid,
+        noise_slices,
+        noise_levels_method,
+        None if waveforms_file_path is None else str(waveforms_file_path),
+    )
+
+    if job_name is None:
+        job_name = "estimate_templates_noise_levels_and_waveforms"
+    processor = ChunkRecordingExecutor(
+        recording,
+        func,
+        init_func,
+        init_args,
+        job_name=job_name,
+        verbose=verbose,
+        gather_func=append_noise_chunk,
+        **job_kwargs,
+    )
+    processor.run(recording_slices=recording_slices)
+
+    outputs = dict()
+
+    waveforms_sum = np.sum(waveform_accumulator_per_worker, axis=0)
+    template_means = waveforms_sum.copy()
+    if spikes.size > 0:
+        unit_indices, spike_count = np.unique(spikes["unit_index"], return_counts=True)
+        template_means[unit_indices, :, :] /= spike_count[:, np.newaxis, np.newaxis]
+    else:
+        unit_indices, spike_count = [], []
+    outputs["templates"] = template_means
+
+    if return_std:
+        waveforms_squared_sum = np.sum(waveform_squared_accumulator_per_worker, axis=0)
+        template_stds = np.zeros_like(template_means)
+        for unit_index, count in zip(unit_indices, spike_count):
+            residuals = (
+                waveforms_squared_sum[unit_index] - 2 * template_means[unit_index] * waveforms_sum[unit_index]
+            ) + count * template_means[unit_index] ** 2
+            residuals[residuals < 0] = 0
+            template_stds[unit_index] = np.sqrt(residuals / count)
+        outputs["templates_std"] = template_stds
+        del waveform_squared_accumulator_per_worker
+        shm_squared.unlink()
+        shm_squared.close()
+
+    # important : release the sharedmem
+    del waveform_accumulator_per_worker
+    shm.unlink()
+    shm.close()
+
+    if noise_levels_method is not None:
+        # averaged in the order of the slices like in get_noise_levels()
+        noise_levels_chunks = [noise_levels_slices[i] for i in sorted(noise_levels_slices)]
+        outputs["noise_levels"] = np.mean(np.stack(noise_levels_chunks), axis=0)
+
+    if all_waveforms is not None:
+        outputs["waveforms"] = all_waveforms
+
+    return outputs
+
+
+estimate_templates_noise_levels_and_waveforms.__doc__ = estimate_templates_noise_levels_and_waveforms.__doc__.format(
+    _shared_job_kwargs_doc
+)
+
+
+def _init_worker_estimate_templates_noise_levels_and_waveforms(
+    recording,
+    spikes,
+    shm_name,
+    shm_squared_name,
+    shape,
+    dtype,
+    nbefore,
+    nafter,
+    return_scaled,
+    lock,
+    array_pid,
+    noise_slices,
+    noise_levels_method,
+    waveforms_file_path,
+):
+    worker_ctx = _init_worker_estimate_templates(
+        recording,
+        spikes,
+        shm_name,
+        shm_squared_name,
+        shape,
+        dtype,
+        nbefore,
+        nafter,
+        return_scaled,
+        lock,
+        array_pid,
+    )
+    worker_ctx["noise_slices"] = noise_slices
+    worker_ctx["noise_levels_method"] = noise_levels_method
+    if waveforms_file_path is not None:
+        worker_ctx["all_waveforms"] = np.load(waveforms_file_path, mmap_mode="r+")
+    else:
+        worker_ctx["all_waveforms"] = None
+    return worker_ctx
+
+
+# used by ChunkRecordingExecutor
+def _worker_estimate_templates_noise_levels_and_waveforms(segment_index, start_frame, end_frame, worker_ctx):
+    # recover variables of the worker
+    recording = worker_ctx["recording"]
+    segment_slices = worker_ctx["segment_slices"]
+    spikes = worker_ctx["spikes"]
+    nbefore = worker_ctx["nbefore"]
+    nafter = worker_ctx["nafter"]
+    waveform_accumulator_per_worker = worker_ctx["waveform_accumulator_per_worker"]
+    waveform_squared_accumulator_per_worker = worker_ctx.get("waveform_squared_accumulator_per_worker", None)
+    worker_index = worker_ctx["worker_index"]
+    return_scaled = worker_ctx["return_scaled"]
+    all_waveforms = worker_ctx["all_waveforms"]
+
+    seg_size = recording.get_num_samples(segment_index=segment_index)
+
+    s0, s1 = segment_slices[segment_index]
+    in_seg_spikes = spikes[s0:s1]
+
+    # take only spikes in range [start_frame, end_frame]
+    # the border of segment are protected by nbefore on left an nafter on the right
+    i0, i1 = np.searchsorted(
+        in_seg_spikes["sample_index"], [max(start_frame, nbefore), min(end_frame, seg_size - nafter)]
+    )
+    l0 = i0 + s0
+    l1 = i1 + s0
+
+    # the noise slices starting in this chunk
+    if segment_index in worker_ctx["noise_slices"]:
+        noise_starts, noise_ends, noise_slice_indices = worker_ctx["noise_slices"][segment_index]
+        n0, n1 = np.searchsorted(noise_starts, [start_frame, end_frame])
+    else:
+        n0, n1 = 0, 0
+
+    # the traces span covers the spikes waveforms and the noise slices
+    if l1 > l0:
+        start = spikes[l0]["sample_index"] - nbefore
+        end = spikes[l1 - 1]["sample_index"] + nafter
+    else:
+        start, end = start_frame, start_frame
+    if n1 > n0:
+        start = min(start, noise_starts[n0])
+        end = max(end, np.max(noise_ends[n0:n1]))
+
+    if end <= start:
+        return None
+
+    # load trace in memory
+    traces = recording.get_traces(
+        start_frame=start, end_frame=end, segment_index=segment_index, return_scaled=return_scaled
+    )
+
+    for spike_index in range(l0, l1):
+        sample_index = spikes[spike_index]["sample_index"]
+        unit_index = spikes[spike_index]["unit_index"]
+        wf = traces[sample_index - start - nbefore : sample_index - start + nafter, :]
+
+        waveform_accumulator_per_worker[worker_index, unit_index, :, :] += wf
+        if waveform_squared_accumulator_per_worker is not None:
+            waveform_squared_accumulator_per_worker[worker_index, unit_index, :, :] += wf.astype("float32") ** 2
+        if all_waveforms is not None:
+            all_waveforms[spike_index, :, :] = wf
+
+    if all_waveforms is not None and l1 > l0:
+        all_waveforms.flush()
+
+    if n1 > n0:
+        noise_levels_slices = dict()
+        for i in range(n0, n1):
+            one_chunk = traces[noise_starts[i] - start : noise_ends[i] - start, :]
+            if worker_ctx["noise_levels_method"] == "mad":
+                med = np.median(one_chunk, axis=0, keepdims=True)
+                # hard-coded so that core doesn't depend on scipy
+                noise_levels = np.median(np.abs(one_chunk - med), axis=0) / 0.6744897501960817
+            elif worker_ctx["noise_levels_method"] == "std":
+                noise_levels = np.std(one_chunk, axis=0)
+            noise_levels_slices[int(noise_slice_indices[i])] = noise_levels
+        return noise_levels_slices
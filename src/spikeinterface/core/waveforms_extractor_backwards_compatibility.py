@@ -286,10 +286,11 @@ class MockWaveformExtractor:
             "random_spikes"
         ), "get_sampled_indices() requires the 'random_spikes' extension."
 
-        some_spikes = self.sorting_analyzer.get_extension("random_spikes").get_random_spikes()
-
-        spike_mask = some_spikes["unit_index"] == unit_index
-        wfs = ext.data["waveforms"][spike_mask, :, :]
+        if ext.is_compressed:
+            wfs = ext.get_waveforms_one_unit(unit_id, force_dense=False)
+        else:
+            rows = self.sorting_analyzer.get_extension("random_spikes").get_unit_spike_rows(unit_index=unit_index)
+            wfs = ext.data["waveforms"][rows, :, :]
 
         if sparsity is not None:
             assert (
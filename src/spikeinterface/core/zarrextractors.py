@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import warnings
+import time
 from pathlib import Path
 import numpy as np
 import zarr
@@ -323,6 +324,284 @@ def get_default_zarr_compressor(clevel: int = 5):
     return Blosc(cname="zstd", clevel=clevel, shuffle=Blosc.BITSHUFFLE)
 
 
+class ZarrDiskCacheStore(zarr.storage.Store):
+    """
+    Zarr store wrapper that keeps a local disk copy of every key (chunk or metadata) read from
+    a slow store (for instance a remote S3 or GCS store).
+    When the cache exceeds `max_size`, the least recently used keys are removed.
+
+    Each cached copy is tagged with the content version of the key in the wrapped store (the etag or
+    modification time and size for fsspec stores, the modification time and size for local folders),
+    so a key rewritten by another process (for instance an extension recomputed by another `SortingAnalyzer`)
+    is downloaded again instead of read from a stale copy.
+    For local folders the version is checked on every read. For fsspec stores the versions of all keys are
+    obtained with one listing of the store, which is done again only after `version_ttl` seconds, so reading
+    a cached key does not make any request to the remote store.
+    Keys of stores that can not provide a content version are not cached.
+
+    Writes and deletions are transmitted to the wrapped store and the corresponding keys
+    are removed from the cache.
+
+    The cache is persistent: using the same `cache_folder` later re-uses the keys already downloaded.
+
+    Parameters
+    ----------
+    store : zarr store
+        The store to cache
+    cache_folder : str or Path
+        The local folder of the cache
+    max_size : str | int, default: "1G"
+        The maximum size of the cache in bytes or as a string (e.g. "500M", "2G")
+    version_ttl : float | None, default: 60.0
+        The time in seconds after which the listing of the versions of an fsspec store is refreshed.
+        If None, the versions are listed once (at the first read after the store is opened or after
+        `refresh_versions()`).
+    """
+
+    _version_fields = ("ETag", "etag", "mtime", "LastModified", "last_modified", "updated", "created")
+
+    def __init__(self, store, cache_folder: str | Path, max_size: str | int = "1G", version_ttl: float | None = 60.0):
+        from collections import OrderedDict
+        from .core_tools import convert_string_to_bytes
+
+        self._store = zarr.storage.BaseStore._ensure_store(store)
+        self.cache_folder = Path(cache_folder)
+        self.cache_folder.mkdir(parents=True, exist_ok=True)
+        self.max_size = convert_string_to_bytes(max_size) if isinstance(max_size, str) else int(max_size)
+        self.version_ttl = version_ttl
+        self.hits = self.misses = 0
+
+        # normalized key > version of the keys of an fsspec store, and the time of the listing
+        self._versions = None
+        self._versions_time = None
+
+        # key > (cache file name, size in bytes), the least recently used first
+        self._lru = OrderedDict()
+        self._current_size = 0
+        # re-use the cache of a previous session, with the last modification as usage order
+        files = [file for file in self.cache_folder.rglob("*") if file.is_file()]
+        files = sorted(files, key=lambda file: file.stat().st_mtime)
+        for file in files:
+            entry = file.relative_to(self.cache_folder).as_posix()
+            key, sep, _ = entry.rpartition("@")
+            if sep == "":
+                # not a cache file
+                continue
+            # only the most recent version of a key is kept
+            self._forget(key)
+            self._register(key, entry, file.stat().st_size)
+        self._evict()
+
+    def _is_fsspec_store(self):
+        return hasattr(self._store, "fs") and hasattr(self._store, "map")
+
+    def _info_to_version(self, info):
+        # etag for object stores, modification time otherwise
+        for field in self._version_fields:
+            if info.get(field, None) is not None:
+                return f"{info[field]}-{info.get('size', None)}"
+        return None
+
+    def _list_versions(self):
+        # versions of all the keys of an fsspec store with one listing
+        store = self._store
+        root = store.map.root.rstrip("/")
+        prefix = f"{root}/" if root != "" else ""
+        try:
+            listing = store.fs.find(root, detail=True)
+        except (FileNotFoundError, NotImplementedError):
+            return dict()
+        versions = dict()
+        for path, info in listing.items():
+            if path.startswith(prefix):
+                versions[path[len(prefix) :]] = self._info_to_version(info)
+        return versions
+
+    def refresh_versions(self):
+        """
+        Forget the listed versions of the keys of an fsspec store, the store is listed again at the next read.
+        """
+        self._versions = None
+        self._versions_time = None
+
+    def _get_version(self, key):
+        """
+        Return a string that changes when `key` is rewritten in the wrapped store, or None if the key
+        does not exist or the store can not provide a content version.
+        """
+        store = self._store
+        try:
+            if isinstance(store, zarr.storage.DirectoryStore):
+                stat = (Path(store.path) / store._normalize_key(key)).stat()
+                return f"{stat.st_mtime_ns}-{stat.st_size}"
+            if self._is_fsspec_store():
+                now = time.monotonic()
+                if self._versions is None or self._versions_time is None:
+                    expired = True
+                else:
+                    expired = self.version_ttl is not None and now - self._versions_time > self.version_ttl
+                if expired:
+                    self._versions = self._list_versions()
+                    self._versions_time = now
+                normalized_key = store._normalize_key(key)
+                if normalized_key not in self._versions:
+                    # written since the listing or absent: asked once until the next listing
+                    try:
+                        info = store.fs.info(store.map._key_to_str(normalized_key))
+                        self._versions[normalized_key] = self._info_to_version(info)
+                    except (FileNotFoundError, KeyError):
+                        self._versions[normalized_key] = None
+                return self._versions[normalized_key]
+        except (FileNotFoundError, KeyError):
+            pass
+        return None
+
+    def _forget_version(self, key):
+        # the version of a key written or deleted through this store is asked again at the next read
+        if self._versions is not None:
+            self._versions.pop(self._store._normalize_key(key), None)
+
+    def _get_entry(self, key, version):
+        import hashlib
+
+        version_hash = hashlib.md5(version.encode("utf8")).hexdigest()[:16]
+        return f"{key}@{version_hash}"
+
+    def _register(self, key, entry, size):
+        self._lru[key] = (entry, size)
+        self._current_size += size
+
+    def _forget(self, key):
+        entry, size = self._lru.pop(key, (None, None))
+        if entry is not None:
+            self._current_size -= size
+            (self.cache_folder / entry).unlink(missing_ok=True)
+
+    def _evict(self):
+        while self._current_size > self.max_size and len(self._lru) > 0:
+            key = next(iter(self._lru))
+            self._forget(key)
+
+    def __getitem__(self, key):
+        version = self._get_version(key)
+        if version is None:
+            # the cached copy could not be validated
+            return self._store[key]
+
+        entry = self._get_entry(key, version)
+        cache_path = self.cache_folder / entry
+        if cache_path.is_file():
+            # the file can also have been written by another instance on the same folder
+            value = cache_path.read_bytes()
+            if self._lru.get(key, (None, None))[0] == entry:
+                self._lru.move_to_end(key)
+            else:
+                self._forget(key)
+                self._register(key, entry, len(value))
+            self.hits += 1
+            return value
+
+        value = self._store[key]
+        self.misses += 1
+        # remove the copy of a previous version
+        self._forget(key)
+        value_bytes = bytes(zarr.util.ensure_bytes(value))
+        if len(value_bytes) <= self.max_size:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            cache_path.write_bytes(value_bytes)
+            self._register(key, entry, len(value_bytes))
+            self._evict()
+        return value
+
+    def __setitem__(self, key, value):
+        self._store[key] = value
+        self._forget(key)
+        self._forget_version(key)
+
+    def __delitem__(self, key):
+        del self._store[key]
+        self._forget(key)
+        self._forget_version(key)
+
+    def __contains__(self, key):
+        return key in self._store
+
+    def __iter__(self):
+        return iter(self._store)
+
+    def __len__(self):
+        return len(self._store)
+
+    def keys(self):
+        return self._store.keys()
+
+    def listdir(self, path=""):
+        return zarr.storage.listdir(self._store, path)
+
+    def getsize(self, path=None):
+        return zarr.storage.getsize(self._store, path)
+
+    def rmdir(self, path=""):
+        zarr.storage.rmdir(self._store, path)
+        prefix = zarr.util.normalize_storage_path(path)
+        for key in list(self._lru.keys()):
+            if prefix == "" or key.startswith(prefix + "/"):
+                self._forget(key)
+        self.refresh_versions()
+
+    def clear(self):
+        """
+        Remove all keys from the cache (the wrapped store is not modified).
+        """
+        for key in list(self._lru.keys()):
+            self._forget(key)
+
+    def close(self):
+        self._store.close()
+
+
+def get_zarr_store(folder_path: str | Path, mode: str = "r", storage_options: dict | None = None, cache_options=None):
+    """
+    Get the zarr store of a local or remote folder, optionally with a local disk cache.
+
+    Parameters
+    ----------
+    folder_path : str or Path
+        The zarr folder, local or remote (s3://, gcs://, ...)
+    mode : str, default: "r"
+        The mode to open the store
+    storage_options : dict | None, default: None
+        The fsspec storage options for remote folders
+    cache_options : dict | None, default: None
+        If not None, the store is wrapped in a `ZarrDiskCacheStore`. It can contain:
+          * cache_folder: the root folder of the cache (default in the global temporary folder).
+            Each zarr folder has its own sub folder.
+          * max_size: the maximum size of the cache of this zarr folder (default: "1G")
+          * version_ttl: the time in seconds after which the versions of the remote keys are listed again
+            (default: 60.0)
+
+    Returns
+    -------
+    store : zarr store
+        The store
+    """
+    import hashlib
+
+    storage_options = storage_options if storage_options else None
+    store = zarr.storage.normalize_store_arg(str(folder_path), storage_options=storage_options, mode=mode)
+    if cache_options is not None:
+        cache_options = cache_options.copy()
+        cache_folder = cache_options.pop("cache_folder", None)
+        if cache_folder is None:
+            from .globals import get_global_tmp_folder
+
+            cache_folder = get_global_tmp_folder() / "zarr_cache"
+        # one sub folder per zarr folder
+        folder_hash = hashlib.md5(str(folder_path).encode("utf8")).hexdigest()
+        store = ZarrDiskCacheStore(store, Path(cache_folder) / folder_hash, **cache_options)
+    return store
+
+
 def add_properties_and_annotations(zarr_group: zarr.hierarchy.Group, recording_or_sorting: BaseRecording | BaseSorting):
     # save properties
     prop_group = zarr_group.create_group("properties")
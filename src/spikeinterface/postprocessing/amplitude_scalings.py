@@ -52,7 +52,7 @@ class ComputeAmplitudeScalings(AnalyzerExtension):
     handle_collisions: bool, default: True
         Whether to handle collisions between spikes. If True, the amplitude scaling of colliding spikes
         (defined as spikes within `delta_collision_ms` ms and with overlapping sparsity) is computed by fitting a
-        multi-linear regression model (with `sklearn.LinearRegression`). If False, each spike is fitted independently.
+        multi-linear regression model with non-negative coefficients. If False, each spike is fitted independently.
     delta_collision_ms: float, default: 2
         The maximum time difference in ms before and after a spike to gather colliding spikes.
     load_if_exists : bool, default: False
@@ -75,6 +75,7 @@ class ComputeAmplitudeScalings(AnalyzerExtension):
     use_nodepipeline = True
     nodepipeline_variables = ["amplitude_scalings", "collision_mask"]
     need_job_kwargs = True
+    per_spike_data = dict(amplitude_scalings="spikes", collision_mask="spikes")
 
     def __init__(self, sorting_analyzer):
         AnalyzerExtension.__init__(self, sorting_analyzer)
@@ -300,8 +301,6 @@ class AmplitudeScalingNode(PipelineNode):
         return self._dtype
 
     def compute(self, traces, peaks):
-        from scipy.stats import linregress
-
         # scale traces with margin to match scaling of templates
         if self._gains is not None:
             traces = traces.astype("float32") * self._gains + self._offsets
@@ -314,85 +313,115 @@ class AmplitudeScalingNode(PipelineNode):
         handle_collisions = self._handle_collisions
         delta_collision_samples = self._delta_collision_samples
 
-        # local_spikes_within_margin = peaks
-        # i0 = np.searchsorted(local_spikes_within_margin["sample_index"], left_margin)
-        # i1 = np.searchsorted(local_spikes_within_margin["sample_index"], traces.shape[0] - right_margin)
-        # local_spikes = local_spikes_within_margin[i0:i1]
-
         local_spikes_within_margin = peaks
-        local_spikes = local_spikes_within_margin[~peaks["in_margin"]]
+        (local_spike_indices,) = np.nonzero(~peaks["in_margin"])
+        local_spikes = local_spikes_within_margin[local_spike_indices]
+
+        scalings = np.zeros(len(local_spikes), dtype=float)
+        spike_collision_mask = np.zeros(len(local_spikes), dtype=bool)
 
         # set colliding spikes apart (if needed)
         if handle_collisions:
             # local spikes with margin!
-            collisions = find_collisions(
-                local_spikes, local_spikes_within_margin, delta_collision_samples, sparsity_mask
+            collision_spike_indices, collision_offsets, colliding_indices = _find_collisions_indices(
+                local_spike_indices, local_spikes_within_margin, delta_collision_samples, sparsity_mask
             )
-        else:
-            collisions = {}
+            spike_collision_mask[collision_spike_indices] = True
+
+        # all spikes without collision are fitted in one batch
+        (isolated_spike_indices,) = np.nonzero(~spike_collision_mask)
+        scalings[isolated_spike_indices] = _fit_isolated_spikes(
+            local_spikes[isolated_spike_indices],
+            traces,
+            nbefore,
+            all_templates,
+            sparsity_mask,
+            cut_out_before,
+            cut_out_after,
+        )
 
-        # compute the scaling for each spike
-        scalings = np.zeros(len(local_spikes), dtype=float)
-        spike_collision_mask = np.zeros(len(local_spikes), dtype=bool)
+        # deal with collisions
+        if handle_collisions and len(collision_spike_indices) > 0:
+            collisions = []
+            for i, spike_index in enumerate(collision_spike_indices):
+                within_margin_indices = colliding_indices[collision_offsets[i] : collision_offsets[i + 1]]
+                within_margin_indices = np.concatenate(([local_spike_indices[spike_index]], within_margin_indices))
+                collisions.append(local_spikes_within_margin[within_margin_indices])
+            all_scaled_amps = fit_collisions(
+                collisions,
+                traces,
+                nbefore,
+                all_templates,
+                sparsity_mask,
+                cut_out_before,
+                cut_out_after,
+            )
+            # the scaling for the current spike is at index 0
+            scalings[collision_spike_indices] = [scaled_amps[0] for scaled_amps in all_scaled_amps]
 
-        for spike_index, spike in enumerate(local_spikes):
-            if spike_index in collisions.keys():
-                # we deal with overlapping spikes later
-                continue
-            unit_index = spike["unit_index"]
-            sample_centered = spike["sample_index"]
-            (sparse_indices,) = np.nonzero(sparsity_mask[unit_index])
-            template = all_templates[unit_index][:, sparse_indices]
-            template = template[nbefore - cut_out_before : nbefore + cut_out_after]
-            cut_out_start = sample_centered - cut_out_before
-            cut_out_end = sample_centered + cut_out_after
-            if sample_centered - cut_out_before < 0:
-                local_waveform = traces[:cut_out_end, sparse_indices]
-                template = template[cut_out_before - sample_centered :]
-            elif sample_centered + cut_out_after > traces.shape[0]:
-                local_waveform = traces[cut_out_start:, sparse_indices]
-                template = template[: -(sample_centered + cut_out_after - (traces.shape[0]))]
-            else:
-                local_waveform = traces[cut_out_start:cut_out_end, sparse_indices]
-            assert template.shape == local_waveform.shape
+        return (scalings, spike_collision_mask)
 
-            # here we use linregress, which is equivalent to using sklearn LinearRegression with fit_intercept=True
-            # y = local_waveform.flatten()
-            # X = template.flatten()[:, np.newaxis]
-            # reg = LinearRegression(positive=True, fit_intercept=True).fit(X, y)
-            # scalings[spike_index] = reg.coef_[0]
+    def get_trace_margin(self):
+        return self._margin
 
-            # closed form: W = (X' * X)^-1 X' y
-            # y = local_waveform.flatten()[:, None]
-            # X = np.ones((len(y), 2))
-            # X[:, 0] = template.flatten()
-            # W = np.linalg.inv(X.T @ X) @ X.T @ y
-            # scalings[spike_index] = W[0, 0]
 
-            linregress_res = linregress(template.flatten(), local_waveform.flatten())
-            scalings[spike_index] = linregress_res[0]
+### Isolated spikes ###
+def _fit_isolated_spikes(
+    spikes, traces_with_margin, nbefore, all_templates, sparsity_mask, cut_out_before, cut_out_after
+):
+    """
+    Compute the scaling of spikes without collisions as the slope of the linear regression (with intercept)
+    of each waveform onto its unit template.
 
-        # deal with collisions
-        if len(collisions) > 0:
-            for spike_index, collision in collisions.items():
-                scaled_amps = fit_collision(
-                    collision,
-                    traces,
-                    nbefore,
-                    all_templates,
-                    sparsity_mask,
-                    cut_out_before,
-                    cut_out_after,
-                )
-                # the scaling for the current spike is at index 0
-                scalings[spike_index] = scaled_amps[0]
-                spike_collision_mask[spike_index] = True
-
-        # TODO: switch to collision mask and return that (to use concatenation)
-        return (scalings, spike_collision_mask)
+    Spikes are fitted in batch for each unit. Only the few spikes whose waveform is clipped by the traces
+    borders are fitted one by one.
 
-    def get_trace_margin(self):
-        return self._margin
+    Returns
+    -------
+    scalings: np.ndarray
+        The scalings of the spikes
+    """
+    scalings = np.zeros(len(spikes), dtype=float)
+    if len(spikes) == 0:
+        return scalings
+
+    num_samples = traces_with_margin.shape[0]
+    sample_indices = spikes["sample_index"].astype("int64")
+    unit_indices = spikes["unit_index"]
+    inside = (sample_indices - cut_out_before >= 0) & (sample_indices + cut_out_after <= num_samples)
+    window = np.arange(-cut_out_before, cut_out_after)
+
+    for unit_index in np.unique(unit_indices[inside]):
+        (spike_inds,) = np.nonzero(inside & (unit_indices == unit_index))
+        (sparse_indices,) = np.nonzero(sparsity_mask[unit_index])
+        template = all_templates[unit_index, nbefore - cut_out_before : nbefore + cut_out_after, :][:, sparse_indices]
+        sample_inds = sample_indices[spike_inds, None, None] + window[None, :, None]
+        waveforms = traces_with_margin[sample_inds, sparse_indices[None, None, :]]
+        scalings[spike_inds] = _linregress_slopes(template, waveforms)
+
+    for spike_ind in np.flatnonzero(~inside):
+        unit_index = unit_indices[spike_ind]
+        (sparse_indices,) = np.nonzero(sparsity_mask[unit_index])
+        template = all_templates[unit_index, nbefore - cut_out_before : nbefore + cut_out_after, :][:, sparse_indices]
+        cut_out_start = sample_indices[spike_ind] - cut_out_before
+        start = max(0, cut_out_start)
+        end = min(num_samples, sample_indices[spike_ind] + cut_out_after)
+        template = template[start - cut_out_start : end - cut_out_start]
+        waveform = traces_with_margin[start:end, sparse_indices]
+        scalings[spike_ind] = _linregress_slopes(template, waveform[np.newaxis])[0]
+
+    return scalings
+
+
+def _linregress_slopes(template, waveforms):
+    """
+    Slopes of the linear regressions (with intercept) of several waveforms onto the same template.
+    This is equivalent to `scipy.stats.linregress(template.flatten(), waveform.flatten())[0]` for each waveform.
+    """
+    x = template.reshape(-1).astype("float64")
+    x_centered = x - np.mean(x)
+    y = waveforms.reshape(waveforms.shape[0], -1).astype("float64")
+    return (y @ x_centered) / np.dot(x_centered, x_centered)
 
 
 ### Collision handling ###
@@ -460,48 +489,212 @@ def find_collisions(spikes, spikes_within_margin, delta_collision_samples, spars
         A dictionary with collisions. The key is the index of the spike with collision, the value is an
         array of overlapping spikes, including the spike itself at position 0.
     """
-    # TODO: refactor to speed-up
+    # find the index of each spike within spikes_within_margin
+    first_index_within_margin = {}
+    for index_within_margin, spike in enumerate(spikes_within_margin):
+        first_index_within_margin.setdefault(spike.tobytes(), index_within_margin)
+    spike_indices_within_margin = np.array(
+        [first_index_within_margin[spike.tobytes()] for spike in spikes], dtype="int64"
+    )
+
+    collision_spike_indices, collision_offsets, colliding_indices = _find_collisions_indices(
+        spike_indices_within_margin, spikes_within_margin, delta_collision_samples, sparsity_mask
+    )
+
     collision_spikes_dict = {}
-    for spike_index, spike in enumerate(spikes):
+    for i, spike_index in enumerate(collision_spike_indices):
+        overlapping_spikes = spikes_within_margin[colliding_indices[collision_offsets[i] : collision_offsets[i + 1]]]
+        collision_spikes_dict[spike_index] = np.concatenate(([spikes[spike_index]], overlapping_spikes))
+    return collision_spikes_dict
 
-        # find the index of the spike within spikes_within_margin
-        spike_index_within_margin = np.where(spikes_within_margin == spike)[0][0]
 
-        # find the spikes that fall within a temporal window around the spike peak
-        spike_collision_window = [
-            spike["sample_index"] - delta_collision_samples,
-            spike["sample_index"] + delta_collision_samples,
-        ]
+def _find_collisions_indices(spike_indices_within_margin, spikes_within_margin, delta_collision_samples, sparsity_mask):
+    """
+    Vectorized core of `find_collisions()` working on indices.
 
-        consecutive_window_pre, consecutive_window_post = np.searchsorted(
-            spikes_within_margin["sample_index"],
-            spike_collision_window,
-        )
+    Parameters
+    ----------
+    spike_indices_within_margin: np.array
+        The indices of the spikes of interest in `spikes_within_margin`
+    spikes_within_margin: np.array
+        The spikes, sorted by sample index
+    delta_collision_samples: int
+        The maximum number of samples between two spikes to consider them as overlapping
+    sparsity_mask: boolean mask
+        A num_units x num_channels boolean array
 
-        # Make an array of indices of all spikes that collide with the spike,
-        # making sure to exlude the spike itself (it is included in the collision_spikes by construction)
-        # The indices here are indices of the spike position in `spikes_within_margin`.
-        pre_possible_consecutive_spike_indices = np.arange(consecutive_window_pre, spike_index_within_margin)
-        post_possible_consecutive_spike_indices = np.arange(spike_index_within_margin + 1, consecutive_window_post)
-        possible_overlapping_spike_indices = np.concatenate(
-            (pre_possible_consecutive_spike_indices, post_possible_consecutive_spike_indices)
-        )
+    Returns
+    -------
+    collision_spike_indices: np.array
+        The positions (in `spike_indices_within_margin`) of the spikes with at least one collision
+    collision_offsets: np.array
+        Offsets of size len(collision_spike_indices) + 1 into `colliding_indices`
+    colliding_indices: np.array
+        The indices in `spikes_within_margin` of the colliding spikes, in temporal order for each spike
+    """
+    sample_indices = spikes_within_margin["sample_index"]
+    unit_indices = spikes_within_margin["unit_index"]
+
+    # the spikes that fall within a temporal window around each spike peak
+    centers = sample_indices[spike_indices_within_margin]
+    window_pre = np.searchsorted(sample_indices, centers - delta_collision_samples)
+    window_post = np.searchsorted(sample_indices, centers + delta_collision_samples)
+
+    # all (spike, candidate) pairs
+    num_candidates = window_post - window_pre
+    owners = np.repeat(np.arange(len(spike_indices_within_margin)), num_candidates)
+    candidate_offsets = np.concatenate(([0], np.cumsum(num_candidates)))
+    candidates = window_pre[owners] + np.arange(owners.size) - candidate_offsets[owners]
+
+    # exclude the spike itself and keep only spatially overlapping units
+    units_overlap = (sparsity_mask.astype("int32") @ sparsity_mask.T.astype("int32")) > 0
+    keep = candidates != spike_indices_within_margin[owners]
+    keep &= units_overlap[unit_indices[spike_indices_within_margin[owners]], unit_indices[candidates]]
+    owners = owners[keep]
+    colliding_indices = candidates[keep]
+
+    num_collisions = np.bincount(owners, minlength=len(spike_indices_within_margin))
+    (collision_spike_indices,) = np.nonzero(num_collisions)
+    collision_offsets = np.concatenate(([0], np.cumsum(num_collisions[collision_spike_indices])))
+    return collision_spike_indices, collision_offsets, colliding_indices
+
+
+def _get_collision_design(
+    collision,
+    traces_with_margin,
+    nbefore,
+    all_templates,
+    sparsity_mask,
+    cut_out_before,
+    cut_out_after,
+):
+    """
+    Build the regression problem of one collision: the observed waveform `y` and the
+    matrix `X` of shifted templates (one column per colliding spike).
+    """
+    # Find the first and last spike peak index
+    # from the set of colliding spikes.
+    sample_first_centered = np.min(collision["sample_index"])
+    sample_last_centered = np.max(collision["sample_index"])
 
-        # Build the collusion_spikes_dict including only
-        # spikes that overlap spatially
-        for possible_overlapping_spike_index in possible_overlapping_spike_indices:
+    # Find channels that have signal from any of the set of
+    # colliding spikes. This is found as the union between
+    # all channels with sparsity mask `True` for any
+    # unit represented in the set of colliding spikes.
+    common_sparse_mask = np.any(sparsity_mask[collision["unit_index"]], axis=0)
+    (sparse_indices,) = np.nonzero(common_sparse_mask)
 
-            if _are_units_spatially_overlapping(
-                sparsity_mask,
-                spike["unit_index"],
-                spikes_within_margin[possible_overlapping_spike_index]["unit_index"],
-            ):
-                if spike_index not in collision_spikes_dict:
-                    collision_spikes_dict[spike_index] = np.array([spike])
-                collision_spikes_dict[spike_index] = np.concatenate(
-                    (collision_spikes_dict[spike_index], [spikes_within_margin[possible_overlapping_spike_index]])
-                )
-    return collision_spikes_dict
+    # Index out the temporal window that includes all colliding spikes
+    # across all channels which contain signal from a colliding spike.
+    local_waveform_start = max(0, sample_first_centered - cut_out_before)
+    local_waveform_end = min(traces_with_margin.shape[0], sample_last_centered + cut_out_after)
+    local_waveform = traces_with_margin[local_waveform_start:local_waveform_end, sparse_indices]
+    num_samples_local_waveform = local_waveform.shape[0]
+
+    y = local_waveform.T.flatten().astype("float64")
+    X = np.zeros((len(collision), len(sparse_indices), num_samples_local_waveform))
+    for i, spike in enumerate(collision):
+        # For the collision spike, take its unit template and insert
+        # it into `X` at the time the collision spike occured.
+        # Deal with borders - if the unit template goes off the start / end
+        # of the local waveform, clip it.
+        sample_centered = spike["sample_index"] - local_waveform_start
+        template_cut = all_templates[spike["unit_index"], nbefore - cut_out_before : nbefore + cut_out_after, :]
+        start = sample_centered - cut_out_before
+        clipped_start = max(0, start)
+        clipped_end = min(num_samples_local_waveform, sample_centered + cut_out_after)
+        X[i, :, clipped_start:clipped_end] = template_cut[clipped_start - start : clipped_end - start, sparse_indices].T
+
+    X = X.reshape(len(collision), -1).T
+    return X, y
+
+
+def _solve_nonnegative_regressions(designs):
+    """
+    Solve several multi-linear regressions with intercept and non-negative coefficients
+    (equivalent to `sklearn.linear_model.LinearRegression(fit_intercept=True, positive=True)`).
+
+    The unconstrained solutions are obtained with batched normal equations, grouped by number
+    of regressors. When the unconstrained solution is non-negative it is also the solution of the
+    constrained problem, otherwise the problem is solved with `scipy.optimize.nnls`.
+
+    Parameters
+    ----------
+    designs: list of tuple
+        List of (X, y) regression problems
+
+    Returns
+    -------
+    coefs: list of np.ndarray
+        The coefficients of each regression
+    """
+    from scipy.optimize import nnls
+
+    centered = []
+    for X, y in designs:
+        centered.append((X - np.mean(X, axis=0), y - np.mean(y)))
+
+    coefs = [None] * len(designs)
+    num_regressors = np.array([X.shape[1] for X, _ in designs])
+    for k in np.unique(num_regressors):
+        (inds,) = np.nonzero(num_regressors == k)
+        grams = np.stack([centered[i][0].T @ centered[i][0] for i in inds])
+        rhs = np.stack([centered[i][0].T @ centered[i][1] for i in inds])
+        try:
+            solutions = np.linalg.solve(grams, rhs[:, :, np.newaxis])[:, :, 0]
+        except np.linalg.LinAlgError:
+            # at least one singular problem: use nnls for the whole group
+            solutions = np.full((len(inds), k), np.nan)
+        for i, solution in zip(inds, solutions):
+            if np.all(np.isfinite(solution)) and np.all(solution >= 0):
+                coefs[i] = solution
+            else:
+                coefs[i] = nnls(*centered[i])[0]
+    return coefs
+
+
+def fit_collisions(
+    collisions,
+    traces_with_margin,
+    nbefore,
+    all_templates,
+    sparsity_mask,
+    cut_out_before,
+    cut_out_after,
+):
+    """
+    Compute the best fit for several collisions at once. See `fit_collision()` for details.
+
+    Parameters
+    ----------
+    collisions: list of np.ndarray
+        List of collisions, each one with the spike of interest in first position
+    traces_with_margin: np.ndarray
+        A numpy array of shape (n_samples, n_channels) containing the traces with a margin.
+    nbefore: int
+        The number of samples before the spike to consider for the fit.
+    all_templates: np.ndarray
+        A numpy array of shape (n_units, n_samples, n_channels) containing the templates.
+    sparsity_mask: boolean mask
+        A num_units x num_channels boolean array indicating whether
+        the unit is represented on the channel.
+    cut_out_before: int
+        The number of samples to cut out before the spike.
+    cut_out_after: int
+        The number of samples to cut out after the spike.
+
+    Returns
+    -------
+    list of np.ndarray
+        The fitted scaling factors for the colliding spikes of each collision.
+    """
+    designs = [
+        _get_collision_design(
+            collision, traces_with_margin, nbefore, all_templates, sparsity_mask, cut_out_before, cut_out_after
+        )
+        for collision in collisions
+    ]
+    return _solve_nonnegative_regressions(designs)
 
 
 def fit_collision(
@@ -522,7 +715,8 @@ def fit_collision(
     the waveform of a spike overlaps with other, colliding spikes, these
     colliding spikes will contribute to the spike amplitude.
 
-    This is addressed by fitting a multivariate regression. `y` is
+    This is addressed by fitting a multivariate regression with non-negative
+    coefficients and an intercept. `y` is
     the observed waveform (including the spike of interest and colliding spikes).
     `X` is the corresponding set of unit templates, with each template
     temporally shifted to match the position of its associated spike in the
@@ -556,58 +750,9 @@ def fit_collision(
     np.ndarray
         The fitted scaling factors for the colliding spikes.
     """
-    from sklearn.linear_model import LinearRegression
-
-    # Find the first and last spike peak index
-    # from the set of colliding spikes.
-    sample_first_centered = np.min(collision["sample_index"])
-    sample_last_centered = np.max(collision["sample_index"])
-
-    # Find channels that have signal from any of the set of
-    # colliding spikes. This is found as the union between
-    # all channels with sparsity mask `True` for any
-    # unit represented in the set of colliding spikes.
-    common_sparse_mask = np.zeros(sparsity_mask.shape[1], dtype="int")
-    for spike in collision:
-        mask_i = sparsity_mask[spike["unit_index"]]
-        common_sparse_mask = np.logical_or(common_sparse_mask, mask_i)
-    (sparse_indices,) = np.nonzero(common_sparse_mask)
-
-    # Index out the temporal window that includes all colliding spikes
-    # across all channels which contain signal from a colliding spike.
-    local_waveform_start = max(0, sample_first_centered - cut_out_before)
-    local_waveform_end = min(traces_with_margin.shape[0], sample_last_centered + cut_out_after)
-    local_waveform = traces_with_margin[local_waveform_start:local_waveform_end, sparse_indices]
-    num_samples_local_waveform = local_waveform.shape[0]
-
-    y = local_waveform.T.flatten()
-    X = np.zeros((len(y), len(collision)))
-    for i, spike in enumerate(collision):
-
-        full_template = np.zeros_like(local_waveform)
-
-        # For the collision spike, take its unit template and insert
-        # it into `full_template` at the time the collision spike occured.
-        sample_centered = spike["sample_index"] - local_waveform_start
-        template = all_templates[spike["unit_index"]][:, sparse_indices]
-        template_cut = template[nbefore - cut_out_before : nbefore + cut_out_after]
-
-        # Deal with borders - if the unit template goes off the start / end
-        # of the full template, clip it.
-        if sample_centered - cut_out_before < 0:
-            full_template[: sample_centered + cut_out_after] = template_cut[cut_out_before - sample_centered :]
-        elif sample_centered + cut_out_after > num_samples_local_waveform:
-            full_template[sample_centered - cut_out_before :] = template_cut[
-                : -(cut_out_after + sample_centered - num_samples_local_waveform)
-            ]
-        else:
-            full_template[sample_centered - cut_out_before : sample_centered + cut_out_after] = template_cut
-
-        X[:, i] = full_template.T.flatten()
-
-    reg = LinearRegression(fit_intercept=True, positive=True).fit(X, y)
-    scalings = reg.coef_
-    return scalings
+    return fit_collisions(
+        [collision], traces_with_margin, nbefore, all_templates, sparsity_mask, cut_out_before, cut_out_after
+    )[0]
 
 
 ### Debugging ###
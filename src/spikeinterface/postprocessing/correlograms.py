@@ -3,6 +3,7 @@ import math
 import warnings
 import numpy as np
 from spikeinterface.core.sortinganalyzer import register_result_extension, AnalyzerExtension, SortingAnalyzer
+from spikeinterface.core.job_tools import fix_job_kwargs, numba_threads_limit, _shared_job_kwargs_doc
 
 from spikeinterface.core.waveforms_extractor_backwards_compatibility import MockWaveformExtractor
 
@@ -31,6 +32,19 @@ class ComputeCorrelograms(AnalyzerExtension):
         bin size 1 ms, the correlation will be binned as -25 ms, -24 ms, ...
     method : "auto" | "numpy" | "numba", default: "auto"
          If "auto" and numba is installed, numba is used, otherwise numpy is used.
+    pair_mask : None | "sparsity" | "unit_locations" | np.array, default: None
+        Restrict the computation to a subset of unit pairs. Auto-correlograms are always computed.
+
+        * None: all pairs are computed and stored in a dense array
+        * "sparsity": only pairs of units whose channel sparsity overlap
+        * "unit_locations": only pairs of units closer than `radius_um` (needs the "unit_locations" extension)
+        * np.array: a boolean (num_units, num_units) mask
+
+        When a mask is used, correlograms are stored in a compact (num_pairs, num_bins) layout,
+        see `get_data(outputs="sparse")`.
+    radius_um : float, default: 100.0
+        The maximum distance between units when pair_mask="unit_locations"
+    {}
 
     Returns
     -------
@@ -72,40 +86,139 @@ class ComputeCorrelograms(AnalyzerExtension):
     depend_on = []
     need_recording = False
     use_nodepipeline = False
-    need_job_kwargs = False
+    need_job_kwargs = True
 
     def __init__(self, sorting_analyzer):
         AnalyzerExtension.__init__(self, sorting_analyzer)
 
-    def _set_params(self, window_ms: float = 50.0, bin_ms: float = 1.0, method: str = "auto"):
-        params = dict(window_ms=window_ms, bin_ms=bin_ms, method=method)
+    def _set_params(
+        self,
+        window_ms: float = 50.0,
+        bin_ms: float = 1.0,
+        method: str = "auto",
+        pair_mask=None,
+        radius_um: float = 100.0,
+    ):
+        if isinstance(pair_mask, str):
+            assert pair_mask in ("sparsity", "unit_locations"), f"pair_mask {pair_mask} is not supported"
+        params = dict(window_ms=window_ms, bin_ms=bin_ms, method=method, pair_mask=pair_mask, radius_um=radius_um)
 
         return params
 
+    def _get_pair_mask(self):
+        pair_mask = self.params.get("pair_mask", None)
+        if pair_mask is None:
+            return None
+
+        num_units = self.sorting_analyzer.get_num_units()
+        if isinstance(pair_mask, str) and pair_mask == "sparsity":
+            sparsity = self.sorting_analyzer.sparsity
+            if sparsity is None:
+                mask = np.ones((num_units, num_units), dtype=bool)
+            else:
+                overlap = sparsity.mask.astype("float32")
+                mask = (overlap @ overlap.T) > 0
+        elif isinstance(pair_mask, str) and pair_mask == "unit_locations":
+            if not self.sorting_analyzer.has_extension("unit_locations"):
+                raise ValueError("pair_mask='unit_locations' requires the 'unit_locations' extension to be computed")
+            unit_locations = self.sorting_analyzer.get_extension("unit_locations").get_data()[:, :2]
+            distances = np.linalg.norm(unit_locations[:, np.newaxis, :] - unit_locations[np.newaxis, :, :], axis=2)
+            mask = distances <= self.params["radius_um"]
+        else:
+            mask = np.asarray(pair_mask, dtype=bool)
+            assert mask.shape == (num_units, num_units), "pair_mask must have shape (num_units, num_units)"
+
+        return mask
+
     def _select_extension_data(self, unit_ids):
         # filter metrics dataframe
         unit_indices = self.sorting_analyzer.sorting.ids_to_indices(unit_ids)
-        new_ccgs = self.data["ccgs"][unit_indices][:, unit_indices]
         new_bins = self.data["bins"]
-        new_data = dict(ccgs=new_ccgs, bins=new_bins)
+        if "pairs" in self.data:
+            pairs = self.data["pairs"]
+            old_to_new = np.full(self.sorting_analyzer.get_num_units(), -1, dtype=pairs.dtype)
+            old_to_new[unit_indices] = np.arange(unit_indices.size)
+            new_pairs = old_to_new[pairs]
+            keep = np.all(new_pairs >= 0, axis=1)
+            new_data = dict(ccgs=self.data["ccgs"][keep], pairs=new_pairs[keep], bins=new_bins)
+        else:
+            new_ccgs = self.data["ccgs"][unit_indices][:, unit_indices]
+            new_data = dict(ccgs=new_ccgs, bins=new_bins)
         return new_data
 
     def _merge_extension_data(
         self, merge_unit_groups, new_unit_ids, new_sorting_analyzer, censor_ms=None, verbose=False, **job_kwargs
     ):
         # recomputing correlogram is fast enough and much easier in this case
-        new_ccgs, new_bins = _compute_correlograms_on_sorting(new_sorting_analyzer.sorting, **self.params)
-        new_data = dict(ccgs=new_ccgs, bins=new_bins)
+        job_kwargs = fix_job_kwargs(job_kwargs)
+        params = dict(
+            window_ms=self.params["window_ms"],
+            bin_ms=self.params["bin_ms"],
+            method=self.params["method"],
+            n_jobs=job_kwargs["n_jobs"],
+        )
+        if "pairs" in self.data:
+            # a merged unit is paired with all the partners of its parents
+            old_mask = pairs_to_pair_mask(self.data["pairs"], self.sorting_analyzer.get_num_units())
+            new_unit_ids = list(new_unit_ids)
+            all_new_unit_ids = new_sorting_analyzer.unit_ids
+            assignment = np.zeros((all_new_unit_ids.size, self.sorting_analyzer.get_num_units()), dtype="float32")
+            for unit_ind, unit_id in enumerate(all_new_unit_ids):
+                if unit_id in new_unit_ids:
+                    group = merge_unit_groups[new_unit_ids.index(unit_id)]
+                else:
+                    group = [unit_id]
+                assignment[unit_ind, self.sorting_analyzer.sorting.ids_to_indices(group)] = 1.0
+            new_mask = (assignment @ old_mask.astype("float32") @ assignment.T) > 0
+            new_ccgs, new_pairs, new_bins = _compute_correlograms_on_sorting(
+                new_sorting_analyzer.sorting, pair_mask=new_mask, **params
+            )
+            new_data = dict(ccgs=new_ccgs, pairs=new_pairs, bins=new_bins)
+        else:
+            new_ccgs, new_bins = _compute_correlograms_on_sorting(new_sorting_analyzer.sorting, **params)
+            new_data = dict(ccgs=new_ccgs, bins=new_bins)
         return new_data
 
-    def _run(self, verbose=False):
-        ccgs, bins = _compute_correlograms_on_sorting(self.sorting_analyzer.sorting, **self.params)
+    def _run(self, verbose=False, **job_kwargs):
+        job_kwargs = fix_job_kwargs(job_kwargs)
+        params = dict(
+            window_ms=self.params["window_ms"],
+            bin_ms=self.params["bin_ms"],
+            method=self.params["method"],
+            n_jobs=job_kwargs["n_jobs"],
+        )
+        pair_mask = self._get_pair_mask()
+        if pair_mask is None:
+            ccgs, bins = _compute_correlograms_on_sorting(self.sorting_analyzer.sorting, **params)
+        else:
+            ccgs, pairs, bins = _compute_correlograms_on_sorting(
+                self.sorting_analyzer.sorting, pair_mask=pair_mask, **params
+            )
+            self.data["pairs"] = pairs
         self.data["ccgs"] = ccgs
         self.data["bins"] = bins
 
-    def _get_data(self):
-        return self.data["ccgs"], self.data["bins"]
+    def _get_data(self, outputs="numpy"):
+        if outputs == "numpy":
+            if "pairs" in self.data:
+                num_units = self.sorting_analyzer.get_num_units()
+                ccgs = sparse_to_dense_correlograms(self.data["ccgs"], self.data["pairs"], num_units)
+            else:
+                ccgs = self.data["ccgs"]
+            return ccgs, self.data["bins"]
+        elif outputs == "sparse":
+            if "pairs" in self.data:
+                ccgs, pairs = self.data["ccgs"], self.data["pairs"]
+            else:
+                num_units = self.sorting_analyzer.get_num_units()
+                pairs = np.stack(np.nonzero(np.ones((num_units, num_units), dtype=bool)), axis=1)
+                ccgs = self.data["ccgs"].reshape(num_units * num_units, -1)
+            return ccgs, pairs, self.data["bins"]
+        else:
+            raise ValueError(f"Wrong .get_data(outputs={outputs}); possibilities are `numpy` or `sparse`")
+
 
+ComputeCorrelograms.__doc__ = ComputeCorrelograms.__doc__.format(_shared_job_kwargs_doc)
 
 register_result_extension(ComputeCorrelograms)
 compute_correlograms_sorting_analyzer = ComputeCorrelograms.function_factory()
@@ -116,6 +229,9 @@ def compute_correlograms(
     window_ms: float = 50.0,
     bin_ms: float = 1.0,
     method: str = "auto",
+    pair_mask=None,
+    radius_um: float = 100.0,
+    **job_kwargs,
 ):
     """
     Compute correlograms using Numba or Numpy.
@@ -126,11 +242,26 @@ def compute_correlograms(
 
     if isinstance(sorting_analyzer_or_sorting, SortingAnalyzer):
         return compute_correlograms_sorting_analyzer(
-            sorting_analyzer_or_sorting, window_ms=window_ms, bin_ms=bin_ms, method=method
+            sorting_analyzer_or_sorting,
+            window_ms=window_ms,
+            bin_ms=bin_ms,
+            method=method,
+            pair_mask=pair_mask,
+            radius_um=radius_um,
+            **job_kwargs,
         )
     else:
+        assert pair_mask is None or not isinstance(
+            pair_mask, str
+        ), "With a Sorting, pair_mask must be None or a boolean array"
+        job_kwargs = fix_job_kwargs(job_kwargs)
         return _compute_correlograms_on_sorting(
-            sorting_analyzer_or_sorting, window_ms=window_ms, bin_ms=bin_ms, method=method
+            sorting_analyzer_or_sorting,
+            window_ms=window_ms,
+            bin_ms=bin_ms,
+            method=method,
+            pair_mask=pair_mask,
+            n_jobs=job_kwargs["n_jobs"],
         )
 
 
@@ -200,7 +331,51 @@ def _compute_num_bins(window_size, bin_size):
     return num_bins, num_half_bins
 
 
-def _compute_correlograms_on_sorting(sorting, window_ms, bin_ms, method="auto"):
+def pair_mask_to_pairs(pair_mask):
+    """
+    Convert a boolean (num_units, num_units) pair mask to the list of ordered pairs
+    used by the compact correlogram layout.
+
+    The mask is symmetrized and the diagonal (auto-correlograms) is always included,
+    so both (A, B) and (B, A) are stored for every selected pair.
+
+    Parameters
+    ----------
+    pair_mask : np.ndarray
+        A boolean (num_units, num_units) array
+
+    Returns
+    -------
+    pairs : np.ndarray
+        A (num_pairs, 2) int32 array of unit indices
+    """
+    pair_mask = np.asarray(pair_mask, dtype=bool)
+    pair_mask = pair_mask | pair_mask.T
+    pair_mask[np.diag_indices(pair_mask.shape[0])] = True
+    pairs = np.stack(np.nonzero(pair_mask), axis=1).astype("int32")
+    return pairs
+
+
+def pairs_to_pair_mask(pairs, num_units):
+    """
+    Inverse of `pair_mask_to_pairs()`.
+    """
+    pair_mask = np.zeros((num_units, num_units), dtype=bool)
+    pair_mask[pairs[:, 0], pairs[:, 1]] = True
+    return pair_mask
+
+
+def sparse_to_dense_correlograms(ccgs, pairs, num_units):
+    """
+    Expand compact (num_pairs, num_bins) correlograms to a dense
+    (num_units, num_units, num_bins) array. Pairs not computed are zeros.
+    """
+    dense_ccgs = np.zeros((num_units, num_units, ccgs.shape[1]), dtype=ccgs.dtype)
+    dense_ccgs[pairs[:, 0], pairs[:, 1], :] = ccgs
+    return dense_ccgs
+
+
+def _compute_correlograms_on_sorting(sorting, window_ms, bin_ms, method="auto", pair_mask=None, n_jobs=1):
     """
     Computes cross-correlograms from multiple units.
 
@@ -219,6 +394,10 @@ def _compute_correlograms_on_sorting(sorting, window_ms, bin_ms, method="auto"):
     method : str
         To use "numpy" or "numba". "auto" will use numba if available,
         otherwise numpy.
+    pair_mask : None | np.ndarray, default: None
+        If given, a boolean (num_units, num_units) mask of the pairs to compute.
+    n_jobs : int, default: 1
+        Number of threads used by the numba implementation. The numpy one is single threaded.
 
     Returns
     -------
@@ -226,6 +405,10 @@ def _compute_correlograms_on_sorting(sorting, window_ms, bin_ms, method="auto"):
         A (num_units, num_units, num_bins) array where unit x unit correlation
         matrices are stacked at all determined time bins. Note the true
         correlation is not returned but instead the count of number of matches.
+        When `pair_mask` is given, a compact (num_pairs, num_bins) array instead.
+    pairs : np.array
+        Only returned when `pair_mask` is given: the (num_pairs, 2) unit indices
+        of each row of `correlograms`
     bins : np.array
         The bins edges in ms
     """
@@ -236,10 +419,18 @@ def _compute_correlograms_on_sorting(sorting, window_ms, bin_ms, method="auto"):
 
     bins, window_size, bin_size = _make_bins(sorting, window_ms, bin_ms)
 
+    if pair_mask is not None:
+        pairs = pair_mask_to_pairs(pair_mask)
+        if method == "numpy":
+            correlograms = _compute_pair_correlograms_numpy(sorting, pairs, window_size, bin_size)
+        if method == "numba":
+            correlograms = _compute_pair_correlograms_numba(sorting, pairs, window_size, bin_size, n_jobs=n_jobs)
+        return correlograms, pairs, bins
+
     if method == "numpy":
         correlograms = _compute_correlograms_numpy(sorting, window_size, bin_size)
     if method == "numba":
-        correlograms = _compute_correlograms_numba(sorting, window_size, bin_size)
+        correlograms = _compute_correlograms_numba(sorting, window_size, bin_size, n_jobs=n_jobs)
 
     return correlograms, bins
 
@@ -384,7 +575,7 @@ def correlogram_for_one_segment(spike_times, spike_unit_indices, window_size, bi
     return correlograms
 
 
-def _compute_correlograms_numba(sorting, window_size, bin_size):
+def _compute_correlograms_numba(sorting, window_size, bin_size, n_jobs=1):
     """
     Computes cross-correlograms between all units in `sorting`.
 
@@ -400,6 +591,9 @@ def _compute_correlograms_numba(sorting, window_size, bin_size):
             The window size over which to perform the cross-correlation, in samples
     bin_size : int
         The size of which to bin lags, in samples.
+    n_jobs : int, default: 1
+        Number of threads. With n_jobs > 1, units are processed in parallel with
+        `_compute_pair_correlograms_numba()` over all pairs.
 
     Returns
     -------
@@ -414,6 +608,12 @@ def _compute_correlograms_numba(sorting, window_size, bin_size):
     num_bins, num_half_bins = _compute_num_bins(window_size, bin_size)
     num_units = len(sorting.unit_ids)
 
+    if n_jobs > 1:
+        pairs = pair_mask_to_pairs(np.ones((num_units, num_units), dtype=bool))
+        correlograms = _compute_pair_correlograms_numba(sorting, pairs, window_size, bin_size, n_jobs=n_jobs)
+        # pairs of a full mask are in C order
+        return correlograms.reshape(num_units, num_units, num_bins)
+
     spikes = sorting.to_spike_vector(concatenated=False)
     correlograms = np.zeros((num_units, num_units, num_bins), dtype=np.int64)
 
@@ -503,3 +703,156 @@ if HAVE_NUMBA:
                 bin = diff // bin_size
 
                 correlograms[spike_unit_indices[i], spike_unit_indices[j], num_half_bins + bin] += 1
+
+
+def _compute_pair_correlograms_numpy(sorting, pairs, window_size, bin_size):
+    """
+    Computes correlograms only for the given ordered pairs of units.
+
+    For each pair (A, B) and each spike of A, the spikes of B within the window
+    are found with `np.searchsorted()` on the sorted spike trains, so the cost
+    scales with the number of pairs and not with num_units ** 2.
+
+    Parameters
+    ----------
+    sorting : Sorting
+        A SpikeInterface Sorting object
+    pairs : np.ndarray
+        A (num_pairs, 2) array of unit indices, see `pair_mask_to_pairs()`
+    window_size : int
+        The window size over which to perform the cross-correlation, in samples
+    bin_size : int
+        The size of which to bin lags, in samples.
+
+    Returns
+    -------
+    correlograms : np.array
+        A (num_pairs, num_bins) array of correlograms
+    """
+    num_bins, num_half_bins = _compute_num_bins(window_size, bin_size)
+    correlograms = np.zeros((pairs.shape[0], num_bins), dtype="int64")
+
+    for segment_index in range(sorting.get_num_segments()):
+        spike_trains = [
+            sorting.get_unit_spike_train(unit_id, segment_index=segment_index).astype("int64")
+            for unit_id in sorting.unit_ids
+        ]
+        for pair_index, (unit_ind1, unit_ind2) in enumerate(pairs):
+            times1 = spike_trains[unit_ind1]
+            times2 = spike_trains[unit_ind2]
+            if times1.size == 0 or times2.size == 0:
+                continue
+            # same convention as the dense version: diff = t1 - t2 with -window_size <= diff < window_size
+            start = np.searchsorted(times2, times1 - window_size, side="right")
+            stop = np.searchsorted(times2, times1 + window_size, side="right")
+            counts = stop - start
+            inds1 = np.repeat(np.arange(times1.size), counts)
+            inds2 = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(start, counts)
+            if unit_ind1 == unit_ind2:
+                keep = inds1 != inds2
+                inds1, inds2 = inds1[keep], inds2[keep]
+            diff = times1[inds1] - times2[inds2]
+            correlograms[pair_index, :] += np.bincount(diff // bin_size + num_half_bins, minlength=num_bins)
+
+    return correlograms
+
+
+def _compute_pair_correlograms_numba(sorting, pairs, window_size, bin_size, n_jobs=1):
+    """
+    Computes correlograms only for the given ordered pairs of units using numba.
+
+    Spikes of all segments are processed in parallel over units with `n_jobs` threads:
+    each thread handles the spikes of one unit, so it only writes the rows of the pairs
+    starting with this unit and no reduction is needed.
+    See `_compute_pair_correlograms_numpy()` for the other parameters.
+    """
+    assert HAVE_NUMBA, "numba version of this function requires installation of numba"
+
+    num_bins, num_half_bins = _compute_num_bins(window_size, bin_size)
+    num_units = len(sorting.unit_ids)
+
+    pair_table = np.full((num_units, num_units), -1, dtype=np.int32)
+    pair_table[pairs[:, 0], pairs[:, 1]] = np.arange(pairs.shape[0], dtype=np.int32)
+
+    spikes = sorting.to_spike_vector(concatenated=False)
+    spike_times = np.concatenate([s["sample_index"] for s in spikes]).astype(np.int64)
+    spike_unit_indices = np.concatenate([s["unit_index"] for s in spikes]).astype(np.int32)
+    segment_bounds = np.zeros(len(spikes) + 1, dtype=np.int64)
+    segment_bounds[1:] = np.cumsum([s.size for s in spikes])
+    spike_segment_indices = np.repeat(np.arange(len(spikes), dtype=np.int64), np.diff(segment_bounds))
+
+    order = np.argsort(spike_unit_indices, kind="stable").astype(np.int64)
+    unit_bounds = np.zeros(num_units + 1, dtype=np.int64)
+    unit_bounds[1:] = np.cumsum(np.bincount(spike_unit_indices, minlength=num_units))
+
+    correlograms = np.zeros((pairs.shape[0], num_bins), dtype=np.int64)
+    with numba_threads_limit(n_jobs):
+        _compute_pair_correlograms_numba_kernel(
+            correlograms,
+            spike_times,
+            spike_unit_indices,
+            spike_segment_indices,
+            segment_bounds,
+            order,
+            unit_bounds,
+            pair_table,
+            window_size,
+            bin_size,
+            num_half_bins,
+        )
+
+    return correlograms
+
+
+if HAVE_NUMBA:
+
+    @numba.jit(nopython=True, nogil=True, cache=False, parallel=True)
+    def _compute_pair_correlograms_numba_kernel(
+        correlograms,
+        spike_times,
+        spike_unit_indices,
+        spike_segment_indices,
+        segment_bounds,
+        order,
+        unit_bounds,
+        pair_table,
+        window_size,
+        bin_size,
+        num_half_bins,
+    ):
+        num_units = unit_bounds.size - 1
+        for unit_ind in numba.prange(num_units):
+            has_pairs = False
+            for other_ind in range(num_units):
+                if pair_table[unit_ind, other_ind] >= 0:
+                    has_pairs = True
+                    break
+            if not has_pairs:
+                continue
+
+            for k in range(unit_bounds[unit_ind], unit_bounds[unit_ind + 1]):
+                i = order[k]
+                seg_start = segment_bounds[spike_segment_indices[i]]
+                seg_stop = segment_bounds[spike_segment_indices[i] + 1]
+
+                # earlier spikes: 0 <= diff < window_size
+                j = i - 1
+                while j >= seg_start:
+                    diff = spike_times[i] - spike_times[j]
+                    if diff >= window_size:
+                        break
+                    pair_index = pair_table[unit_ind, spike_unit_indices[j]]
+                    if pair_index >= 0:
+                        correlograms[pair_index, num_half_bins + diff // bin_size] += 1
+                    j -= 1
+
+                # later spikes: -window_size <= diff <= 0
+                j = i + 1
+                while j < seg_stop:
+                    diff = spike_times[i] - spike_times[j]
+                    if diff < -window_size:
+                        break
+                    pair_index = pair_table[unit_ind, spike_unit_indices[j]]
+                    if pair_index >= 0:
+                        correlograms[pair_index, num_half_bins + diff // bin_size] += 1
+                    j += 1
@@ -3,6 +3,7 @@ from __future__ import annotations
 import numpy as np
 
 from spikeinterface.core.sortinganalyzer import register_result_extension, AnalyzerExtension
+from spikeinterface.core.job_tools import fix_job_kwargs, numba_threads_limit, _shared_job_kwargs_doc
 
 try:
     import numba
@@ -25,6 +26,7 @@ class ComputeISIHistograms(AnalyzerExtension):
         The bin size in ms
     method : "auto" | "numpy" | "numba", default: "auto"
         . If "auto" and numba is installed, numba is used, otherwise numpy is used
+    {}
 
     Returns
     -------
@@ -38,7 +40,7 @@ class ComputeISIHistograms(AnalyzerExtension):
     depend_on = []
     need_recording = False
     use_nodepipeline = False
-    need_job_kwargs = False
+    need_job_kwargs = True
 
     def __init__(self, sorting_analyzer):
         AnalyzerExtension.__init__(self, sorting_analyzer)
@@ -66,8 +68,9 @@ class ComputeISIHistograms(AnalyzerExtension):
         new_isi_hists = np.zeros((len(all_new_units), num_dims), dtype=arr.dtype)
 
         # compute all new isi at once
+        job_kwargs = fix_job_kwargs(job_kwargs)
         new_sorting = new_sorting_analyzer.sorting.select_units(new_unit_ids)
-        only_new_hist, _ = _compute_isi_histograms(new_sorting, **self.params)
+        only_new_hist, _ = _compute_isi_histograms(new_sorting, **self.params, n_jobs=job_kwargs["n_jobs"])
 
         for unit_ind, unit_id in enumerate(all_new_units):
             if unit_id not in new_unit_ids:
@@ -80,8 +83,11 @@ class ComputeISIHistograms(AnalyzerExtension):
         new_extension_data = dict(isi_histograms=new_isi_hists, bins=new_bins)
         return new_extension_data
 
-    def _run(self, verbose=False):
-        isi_histograms, bins = _compute_isi_histograms(self.sorting_analyzer.sorting, **self.params)
+    def _run(self, verbose=False, **job_kwargs):
+        job_kwargs = fix_job_kwargs(job_kwargs)
+        isi_histograms, bins = _compute_isi_histograms(
+            self.sorting_analyzer.sorting, **self.params, n_jobs=job_kwargs["n_jobs"]
+        )
         self.data["isi_histograms"] = isi_histograms
         self.data["bins"] = bins
 
@@ -89,14 +95,20 @@ class ComputeISIHistograms(AnalyzerExtension):
         return self.data["isi_histograms"], self.data["bins"]
 
 
+ComputeISIHistograms.__doc__ = ComputeISIHistograms.__doc__.format(_shared_job_kwargs_doc)
+
 register_result_extension(ComputeISIHistograms)
 compute_isi_histograms = ComputeISIHistograms.function_factory()
 
 
-def _compute_isi_histograms(sorting, window_ms: float = 50.0, bin_ms: float = 1.0, method: str = "auto"):
+def _compute_isi_histograms(
+    sorting, window_ms: float = 50.0, bin_ms: float = 1.0, method: str = "auto", n_jobs: int = 1
+):
     """
     Computes the Inter-Spike Intervals histogram for all
     the units inside the given sorting.
+
+    `n_jobs` is the number of threads of the numba implementation, the numpy one is single threaded.
     """
 
     assert method in ("auto", "numba", "numpy")
@@ -107,7 +119,7 @@ def _compute_isi_histograms(sorting, window_ms: float = 50.0, bin_ms: float = 1.
     if method == "numpy":
         return compute_isi_histograms_numpy(sorting, window_ms, bin_ms)
     if method == "numba":
-        return compute_isi_histograms_numba(sorting, window_ms, bin_ms)
+        return compute_isi_histograms_numba(sorting, window_ms, bin_ms, n_jobs=n_jobs)
 
 
 # LOW-LEVEL IMPLEMENTATIONS
@@ -140,13 +152,14 @@ def compute_isi_histograms_numpy(sorting, window_ms: float = 50.0, bin_ms: float
     return ISIs, bins * 1e3 / fs
 
 
-def compute_isi_histograms_numba(sorting, window_ms: float = 50.0, bin_ms: float = 1.0):
+def compute_isi_histograms_numba(sorting, window_ms: float = 50.0, bin_ms: float = 1.0, n_jobs: int = 1):
     """
     Computes the Inter-Spike Intervals histogram for all
     the units inside the given sorting.
 
     This is a "brute force" method using compiled code (numba)
-    to accelerate the computation.
+    to accelerate the computation. Spikes are grouped by unit once per
+    segment and units are processed in parallel with `n_jobs` threads.
 
     Implementation: Aurélien Wyngaard
     """
@@ -168,14 +181,15 @@ def compute_isi_histograms_numba(sorting, window_ms: float = 50.0, bin_ms: float
 
     for seg_index in range(sorting.get_num_segments()):
         spike_times = spikes[seg_index]["sample_index"].astype(np.int64)
-        spike_labels = spikes[seg_index]["unit_index"].astype(np.int32)
+        spike_labels = spikes[seg_index]["unit_index"]
 
-        _compute_isi_histograms_numba(
-            ISIs,
-            spike_times,
-            spike_labels,
-            bins,
-        )
+        # spike trains of each unit are contiguous after a stable sort
+        order = np.argsort(spike_labels, kind="stable")
+        unit_bounds = np.zeros(num_units + 1, dtype=np.int64)
+        unit_bounds[1:] = np.cumsum(np.bincount(spike_labels, minlength=num_units))
+
+        with numba_threads_limit(n_jobs):
+            _compute_isi_histograms_numba(ISIs, spike_times[order], unit_bounds, window_size, bin_size)
 
     return ISIs, bins * 1e3 / fs
 
@@ -186,11 +200,17 @@ if HAVE_NUMBA:
         nopython=True,
         nogil=True,
         cache=False,
+        parallel=True,
     )
-    def _compute_isi_histograms_numba(ISIs, spike_trains, spike_clusters, bins):
+    def _compute_isi_histograms_numba(ISIs, sorted_spike_trains, unit_bounds, window_size, bin_size):
         n_units = ISIs.shape[0]
-
-        units_loop = numba.prange(n_units) if n_units > 300 else range(n_units)
-        for i in units_loop:
-            spike_train = spike_trains[spike_clusters == i]
-            ISIs[i] += np.histogram(np.diff(spike_train), bins=bins)[0]
+        num_bins = ISIs.shape[1]
+
+        for i in numba.prange(n_units):
+            for k in range(unit_bounds[i] + 1, unit_bounds[i + 1]):
+                isi = sorted_spike_trains[k] - sorted_spike_trains[k - 1]
+                # same as np.histogram: the last bin includes its right edge
+                if isi > window_size:
+                    continue
+                bin = min(isi // bin_size, num_bins - 1)
+                ISIs[i, bin] += 1
@@ -100,7 +100,11 @@ def compute_monopolar_triangulation(
         enforce_decrease_radial_parents = make_radial_order_parents(contact_locations, neighbours_mask)
         best_channels = get_template_extremum_channel(sorting_analyzer_or_templates, outputs="index")
 
-    unit_location = np.zeros((unit_ids.size, 4), dtype="float64")
+    # features are padded to the largest number of channels and solved in one batch
+    max_num_channels = max((sparsity.unit_id_to_channel_indices[unit_id].size for unit_id in unit_ids), default=0)
+    all_wf_data = np.zeros((unit_ids.size, max_num_channels), dtype="float64")
+    all_local_contact_locations = np.zeros((unit_ids.size, max_num_channels, 2), dtype="float64")
+    channel_mask = np.zeros((unit_ids.size, max_num_channels), dtype=bool)
     for i, unit_id in enumerate(unit_ids):
         chan_inds = sparsity.unit_id_to_channel_indices[unit_id]
         local_contact_locations = contact_locations[chan_inds, :]
@@ -119,7 +123,13 @@ def compute_monopolar_triangulation(
         #        wf_data, best_channels[unit_id], enforce_decrease_radial_parents, in_place=True
         #    )
 
-        unit_location[i] = solve_monopolar_triangulation(wf_data, local_contact_locations, max_distance_um, optimizer)
+        all_wf_data[i, : chan_inds.size] = wf_data
+        all_local_contact_locations[i, : chan_inds.size] = local_contact_locations
+        channel_mask[i, : chan_inds.size] = True
+
+    unit_location = solve_monopolar_triangulation_batch(
+        all_wf_data, all_local_contact_locations, channel_mask, max_distance_um, optimizer
+    )
 
     if not return_alpha:
         unit_location = unit_location[:, :3]
@@ -383,6 +393,245 @@ def solve_monopolar_triangulation(wf_data, local_contact_locations, max_distance
             return (np.nan, np.nan, np.nan, np.nan)
 
 
+def make_initial_guess_and_bounds_batch(wf_data, local_contact_locations, channel_mask, max_distance_um, initial_z=20):
+    """
+    Batched version of `make_initial_guess_and_bounds()`.
+
+    Parameters
+    ----------
+    wf_data : np.array
+        The features with shape (num_items, num_channels), padded with zeros
+    local_contact_locations : np.array
+        The local contact locations with shape (num_items, num_channels, 2)
+    channel_mask : np.array
+        Boolean mask with shape (num_items, num_channels) of the valid channels
+    max_distance_um : float
+        Boundary for x, y, z and alpha
+    initial_z : float, default: 20
+        The initial guess for z
+
+    Returns
+    -------
+    x0 : np.array
+        The initial guesses (x, y, z, alpha) with shape (num_items, 4)
+    lower, upper : np.array
+        The bounds with shape (num_items, 4)
+    """
+    num_items = wf_data.shape[0]
+    wf_data = np.where(channel_mask, wf_data, 0.0)
+    ind_max = np.argmax(np.where(channel_mask, wf_data, -np.inf), axis=1)
+    max_ptp = wf_data[np.arange(num_items), ind_max]
+    max_alpha = max_ptp * max_distance_um
+
+    # initial guess is the center of mass
+    com = np.sum(wf_data[:, :, np.newaxis] * local_contact_locations, axis=1) / np.sum(wf_data, axis=1)[:, np.newaxis]
+    x0 = np.zeros((num_items, 4), dtype="float64")
+    x0[:, :2] = com
+    x0[:, 2] = initial_z
+    max_location = local_contact_locations[np.arange(num_items), ind_max]
+    x0[:, 3] = np.sqrt(np.sum((com - max_location) ** 2, axis=1) + initial_z**2) * max_ptp
+
+    # bounds depend on initial guess
+    lower = np.stack([x0[:, 0] - max_distance_um, x0[:, 1] - max_distance_um, np.ones(num_items), np.zeros(num_items)])
+    upper = np.stack(
+        [
+            x0[:, 0] + max_distance_um,
+            x0[:, 1] + max_distance_um,
+            np.full(num_items, max_distance_um * 10.0),
+            max_alpha,
+        ]
+    )
+    return x0, lower.T, upper.T
+
+
+def solve_monopolar_triangulation_batch(
+    wf_data, local_contact_locations, channel_mask, max_distance_um, optimizer, max_iterations=200, tol=1e-10
+):
+    """
+    Batched version of `solve_monopolar_triangulation()`: all items are fitted at once with a vectorized
+    projected Levenberg-Marquardt, using the same initial guesses and bounds as the scipy based solver.
+
+    Items have different channel counts, so the inputs are padded and `channel_mask` gives the valid channels.
+
+    Parameters
+    ----------
+    wf_data : np.array
+        The features (ptp, energy, ...) with shape (num_items, num_channels)
+    local_contact_locations : np.array
+        The contact locations of each item with shape (num_items, num_channels, 2)
+    channel_mask : np.array | None
+        Boolean mask with shape (num_items, num_channels). If None all channels are valid.
+    max_distance_um : float
+        Boundary for x, y, z and alpha
+    optimizer : "least_square" | "minimize_with_log_penality"
+        The objective, see `solve_monopolar_triangulation()`
+    max_iterations : int, default: 200
+        Maximum number of iterations
+    tol : float, default: 1e-10
+        Relative tolerance on the objective to stop the iterations
+
+    Returns
+    -------
+    locations : np.array
+        The (x, y, z, alpha) estimations with shape (num_items, 4), nan when the fit failed
+    """
+    assert optimizer in ("least_square", "minimize_with_log_penality")
+
+    wf_data = np.asarray(wf_data, dtype="float64")
+    local_contact_locations = np.asarray(local_contact_locations, dtype="float64")
+    num_items, num_channels = wf_data.shape
+    if channel_mask is None:
+        channel_mask = np.ones((num_items, num_channels), dtype=bool)
+    locations = np.full((num_items, 4), np.nan)
+    if num_items == 0:
+        return locations
+
+    x0, lower, upper = make_initial_guess_and_bounds_batch(
+        wf_data, local_contact_locations, channel_mask, max_distance_um
+    )
+    valid = np.all(np.isfinite(x0), axis=1) & np.all(lower <= upper, axis=1)
+
+    mask = channel_mask.astype("float64")
+    if optimizer == "least_square":
+        data = wf_data * mask
+        weights = np.ones(num_items)
+        log_penalty = False
+    else:
+        # alpha is unbounded and fitted on data scaled by its max, z has a log penalty
+        max_data = np.max(np.where(channel_mask, wf_data, -np.inf), axis=1)
+        max_data[~np.isfinite(max_data) | (max_data == 0)] = 1.0
+        data = wf_data * mask / max_data[:, np.newaxis]
+        weights = 1.0 / np.sqrt(np.sum(mask, axis=1))
+        log_penalty = True
+        lower[:, 3] = -np.inf
+        upper[:, 3] = np.inf
+        x0[:, 3] = _monopolar_best_alpha(x0[:, :3], data, local_contact_locations, mask)
+
+    x0[~valid] = 0.0
+    lower[~valid] = -1.0
+    upper[~valid] = 1.0
+    params = np.clip(x0, lower, upper)
+
+    objective, residuals, jacobian = _monopolar_objective(
+        params, data, local_contact_locations, mask, weights, log_penalty
+    )
+    damping = np.full(num_items, 1.0)
+    active_items = valid.copy()
+    diag = np.arange(4)
+    for _ in range(max_iterations):
+        if not np.any(active_items):
+            break
+        inds = np.flatnonzero(active_items)
+        J = jacobian[inds]
+        gradient = 2 * np.einsum("nci,nc->ni", J, residuals[inds])
+        hessian = 2 * np.einsum("nci,ncj->nij", J, J)
+        if log_penalty:
+            z = params[inds, 2]
+            gradient[:, 2] -= 1e-3 / (1 + 10 * z)
+            hessian[:, 2, 2] += 1e-2 / (1 + 10 * z) ** 2
+
+        # variables on a bound with a gradient pointing outside are frozen
+        at_bound = ((params[inds] <= lower[inds]) & (gradient > 0)) | ((params[inds] >= upper[inds]) & (gradient < 0))
+        gradient[at_bound] = 0.0
+        if log_penalty:
+            # same stopping rule as the L-BFGS-B projected gradient tolerance used by scipy.optimize.minimize
+            done = np.max(np.abs(gradient[:, :3]), axis=1) <= 1e-5
+            if np.any(done):
+                active_items[inds[done]] = False
+                keep = ~done
+                inds, gradient, hessian, at_bound = inds[keep], gradient[keep], hessian[keep], at_bound[keep]
+                if inds.size == 0:
+                    break
+        hessian_diag = np.maximum(hessian[:, diag, diag], 1e-12)
+        system = hessian.copy()
+        system[:, diag, diag] += damping[inds, np.newaxis] * hessian_diag
+        system[at_bound[:, :, np.newaxis] | at_bound[:, np.newaxis, :]] = 0.0
+        system[:, diag, diag] = np.where(at_bound, 1.0, system[:, diag, diag])
+        with np.errstate(all="ignore"):
+            try:
+                step = -np.linalg.solve(system, gradient[:, :, np.newaxis])[:, :, 0]
+            except np.linalg.LinAlgError:
+                step = -gradient / system[:, diag, diag]
+        step[~np.isfinite(step)] = 0.0
+
+        new_params = np.clip(params[inds] + step, lower[inds], upper[inds])
+        new_objective, new_residuals, new_jacobian = _monopolar_objective(
+            new_params, data[inds], local_contact_locations[inds], mask[inds], weights[inds], log_penalty
+        )
+        improved = new_objective < objective[inds]
+        decrease = objective[inds] - new_objective
+        small_step = np.all(np.abs(new_params - params[inds]) <= 1e-9 * (1 + np.abs(params[inds])), axis=1)
+        improved_inds = inds[improved]
+        if log_penalty and improved_inds.size > 0:
+            # keep alpha at its optimum for the new position
+            new_params = new_params[improved]
+            new_params[:, 3] = _monopolar_best_alpha(
+                new_params[:, :3], data[improved_inds], local_contact_locations[improved_inds], mask[improved_inds]
+            )
+            new_objective, new_residuals, new_jacobian = _monopolar_objective(
+                new_params,
+                data[improved_inds],
+                local_contact_locations[improved_inds],
+                mask[improved_inds],
+                weights[improved_inds],
+                log_penalty,
+            )
+        else:
+            new_params = new_params[improved]
+            new_objective = new_objective[improved]
+            new_residuals = new_residuals[improved]
+            new_jacobian = new_jacobian[improved]
+        params[improved_inds] = new_params
+        objective[improved_inds] = new_objective
+        residuals[improved_inds] = new_residuals
+        jacobian[improved_inds] = new_jacobian
+        damping[inds] = np.clip(np.where(improved, damping[inds] / 3.0, damping[inds] * 2.0), 1e-12, 1e12)
+
+        converged = improved & (decrease <= tol * np.abs(objective[inds]))
+        converged |= small_step
+        converged |= damping[inds] >= 1e12
+        active_items[inds[converged]] = False
+
+    locations[valid] = params[valid]
+    if optimizer == "minimize_with_log_penality":
+        # final alpha on the unscaled data
+        locations[valid, 3] = _monopolar_best_alpha(
+            params[valid, :3], wf_data[valid] * mask[valid], local_contact_locations[valid], mask[valid]
+        )
+    return locations
+
+
+def _monopolar_objective(params, data, local_contact_locations, mask, weights, log_penalty):
+    """
+    Objective, residuals and jacobian of the residuals of the monopolar model alpha / distance,
+    for a batch of (x, y, z, alpha) parameters.
+    """
+    dx = params[:, np.newaxis, 0] - local_contact_locations[:, :, 0]
+    dy = params[:, np.newaxis, 1] - local_contact_locations[:, :, 1]
+    z = params[:, np.newaxis, 2]
+    alpha = params[:, np.newaxis, 3]
+    with np.errstate(all="ignore"):
+        q = mask / np.sqrt(dx**2 + dy**2 + z**2)
+    w = weights[:, np.newaxis]
+    residuals = w * (data - alpha * q)
+
+    q3 = w * alpha * q**3
+    jacobian = np.stack([q3 * dx, q3 * dy, q3 * z, -w * q], axis=2)
+
+    objective = np.sum(residuals**2, axis=1)
+    if log_penalty:
+        objective -= np.log1p(10.0 * params[:, 2]) / 10000.0
+    objective[~np.isfinite(objective)] = np.inf
+    return objective, residuals, jacobian
+
+
+def _monopolar_best_alpha(positions, data, local_contact_locations, mask):
+    """The least square alpha for given (x, y, z) positions."""
+    dist2 = np.sum((positions[:, np.newaxis, :2] - local_contact_locations) ** 2, axis=2) + positions[:, 2:3] ** 2
+    q = mask / np.sqrt(dist2)
+    return np.sum(data * q, axis=1) / np.sum(q * q, axis=1)
+
+
 # ----
 # optimizer "least_square"
 
@@ -513,6 +762,13 @@ def enforce_decrease_shells_data(wf_data, maxchan, radial_parents, in_place=Fals
     return decreasing_data
 
 
+def enforce_decrease_shells_data_batch(wf_data, maxchan, radial_parents):
+    """Radial enforce decrease, in place, for several data vectors (num_items, num_channels) with the same maxchan"""
+    for c, parents_rel in radial_parents[maxchan]:
+        np.minimum(wf_data[:, c], wf_data[:, parents_rel].max(axis=1), out=wf_data[:, c])
+    return wf_data
+
+
 def get_grid_convolution_templates_and_weights(
     contact_locations, radius_um=40, upsampling_um=5, margin_um=50, weight_method={"mode": "exponential_3d"}
 ):
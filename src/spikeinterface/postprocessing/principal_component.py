@@ -69,6 +69,7 @@ class ComputePrincipalComponents(AnalyzerExtension):
     need_recording = False
     use_nodepipeline = False
     need_job_kwargs = True
+    per_spike_data = dict(pca_projection="random_spikes")
 
     def __init__(self, sorting_analyzer):
         AnalyzerExtension.__init__(self, sorting_analyzer)
@@ -195,11 +196,9 @@ class ComputePrincipalComponents(AnalyzerExtension):
             assert self.params["mode"] != "concatenated", "mode concatenated cannot retrieve sparse projection"
             assert sparsity is not None, "sparse projection need SortingAnalyzer to be sparse"
 
-        some_spikes = self.sorting_analyzer.get_extension("random_spikes").get_random_spikes()
-
         unit_index = sorting.id_to_index(unit_id)
-        spike_mask = some_spikes["unit_index"] == unit_index
-        projections = self.data["pca_projection"][spike_mask]
+        rows = self.sorting_analyzer.get_extension("random_spikes").get_unit_spike_rows(unit_index=unit_index)
+        projections = self.data["pca_projection"][rows]
 
         if sparsity is None:
             return projections
@@ -335,7 +334,7 @@ class ComputePrincipalComponents(AnalyzerExtension):
 
         # transform
         waveforms_ext = self.sorting_analyzer.get_extension("waveforms")
-        some_waveforms = waveforms_ext.data["waveforms"]
+        some_waveforms = waveforms_ext.get_data()
         some_spikes = self.sorting_analyzer.get_extension("random_spikes").get_random_spikes()
 
         pca_projection = self._transform_waveforms(some_spikes, some_waveforms, pca_model, progress_bar)
@@ -596,11 +595,20 @@ class ComputePrincipalComponents(AnalyzerExtension):
     def _get_sparse_waveforms(self, unit_id):
         # get waveforms + channel_inds: dense or sparse
         waveforms_ext = self.sorting_analyzer.get_extension("waveforms")
-        some_waveforms = waveforms_ext.data["waveforms"]
+        wfs = waveforms_ext.get_waveforms_one_unit(unit_id, force_dense=False)
 
-        some_spikes = self.sorting_analyzer.get_extension("random_spikes").get_random_spikes()
+        random_spikes_ext = self.sorting_analyzer.get_extension("random_spikes")
+        unit_index = self.sorting_analyzer.sorting.id_to_index(unit_id)
+        spike_mask = np.zeros(random_spikes_ext.data["random_spikes_indices"].size, dtype=bool)
+        spike_mask[random_spikes_ext.get_unit_spike_rows(unit_index=unit_index)] = True
 
-        return self._get_slice_waveforms(unit_id, some_spikes, some_waveforms)
+        sparsity = self.sorting_analyzer.sparsity
+        if sparsity is not None:
+            channel_inds = sparsity.unit_id_to_channel_indices[unit_id]
+        else:
+            channel_inds = np.arange(self.sorting_analyzer.channel_ids.size, dtype=int)
+
+        return wfs, channel_inds, spike_mask
 
 
 def _all_pc_extractor_chunk(segment_index, start_frame, end_frame, worker_ctx):
@@ -60,6 +60,7 @@ class ComputeSpikeAmplitudes(AnalyzerExtension):
     use_nodepipeline = True
     nodepipeline_variables = ["amplitudes"]
     need_job_kwargs = True
+    per_spike_data = dict(amplitudes="spikes")
 
     def __init__(self, sorting_analyzer):
         AnalyzerExtension.__init__(self, sorting_analyzer)
@@ -127,7 +128,7 @@ class ComputeSpikeAmplitudes(AnalyzerExtension):
             nodes,
             job_kwargs=job_kwargs,
             job_name="spike_amplitudes",
-            gather_mode="memory",
+            **self._get_pipeline_gather_kwargs(),
             verbose=False,
         )
         self.data["amplitudes"] = amps
@@ -55,6 +55,7 @@ class ComputeSpikeLocations(AnalyzerExtension):
     use_nodepipeline = True
     nodepipeline_variables = ["spike_locations"]
     need_job_kwargs = True
+    per_spike_data = dict(spike_locations="spikes")
 
     def __init__(self, sorting_analyzer):
         AnalyzerExtension.__init__(self, sorting_analyzer)
@@ -139,7 +140,7 @@ class ComputeSpikeLocations(AnalyzerExtension):
             nodes,
             job_kwargs=job_kwargs,
             job_name="spike_locations",
-            gather_mode="memory",
+            **self._get_pipeline_gather_kwargs(),
             verbose=verbose,
         )
         self.data["spike_locations"] = spike_locations
@@ -10,7 +10,11 @@ import numpy as np
 import warnings
 from copy import deepcopy
 
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
 from ..core.sortinganalyzer import register_result_extension, AnalyzerExtension
+from ..core.job_tools import fix_job_kwargs
 from ..core.template_tools import get_template_extremum_channel
 from ..core.template_tools import get_dense_templates_array
 
@@ -80,6 +84,9 @@ class ComputeTemplateMetrics(AnalyzerExtension):
                 - If None, all channels all channels are considered
                 - If 0 or 1, only the "column" that includes the max channel is considered
                 - If > 1, only channels within range (+/-) um from the max channel horizontal position are used
+    **job_kwargs : keyword arguments for parallel processing
+        With n_jobs > 1, the multi-channel fits (velocity and exp decay) of units are run in parallel
+        with a process pool (n_jobs and mp_context are used).
 
     Returns
     -------
@@ -99,7 +106,7 @@ class ComputeTemplateMetrics(AnalyzerExtension):
     depend_on = ["templates"]
     need_recording = False
     use_nodepipeline = False
-    need_job_kwargs = False
+    need_job_kwargs = True
 
     min_channels_for_multi_channel_warning = 10
 
@@ -203,6 +210,25 @@ class ComputeTemplateMetrics(AnalyzerExtension):
         new_data = dict(metrics=metrics)
         return new_data
 
+    def _compute_single_channel_metric_one_by_one(
+        self, metric_name, templates_upsampled, sampling_frequency, trough_idx, peak_idx, template_unit_ids
+    ):
+        func = _single_channel_metric_name_to_func[metric_name]
+        values = np.zeros(templates_upsampled.shape[0], dtype="float64")
+        for i, template_upsampled in enumerate(templates_upsampled):
+            try:
+                values[i] = func(
+                    template_upsampled,
+                    sampling_frequency=sampling_frequency,
+                    trough_idx=int(trough_idx[i]),
+                    peak_idx=int(peak_idx[i]),
+                    **self.params["metrics_kwargs"],
+                )
+            except Exception as e:
+                warnings.warn(f"Error computing metric {metric_name} for unit {template_unit_ids[i]}: {e}")
+                values[i] = np.nan
+        return values
+
     def _compute_metrics(self, sorting_analyzer, unit_ids=None, verbose=False, metric_names=None, **job_kwargs):
         """
         Compute template metrics.
@@ -240,98 +266,130 @@ class ComputeTemplateMetrics(AnalyzerExtension):
 
         channel_locations = sorting_analyzer.get_channel_locations()
 
+        if upsampling_factor > 1:
+            assert isinstance(upsampling_factor, (int, np.integer)), "'upsample' must be an integer"
+            sampling_frequency_up = upsampling_factor * sampling_frequency
+        else:
+            sampling_frequency_up = sampling_frequency
+
+        # compute single_channel metrics on all (unit, channel) templates at once
+        row_indices = []
+        template_unit_ids = []
+        template_unit_indices = []
+        template_channel_indices = []
         for unit_id in unit_ids:
             unit_index = sorting_analyzer.sorting.id_to_index(unit_id)
-            template_all_chans = all_templates[unit_index]
             chan_ids = np.array(extremum_channels_ids[unit_id])
             if chan_ids.ndim == 0:
                 chan_ids = [chan_ids]
             chan_ind = sorting_analyzer.channel_ids_to_indices(chan_ids)
-            template = template_all_chans[:, chan_ind]
-
-            # compute single_channel metrics
-            for i, template_single in enumerate(template.T):
+            for i, channel_index in enumerate(chan_ind):
                 if sparsity is None:
-                    index = unit_id
+                    row_indices.append(unit_id)
                 else:
-                    index = (unit_id, chan_ids[i])
-                if upsampling_factor > 1:
-                    assert isinstance(upsampling_factor, (int, np.integer)), "'upsample' must be an integer"
-                    template_upsampled = resample_poly(template_single, up=upsampling_factor, down=1)
-                    sampling_frequency_up = upsampling_factor * sampling_frequency
-                else:
-                    template_upsampled = template_single
-                    sampling_frequency_up = sampling_frequency
-
-                trough_idx, peak_idx = get_trough_and_peak_idx(template_upsampled)
-
-                for metric_name in metrics_single_channel:
-                    func = _metric_name_to_func[metric_name]
-                    try:
-                        value = func(
-                            template_upsampled,
-                            sampling_frequency=sampling_frequency_up,
-                            trough_idx=trough_idx,
-                            peak_idx=peak_idx,
-                            **self.params["metrics_kwargs"],
-                        )
-                    except Exception as e:
-                        warnings.warn(f"Error computing metric {metric_name} for unit {unit_id}: {e}")
-                        value = np.nan
-                    template_metrics.at[index, metric_name] = value
-
-            # compute metrics multi_channel
-            for metric_name in metrics_multi_channel:
+                    row_indices.append((unit_id, chan_ids[i]))
+                template_unit_ids.append(unit_id)
+                template_unit_indices.append(unit_index)
+                template_channel_indices.append(channel_index)
+
+        if len(metrics_single_channel) > 0 and len(row_indices) > 0:
+            rows = template_metrics.index.get_indexer(row_indices)
+            templates_single = all_templates[template_unit_indices, :, template_channel_indices]
+            if upsampling_factor > 1:
+                templates_upsampled = resample_poly(templates_single, up=upsampling_factor, down=1, axis=1)
+            else:
+                templates_upsampled = templates_single
+
+            trough_idx, peak_idx = _get_trough_and_peak_idx_batch(templates_upsampled)
+
+            for metric_name in metrics_single_channel:
+                func = _single_channel_metric_name_to_batch_func[metric_name]
+                try:
+                    values = func(
+                        templates_upsampled,
+                        sampling_frequency=sampling_frequency_up,
+                        trough_idx=trough_idx,
+                        peak_idx=peak_idx,
+                        **self.params["metrics_kwargs"],
+                    )
+                except Exception:
+                    # one template can make the whole batch fail: only the failing templates get NaN
+                    values = self._compute_single_channel_metric_one_by_one(
+                        metric_name,
+                        templates_upsampled,
+                        sampling_frequency_up,
+                        trough_idx,
+                        peak_idx,
+                        template_unit_ids,
+                    )
+                template_metrics.iloc[rows, template_metrics.columns.get_loc(metric_name)] = values
+
+        # compute metrics multi_channel, the fits of each unit are independent and can run in parallel
+        if len(metrics_multi_channel) > 0 and len(unit_ids) > 0:
+            unit_indices = sorting_analyzer.sorting.ids_to_indices(unit_ids)
+            templates = all_templates[unit_indices]
+            if upsampling_factor > 1:
+                templates = resample_poly(templates, up=upsampling_factor, down=1, axis=1)
+
+            items = []
+            for i, unit_index in enumerate(unit_indices):
                 # retrieve template (with sparsity if waveform extractor is sparse)
-                template = all_templates[unit_index, :, :]
+                template = templates[i]
                 if sorting_analyzer.is_sparse():
                     mask = sorting_analyzer.sparsity.mask[unit_index, :]
                     template = template[:, mask]
+                    channel_locations_sparse = channel_locations[mask]
+                else:
+                    channel_locations_sparse = channel_locations
 
                 if template.shape[1] < self.min_channels_for_multi_channel_warning:
                     warnings.warn(
                         f"With less than {self.min_channels_for_multi_channel_warning} channels, "
                         "multi-channel metrics might not be reliable."
                     )
-                if sorting_analyzer.is_sparse():
-                    channel_locations_sparse = channel_locations[sorting_analyzer.sparsity.mask[unit_index]]
-                else:
-                    channel_locations_sparse = channel_locations
+                items.append(
+                    (
+                        metrics_multi_channel,
+                        template,
+                        channel_locations_sparse,
+                        sampling_frequency_up,
+                        self.params["metrics_kwargs"],
+                    )
+                )
 
-                if upsampling_factor > 1:
-                    assert isinstance(upsampling_factor, (int, np.integer)), "'upsample' must be an integer"
-                    template_upsampled = resample_poly(template, up=upsampling_factor, down=1, axis=0)
-                    sampling_frequency_up = upsampling_factor * sampling_frequency
-                else:
-                    template_upsampled = template
-                    sampling_frequency_up = sampling_frequency
+            job_kwargs = fix_job_kwargs(job_kwargs)
+            n_jobs = job_kwargs["n_jobs"]
+            if n_jobs > 1 and len(items) > 1:
+                with ProcessPoolExecutor(
+                    max_workers=n_jobs, mp_context=mp.get_context(job_kwargs["mp_context"])
+                ) as executor:
+                    results = list(executor.map(_compute_multi_channel_metrics_one_unit, items))
+            else:
+                results = [_compute_multi_channel_metrics_one_unit(item) for item in items]
 
-                func = _metric_name_to_func[metric_name]
-                try:
-                    value = func(
-                        template_upsampled,
-                        channel_locations=channel_locations_sparse,
-                        sampling_frequency=sampling_frequency_up,
-                        **self.params["metrics_kwargs"],
-                    )
-                except Exception as e:
+            for unit_id, (values, errors) in zip(unit_ids, results):
+                for metric_name, value in values.items():
+                    template_metrics.at[unit_id, metric_name] = value
+                for metric_name, e in errors.items():
                     warnings.warn(f"Error computing metric {metric_name} for unit {unit_id}: {e}")
-                    value = np.nan
-                template_metrics.at[index, metric_name] = value
 
         # we use the convert_dtypes to convert the columns to the most appropriate dtype and avoid object columns
         # (in case of NaN values)
         template_metrics = template_metrics.convert_dtypes()
         return template_metrics
 
-    def _run(self, verbose=False):
+    def _run(self, verbose=False, **job_kwargs):
 
         delete_existing_metrics = self.params["delete_existing_metrics"]
         metrics_to_compute = self.params["metrics_to_compute"]
 
         # compute the metrics which have been specified by the user
         computed_metrics = self._compute_metrics(
-            sorting_analyzer=self.sorting_analyzer, unit_ids=None, verbose=verbose, metric_names=metrics_to_compute
+            sorting_analyzer=self.sorting_analyzer,
+            unit_ids=None,
+            verbose=verbose,
+            metric_names=metrics_to_compute,
+            **job_kwargs,
         )
 
         existing_metrics = []
@@ -665,6 +723,113 @@ _single_channel_metric_name_to_func = {
 }
 
 
+#########################################################################################
+# Single-channel metrics on a batch of templates
+# These functions compute the same values as the functions above for several 1D templates at once.
+# templates_single is a 2D array (num_templates, num_samples) and trough_idx / peak_idx are 1D arrays.
+
+
+def _get_trough_and_peak_idx_batch(templates_single):
+    trough_idx = np.argmin(templates_single, axis=1)
+    after_trough = np.arange(templates_single.shape[1])[None, :] >= trough_idx[:, None]
+    peak_idx = np.argmax(np.where(after_trough, templates_single, -np.inf), axis=1)
+    return trough_idx, peak_idx
+
+
+def _linregress_slope_batch(times, templates_single, mask):
+    # slope of the least square fit of each template restricted to mask, like scipy.stats.linregress
+    num_points = np.sum(mask, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        times_mean = np.sum(np.where(mask, times[None, :], 0.0), axis=1) / num_points
+        values_mean = np.sum(np.where(mask, templates_single, 0.0), axis=1) / num_points
+        times_centered = np.where(mask, times[None, :] - times_mean[:, None], 0.0)
+        values_centered = np.where(mask, templates_single - values_mean[:, None], 0.0)
+        slope = np.sum(times_centered * values_centered, axis=1) / np.sum(times_centered**2, axis=1)
+    slope[num_points < 2] = np.nan
+    return slope
+
+
+def _get_peak_to_valley_batch(templates_single, sampling_frequency, trough_idx, peak_idx, **kwargs):
+    return (peak_idx - trough_idx) / sampling_frequency
+
+
+def _get_peak_trough_ratio_batch(templates_single, sampling_frequency, trough_idx, peak_idx, **kwargs):
+    rows = np.arange(templates_single.shape[0])
+    return templates_single[rows, peak_idx] / templates_single[rows, trough_idx]
+
+
+def _get_half_width_batch(templates_single, sampling_frequency, trough_idx, peak_idx, **kwargs):
+    num_samples = templates_single.shape[1]
+    sample_indices = np.arange(num_samples)[None, :]
+    # threshold is half of peak height (assuming baseline is 0)
+    threshold = 0.5 * templates_single[np.arange(templates_single.shape[0]), trough_idx]
+    below = templates_single < threshold[:, None]
+    below_pre = below & (sample_indices < trough_idx[:, None])
+    below_post = below & (sample_indices >= trough_idx[:, None])
+
+    cross_pre_pk = np.argmax(below_pre, axis=1) - 1
+    cross_post_pk = num_samples - 1 - np.argmax(below_post[:, ::-1], axis=1) + 1
+
+    hw = (cross_post_pk - cross_pre_pk) / sampling_frequency
+    hw[~np.any(below_pre, axis=1) | ~np.any(below_post, axis=1) | (peak_idx == 0)] = np.nan
+    return hw
+
+
+def _get_repolarization_slope_batch(templates_single, sampling_frequency, trough_idx, **kwargs):
+    num_samples = templates_single.shape[1]
+    sample_indices = np.arange(num_samples)[None, :]
+    times = np.arange(num_samples) / sampling_frequency
+
+    # first time after trough, where template is at baseline
+    at_baseline = (templates_single >= 0) & (sample_indices >= trough_idx[:, None])
+    return_to_base_idx = np.argmax(at_baseline, axis=1)
+
+    mask = (sample_indices >= trough_idx[:, None]) & (sample_indices < return_to_base_idx[:, None])
+    slope = _linregress_slope_batch(times, templates_single, mask)
+    slope[(trough_idx == 0) | ~np.any(at_baseline, axis=1) | (return_to_base_idx - trough_idx < 3)] = np.nan
+    return slope
+
+
+def _get_recovery_slope_batch(templates_single, sampling_frequency, peak_idx, **kwargs):
+    assert "recovery_window_ms" in kwargs, "recovery_window_ms must be given as kwarg"
+    recovery_window_ms = kwargs["recovery_window_ms"]
+    num_samples = templates_single.shape[1]
+    sample_indices = np.arange(num_samples)[None, :]
+    times = np.arange(num_samples) / sampling_frequency
+
+    max_idx = (peak_idx + ((recovery_window_ms / 1000) * sampling_frequency)).astype(int)
+    max_idx = np.minimum(max_idx, num_samples)
+
+    mask = (sample_indices >= peak_idx[:, None]) & (sample_indices < max_idx[:, None])
+    slope = _linregress_slope_batch(times, templates_single, mask)
+    slope[peak_idx == 0] = np.nan
+    return slope
+
+
+def _get_num_positive_peaks_batch(templates_single, sampling_frequency, **kwargs):
+    # scipy find_peaks has no batch mode
+    return np.array(
+        [get_num_positive_peaks(template_single, sampling_frequency, **kwargs) for template_single in templates_single]
+    )
+
+
+def _get_num_negative_peaks_batch(templates_single, sampling_frequency, **kwargs):
+    return np.array(
+        [get_num_negative_peaks(template_single, sampling_frequency, **kwargs) for template_single in templates_single]
+    )
+
+
+_single_channel_metric_name_to_batch_func = {
+    "peak_to_valley": _get_peak_to_valley_batch,
+    "peak_trough_ratio": _get_peak_trough_ratio_batch,
+    "half_width": _get_half_width_batch,
+    "repolarization_slope": _get_repolarization_slope_batch,
+    "recovery_slope": _get_recovery_slope_batch,
+    "num_positive_peaks": _get_num_positive_peaks_batch,
+    "num_negative_peaks": _get_num_negative_peaks_batch,
+}
+
+
 #########################################################################################
 # Multi-channel metrics
 
@@ -1030,3 +1195,23 @@ _multi_channel_metric_name_to_func = {
 }
 
 _metric_name_to_func = {**_single_channel_metric_name_to_func, **_multi_channel_metric_name_to_func}
+
+
+def _compute_multi_channel_metrics_one_unit(args):
+    # used by ComputeTemplateMetrics, possibly in a worker process
+    metric_names, template, channel_locations, sampling_frequency, metrics_kwargs = args
+    values = {}
+    errors = {}
+    for metric_name in metric_names:
+        func = _metric_name_to_func[metric_name]
+        try:
+            values[metric_name] = func(
+                template,
+                channel_locations=channel_locations,
+                sampling_frequency=sampling_frequency,
+                **metrics_kwargs,
+            )
+        except Exception as e:
+            values[metric_name] = np.nan
+            errors[metric_name] = str(e)
+    return values, errors
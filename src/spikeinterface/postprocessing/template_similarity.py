@@ -305,6 +305,130 @@ else:
     _compute_similarity_matrix = _compute_similarity_matrix_numpy
 
 
+def _compute_similarity_matrix_blas(
+    templates_array,
+    other_templates_array,
+    num_shifts,
+    method,
+    support="union",
+    sparsity_mask=None,
+    other_sparsity_mask=None,
+    block_size=256,
+):
+    """
+    Batched version of `_compute_similarity_matrix_numpy()` for the "cosine" and "l2" methods.
+
+    The masked dot products and norms of all pairs are expressed as matrix products
+    of flattened templates, so each lag costs a few GEMMs instead of a loop over pairs.
+    With sparsity masks a and b, the support of a pair is:
+
+      * "intersection": a_i & b_j, so dot_ij = (T_i * a_i) . (O_j * b_j)
+      * "union": a_i | b_j = a_i + b_j - a_i * b_j, so dot_ij is a sum of 3 products
+
+    and the masked squared norms are obtained the same way from the per-channel energies.
+    Templates are sorted by their mean channel and processed in blocks of `block_size`, and
+    for each block only the other templates with a sparsity overlap are computed: pairs
+    without overlap keep a distance of 1, as in the loop implementations.
+
+    Computations are done in float64 to avoid cancellations in the l2 distance.
+    The (num_templates, other_num_templates, num_channels) mask is never built.
+    """
+    assert method in ("cosine", "l2")
+
+    num_templates = templates_array.shape[0]
+    num_samples = templates_array.shape[1]
+    num_channels = templates_array.shape[2]
+    other_num_templates = other_templates_array.shape[0]
+
+    num_shifts_both_sides = 2 * num_shifts + 1
+    distances = np.ones((num_shifts_both_sides, num_templates, other_num_templates), dtype=np.float32)
+    same_array = np.array_equal(templates_array, other_templates_array)
+
+    use_sparsity = sparsity_mask is not None and other_sparsity_mask is not None and support != "dense"
+    if use_sparsity:
+        a = sparsity_mask.astype(np.float64)
+        b = other_sparsity_mask.astype(np.float64)
+        overlaps = (a @ b.T) > 0
+        # blocks of spatially close templates share few overlapping partners
+        channel_positions = np.arange(num_channels, dtype=np.float64)
+        centers = (a @ channel_positions) / np.maximum(a.sum(axis=1), 1)
+        order = np.argsort(centers, kind="stable")
+    else:
+        order = np.arange(num_templates)
+        block_size = max(num_templates, 1)
+
+    if same_array:
+        shift_loop = range(-num_shifts, 1)
+    else:
+        shift_loop = range(-num_shifts, num_shifts + 1)
+
+    src_sliced_templates = templates_array[:, num_shifts : num_samples - num_shifts].astype(np.float64)
+    src_energies = np.sum(src_sliced_templates**2, axis=1)
+
+    for count, shift in enumerate(shift_loop):
+        tgt_sliced_templates = other_templates_array[:, num_shifts + shift : num_samples - num_shifts + shift].astype(
+            np.float64
+        )
+        tgt_energies = np.sum(tgt_sliced_templates**2, axis=1)
+
+        for block_start in range(0, num_templates, block_size):
+            rows = order[block_start : block_start + block_size]
+            if use_sparsity:
+                cols = np.flatnonzero(np.any(overlaps[rows], axis=0))
+                if cols.size == 0:
+                    continue
+            else:
+                cols = np.arange(other_num_templates)
+
+            src = src_sliced_templates[rows]
+            tgt = tgt_sliced_templates[cols]
+            src_flat = src.reshape(rows.size, -1)
+            tgt_flat = tgt.reshape(cols.size, -1)
+            src_energy = src_energies[rows]
+            tgt_energy = tgt_energies[cols]
+
+            if not use_sparsity:
+                dot = src_flat @ tgt_flat.T
+                norm_i2 = np.repeat(src_energy.sum(axis=1)[:, np.newaxis], cols.size, axis=1)
+                norm_j2 = np.repeat(tgt_energy.sum(axis=1)[np.newaxis, :], rows.size, axis=0)
+            else:
+                a_rows, b_cols = a[rows], b[cols]
+                src_a_flat = (src * a_rows[:, np.newaxis, :]).reshape(rows.size, -1)
+                tgt_b_flat = (tgt * b_cols[:, np.newaxis, :]).reshape(cols.size, -1)
+                if support == "intersection":
+                    dot = src_a_flat @ tgt_b_flat.T
+                    norm_i2 = (src_energy * a_rows) @ b_cols.T
+                    norm_j2 = a_rows @ (tgt_energy * b_cols).T
+                elif support == "union":
+                    dot = src_a_flat @ tgt_flat.T + src_flat @ tgt_b_flat.T - src_a_flat @ tgt_b_flat.T
+                    norm_i2 = (
+                        np.sum(src_energy * a_rows, axis=1)[:, np.newaxis]
+                        + src_energy @ b_cols.T
+                        - (src_energy * a_rows) @ b_cols.T
+                    )
+                    norm_j2 = (
+                        a_rows @ tgt_energy.T
+                        + np.sum(tgt_energy * b_cols, axis=1)[np.newaxis, :]
+                        - a_rows @ (tgt_energy * b_cols).T
+                    )
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                if method == "cosine":
+                    block_distances = 1 - dot / np.sqrt(norm_i2 * norm_j2)
+                elif method == "l2":
+                    block_distances = np.sqrt(np.maximum(norm_i2 + norm_j2 - 2 * dot, 0))
+                    block_distances /= np.sqrt(norm_i2) + np.sqrt(norm_j2)
+
+            if use_sparsity:
+                block_distances[~overlaps[np.ix_(rows, cols)]] = 1.0
+            distances[count][np.ix_(rows, cols)] = block_distances
+
+        if same_array and num_shifts != 0:
+            distances[num_shifts_both_sides - count - 1] = distances[count].T
+
+    return distances
+
+
 def compute_similarity_with_templates_array(
     templates_array, other_templates_array, method, support="union", num_shifts=0, sparsity=None, other_sparsity=None
 ):
@@ -328,6 +452,22 @@ def compute_similarity_with_templates_array(
     num_channels = templates_array.shape[2]
     other_num_templates = other_templates_array.shape[0]
 
+    assert num_shifts < num_samples, "max_lag is too large"
+
+    if method in ("cosine", "l2"):
+        distances = _compute_similarity_matrix_blas(
+            templates_array,
+            other_templates_array,
+            num_shifts,
+            method,
+            support=support,
+            sparsity_mask=sparsity.mask if sparsity is not None else None,
+            other_sparsity_mask=other_sparsity.mask if other_sparsity is not None else None,
+        )
+        distances = np.min(distances, axis=0)
+        similarity = 1 - distances
+        return similarity
+
     mask = np.ones((num_templates, other_num_templates, num_channels), dtype=bool)
 
     if sparsity is not None and other_sparsity is not None:
@@ -339,7 +479,6 @@ def compute_similarity_with_templates_array(
             mask = np.logical_or(sparsity.mask[:, np.newaxis, :], other_sparsity.mask[np.newaxis, :, :])
             mask[~units_overlaps] = False
 
-    assert num_shifts < num_samples, "max_lag is too large"
     distances = _compute_similarity_matrix(templates_array, other_templates_array, num_shifts, mask, method)
 
     distances = np.min(distances, axis=0)
@@ -35,3 +35,36 @@ class TestAmplitudeScalingsExtension(AnalyzerExtensionCommonTestSuite):
             scalings = ext.data["amplitude_scalings"][mask]
             median_scaling = np.median(scalings)
             np.testing.assert_array_equal(np.round(median_scaling), 1)
+
+
+def test_fit_collision():
+    from sklearn.linear_model import LinearRegression
+    from spikeinterface.postprocessing.amplitude_scalings import (
+        find_collisions,
+        fit_collision,
+        _get_collision_design,
+    )
+
+    rng = np.random.default_rng(seed=2205)
+    num_units, num_channels, nbefore, nafter = 4, 6, 20, 40
+    templates = rng.normal(size=(num_units, nbefore + nafter, num_channels))
+    sparsity_mask = rng.random((num_units, num_channels)) > 0.3
+    traces = rng.normal(size=(3000, num_channels)).astype("float32")
+
+    spike_dtype = [("sample_index", "int64"), ("unit_index", "int64"), ("in_margin", "bool")]
+    spikes = np.zeros(150, dtype=spike_dtype)
+    spikes["sample_index"] = np.sort(rng.integers(0, 3000, size=150))
+    spikes["unit_index"] = rng.integers(0, num_units, size=150)
+    spikes["in_margin"] = (spikes["sample_index"] < 100) | (spikes["sample_index"] > 2900)
+    local_spikes = spikes[~spikes["in_margin"]]
+
+    collisions = find_collisions(local_spikes, spikes, 30, sparsity_mask)
+    assert len(collisions) > 0
+    for spike_index, collision in collisions.items():
+        assert collision[0] == local_spikes[spike_index]
+        assert np.all(np.abs(collision["sample_index"] - collision[0]["sample_index"]) <= 30)
+
+        scalings = fit_collision(collision, traces, nbefore, templates, sparsity_mask, nbefore, nafter)
+        X, y = _get_collision_design(collision, traces, nbefore, templates, sparsity_mask, nbefore, nafter)
+        reg = LinearRegression(fit_intercept=True, positive=True).fit(X, y)
+        np.testing.assert_allclose(scalings, reg.coef_, atol=1e-6)
@@ -29,6 +29,8 @@ class TestComputeCorrelograms(AnalyzerExtensionCommonTestSuite):
             dict(method="numpy"),
             dict(method="auto"),
             param(dict(method="numba"), marks=SKIP_NUMBA),
+            dict(method="numpy", pair_mask="sparsity"),
+            param(dict(method="numba", pair_mask="sparsity"), marks=SKIP_NUMBA),
         ],
     )
     def test_extension(self, params):
@@ -52,6 +54,33 @@ class TestComputeCorrelograms(AnalyzerExtensionCommonTestSuite):
         assert np.array_equal(result_sorting, ext_numpy.data["ccgs"])
         assert np.array_equal(bins_sorting, ext_numpy.data["bins"])
 
+    @pytest.mark.parametrize("method", ["numpy", param("numba", marks=SKIP_NUMBA)])
+    def test_sparse_correlograms(self, method):
+        """
+        Test that the compact per-pair layout holds the same correlograms
+        as the dense computation for the selected pairs.
+        """
+        sorting_analyzer = self._prepare_sorting_analyzer("memory", sparse=False, extension_class=ComputeCorrelograms)
+        num_units = sorting_analyzer.get_num_units()
+        pair_mask = np.zeros((num_units, num_units), dtype=bool)
+        pair_mask[0, 1] = True
+
+        ext = sorting_analyzer.compute("correlograms", method=method, pair_mask=pair_mask)
+        ccgs, pairs, bins = ext.get_data(outputs="sparse")
+        # symmetrized and with all auto-correlograms
+        assert pairs.shape[0] == num_units + 2
+        assert ccgs.shape == (pairs.shape[0], bins.size - 1)
+
+        dense_ccgs, dense_bins = compute_correlograms(self.sorting, method=method)
+        assert np.array_equal(ccgs, dense_ccgs[pairs[:, 0], pairs[:, 1]])
+
+        ccgs_from_sparse, _ = ext.get_data()
+        assert np.array_equal(
+            ccgs_from_sparse[pair_mask | np.eye(num_units, dtype=bool)],
+            dense_ccgs[pair_mask | np.eye(num_units, dtype=bool)],
+        )
+        assert np.all(ccgs_from_sparse[0, 2] == 0)
+
 
 # Unit Tests
 ############
@@ -94,6 +123,19 @@ def test_equal_results_correlograms(window_and_bin_ms):
 
     assert np.array_equal(result_numpy, result_numba)
 
+    result_numba_parallel, _ = _compute_correlograms_on_sorting(
+        sorting, window_ms=window_ms, bin_ms=bin_ms, method="numba", n_jobs=2
+    )
+    assert np.array_equal(result_numpy, result_numba_parallel)
+
+    pair_mask = np.zeros((5, 5), dtype=bool)
+    pair_mask[0, 3] = pair_mask[2, 4] = True
+    for method in ("numpy", "numba"):
+        result_pairs, pairs, bins = _compute_correlograms_on_sorting(
+            sorting, window_ms=window_ms, bin_ms=bin_ms, method=method, pair_mask=pair_mask
+        )
+        assert np.array_equal(result_pairs, result_numpy[pairs[:, 0], pairs[:, 1]])
+
 
 @pytest.mark.parametrize("method", ["numpy", param("numba", marks=SKIP_NUMBA)])
 def test_flat_cross_correlogram(method):
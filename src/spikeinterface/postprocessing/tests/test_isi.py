@@ -52,3 +52,7 @@ class TestComputeISIHistograms(AnalyzerExtensionCommonTestSuite):
             else:
                 assert np.all(ISI == ref_ISI), f"Failed with method={method}"
                 assert np.allclose(bins, ref_bins, atol=1e-10), f"Failed with method={method}"
+
+        if "numba" in methods:
+            ISI, bins = _compute_isi_histograms(sorting, window_ms=window_ms, bin_ms=bin_ms, method="numba", n_jobs=2)
+            assert np.all(ISI == ref_ISI), "Failed with method=numba and n_jobs=2"
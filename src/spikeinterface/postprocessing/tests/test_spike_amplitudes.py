@@ -1,3 +1,6 @@
+import pytest
+
+from spikeinterface.core import SortingAnalyzer, load_sorting_analyzer
 from spikeinterface.postprocessing import ComputeSpikeAmplitudes
 from spikeinterface.postprocessing.tests.common_extension_tests import AnalyzerExtensionCommonTestSuite
 
@@ -6,3 +9,24 @@ class TestComputeSpikeAmplitudes(AnalyzerExtensionCommonTestSuite):
 
     def test_extension(self):
         self.run_extension_tests(ComputeSpikeAmplitudes, params=dict())
+
+    def test_binary_folder_memmap(self):
+        import numpy as np
+
+        sorting_analyzer = self._prepare_sorting_analyzer("binary_folder", False, ComputeSpikeAmplitudes)
+        ext = sorting_analyzer.compute("spike_amplitudes", n_jobs=1, chunk_duration="1s")
+        # amplitudes are gathered straight to disk and exposed as a memmap
+        assert isinstance(ext.data["amplitudes"], np.memmap)
+
+        memory_analyzer = self._prepare_sorting_analyzer("memory", False, ComputeSpikeAmplitudes)
+        ext_memory = memory_analyzer.compute("spike_amplitudes", n_jobs=1, chunk_duration="1s")
+        assert np.array_equal(ext.data["amplitudes"], ext_memory.data["amplitudes"])
+
+        # reloaded as memmap, also when the analyzer is read-only
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            monkeypatch.setattr(SortingAnalyzer, "is_read_only", lambda self: True)
+            read_only_analyzer = load_sorting_analyzer(sorting_analyzer.folder)
+            assert read_only_analyzer.is_read_only()
+            amplitudes = read_only_analyzer.get_extension("spike_amplitudes").data["amplitudes"]
+            assert isinstance(amplitudes, np.memmap)
+            assert np.array_equal(amplitudes, ext_memory.data["amplitudes"])
@@ -1,3 +1,6 @@
+import numpy as np
+
+from spikeinterface.core import load_sorting_analyzer
 from spikeinterface.postprocessing import ComputeSpikeLocations
 from spikeinterface.postprocessing.tests.common_extension_tests import AnalyzerExtensionCommonTestSuite
 import pytest
@@ -17,3 +20,35 @@ class TestSpikeLocationsExtension(AnalyzerExtensionCommonTestSuite):
     )
     def test_extension(self, params):
         self.run_extension_tests(ComputeSpikeLocations, params)
+
+    def test_binary_folder_memmap(self):
+        sorting_analyzer = self._prepare_sorting_analyzer("binary_folder", False, ComputeSpikeLocations)
+        ext = sorting_analyzer.compute("spike_locations", n_jobs=1, chunk_duration="1s")
+        # spike locations are gathered straight to disk and exposed as a memmap
+        assert isinstance(ext.data["spike_locations"], np.memmap)
+
+        memory_analyzer = self._prepare_sorting_analyzer("memory", False, ComputeSpikeLocations)
+        ext_memory = memory_analyzer.compute("spike_locations", n_jobs=1, chunk_duration="1s")
+        assert np.array_equal(ext.data["spike_locations"], ext_memory.data["spike_locations"])
+
+        reloaded_analyzer = load_sorting_analyzer(sorting_analyzer.folder)
+        spike_locations = reloaded_analyzer.get_extension("spike_locations").data["spike_locations"]
+        assert isinstance(spike_locations, np.memmap)
+        assert np.array_equal(spike_locations, ext_memory.data["spike_locations"])
+
+    def test_compute_several_extensions_memmap(self):
+        # the fused pipeline of several extensions also gathers to the npy files of each extension
+        sorting_analyzer = self._prepare_sorting_analyzer("binary_folder", False, ComputeSpikeLocations)
+        sorting_analyzer.compute(["spike_amplitudes", "spike_locations"], n_jobs=1, chunk_duration="1s")
+
+        extensions_folder = sorting_analyzer.folder / "extensions"
+        assert (extensions_folder / "spike_amplitudes" / "amplitudes.npy").is_file()
+        assert (extensions_folder / "spike_locations" / "spike_locations.npy").is_file()
+
+        reloaded_analyzer = load_sorting_analyzer(sorting_analyzer.folder)
+        for analyzer in (sorting_analyzer, reloaded_analyzer):
+            amplitudes = analyzer.get_extension("spike_amplitudes").data["amplitudes"]
+            spike_locations = analyzer.get_extension("spike_locations").data["spike_locations"]
+            assert isinstance(amplitudes, np.memmap)
+            assert isinstance(spike_locations, np.memmap)
+            assert amplitudes.shape[0] == spike_locations.shape[0] == sorting_analyzer.sorting.count_total_num_spikes()
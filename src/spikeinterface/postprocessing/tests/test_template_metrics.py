@@ -3,7 +3,15 @@ from spikeinterface.postprocessing import ComputeTemplateMetrics
 import pytest
 import csv
 
-from spikeinterface.postprocessing.template_metrics import _single_channel_metric_name_to_func
+import numpy as np
+
+from spikeinterface.postprocessing.template_metrics import (
+    _single_channel_metric_name_to_func,
+    _single_channel_metric_name_to_batch_func,
+    _get_trough_and_peak_idx_batch,
+    _default_function_kwargs,
+    get_trough_and_peak_idx,
+)
 
 template_metrics = list(_single_channel_metric_name_to_func.keys())
 
@@ -62,6 +70,36 @@ def test_metric_names_in_same_order(small_sorting_analyzer):
         assert specified_metric_names[i] == tm_keys[i]
 
 
+def test_batch_failure_falls_back_to_one_by_one(small_sorting_analyzer, monkeypatch):
+    """
+    When the batch function of a single channel metric fails, only the failing templates get NaN.
+    """
+    small_sorting_analyzer.compute("template_metrics", metric_names=["peak_to_valley"])
+    expected = small_sorting_analyzer.get_extension("template_metrics").get_data()["peak_to_valley"].to_numpy()
+
+    def failing_batch_func(*args, **kwargs):
+        raise ValueError("batch failure")
+
+    peak_to_valley = _single_channel_metric_name_to_func["peak_to_valley"]
+    num_calls = [0]
+
+    def failing_on_first_template(*args, **kwargs):
+        num_calls[0] += 1
+        if num_calls[0] == 1:
+            raise ValueError("template failure")
+        return peak_to_valley(*args, **kwargs)
+
+    monkeypatch.setitem(_single_channel_metric_name_to_batch_func, "peak_to_valley", failing_batch_func)
+    monkeypatch.setitem(_single_channel_metric_name_to_func, "peak_to_valley", failing_on_first_template)
+    with pytest.warns(UserWarning, match="template failure"):
+        small_sorting_analyzer.compute("template_metrics", metric_names=["peak_to_valley"])
+    values = small_sorting_analyzer.get_extension("template_metrics").get_data()["peak_to_valley"].to_numpy()
+    values = values.astype("float64")
+
+    assert np.isnan(values[0])
+    assert np.allclose(values[1:], expected[1:].astype("float64"))
+
+
 def test_save_template_metrics(small_sorting_analyzer, create_cache_folder):
     """
     Computes template metrics in binary folder format. Then computes subsets of template
@@ -105,6 +143,37 @@ def test_save_template_metrics(small_sorting_analyzer, create_cache_folder):
             assert metric_name not in metric_names
 
 
+def test_single_channel_metrics_batch(small_sorting_analyzer):
+    from scipy.signal import resample_poly
+
+    templates = small_sorting_analyzer.get_extension("templates").get_data()
+    # all channels of all units, including flat and noisy templates
+    templates_single = templates.transpose(0, 2, 1).reshape(-1, templates.shape[1])
+    templates_single = resample_poly(templates_single, up=10, down=1, axis=1)
+    sampling_frequency = small_sorting_analyzer.sampling_frequency * 10
+
+    trough_idx, peak_idx = _get_trough_and_peak_idx_batch(templates_single)
+    for metric_name, func in _single_channel_metric_name_to_func.items():
+        batch_func = _single_channel_metric_name_to_batch_func[metric_name]
+        values = batch_func(
+            templates_single, sampling_frequency, trough_idx=trough_idx, peak_idx=peak_idx, **_default_function_kwargs
+        )
+        for i, template_single in enumerate(templates_single):
+            assert (trough_idx[i], peak_idx[i]) == get_trough_and_peak_idx(template_single)
+            try:
+                expected = func(
+                    template_single,
+                    sampling_frequency,
+                    trough_idx=trough_idx[i],
+                    peak_idx=peak_idx[i],
+                    **_default_function_kwargs,
+                )
+            except ValueError:
+                # linregress fails on less than 2 points
+                expected = np.nan
+            assert np.isclose(values[i], expected, equal_nan=True, rtol=1e-5), metric_name
+
+
 class TestTemplateMetrics(AnalyzerExtensionCommonTestSuite):
 
     @pytest.mark.parametrize(
@@ -10,6 +10,7 @@ from spikeinterface.postprocessing import check_equal_template_with_distribution
 from spikeinterface.postprocessing.template_similarity import (
     compute_similarity_with_templates_array,
     _compute_similarity_matrix_numpy,
+    _compute_similarity_matrix_blas,
 )
 
 try:
@@ -117,6 +118,47 @@ def test_equal_results_numba(params):
     assert np.allclose(result_numpy, result_numba, 1e-3)
 
 
+@pytest.mark.parametrize("method", ["cosine", "l2"])
+@pytest.mark.parametrize("support", ["dense", "intersection", "union"])
+@pytest.mark.parametrize("num_shifts", [0, 3])
+def test_equal_results_blas(method, support, num_shifts):
+    """
+    Test that the batched implementation gives the same results as the loop one,
+    with sparsity masks and several blocks.
+    """
+    rng = np.random.default_rng(seed=2205)
+    num_channels = 12
+    templates_array = rng.standard_normal(size=(10, 30, num_channels), dtype=np.float32)
+    other_templates_array = rng.standard_normal(size=(7, 30, num_channels), dtype=np.float32)
+    sparsity_mask = np.zeros((10, num_channels), dtype=bool)
+    other_sparsity_mask = np.zeros((7, num_channels), dtype=bool)
+    for mask in (sparsity_mask, other_sparsity_mask):
+        for i, start in enumerate(rng.integers(0, num_channels - 3, size=mask.shape[0])):
+            mask[i, start : start + 3] = True
+
+    mask = np.ones((10, 7, num_channels), dtype=bool)
+    if support == "intersection":
+        mask = sparsity_mask[:, np.newaxis, :] & other_sparsity_mask[np.newaxis, :, :]
+    elif support == "union":
+        units_overlaps = np.any(sparsity_mask[:, np.newaxis, :] & other_sparsity_mask[np.newaxis, :, :], axis=2)
+        mask = sparsity_mask[:, np.newaxis, :] | other_sparsity_mask[np.newaxis, :, :]
+        mask[~units_overlaps] = False
+
+    result_numpy = _compute_similarity_matrix_numpy(templates_array, other_templates_array, num_shifts, mask, method)
+    result_blas = _compute_similarity_matrix_blas(
+        templates_array,
+        other_templates_array,
+        num_shifts,
+        method,
+        support=support,
+        sparsity_mask=sparsity_mask,
+        other_sparsity_mask=other_sparsity_mask,
+        block_size=4,
+    )
+
+    assert np.allclose(result_numpy, result_blas, atol=1e-5)
+
+
 if __name__ == "__main__":
     from spikeinterface.postprocessing.tests.common_extension_tests import get_dataset
     from spikeinterface.core import estimate_sparsity
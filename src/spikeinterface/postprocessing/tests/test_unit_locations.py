@@ -18,3 +18,37 @@ class TestUnitLocationsExtension(AnalyzerExtensionCommonTestSuite):
     )
     def test_extension(self, params):
         self.run_extension_tests(ComputeUnitLocations, params=params)
+
+
+def test_solve_monopolar_triangulation_batch():
+    import numpy as np
+    from spikeinterface.postprocessing.localization_tools import (
+        solve_monopolar_triangulation,
+        solve_monopolar_triangulation_batch,
+    )
+
+    rng = np.random.default_rng(seed=2205)
+    contact_locations = np.c_[np.tile([0.0, 32.0, 16.0, 48.0], 10), np.repeat(np.arange(10) * 20.0, 4)]
+    num_sources = 50
+    sources = np.c_[rng.uniform(0, 48, num_sources), rng.uniform(40, 140, num_sources), rng.uniform(5, 40, num_sources)]
+    alphas = rng.uniform(1000, 5000, num_sources)
+    distances = np.sqrt(
+        np.sum((sources[:, np.newaxis, :2] - contact_locations[np.newaxis]) ** 2, axis=2) + sources[:, 2:3] ** 2
+    )
+    wf_data = alphas[:, np.newaxis] / distances * (1 + 0.05 * rng.normal(size=distances.shape))
+
+    # variable number of channels per item
+    channel_mask = rng.random(wf_data.shape) > 0.2
+    local_contact_locations = np.broadcast_to(contact_locations, (num_sources,) + contact_locations.shape)
+
+    locations = solve_monopolar_triangulation_batch(wf_data, local_contact_locations, channel_mask, 150, "least_square")
+    for i in range(num_sources):
+        expected = solve_monopolar_triangulation(
+            wf_data[i, channel_mask[i]], contact_locations[channel_mask[i]], 150, "least_square"
+        )
+        np.testing.assert_allclose(locations[i, :3], expected[:3], atol=0.1)
+
+    locations = solve_monopolar_triangulation_batch(
+        wf_data, local_contact_locations, channel_mask, 150, "minimize_with_log_penality"
+    )
+    assert np.median(np.abs(locations[:, :2] - sources[:, :2])) < 5
@@ -11,6 +11,7 @@ from __future__ import annotations
 
 
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 import math
 import numpy as np
@@ -18,13 +19,14 @@ import warnings
 
 from ..postprocessing import correlogram_for_one_segment
 from ..core import SortingAnalyzer, get_noise_levels
+from ..core.job_tools import numba_threads_limit
+from ..core.sorting_tools import unit_indices_to_csr_index
 from ..core.template_tools import (
     get_template_extremum_channel,
     get_template_extremum_amplitude,
     get_dense_templates_array,
 )
 
-
 try:
     import numba
 
@@ -36,6 +38,31 @@ except ModuleNotFoundError as err:
 _default_params = dict()
 
 
+def _get_spike_vector_by_unit(sorting):
+    """
+    Return the concatenated spike vector and a per unit CSR index on it (see `unit_indices_to_csr_index()`).
+
+    This is shared by the spike train based metrics: the spikes of one unit are
+    `spikes[order[offsets[unit_index]:offsets[unit_index + 1]]]`, sorted by segment and time.
+    """
+    spikes = sorting.to_spike_vector()
+    order, offsets = unit_indices_to_csr_index(spikes["unit_index"], len(sorting.unit_ids))
+    return spikes, order, offsets
+
+
+def _apply_per_unit(func, per_unit_args, n_jobs=1):
+    """
+    Apply `func(*args)` for every element of `per_unit_args` and return the list of results.
+
+    With n_jobs > 1 units are dispatched to a thread pool: the per unit work of the metrics
+    (histograms, medians, scipy.stats) is mostly done in numpy which releases the GIL.
+    """
+    if n_jobs == 1 or len(per_unit_args) < 2:
+        return [func(*args) for args in per_unit_args]
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        return list(executor.map(lambda args: func(*args), per_unit_args))
+
+
 def compute_num_spikes(sorting_analyzer, unit_ids=None, **kwargs):
     """
     Compute the number of spike across segments.
@@ -296,7 +323,6 @@ def compute_isi_violations(sorting_analyzer, isi_threshold_ms=1.5, min_isi_ms=0,
     sorting = sorting_analyzer.sorting
     if unit_ids is None:
         unit_ids = sorting_analyzer.unit_ids
-    num_segs = sorting_analyzer.get_num_segments()
 
     total_duration_s = sorting_analyzer.get_total_duration()
     fs = sorting_analyzer.sampling_frequency
@@ -307,19 +333,23 @@ def compute_isi_violations(sorting_analyzer, isi_threshold_ms=1.5, min_isi_ms=0,
     isi_violations_count = {}
     isi_violations_ratio = {}
 
-    # all units converted to seconds
-    for unit_id in unit_ids:
-        spike_train_list = []
-
-        for segment_index in range(num_segs):
-            spike_train = sorting.get_unit_spike_train(unit_id=unit_id, segment_index=segment_index)
-            if len(spike_train) > 0:
-                spike_train_list.append(spike_train / fs)
+    # all isis at once from the spike vector sorted by unit, in seconds
+    spikes, order, offsets = _get_spike_vector_by_unit(sorting)
+    sorted_spikes = spikes[order]
+    isis = np.diff(sorted_spikes["sample_index"] / fs)
+    same_train = (np.diff(sorted_spikes["unit_index"]) == 0) & (np.diff(sorted_spikes["segment_index"]) == 0)
+    violations = same_train & (isis < isi_threshold_s)
+    num_violations = np.bincount(sorted_spikes["unit_index"][1:][violations], minlength=offsets.size - 1)
+    num_spikes = np.diff(offsets)
 
-        if not any([len(train) > 0 for train in spike_train_list]):
+    for unit_id in unit_ids:
+        unit_index = sorting.id_to_index(unit_id)
+        if num_spikes[unit_index] == 0:
             continue
 
-        ratio, _, count = isi_violations(spike_train_list, total_duration_s, isi_threshold_s, min_isi_s)
+        ratio, _, count = _isi_violations_from_counts(
+            num_violations[unit_index], num_spikes[unit_index], total_duration_s, isi_threshold_s, min_isi_s
+        )
 
         isi_violations_ratio[unit_id] = ratio
         isi_violations_count[unit_id] = count
@@ -331,7 +361,7 @@ _default_params["isi_violation"] = dict(isi_threshold_ms=1.5, min_isi_ms=0)
 
 
 def compute_refrac_period_violations(
-    sorting_analyzer, refractory_period_ms: float = 1.0, censored_period_ms: float = 0.0, unit_ids=None
+    sorting_analyzer, refractory_period_ms: float = 1.0, censored_period_ms: float = 0.0, unit_ids=None, n_jobs=1
 ):
     """
     Calculate the number of refractory period violations.
@@ -351,6 +381,8 @@ def compute_refrac_period_violations(
         because they were removed by another mean).
     unit_ids : list or None
         List of unit ids to compute the refractory period violations. If None, all units are used.
+    n_jobs : int, default: 1
+        Number of threads used to process units in parallel.
 
     Returns
     -------
@@ -383,9 +415,6 @@ def compute_refrac_period_violations(
     sorting = sorting_analyzer.sorting
     fs = sorting_analyzer.sampling_frequency
     num_units = len(sorting_analyzer.unit_ids)
-    num_segments = sorting_analyzer.get_num_segments()
-
-    spikes = sorting.to_spike_vector(concatenated=False)
 
     if unit_ids is None:
         unit_ids = sorting_analyzer.unit_ids
@@ -396,10 +425,17 @@ def compute_refrac_period_violations(
     t_r = int(round(refractory_period_ms * fs * 1e-3))
     nb_rp_violations = np.zeros((num_units), dtype=np.int64)
 
-    for seg_index in range(num_segments):
-        spike_times = spikes[seg_index]["sample_index"].astype(np.int64)
-        spike_labels = spikes[seg_index]["unit_index"].astype(np.int32)
-        _compute_rp_violations_numba(nb_rp_violations, spike_times, spike_labels, t_c, t_r)
+    spikes, order, offsets = _get_spike_vector_by_unit(sorting)
+    with numba_threads_limit(n_jobs):
+        _compute_rp_violations_numba(
+            nb_rp_violations,
+            spikes["sample_index"].astype(np.int64),
+            spikes["segment_index"].astype(np.int64),
+            order,
+            offsets,
+            t_c,
+            t_r,
+        )
 
     T = sorting_analyzer.get_total_samples()
 
@@ -433,6 +469,7 @@ def compute_sliding_rp_violations(
     max_ref_period_ms=10,
     contamination_values=None,
     unit_ids=None,
+    n_jobs=1,
 ):
     """
     Compute sliding refractory period violations, a metric developed by IBL which computes
@@ -458,6 +495,8 @@ def compute_sliding_rp_violations(
         The contamination values to test, If None, it is set to np.arange(0.5, 35, 0.5).
     unit_ids : list or None
         List of unit ids to compute the sliding RP violations. If None, all units are used.
+    n_jobs : int, default: 1
+        Number of threads used to process units in parallel.
 
     Returns
     -------
@@ -479,33 +518,69 @@ def compute_sliding_rp_violations(
 
     contamination = {}
 
-    # all units converted to seconds
+    spikes, order, offsets = _get_spike_vector_by_unit(sorting)
+    num_spikes = np.diff(offsets)
+    unit_ids_to_compute = []
     for unit_id in unit_ids:
-        spike_train_list = []
-
-        for segment_index in range(num_segs):
-            spike_train = sorting.get_unit_spike_train(unit_id=unit_id, segment_index=segment_index)
-            if np.any(spike_train):
-                spike_train_list.append(spike_train)
-
-        if not any([np.any(train) for train in spike_train_list]):
+        unit_n_spikes = num_spikes[sorting.id_to_index(unit_id)]
+        if unit_n_spikes == 0:
             continue
-
-        unit_n_spikes = np.sum([len(train) for train in spike_train_list])
         if unit_n_spikes <= min_spikes:
             contamination[unit_id] = np.nan
             continue
+        unit_ids_to_compute.append(unit_id)
+
+    if HAVE_NUMBA:
+        # only the first lags of the auto-correlograms are used: compute them all at once
+        bin_size = max(int(bin_size_ms / 1000 * fs), 1)
+        num_half_bins = int(int(window_size_s * fs) // bin_size)
+        num_rp_bins = np.arange(0, max_ref_period_ms / 1000, bin_size_ms / 1000).size
+        auto_correlograms = np.zeros((offsets.size - 1, min(num_rp_bins, num_half_bins)), dtype=np.int64)
+        with numba_threads_limit(n_jobs):
+            _compute_positive_auto_correlograms_numba(
+                auto_correlograms,
+                spikes["sample_index"].astype(np.int64),
+                spikes["segment_index"].astype(np.int64),
+                order,
+                offsets,
+                bin_size,
+            )
+        per_unit_args = [
+            (
+                auto_correlograms[sorting.id_to_index(unit_id)],
+                num_spikes[sorting.id_to_index(unit_id)],
+                duration,
+                bin_size_ms,
+                exclude_ref_period_below_ms,
+                max_ref_period_ms,
+                contamination_values,
+            )
+            for unit_id in unit_ids_to_compute
+        ]
+        results = _apply_per_unit(_sliding_rp_violations_from_correlogram, per_unit_args, n_jobs=n_jobs)
+    else:
+        per_unit_args = []
+        for unit_id in unit_ids_to_compute:
+            spike_train_list = [
+                sorting.get_unit_spike_train(unit_id=unit_id, segment_index=segment_index)
+                for segment_index in range(num_segs)
+            ]
+            per_unit_args.append(
+                (
+                    [train for train in spike_train_list if len(train) > 0],
+                    fs,
+                    duration,
+                    bin_size_ms,
+                    window_size_s,
+                    exclude_ref_period_below_ms,
+                    max_ref_period_ms,
+                    contamination_values,
+                )
+            )
+        results = _apply_per_unit(slidingRP_violations, per_unit_args, n_jobs=n_jobs)
 
-        contamination[unit_id] = slidingRP_violations(
-            spike_train_list,
-            fs,
-            duration,
-            bin_size_ms,
-            window_size_s,
-            exclude_ref_period_below_ms,
-            max_ref_period_ms,
-            contamination_values,
-        )
+    for unit_id, result in zip(unit_ids_to_compute, results):
+        contamination[unit_id] = result
 
     return contamination
 
@@ -520,10 +595,14 @@ _default_params["sliding_rp_violation"] = dict(
 )
 
 
-def get_synchrony_counts(spikes, synchrony_sizes, all_unit_ids):
+def get_synchrony_counts(spikes, synchrony_sizes, all_unit_ids, tolerance_samples=0):
     """
     Compute synchrony counts, the number of simultaneous spikes with sizes `synchrony_sizes`.
 
+    The synchrony size of a spike is the number of spikes (itself included) of the same segment
+    within +/- `tolerance_samples` of it. A spike with a synchrony size of n is counted for its
+    unit in all `synchrony_sizes` <= n.
+
     Parameters
     ----------
     spikes : np.array
@@ -532,6 +611,9 @@ def get_synchrony_counts(spikes, synchrony_sizes, all_unit_ids):
         The synchrony sizes to compute. Should be pre-sorted.
     all_unit_ids : list or None, default: None
         List of unit ids to compute the synchrony metrics. Expecting all units.
+    tolerance_samples : int, default: 0
+        Spikes within +/- `tolerance_samples` are considered simultaneous.
+        With 0 only spikes at the exact same sample index are simultaneous.
 
     Returns
     -------
@@ -544,31 +626,40 @@ def get_synchrony_counts(spikes, synchrony_sizes, all_unit_ids):
     This code was adapted from `Elephant - Electrophysiology Analysis Toolkit <https://github.com/NeuralEnsemble/elephant/blob/master/elephant/spike_train_synchrony.py#L245>`_
     """
 
+    synchrony_sizes = np.atleast_1d(synchrony_sizes)
     synchrony_counts = np.zeros((np.size(synchrony_sizes), len(all_unit_ids)), dtype=np.int64)
 
-    # compute the occurrence of each sample_index. Count >2 means there's synchrony
-    _, unique_spike_index, counts = np.unique(spikes["sample_index"], return_index=True, return_counts=True)
-
-    sync_indices = unique_spike_index[counts >= 2]
-    sync_counts = counts[counts >= 2]
-
-    for i, sync_index in enumerate(sync_indices):
-
-        num_of_syncs = sync_counts[i]
-        units_with_sync = [spikes[sync_index + a][1] for a in range(0, num_of_syncs)]
-
-        # Counts inclusively. E.g. if there are 3 simultaneous spikes, these are also added
-        # to the 2 simultaneous spike bins.
-        how_many_bins_to_add_to = np.size(synchrony_sizes[synchrony_sizes <= num_of_syncs])
-        synchrony_counts[:how_many_bins_to_add_to, units_with_sync] += 1
+    # the spike vector is sorted by segment and time, other spikes arrays are sorted here
+    segment_indices = spikes["segment_index"]
+    sample_indices = spikes["sample_index"]
+    is_sorted = np.all(
+        (np.diff(segment_indices) > 0) | ((np.diff(segment_indices) == 0) & (np.diff(sample_indices) >= 0))
+    )
+    if not is_sorted:
+        spikes = spikes[np.lexsort((sample_indices, segment_indices))]
+
+    # number of spikes within the tolerance window of each spike, segment by segment
+    spike_synchrony_sizes = np.zeros(spikes.size, dtype=np.int64)
+    segment_bounds = np.searchsorted(spikes["segment_index"], np.arange(spikes["segment_index"].max(initial=0) + 2))
+    for i0, i1 in zip(segment_bounds[:-1], segment_bounds[1:]):
+        sample_indices = spikes["sample_index"][i0:i1].astype(np.int64)
+        left = np.searchsorted(sample_indices, sample_indices - tolerance_samples, side="left")
+        right = np.searchsorted(sample_indices, sample_indices + tolerance_samples, side="right")
+        spike_synchrony_sizes[i0:i1] = right - left
+
+    # Counts inclusively. E.g. if there are 3 simultaneous spikes, these are also added
+    # to the 2 simultaneous spike bins.
+    for sync_idx, synchrony_size in enumerate(synchrony_sizes):
+        units_with_sync = spikes["unit_index"][spike_synchrony_sizes >= synchrony_size]
+        synchrony_counts[sync_idx] = np.bincount(units_with_sync, minlength=len(all_unit_ids))
 
     return synchrony_counts
 
 
-def compute_synchrony_metrics(sorting_analyzer, synchrony_sizes=(2, 4, 8), unit_ids=None):
+def compute_synchrony_metrics(sorting_analyzer, synchrony_sizes=(2, 4, 8), unit_ids=None, tolerance_samples=0):
     """
     Compute synchrony metrics. Synchrony metrics represent the rate of occurrences of
-    "synchrony_size" spikes at the exact same sample index.
+    "synchrony_size" spikes at the exact same sample index (or within +/- `tolerance_samples`).
 
     Parameters
     ----------
@@ -578,6 +669,8 @@ def compute_synchrony_metrics(sorting_analyzer, synchrony_sizes=(2, 4, 8), unit_
         The synchrony sizes to compute.
     unit_ids : list or None, default: None
         List of unit ids to compute the synchrony metrics. If None, all units are used.
+    tolerance_samples : int, default: 0
+        Spikes within +/- `tolerance_samples` samples are considered simultaneous.
 
     Returns
     -------
@@ -606,7 +699,7 @@ def compute_synchrony_metrics(sorting_analyzer, synchrony_sizes=(2, 4, 8), unit_
 
     spikes = sorting.to_spike_vector()
     all_unit_ids = sorting.unit_ids
-    synchrony_counts = get_synchrony_counts(spikes, synchrony_sizes_np, all_unit_ids)
+    synchrony_counts = get_synchrony_counts(spikes, synchrony_sizes_np, all_unit_ids, tolerance_samples)
 
     synchrony_metrics_dict = {}
     for sync_idx, synchrony_size in enumerate(synchrony_sizes_np):
@@ -623,7 +716,7 @@ def compute_synchrony_metrics(sorting_analyzer, synchrony_sizes=(2, 4, 8), unit_
     return res(**synchrony_metrics_dict)
 
 
-_default_params["synchrony"] = dict(synchrony_sizes=(2, 4, 8))
+_default_params["synchrony"] = dict(synchrony_sizes=(2, 4, 8), tolerance_samples=0)
 
 
 def compute_firing_ranges(sorting_analyzer, bin_size_s=5, percentiles=(5, 95), unit_ids=None):
@@ -805,13 +898,12 @@ def _get_amplitudes_by_units(sorting_analyzer, unit_ids, peak_sign):
     # used by compute_amplitude_cutoffs and compute_amplitude_medians
     amplitudes_by_units = {}
     if sorting_analyzer.has_extension("spike_amplitudes"):
-        spikes = sorting_analyzer.sorting.to_spike_vector()
+        _, order, offsets = _get_spike_vector_by_unit(sorting_analyzer.sorting)
         ext = sorting_analyzer.get_extension("spike_amplitudes")
         all_amplitudes = ext.get_data()
         for unit_id in unit_ids:
             unit_index = sorting_analyzer.sorting.id_to_index(unit_id)
-            spike_mask = spikes["unit_index"] == unit_index
-            amplitudes_by_units[unit_id] = all_amplitudes[spike_mask]
+            amplitudes_by_units[unit_id] = all_amplitudes[order[offsets[unit_index] : offsets[unit_index + 1]]]
 
     elif sorting_analyzer.has_extension("waveforms"):
         waveforms_ext = sorting_analyzer.get_extension("waveforms")
@@ -836,6 +928,7 @@ def compute_amplitude_cutoffs(
     histogram_smoothing_value=3,
     amplitudes_bins_min_ratio=5,
     unit_ids=None,
+    n_jobs=1,
 ):
     """
     Calculate approximate fraction of spikes missing from a distribution of amplitudes.
@@ -856,6 +949,8 @@ def compute_amplitude_cutoffs(
         to NaN.
     unit_ids : list or None
         List of unit ids to compute the amplitude cutoffs. If None, all units are used.
+    n_jobs : int, default: 1
+        Number of threads used to process units in parallel.
 
     Returns
     -------
@@ -895,14 +990,16 @@ def compute_amplitude_cutoffs(
 
         amplitudes_by_units = _get_amplitudes_by_units(sorting_analyzer, unit_ids, peak_sign)
 
+        per_unit_args = []
         for unit_id in unit_ids:
             amplitudes = amplitudes_by_units[unit_id]
             if invert_amplitudes:
                 amplitudes = -amplitudes
+            per_unit_args.append((amplitudes, num_histogram_bins, histogram_smoothing_value, amplitudes_bins_min_ratio))
 
-            all_fraction_missing[unit_id] = amplitude_cutoff(
-                amplitudes, num_histogram_bins, histogram_smoothing_value, amplitudes_bins_min_ratio
-            )
+        results = _apply_per_unit(amplitude_cutoff, per_unit_args, n_jobs=n_jobs)
+        for unit_id, fraction_missing in zip(unit_ids, results):
+            all_fraction_missing[unit_id] = fraction_missing
 
         if np.any(np.isnan(list(all_fraction_missing.values()))):
             warnings.warn(f"Some units have too few spikes : amplitude_cutoff is set to NaN")
@@ -973,6 +1070,7 @@ def compute_drift_metrics(
     min_num_bins=2,
     return_positions=False,
     unit_ids=None,
+    n_jobs=1,
 ):
     """
     Compute drifts metrics using estimated spike locations.
@@ -1009,6 +1107,8 @@ def compute_drift_metrics(
         If True, median positions are returned (for debugging).
     unit_ids : list or None, default: None
         List of unit ids to compute the drift metrics. If None, all units are used.
+    n_jobs : int, default: 1
+        Number of threads used to process units in parallel.
 
     Returns
     -------
@@ -1034,15 +1134,7 @@ def compute_drift_metrics(
     if sorting_analyzer.has_extension("spike_locations"):
         spike_locations_ext = sorting_analyzer.get_extension("spike_locations")
         spike_locations = spike_locations_ext.get_data()
-        # spike_locations_by_unit = spike_locations_ext.get_data(outputs="by_unit")
-        spikes = sorting.to_spike_vector()
-        spike_locations_by_unit = {}
-        for unit_id in unit_ids:
-            unit_index = sorting.id_to_index(unit_id)
-            # TODO @alessio this is very slow this sjould be done with spike_vector_to_indices() in code
-            spike_mask = spikes["unit_index"] == unit_index
-            spike_locations_by_unit[unit_id] = spike_locations[spike_mask]
-
+        spikes, order, offsets = _get_spike_vector_by_unit(sorting)
     else:
         warnings.warn(
             "The drift metrics require the `spike_locations` waveform extension. "
@@ -1071,51 +1163,37 @@ def compute_drift_metrics(
         else:
             return res(empty_dict, empty_dict, empty_dict)
 
-    # we need
     drift_ptps = {}
     drift_stds = {}
     drift_mads = {}
 
-    # reference positions are the medians across segments
-    reference_positions = np.zeros(len(unit_ids))
-    for i, unit_id in enumerate(unit_ids):
-        unit_ind = sorting.id_to_index(unit_id)
-        reference_positions[i] = np.median(spike_locations_by_unit[unit_id][direction])
-
-    # now compute median positions and concatenate them over segments
-    median_position_segments = None
-    for segment_index in range(sorting_analyzer.get_num_segments()):
-        seg_length = sorting_analyzer.get_num_samples(segment_index)
-        num_bin_edges = seg_length // interval_samples + 1
-        bins = np.arange(num_bin_edges) * interval_samples
-        spike_vector = sorting.to_spike_vector()
-
-        # retrieve spikes in segment
-        i0, i1 = np.searchsorted(spike_vector["segment_index"], [segment_index, segment_index + 1])
-        spikes_in_segment = spike_vector[i0:i1]
-        spike_locations_in_segment = spike_locations[i0:i1]
-
-        # compute median positions (if less than min_spikes_per_interval, median position is 0)
-        median_positions = np.nan * np.zeros((len(unit_ids), num_bin_edges - 1))
-        for bin_index, (start_frame, end_frame) in enumerate(zip(bins[:-1], bins[1:])):
-            i0, i1 = np.searchsorted(spikes_in_segment["sample_index"], [start_frame, end_frame])
-            spikes_in_bin = spikes_in_segment[i0:i1]
-            spike_locations_in_bin = spike_locations_in_segment[i0:i1][direction]
-
-            for i, unit_id in enumerate(unit_ids):
-                unit_ind = sorting.id_to_index(unit_id)
-                mask = spikes_in_bin["unit_index"] == unit_ind
-                if np.sum(mask) >= min_spikes_per_interval:
-                    median_positions[i, bin_index] = np.median(spike_locations_in_bin[mask])
-        if median_position_segments is None:
-            median_position_segments = median_positions
-        else:
-            median_position_segments = np.hstack((median_position_segments, median_positions))
+    # global interval index of each spike, intervals are concatenated over segments
+    # spikes after the last full interval of a segment are not used
+    num_intervals = [
+        sorting_analyzer.get_num_samples(segment_index) // interval_samples
+        for segment_index in range(sorting_analyzer.get_num_segments())
+    ]
+    interval_offsets = np.concatenate([[0], np.cumsum(num_intervals)])
+    spike_intervals = spikes["sample_index"] // interval_samples
+    valid = spike_intervals < np.asarray(num_intervals)[spikes["segment_index"]]
+    spike_intervals = spike_intervals + interval_offsets[spikes["segment_index"]]
+    spike_positions = spike_locations[direction]
+
+    per_unit_args = []
+    for unit_id in unit_ids:
+        unit_index = sorting.id_to_index(unit_id)
+        inds = order[offsets[unit_index] : offsets[unit_index + 1]]
+        per_unit_args.append(
+            (spike_positions[inds], spike_intervals[inds], valid[inds], interval_offsets[-1], min_spikes_per_interval)
+        )
+    median_positions = np.array(_apply_per_unit(_median_positions_one_unit, per_unit_args, n_jobs=n_jobs))
+    median_positions = median_positions.reshape(len(unit_ids), interval_offsets[-1])
 
     # finally, compute deviations and drifts
-    position_diffs = median_position_segments - reference_positions[:, None]
     for i, unit_id in enumerate(unit_ids):
-        position_diff = position_diffs[i]
+        # reference positions are the medians across segments
+        reference_position = np.median(per_unit_args[i][0])
+        position_diff = median_positions[i] - reference_position
         if np.any(np.isnan(position_diff)):
             # deal with nans: if more than 50% nans --> set to nan
             if np.sum(np.isnan(position_diff)) > min_fraction_valid_intervals * len(position_diff):
@@ -1140,6 +1218,18 @@ def compute_drift_metrics(
     return outs
 
 
+def _median_positions_one_unit(positions, intervals, valid, num_intervals, min_spikes_per_interval):
+    # spikes of one unit are sorted by segment and time so intervals are sorted too
+    positions = positions[valid]
+    intervals = intervals[valid]
+    median_positions = np.full(num_intervals, np.nan)
+    counts = np.bincount(intervals, minlength=num_intervals)
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    for interval_index in np.flatnonzero(counts >= min_spikes_per_interval):
+        median_positions[interval_index] = np.median(positions[bounds[interval_index] : bounds[interval_index + 1]])
+    return median_positions
+
+
 _default_params["drift"] = dict(interval_s=60, min_spikes_per_interval=100, direction="y", min_num_bins=2)
 
 
@@ -1214,15 +1304,19 @@ def isi_violations(spike_trains, total_duration_s, isi_threshold_s=0.0015, min_i
     num_violations = 0
     num_spikes = 0
 
-    isi_violations_ratio = np.float64(np.nan)
-    isi_violations_rate = np.float64(np.nan)
-    isi_violations_count = np.float64(np.nan)
-
     for spike_train in spike_trains:
         isis = np.diff(spike_train)
         num_spikes += len(spike_train)
         num_violations += np.sum(isis < isi_threshold_s)
 
+    return _isi_violations_from_counts(num_violations, num_spikes, total_duration_s, isi_threshold_s, min_isi_s)
+
+
+def _isi_violations_from_counts(num_violations, num_spikes, total_duration_s, isi_threshold_s, min_isi_s):
+    isi_violations_ratio = np.float64(np.nan)
+    isi_violations_rate = np.float64(np.nan)
+    isi_violations_count = np.float64(np.nan)
+
     violation_time = 2 * num_spikes * (isi_threshold_s - min_isi_s)
 
     if num_spikes > 0:
@@ -1332,15 +1426,8 @@ def slidingRP_violations(
     min_cont_with_90_confidence : dict of floats
         The minimum contamination with confidence > 90%.
     """
-    if contamination_values is None:
-        contamination_values = np.arange(0.5, 35, 0.5) / 100  # vector of contamination values to test
-    rp_bin_size = bin_size_ms / 1000
-    rp_edges = np.arange(0, max_ref_period_ms / 1000, rp_bin_size)  # in s
-    rp_centers = rp_edges + ((rp_edges[1] - rp_edges[0]) / 2)  # vector of refractory period durations to test
-
-    # compute firing rate and spike count (concatenate for multi-segments)
+    # compute spike count (concatenate for multi-segments)
     n_spikes = len(np.concatenate(spike_samples))
-    firing_rate = n_spikes / duration
     if np.isscalar(spike_samples[0]):
         spike_samples_list = [spike_samples]
     else:
@@ -1360,6 +1447,39 @@ def slidingRP_violations(
             correlogram += c0
     correlogram_positive = correlogram[len(correlogram) // 2 :]
 
+    return _sliding_rp_violations_from_correlogram(
+        correlogram_positive,
+        n_spikes,
+        duration,
+        bin_size_ms,
+        exclude_ref_period_below_ms,
+        max_ref_period_ms,
+        contamination_values,
+        return_conf_matrix,
+    )
+
+
+def _sliding_rp_violations_from_correlogram(
+    correlogram_positive,
+    n_spikes,
+    duration,
+    bin_size_ms=0.25,
+    exclude_ref_period_below_ms=0.5,
+    max_ref_period_ms=10,
+    contamination_values=None,
+    return_conf_matrix=False,
+):
+    """
+    Second part of `slidingRP_violations()`, from the positive half of the auto-correlogram of one unit.
+    """
+    if contamination_values is None:
+        contamination_values = np.arange(0.5, 35, 0.5) / 100  # vector of contamination values to test
+    rp_bin_size = bin_size_ms / 1000
+    rp_edges = np.arange(0, max_ref_period_ms / 1000, rp_bin_size)  # in s
+    rp_centers = rp_edges + ((rp_edges[1] - rp_edges[0]) / 2)  # vector of refractory period durations to test
+
+    firing_rate = n_spikes / duration
+
     conf_matrix = _compute_violations(
         np.cumsum(correlogram_positive[0 : rp_centers.size])[np.newaxis, :],
         firing_rate,
@@ -1421,13 +1541,48 @@ if HAVE_NUMBA:
         cache=False,
         parallel=True,
     )
-    def _compute_rp_violations_numba(nb_rp_violations, spike_trains, spike_clusters, t_c, t_r):
+    def _compute_rp_violations_numba(nb_rp_violations, spike_times, spike_segments, order, offsets, t_c, t_r):
         n_units = len(nb_rp_violations)
 
         for i in numba.prange(n_units):
-            spike_train = spike_trains[spike_clusters == i]
-            n_v = _compute_nb_violations_numba(spike_train, t_r)
-            nb_rp_violations[i] += n_v
+            # spikes of the unit are sorted by segment: count violations segment by segment
+            start = offsets[i]
+            while start < offsets[i + 1]:
+                stop = start + 1
+                while stop < offsets[i + 1] and spike_segments[order[stop]] == spike_segments[order[start]]:
+                    stop += 1
+                spike_train = spike_times[order[start:stop]]
+                nb_rp_violations[i] += _compute_nb_violations_numba(spike_train, t_r)
+                start = stop
+
+    @numba.jit(
+        nopython=True,
+        nogil=True,
+        cache=False,
+        parallel=True,
+    )
+    def _compute_positive_auto_correlograms_numba(
+        auto_correlograms, spike_times, spike_segments, order, offsets, bin_size
+    ):
+        """
+        Positive half of the auto-correlogram of every unit, for the first `auto_correlograms.shape[1]` bins.
+        This gives the same counts as `correlogram_for_one_segment()`: lags of 0 count twice.
+        """
+        n_units = auto_correlograms.shape[0]
+        num_bins = auto_correlograms.shape[1]
+        max_lag = num_bins * bin_size
+
+        for unit_index in numba.prange(n_units):
+            for k in range(offsets[unit_index], offsets[unit_index + 1]):
+                i = order[k]
+                for l in range(k + 1, offsets[unit_index + 1]):
+                    j = order[l]
+                    if spike_segments[j] != spike_segments[i]:
+                        break
+                    lag = spike_times[j] - spike_times[i]
+                    if lag >= max_lag:
+                        break
+                    auto_correlograms[unit_index, lag // bin_size] += 2 if lag == 0 else 1
 
 
 def compute_sd_ratio(
@@ -10,12 +10,13 @@ from tqdm.auto import tqdm
 import numpy as np
 
 import multiprocessing as mp
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from threadpoolctl import threadpool_limits
 
 from .misc_metrics import compute_num_spikes, compute_firing_rates
 
 from ..core import get_random_data_chunks, compute_sparsity
+from ..core.core_tools import make_shared_array
 from ..core.template_tools import get_template_extremum_channel
 
 _possible_pc_metric_names = [
@@ -33,12 +34,27 @@ _default_params = dict(
     nearest_neighbor=dict(
         max_spikes=10000,
         n_neighbors=5,
+        knn_method="exact",
     ),
     nn_isolation=dict(
-        max_spikes=10000, min_spikes=10, min_fr=0.0, n_neighbors=4, n_components=10, radius_um=100, peak_sign="neg"
+        max_spikes=10000,
+        min_spikes=10,
+        min_fr=0.0,
+        n_neighbors=4,
+        n_components=10,
+        radius_um=100,
+        peak_sign="neg",
+        knn_method="exact",
     ),
     nn_noise_overlap=dict(
-        max_spikes=10000, min_spikes=10, min_fr=0.0, n_neighbors=4, n_components=10, radius_um=100, peak_sign="neg"
+        max_spikes=10000,
+        min_spikes=10,
+        min_fr=0.0,
+        n_neighbors=4,
+        n_components=10,
+        radius_um=100,
+        peak_sign="neg",
+        knn_method="exact",
     ),
     silhouette=dict(method=("simplified",)),
 )
@@ -78,8 +94,13 @@ def compute_pc_metrics(
         Random seed value.
     n_jobs : int
         Number of jobs to parallelize metric computations.
+        The projections are shared once with the worker processes through shared memory.
     progress_bar : bool
         If True, progress bar is shown.
+    mp_context : "fork" | "spawn" | None, default: None
+        The multiprocessing context used when n_jobs > 1.
+    max_threads_per_process : int or None, default: None
+        Limit the number of BLAS threads of each worker.
 
     Returns
     -------
@@ -131,7 +152,9 @@ def compute_pc_metrics(
     dense_projections, spike_unit_indices = pca_ext.get_some_projections(channel_ids=None, unit_ids=unit_ids)
     all_labels = sorting.unit_ids[spike_unit_indices]
 
-    items = []
+    # units with the same neighborhood (neighbor units and channels) use the same subset of the projections:
+    # group them so that each subset is extracted once per worker, tasks only carry indices
+    neighborhoods = {}
     for unit_id in unit_ids:
         if sorting_analyzer.is_sparse():
             neighbor_channel_ids = sorting_analyzer.sparsity.unit_id_to_channel_ids[unit_id]
@@ -142,51 +165,90 @@ def compute_pc_metrics(
             neighbor_channel_ids = channel_ids
             neighbor_unit_ids = unit_ids
         neighbor_channel_indices = sorting_analyzer.channel_ids_to_indices(neighbor_channel_ids)
+        neighbor_unit_indices = sorting.ids_to_indices(neighbor_unit_ids)
 
-        labels = all_labels[np.isin(all_labels, neighbor_unit_ids)]
-        pcs = dense_projections[np.isin(all_labels, neighbor_unit_ids)][:, :, neighbor_channel_indices]
-        pcs_flat = pcs.reshape(pcs.shape[0], -1)
+        key = (tuple(neighbor_unit_indices), tuple(neighbor_channel_indices))
+        neighborhoods.setdefault(key, []).append(unit_id)
 
-        func_args = (pcs_flat, labels, non_nn_metrics, unit_id, unit_ids, qm_params, max_threads_per_process)
-        items.append(func_args)
+    items = []
+    for (neighbor_unit_indices, neighbor_channel_indices), neighborhood_unit_ids in neighborhoods.items():
+        # the units of a neighborhood are split in chunks (about n_jobs chunks for a dense analyzer),
+        # so that all workers are used even when all units share the same neighborhood
+        num_chunks = 1
+        if run_in_parallel:
+            num_chunks = int(np.ceil(n_jobs * len(neighborhood_unit_ids) / len(unit_ids)))
+            num_chunks = min(num_chunks, len(neighborhood_unit_ids))
+        chunks = np.array_split(np.arange(len(neighborhood_unit_ids)), num_chunks)
+        for chunk_index, chunk in enumerate(chunks):
+            func_args = (
+                np.array(neighbor_unit_indices, dtype="int64"),
+                np.array(neighbor_channel_indices, dtype="int64"),
+                neighborhood_unit_ids,
+                [neighborhood_unit_ids[i] for i in chunk],
+                # the nearest neighbor graph of the neighborhood is computed by its first chunk only
+                chunk_index == 0,
+                non_nn_metrics,
+                unit_ids,
+                qm_params,
+                max_threads_per_process,
+                seed,
+            )
+            items.append(func_args)
 
     if not run_in_parallel and non_nn_metrics:
-        units_loop = enumerate(unit_ids)
+        items_loop = items
         if progress_bar:
-            units_loop = tqdm(units_loop, desc="calculate pc_metrics", total=len(unit_ids))
+            items_loop = tqdm(items_loop, desc="calculate pc_metrics", total=len(items))
 
-        for i, unit_id in units_loop:
-            pca_metrics_unit = pca_metrics_one_unit(items[i])
-            for metric_name, metric in pca_metrics_unit.items():
-                pc_metrics[metric_name][unit_id] = metric
+        for func_args in items_loop:
+            pcs_flat, labels = _get_neighborhood_projections(
+                dense_projections, spike_unit_indices, sorting.unit_ids, *func_args[:2]
+            )
+            pca_metrics_neighborhood = _pca_metrics_one_neighborhood(pcs_flat, labels, *func_args[2:])
+            for unit_id, pca_metrics_unit in pca_metrics_neighborhood.items():
+                for metric_name, metric in pca_metrics_unit.items():
+                    pc_metrics[metric_name][unit_id] = metric
     elif run_in_parallel and non_nn_metrics:
         if mp_context is not None and platform.system() == "Windows":
             assert mp_context != "fork", "'fork' mp_context not supported on Windows!"
         elif mp_context == "fork" and platform.system() == "Darwin":
             warnings.warn('As of Python 3.8 "fork" is no longer considered safe on macOS')
 
-        with ProcessPoolExecutor(
-            max_workers=n_jobs,
-            mp_context=mp.get_context(mp_context),
-        ) as executor:
-            results = executor.map(pca_metrics_one_unit, items)
-            if progress_bar:
-                results = tqdm(results, total=len(unit_ids), desc="calculate_pc_metrics")
-
-            for ui, pca_metrics_unit in enumerate(results):
-                unit_id = unit_ids[ui]
-                for metric_name, metric in pca_metrics_unit.items():
-                    pc_metrics[metric_name][unit_id] = metric
+        # the projections are copied once in shared memory instead of being pickled for every unit
+        shared_projections, shm = make_shared_array(dense_projections.shape, dense_projections.dtype)
+        shared_projections[:] = dense_projections
+        init_args = (
+            shm.name,
+            dense_projections.shape,
+            dense_projections.dtype.str,
+            spike_unit_indices,
+            sorting.unit_ids,
+        )
+        try:
+            with ProcessPoolExecutor(
+                max_workers=n_jobs,
+                mp_context=mp.get_context(mp_context),
+                initializer=_init_pca_metrics_worker,
+                initargs=init_args,
+            ) as executor:
+                results = executor.map(pca_metrics_one_neighborhood, items)
+                if progress_bar:
+                    results = tqdm(results, total=len(items), desc="calculate_pc_metrics")
+
+                for pca_metrics_neighborhood in results:
+                    for unit_id, pca_metrics_unit in pca_metrics_neighborhood.items():
+                        for metric_name, metric in pca_metrics_unit.items():
+                            pc_metrics[metric_name][unit_id] = metric
+        finally:
+            del shared_projections
+            shm.close()
+            shm.unlink()
 
     for metric_name in nn_metrics:
-        units_loop = enumerate(unit_ids)
-        if progress_bar:
-            units_loop = tqdm(units_loop, desc=f"calculate {metric_name} metric", total=len(unit_ids))
-
         func = _nn_metric_name_to_func[metric_name]
         metric_params = qm_params[metric_name] if metric_name in qm_params else {}
 
-        for _, unit_id in units_loop:
+        def _nn_metric_one_unit(unit_id):
             try:
                 res = func(
                     sorting_analyzer,
@@ -201,13 +263,35 @@ def compute_pc_metrics(
                     res = (np.nan, np.nan)
                 elif metric_name == "nn_noise_overlap":
                     res = np.nan
+            return res
+
+        # units are independent and mostly spend time in numpy/sklearn: use threads,
+        # which share the sorting_analyzer instead of pickling it to processes.
+        # Each thread is limited to one BLAS/OpenMP thread, otherwise the n_jobs threads and the
+        # threads of the knn searches oversubscribe the CPU.
+        if run_in_parallel:
+            limits = threadpool_limits(limits=1)
+            executor = ThreadPoolExecutor(max_workers=n_jobs)
+            results = executor.map(_nn_metric_one_unit, unit_ids)
+        else:
+            limits = None
+            executor = None
+            results = map(_nn_metric_one_unit, unit_ids)
+        if progress_bar:
+            results = tqdm(results, desc=f"calculate {metric_name} metric", total=len(unit_ids))
 
-            if metric_name == "nn_isolation":
-                nn_isolation, nn_unit_id = res
-                pc_metrics["nn_isolation"][unit_id] = nn_isolation
-                pc_metrics["nn_unit_id"][unit_id] = nn_unit_id
-            elif metric_name == "nn_noise_overlap":
-                pc_metrics["nn_noise_overlap"][unit_id] = res
+        try:
+            for unit_id, res in zip(unit_ids, results):
+                if metric_name == "nn_isolation":
+                    nn_isolation, nn_unit_id = res
+                    pc_metrics["nn_isolation"][unit_id] = nn_isolation
+                    pc_metrics["nn_unit_id"][unit_id] = nn_unit_id
+                elif metric_name == "nn_noise_overlap":
+                    pc_metrics["nn_noise_overlap"][unit_id] = res
+        finally:
+            if executor is not None:
+                executor.shutdown()
+                limits.restore_original_limits()
 
     return pc_metrics
 
@@ -339,7 +423,9 @@ def lda_metrics(all_pcs, all_labels, this_unit_id) -> float:
     return d_prime
 
 
-def nearest_neighbors_metrics(all_pcs, all_labels, this_unit_id, max_spikes, n_neighbors):
+def nearest_neighbors_metrics(
+    all_pcs, all_labels, this_unit_id, max_spikes, n_neighbors, knn_method="exact", seed=None
+):
     """
     Calculate unit contamination based on NearestNeighbors search in PCA space.
 
@@ -356,6 +442,10 @@ def nearest_neighbors_metrics(all_pcs, all_labels, this_unit_id, max_spikes, n_n
         Note that the calculation can be very slow when this number is >20000.
     n_neighbors : int
         The number of neighbors to use.
+    knn_method : "exact" | "approximate", default: "exact"
+        The nearest neighbors search, see `get_knn_indices()`.
+    seed : int | None, default: None
+        The random seed of the "approximate" nearest neighbors search.
 
     Returns
     -------
@@ -376,8 +466,6 @@ def nearest_neighbors_metrics(all_pcs, all_labels, this_unit_id, max_spikes, n_n
     ----------
     Based on metrics described in [Chung]_
     """
-    from sklearn.neighbors import NearestNeighbors
-
     total_spikes = all_pcs.shape[0]
     ratio = max_spikes / total_spikes
 
@@ -398,11 +486,11 @@ def nearest_neighbors_metrics(all_pcs, all_labels, this_unit_id, max_spikes, n_n
         X = X[inds, :]
         num_obs_this_unit = int(num_obs_this_unit * ratio)
 
-    nbrs = NearestNeighbors(n_neighbors=n_neighbors, algorithm="ball_tree").fit(X)
-    distances, indices = nbrs.kneighbors(X)
+    # the first neighbor of each spike is itself
+    indices = get_knn_indices(X, n_neighbors - 1, knn_method=knn_method, seed=seed)
 
-    this_cluster_nearest = indices[:num_obs_this_unit, 1:].flatten()
-    other_cluster_nearest = indices[num_obs_this_unit:, 1:].flatten()
+    this_cluster_nearest = indices[:num_obs_this_unit].flatten()
+    other_cluster_nearest = indices[num_obs_this_unit:].flatten()
 
     hit_rate = np.mean(this_cluster_nearest < num_obs_this_unit)
     miss_rate = np.mean(other_cluster_nearest < num_obs_this_unit)
@@ -424,6 +512,7 @@ def nearest_neighbors_isolation(
     peak_sign: str = "neg",
     min_spatial_overlap: float = 0.5,
     seed=None,
+    knn_method: str = "exact",
 ):
     """
     Calculate unit isolation based on NearestNeighbors search in PCA space.
@@ -464,6 +553,8 @@ def nearest_neighbors_isolation(
         `min_spatial_overlap` times `n_target_unit_channels` with the target unit.
     seed : int, default: None
         Seed for random subsampling of spikes.
+    knn_method : "exact" | "approximate", default: "exact"
+        The nearest neighbors search, see `get_knn_indices()`.
 
     Returns
     -------
@@ -617,7 +708,11 @@ def nearest_neighbors_isolation(
 
                 # compute isolation
                 isolation[other_unit_id == other_units_ids] = _compute_isolation(
-                    projected_snippets[:n_snippets, :], projected_snippets[n_snippets:, :], n_neighbors
+                    projected_snippets[:n_snippets, :],
+                    projected_snippets[n_snippets:, :],
+                    n_neighbors,
+                    knn_method,
+                    seed=seed,
                 )
             # isolation metric is the minimum of the pairwise isolations
             # nn_unit_id is the unit with lowest isolation score
@@ -640,6 +735,7 @@ def nearest_neighbors_noise_overlap(
     radius_um: float = 100,
     peak_sign: str = "neg",
     seed=None,
+    knn_method: str = "exact",
 ):
     """
     Calculate unit noise overlap based on NearestNeighbors search in PCA space.
@@ -675,6 +771,8 @@ def nearest_neighbors_noise_overlap(
         is not sparse already.
     seed : int, default: 0
         Random seed for subsampling spikes.
+    knn_method : "exact" | "approximate", default: "exact"
+        The nearest neighbors search, see `get_knn_indices()`.
 
     Returns
     -------
@@ -807,7 +905,11 @@ def nearest_neighbors_noise_overlap(
 
         # compute overlap
         nn_noise_overlap = 1 - _compute_isolation(
-            projected_snippets[:n_snippets, :], projected_snippets[n_snippets:, :], n_neighbors
+            projected_snippets[:n_snippets, :],
+            projected_snippets[n_snippets:, :],
+            n_neighbors,
+            knn_method,
+            seed=seed,
         )
 
         return nn_noise_overlap
@@ -921,7 +1023,52 @@ def _subtract_clip_component(clip1, component):
     return V1.reshape(clip1.shape)
 
 
-def _compute_isolation(pcs_target_unit, pcs_other_unit, n_neighbors: int):
+def get_knn_indices(X, n_neighbors, knn_method="exact", seed=None):
+    """
+    Find the nearest neighbors of every point of X among the other points of X.
+
+    Parameters
+    ----------
+    X : 2d array
+        The points, organized as [num_points, num_features].
+    n_neighbors : int
+        The number of neighbors to find, the point itself is excluded.
+    knn_method : "exact" | "approximate", default: "exact"
+        "exact" uses a sklearn tree index.
+        "approximate" uses a nearest neighbor descent graph (needs pynndescent), which is much
+        faster for large number of spikes at the cost of a few wrong neighbors.
+    seed : int or None, default: None
+        The random seed of the "approximate" method.
+
+    Returns
+    -------
+    indices : 2d array
+        The indices of the neighbors of each point, as [num_points, n_neighbors].
+    """
+    if knn_method == "exact":
+        from sklearn.neighbors import NearestNeighbors
+
+        _, indices = NearestNeighbors(n_neighbors=n_neighbors, algorithm="auto").fit(X).kneighbors()
+    elif knn_method == "approximate":
+        try:
+            from pynndescent import NNDescent
+        except ImportError:
+            raise ImportError("knn_method='approximate' requires pynndescent: pip install pynndescent")
+
+        index = NNDescent(X, n_neighbors=n_neighbors + 1, random_state=seed)
+        indices, _ = index.neighbor_graph
+        # the first neighbor is the point itself except for duplicated points
+        is_self = indices == np.arange(X.shape[0])[:, None]
+        is_self[~np.any(is_self, axis=1), -1] = True
+        indices = indices[~is_self].reshape(X.shape[0], n_neighbors)
+    else:
+        raise ValueError(f"knn_method must be 'exact' or 'approximate', not {knn_method}")
+    return indices
+
+
+def _compute_isolation(
+    pcs_target_unit, pcs_other_unit, n_neighbors: int, knn_method: str = "exact", seed: int | None = None
+):
     """
     Compute the isolation score used for nn_isolation and nn_noise_overlap.
 
@@ -933,6 +1080,10 @@ def _compute_isolation(pcs_target_unit, pcs_other_unit, n_neighbors: int):
         PCA projection of the spikes in the other cluster, as [n_spikes, n_components].
     n_neighbors : int
         The number of nearest neighbors to check membership of.
+    knn_method : "exact" | "approximate", default: "exact"
+        The nearest neighbors search, see `get_knn_indices()`.
+    seed : int | None, default: None
+        The random seed of the "approximate" nearest neighbors search.
 
     Returns
     -------
@@ -948,8 +1099,6 @@ def _compute_isolation(pcs_target_unit, pcs_other_unit, n_neighbors: int):
         (1) ranges from 0 to 1; and
         (2) is symmetric, i.e. Isolation(A, B) = Isolation(B, A)
     """
-    from sklearn.neighbors import NearestNeighbors
-
     # get lengths
     n_spikes_target = pcs_target_unit.shape[0]
     n_spikes_other = pcs_other_unit.shape[0]
@@ -964,9 +1113,7 @@ def _compute_isolation(pcs_target_unit, pcs_other_unit, n_neighbors: int):
     else:
         n_neighbors_adjusted = n_neighbors
 
-    _, membership_ind = (
-        NearestNeighbors(n_neighbors=n_neighbors_adjusted, algorithm="auto").fit(pcs_concat).kneighbors()
-    )
+    membership_ind = get_knn_indices(pcs_concat, n_neighbors_adjusted, knn_method=knn_method, seed=seed)
 
     target_nn_in_target = np.sum(label_concat[membership_ind[:n_spikes_target]] == 0)
     other_nn_in_other = np.sum(label_concat[membership_ind[n_spikes_target:]] == 1)
@@ -976,17 +1123,104 @@ def _compute_isolation(pcs_target_unit, pcs_other_unit, n_neighbors: int):
     return isolation
 
 
+# context of the worker processes of compute_pc_metrics(), set by _init_pca_metrics_worker()
+_pca_worker_ctx = {}
+
+
+def _init_pca_metrics_worker(shm_name, shape, dtype, spike_unit_indices, all_unit_ids):
+    from multiprocessing.shared_memory import SharedMemory
+
+    # keep a reference to the SharedMemory, otherwise the buffer is released
+    shm = SharedMemory(shm_name)
+    _pca_worker_ctx["shm"] = shm
+    _pca_worker_ctx["dense_projections"] = np.ndarray(shape=shape, dtype=dtype, buffer=shm.buf)
+    _pca_worker_ctx["spike_unit_indices"] = spike_unit_indices
+    _pca_worker_ctx["all_unit_ids"] = all_unit_ids
+
+
+def pca_metrics_one_neighborhood(args):
+    neighbor_unit_indices, neighbor_channel_indices = args[:2]
+    key = (neighbor_unit_indices.tobytes(), neighbor_channel_indices.tobytes())
+    if _pca_worker_ctx.get("neighborhood_key", None) != key:
+        # the next chunks of the same neighborhood re-use the subset of the projections
+        _pca_worker_ctx["neighborhood_projections"] = _get_neighborhood_projections(
+            _pca_worker_ctx["dense_projections"],
+            _pca_worker_ctx["spike_unit_indices"],
+            _pca_worker_ctx["all_unit_ids"],
+            neighbor_unit_indices,
+            neighbor_channel_indices,
+        )
+        _pca_worker_ctx["neighborhood_key"] = key
+    pcs_flat, labels = _pca_worker_ctx["neighborhood_projections"]
+    return _pca_metrics_one_neighborhood(pcs_flat, labels, *args[2:])
+
+
+def _get_neighborhood_projections(
+    dense_projections, spike_unit_indices, all_unit_ids, neighbor_unit_indices, neighbor_channel_indices
+):
+    # the subset of the projections shared by all units of a neighborhood
+    spike_mask = np.isin(spike_unit_indices, neighbor_unit_indices)
+    labels = all_unit_ids[spike_unit_indices[spike_mask]]
+    pcs = dense_projections[spike_mask][:, :, neighbor_channel_indices]
+    pcs_flat = pcs.reshape(pcs.shape[0], -1)
+    return pcs_flat, labels
+
+
+def _pca_metrics_one_neighborhood(
+    pcs_flat,
+    labels,
+    neighborhood_unit_ids,
+    chunk_unit_ids,
+    with_nn_graph,
+    metric_names,
+    unit_ids,
+    qm_params,
+    max_threads_per_process,
+    seed=None,
+):
+    pc_metrics = {}
+    for unit_id in chunk_unit_ids:
+        args = (pcs_flat, labels, metric_names, unit_id, unit_ids, qm_params, max_threads_per_process, seed)
+        pc_metrics[unit_id] = pca_metrics_one_unit(args)
+
+    if "nearest_neighbor" in metric_names and with_nn_graph:
+        # one nearest neighbor graph is shared by all units of the neighborhood
+        nn_params = dict(qm_params["nearest_neighbor"])
+        if pcs_flat.shape[0] <= nn_params["max_spikes"] and len(np.unique(labels)) > 1:
+            try:
+                with threadpool_limits(limits=max_threads_per_process):
+                    indices = get_knn_indices(
+                        pcs_flat,
+                        nn_params["n_neighbors"] - 1,
+                        knn_method=nn_params.get("knn_method", "exact"),
+                        seed=seed,
+                    )
+                neighbor_labels = labels[indices]
+                for unit_id in neighborhood_unit_ids:
+                    this_unit = labels == unit_id
+                    unit_metrics = pc_metrics.setdefault(unit_id, {})
+                    unit_metrics["nn_hit_rate"] = np.mean(neighbor_labels[this_unit] == unit_id)
+                    unit_metrics["nn_miss_rate"] = np.mean(neighbor_labels[~this_unit] == unit_id)
+            except:
+                for unit_id in neighborhood_unit_ids:
+                    unit_metrics = pc_metrics.setdefault(unit_id, {})
+                    unit_metrics["nn_hit_rate"] = np.nan
+                    unit_metrics["nn_miss_rate"] = np.nan
+
+    return pc_metrics
+
+
 def pca_metrics_one_unit(args):
-    (pcs_flat, labels, metric_names, unit_id, unit_ids, qm_params, max_threads_per_process) = args
+    pcs_flat, labels, metric_names, unit_id, unit_ids, qm_params, max_threads_per_process, seed = args
 
     if max_threads_per_process is None:
-        return _pca_metrics_one_unit(pcs_flat, labels, metric_names, unit_id, unit_ids, qm_params)
+        return _pca_metrics_one_unit(pcs_flat, labels, metric_names, unit_id, unit_ids, qm_params, seed=seed)
     else:
         with threadpool_limits(limits=int(max_threads_per_process)):
-            return _pca_metrics_one_unit(pcs_flat, labels, metric_names, unit_id, unit_ids, qm_params)
+            return _pca_metrics_one_unit(pcs_flat, labels, metric_names, unit_id, unit_ids, qm_params, seed=seed)
 
 
-def _pca_metrics_one_unit(pcs_flat, labels, metric_names, unit_id, unit_ids, qm_params):
+def _pca_metrics_one_unit(pcs_flat, labels, metric_names, unit_id, unit_ids, qm_params, seed=None):
     pc_metrics = {}
     # metrics
     if "isolation_distance" in metric_names or "l_ratio" in metric_names:
@@ -1012,10 +1246,13 @@ def _pca_metrics_one_unit(pcs_flat, labels, metric_names, unit_id, unit_ids, qm_
 
         pc_metrics["d_prime"] = d_prime
 
-    if "nearest_neighbor" in metric_names:
+    if "nearest_neighbor" in metric_names and (
+        len(np.unique(labels)) == 1 or pcs_flat.shape[0] > qm_params["nearest_neighbor"]["max_spikes"]
+    ):
+        # otherwise nearest_neighbor is computed for all units of the neighborhood at once
         try:
             nn_hit_rate, nn_miss_rate = nearest_neighbors_metrics(
-                pcs_flat, labels, unit_id, **qm_params["nearest_neighbor"]
+                pcs_flat, labels, unit_id, **qm_params["nearest_neighbor"], seed=seed
             )
         except:
             nn_hit_rate = np.nan
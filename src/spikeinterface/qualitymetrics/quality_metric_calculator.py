@@ -14,6 +14,7 @@ from spikeinterface.core.sortinganalyzer import register_result_extension, Analy
 from .quality_metric_list import (
     compute_pc_metrics,
     _misc_metric_name_to_func,
+    _misc_metrics_with_n_jobs,
     _possible_pc_metric_names,
     compute_name_to_column_names,
 )
@@ -178,6 +179,8 @@ class ComputeQualityMetrics(AnalyzerExtension):
             func = _misc_metric_name_to_func[metric_name]
 
             params = qm_params[metric_name] if metric_name in qm_params else {}
+            if metric_name in _misc_metrics_with_n_jobs:
+                params = dict(params, n_jobs=n_jobs)
             res = func(sorting_analyzer, unit_ids=non_empty_unit_ids, **params)
             # QM with uninstall dependencies might return None
             if res is not None:
@@ -34,7 +34,6 @@ from .pca_metrics import (
 
 from .pca_metrics import _possible_pc_metric_names
 
-
 # list of all available metrics and mapping to function
 # this list MUST NOT contain pca metrics, which are handled separately
 _misc_metric_name_to_func = {
@@ -54,6 +53,9 @@ _misc_metric_name_to_func = {
     "sd_ratio": compute_sd_ratio,
 }
 
+# misc metrics which can process units in parallel and accept a `n_jobs` argument
+_misc_metrics_with_n_jobs = ("rp_violation", "sliding_rp_violation", "amplitude_cutoff", "drift")
+
 # a dict converting the name of the metric for computation to the output of that computation
 compute_name_to_column_names = {
     "num_spikes": ["num_spikes"],
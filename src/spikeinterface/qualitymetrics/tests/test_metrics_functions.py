@@ -17,6 +17,7 @@ from spikeinterface.qualitymetrics.utils import create_ground_truth_pc_distribut
 from spikeinterface.qualitymetrics.quality_metric_list import (
     _misc_metric_name_to_func,
 )
+from spikeinterface.qualitymetrics.misc_metrics import slidingRP_violations
 
 from spikeinterface.qualitymetrics import (
     get_quality_metric_list,
@@ -46,7 +47,6 @@ from spikeinterface.qualitymetrics import (
 
 from spikeinterface.core.basesorting import minimum_spike_dtype
 
-
 job_kwargs = dict(n_jobs=2, progress_bar=True, chunk_duration="1s")
 
 
@@ -414,6 +414,25 @@ def test_synchrony_counts_not_all_units():
     assert np.all(sync_count[0] == np.array([0, 1, 1]))
 
 
+def test_synchrony_counts_tolerance():
+    # two spikes 2 samples apart are synchronous only with a tolerance
+    spikes = np.zeros(3, minimum_spike_dtype)
+    spikes["sample_index"] = [100, 102, 200]
+    spikes["unit_index"] = [0, 1, 1]
+
+    sync_count = get_synchrony_counts(spikes, np.array((2)), [0, 1])
+    assert np.all(sync_count[0] == np.array([0, 0]))
+
+    sync_count = get_synchrony_counts(spikes, np.array((2)), [0, 1], tolerance_samples=2)
+    assert np.all(sync_count[0] == np.array([1, 1]))
+
+    # the same sample indices in different segments are not synchronous
+    spikes["sample_index"] = [100, 50, 100]
+    spikes["segment_index"] = [0, 1, 1]
+    sync_count = get_synchrony_counts(spikes, np.array((2)), [0, 1])
+    assert np.all(sync_count[0] == np.array([0, 0]))
+
+
 def test_mahalanobis_metrics():
     all_pcs1, all_labels1 = create_ground_truth_pc_distributions([1, -1], [1000, 1000])
     all_pcs2, all_labels2 = create_ground_truth_pc_distributions(
@@ -577,6 +596,22 @@ def test_calculate_sliding_rp_violations(sorting_analyzer_violations):
     contaminations = compute_sliding_rp_violations(sorting_analyzer, bin_size_ms=0.25, window_size_s=1)
     print(contaminations)
 
+    # the shared auto-correlogram kernel gives the same result as the one unit function
+    sorting = sorting_analyzer.sorting
+    for unit_id, contamination in contaminations.items():
+        if np.isnan(contamination):
+            continue
+        spike_trains = [sorting.get_unit_spike_train(unit_id, segment_index=0)]
+        expected = slidingRP_violations(
+            spike_trains, sorting.sampling_frequency, sorting_analyzer.get_total_duration(), 0.25, 1
+        )
+        assert np.isclose(expected, contamination, equal_nan=True)
+
+    contaminations_parallel = compute_sliding_rp_violations(
+        sorting_analyzer, bin_size_ms=0.25, window_size_s=1, n_jobs=2
+    )
+    assert contaminations_parallel == contaminations
+
     # testing method accuracy with magic number is not a good pratcice, I remove this.
     # contaminations_gt = {0: 0.03, 1: 0.185, 2: 0.325}
     # assert np.allclose(list(contaminations_gt.values()), list(contaminations.values()), rtol=0.05)
@@ -589,6 +624,11 @@ def test_calculate_rp_violations(sorting_analyzer_violations):
     )
     print(rp_contamination, counts)
 
+    _, counts_parallel = compute_refrac_period_violations(
+        sorting_analyzer, refractory_period_ms=1, censored_period_ms=0.0, n_jobs=2
+    )
+    assert counts_parallel == counts
+
     # testing method accuracy with magic number is not a good pratcice, I remove this.
     # counts_gt = {0: 2, 1: 4, 2: 10}
     # rp_contamination_gt = {0: 0.10534956502609294, 1: 1.0, 2: 1.0}
@@ -676,6 +716,11 @@ def test_calculate_drift_metrics(sorting_analyzer_simple):
 
     # print(drifts_ptps, drifts_stds, drift_mads)
 
+    drifts_ptps_parallel, _, _ = compute_drift_metrics(
+        sorting_analyzer, interval_s=10, min_spikes_per_interval=10, n_jobs=2
+    )
+    np.testing.assert_array_equal(list(drifts_ptps_parallel.values()), list(drifts_ptps.values()))
+
     # testing method accuracy with magic number is not a good pratcice, I remove this.
     # drift_ptps_gt = {0: 0.7155675636836349, 1: 0.8163672125409391, 2: 1.0224792180505773}
     # drift_stds_gt = {0: 0.17536888672049475, 1: 0.24508522219800638, 2: 0.29252984101193136}
@@ -41,3 +41,78 @@ def test_pca_metrics_multi_processing(small_sorting_analyzer):
     res2 = compute_pc_metrics(
         sorting_analyzer, n_jobs=-1, metric_names=metric_names, max_threads_per_process=2, progress_bar=True
     )
+
+
+def test_pca_metrics_dense_parallel_tasks(monkeypatch):
+    from concurrent.futures import ProcessPoolExecutor
+    from spikeinterface.core import generate_ground_truth_recording, create_sorting_analyzer
+    import spikeinterface.qualitymetrics.pca_metrics as pca_metrics_module
+
+    num_tasks = []
+
+    class CountingExecutor(ProcessPoolExecutor):
+        def map(self, fn, *iterables, **kwargs):
+            items = list(iterables[0])
+            num_tasks.append(len(items))
+            return super().map(fn, items, **kwargs)
+
+    monkeypatch.setattr(pca_metrics_module, "ProcessPoolExecutor", CountingExecutor)
+
+    recording, sorting = generate_ground_truth_recording(durations=[2.0], num_units=4, seed=1205)
+    sorting_analyzer = create_sorting_analyzer(sorting, recording, format="memory", sparse=False)
+    sorting_analyzer.compute(["random_spikes", "waveforms", "templates", "principal_components"])
+
+    # all units of a dense analyzer share one neighborhood, which is still split between the workers
+    metric_names = ["isolation_distance", "l_ratio", "d_prime", "nearest_neighbor"]
+    res_parallel = compute_pc_metrics(sorting_analyzer, metric_names=metric_names, n_jobs=2, seed=1205)
+    assert len(num_tasks) == 1 and num_tasks[0] > 1
+
+    res = compute_pc_metrics(sorting_analyzer, metric_names=metric_names, n_jobs=1, seed=1205)
+    for metric_name, values in res.items():
+        assert set(res_parallel[metric_name].keys()) == set(sorting_analyzer.unit_ids)
+        for unit_id in sorting_analyzer.unit_ids:
+            np.testing.assert_array_equal(res_parallel[metric_name][unit_id], values[unit_id])
+
+
+def test_pca_metrics_approximate_knn_seed(small_sorting_analyzer):
+    pytest.importorskip("pynndescent")
+    from copy import deepcopy
+    from spikeinterface.qualitymetrics.pca_metrics import _default_params
+
+    qm_params = deepcopy(_default_params)
+    for metric_name in ("nearest_neighbor", "nn_isolation", "nn_noise_overlap"):
+        qm_params[metric_name]["knn_method"] = "approximate"
+    metric_names = ["nearest_neighbor", "nn_isolation", "nn_noise_overlap"]
+
+    # the seed is forwarded to the approximate search: the results are reproducible
+    res1 = compute_pc_metrics(small_sorting_analyzer, metric_names=metric_names, qm_params=qm_params, seed=1205)
+    res2 = compute_pc_metrics(
+        small_sorting_analyzer, metric_names=metric_names, qm_params=qm_params, seed=1205, n_jobs=2
+    )
+    for metric_name, values in res1.items():
+        for unit_id, value in values.items():
+            np.testing.assert_array_equal(res2[metric_name][unit_id], value)
+
+
+@pytest.mark.parametrize("knn_method", ["exact", "approximate"])
+def test_get_knn_indices(knn_method):
+    from spikeinterface.qualitymetrics.pca_metrics import get_knn_indices
+
+    if knn_method == "approximate":
+        pytest.importorskip("pynndescent")
+
+    rng = np.random.default_rng(seed=2205)
+    X = rng.normal(size=(500, 5))
+    indices = get_knn_indices(X, 4, knn_method=knn_method, seed=0)
+    assert indices.shape == (500, 4)
+    # the point itself is never a neighbor
+    assert not np.any(indices == np.arange(500)[:, None])
+
+    distances = np.linalg.norm(X[:, None, :] - X[None, :, :], axis=2)
+    np.fill_diagonal(distances, np.inf)
+    expected = np.argsort(distances, axis=1)[:, :4]
+    recall = np.mean([np.isin(indices[i], expected[i]).mean() for i in range(500)])
+    if knn_method == "exact":
+        assert recall == 1.0
+    else:
+        assert recall > 0.9
@@ -12,6 +12,7 @@ from spikeinterface.core.job_tools import get_poolexecutor, fix_job_kwargs
 try:
     import numba
     import networkx as nx
+    import scipy.sparse
     import scipy.spatial
     from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
 
@@ -89,6 +90,9 @@ def merge_clusters(
     if DEBUG:
         import matplotlib.pyplot as plt
 
+        pair_mask = pair_mask.toarray()
+        pair_values = pair_values.toarray()
+
         fig, ax = plt.subplots()
         ax.matshow(pair_values)
 
@@ -144,19 +148,19 @@ def merge_clusters(
 
 
 def resolve_final_shifts(labels_set, merges, pair_mask, pair_shift):
-    labels_set = list(labels_set)
+    label_to_index = {label: ind for ind, label in enumerate(labels_set)}
 
     group_shifts = []
     for merge in merges:
         shifts = np.zeros(len(merge), dtype="int64")
 
-        label_inds = [labels_set.index(label) for label in merge]
+        label_inds = [label_to_index[label] for label in merge]
 
         label0 = merge[0]
         ind0 = label_inds[0]
 
         # First find relative shift to label0 (l=0) in the subgraph
-        local_pair_mask = pair_mask[label_inds, :][:, label_inds]
+        local_pair_mask = _to_dense(pair_mask[label_inds, :][:, label_inds])
         local_pair_shift = None
         G = None
         for l, label1 in enumerate(merge):
@@ -172,7 +176,7 @@ def resolve_final_shifts(labels_set, merges, pair_mask, pair_shift):
                 if G is None:
                     # the the graph only once and only if needed
                     G = nx.from_numpy_array(local_pair_mask | local_pair_mask.T)
-                    local_pair_shift = pair_shift[label_inds, :][:, label_inds]
+                    local_pair_shift = _to_dense(pair_shift[label_inds, :][:, label_inds])
                     local_pair_shift += local_pair_shift.T
 
                 shift_chain = nx.shortest_path(G, source=l, target=0)
@@ -192,13 +196,20 @@ def agglomerate_pairs(labels_set, pair_mask, pair_values, connection_mode="full"
 
     The merges are ordered by label.
 
+    pair_mask can be a dense array or a scipy sparse matrix, in which case the graph is built
+    from the sparse pairs only.
+
     """
 
     labels_set = np.array(labels_set)
 
     merges = []
 
-    graph = nx.from_numpy_array(pair_mask | pair_mask.T)
+    if scipy.sparse.issparse(pair_mask):
+        pair_mask = scipy.sparse.csr_matrix(pair_mask, dtype="bool")
+        graph = nx.from_scipy_sparse_array(pair_mask + pair_mask.T)
+    else:
+        graph = nx.from_numpy_array(pair_mask | pair_mask.T)
     # put real nodes names for debugging
     maps = dict(zip(np.arange(labels_set.size), labels_set))
     graph = nx.relabel_nodes(graph, maps)
@@ -248,6 +259,12 @@ def agglomerate_pairs(labels_set, pair_mask, pair_values, connection_mode="full"
     return merges
 
 
+def _get_pair_batch_size(num_pairs, n_jobs, pair_batch_size, num_batches_per_job=4):
+    # at least num_batches_per_job batches per worker for load balancing, capped by pair_batch_size
+    batch_size = num_pairs // (n_jobs * num_batches_per_job)
+    return max(1, min(pair_batch_size, batch_size))
+
+
 def find_merge_pairs(
     peaks,
     peak_labels,
@@ -258,6 +275,7 @@ def find_merge_pairs(
     radius_um=70,
     method="project_distribution",
     method_kwargs={},
+    pair_batch_size=100,
     **job_kwargs,
     # n_jobs=1,
     # mp_context="fork",
@@ -266,6 +284,12 @@ def find_merge_pairs(
 ):
     """
     Searh some possible merge 2 by 2.
+
+    Only the pairs of clusters with templates closer than radius_um are tested: they are found with a
+    KD-tree and evaluated by batches in the pool. The batches have at most pair_batch_size pairs and are
+    smaller when there are few pairs, so that every worker gets several batches.
+    The pairs are returned as sparse (n, n) upper triangular matrices, so the memory scales with the number
+    of candidate pairs and not with the square of the number of clusters.
     """
     job_kwargs = fix_job_kwargs(job_kwargs)
 
@@ -278,9 +302,6 @@ def find_merge_pairs(
 
     labels_set = np.setdiff1d(peak_labels, [-1]).tolist()
     n = len(labels_set)
-    pair_mask = np.triu(np.ones((n, n), dtype="bool")) & ~np.eye(n, dtype="bool")
-    pair_shift = np.zeros((n, n), dtype="int64")
-    pair_values = np.zeros((n, n), dtype="float64")
 
     # compute template (no shift at this step)
 
@@ -292,10 +313,13 @@ def find_merge_pairs(
 
     channel_locs = recording.get_channel_locations()
     template_locs = channel_locs[max_chans, :]
-    template_dist = scipy.spatial.distance.cdist(template_locs, template_locs, metric="euclidean")
 
-    pair_mask = pair_mask & (template_dist <= radius_um)
-    indices0, indices1 = np.nonzero(pair_mask)
+    # candidate pairs (ind0 < ind1) with a radius query
+    kdtree = scipy.spatial.cKDTree(template_locs)
+    candidate_pairs = kdtree.query_pairs(r=radius_um, output_type="ndarray").astype("int64")
+    candidate_pairs = np.sort(candidate_pairs, axis=1)
+    order = np.lexsort((candidate_pairs[:, 1], candidate_pairs[:, 0]))
+    candidate_pairs = candidate_pairs[order]
 
     n_jobs = job_kwargs["n_jobs"]
     mp_context = job_kwargs.get("mp_context", None)
@@ -304,6 +328,7 @@ def find_merge_pairs(
 
     Executor = get_poolexecutor(n_jobs)
 
+    merge_inds0, merge_inds1, merge_shifts, merge_values = [], [], [], []
     with Executor(
         max_workers=n_jobs,
         initializer=find_pair_worker_init,
@@ -320,32 +345,47 @@ def find_merge_pairs(
         ),
     ) as pool:
         jobs = []
-        for ind0, ind1 in zip(indices0, indices1):
-            label0 = labels_set[ind0]
-            label1 = labels_set[ind1]
-            jobs.append(pool.submit(find_pair_function_wrapper, label0, label1))
+        batch_size = _get_pair_batch_size(candidate_pairs.shape[0], n_jobs, pair_batch_size)
+        for i in range(0, candidate_pairs.shape[0], batch_size):
+            jobs.append(pool.submit(find_pair_function_wrapper, candidate_pairs[i : i + batch_size]))
 
         if progress_bar:
-            iterator = tqdm(jobs, desc=f"find_merge_pairs with {method}", total=len(jobs))
-        else:
-            iterator = jobs
+            pbar = tqdm(desc=f"find_merge_pairs with {method}", total=candidate_pairs.shape[0])
 
-        for res in iterator:
-            is_merge, label0, label1, shift, merge_value = res.result()
-            ind0 = labels_set.index(label0)
-            ind1 = labels_set.index(label1)
+        for res in jobs:
+            pairs, is_merge, shifts, values = res.result()
+            merge_inds0.append(pairs[is_merge, 0])
+            merge_inds1.append(pairs[is_merge, 1])
+            merge_shifts.append(shifts[is_merge])
+            merge_values.append(values[is_merge])
+            if progress_bar:
+                pbar.update(pairs.shape[0])
 
-            pair_mask[ind0, ind1] = is_merge
-            if is_merge:
-                pair_shift[ind0, ind1] = shift
-                pair_values[ind0, ind1] = merge_value
+        if progress_bar:
+            pbar.close()
 
-    pair_mask = pair_mask & (template_dist <= radius_um)
-    indices0, indices1 = np.nonzero(pair_mask)
+    if len(jobs) > 0:
+        merge_inds = (np.concatenate(merge_inds0), np.concatenate(merge_inds1))
+        merge_shifts = np.concatenate(merge_shifts)
+        merge_values = np.concatenate(merge_values)
+    else:
+        merge_inds = (np.zeros(0, dtype="int64"), np.zeros(0, dtype="int64"))
+        merge_shifts = np.zeros(0, dtype="int64")
+        merge_values = np.zeros(0, dtype="float64")
+
+    pair_mask = scipy.sparse.csr_matrix((np.ones(merge_shifts.size, dtype="bool"), merge_inds), shape=(n, n))
+    pair_shift = scipy.sparse.csr_matrix((merge_shifts, merge_inds), shape=(n, n))
+    pair_values = scipy.sparse.csr_matrix((merge_values, merge_inds), shape=(n, n))
 
     return labels_set, pair_mask, pair_shift, pair_values
 
 
+def _to_dense(pair_matrix):
+    if scipy.sparse.issparse(pair_matrix):
+        return pair_matrix.toarray()
+    return np.asarray(pair_matrix)
+
+
 def find_pair_worker_init(
     recording,
     features_dict_or_folder,
@@ -378,21 +418,28 @@ def find_pair_worker_init(
     _ctx["peaks"] = _ctx["features"]["peaks"]
 
 
-def find_pair_function_wrapper(label0, label1):
+def find_pair_function_wrapper(pairs):
+    """
+    Test a batch of pairs, given as an array (num_pairs, 2) of indices in labels_set.
+    """
     global _ctx
+    is_merge = np.zeros(pairs.shape[0], dtype="bool")
+    shifts = np.zeros(pairs.shape[0], dtype="int64")
+    values = np.zeros(pairs.shape[0], dtype="float64")
     with threadpool_limits(limits=_ctx["max_threads_per_process"]):
-        is_merge, label0, label1, shift, merge_value = _ctx["method_class"].merge(
-            label0,
-            label1,
-            _ctx["labels_set"],
-            _ctx["templates"],
-            _ctx["original_labels"],
-            _ctx["peaks"],
-            _ctx["features"],
-            **_ctx["method_kwargs"],
-        )
+        for i, (ind0, ind1) in enumerate(pairs):
+            is_merge[i], _, _, shifts[i], values[i] = _ctx["method_class"].merge(
+                _ctx["labels_set"][ind0],
+                _ctx["labels_set"][ind1],
+                _ctx["labels_set"],
+                _ctx["templates"],
+                _ctx["original_labels"],
+                _ctx["peaks"],
+                _ctx["features"],
+                **_ctx["method_kwargs"],
+            )
 
-    return is_merge, label0, label1, shift, merge_value
+    return pairs, is_merge, shifts, values
 
 
 class ProjectDistribution:
@@ -641,10 +688,11 @@ class NormalizedTemplateDiff:
         target_chans = np.intersect1d(target_chans0, target_chans1)
         union_chans = np.union1d(target_chans0, target_chans1)
 
-        ind0 = list(labels_set).index(label0)
+        # labels_set is sorted
+        ind0 = np.searchsorted(labels_set, label0)
         template0 = templates[ind0][:, target_chans]
 
-        ind1 = list(labels_set).index(label1)
+        ind1 = np.searchsorted(labels_set, label1)
         template1 = templates[ind1][:, target_chans]
 
         num_samples = template0.shape[0]
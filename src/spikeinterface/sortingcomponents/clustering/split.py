@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import time
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
 from multiprocessing import get_context
 from threadpoolctl import threadpool_limits
 from tqdm.auto import tqdm
@@ -29,11 +32,15 @@ def split_clusters(
     recursive=False,
     recursive_depth=None,
     returns_split_count=False,
+    returns_split_timings=False,
     **job_kwargs,
 ):
     """
     Run recusrsively (or not) in a multi process pool a local split method.
 
+    Child splits are submitted as soon as their parent split is done, so that a slow split does not hold back
+    the others. The final labels do not depend on the order in which the splits finish.
+
     Parameters
     ----------
     peak_labels: numpy.array
@@ -41,7 +48,9 @@ def split_clusters(
     recording: Recording
         Recording object
     features_dict_or_folder: dict or folder
-        A dictionary of features precomputed with peak_pipeline or a folder containing npz file for features
+        A dictionary of features precomputed with peak_pipeline or a folder containing npz file for features.
+        With several processes, the arrays of a dictionary are shared with the workers through shared memory
+        and the npy files of a folder are memory mapped only once per worker.
     method: str, default: "hdbscan_on_local_pca"
         The method name
     method_kwargs: dict, default: dict()
@@ -52,6 +61,9 @@ def split_clusters(
         If recursive=True, then this is the max split per spikes
     returns_split_count: bool, default: False
         Optionally return  the split count vector. Same size as labels
+    returns_split_timings: bool, default: False
+        Optionally return the timings of every split, as a structured array with the fields
+        "recursion_level", "num_peaks", "is_split" and "run_time" (in seconds)
 
     Returns
     -------
@@ -59,6 +71,8 @@ def split_clusters(
         The labels of peaks after split.
     split_count: numpy.ndarray
         Optionally returned
+    split_timings: numpy.ndarray
+        Optionally returned
     """
 
     job_kwargs = fix_job_kwargs(job_kwargs)
@@ -73,60 +87,171 @@ def split_clusters(
 
     Executor = get_poolexecutor(n_jobs)
 
-    with Executor(
-        max_workers=n_jobs,
-        initializer=split_worker_init,
-        mp_context=get_context(method=mp_context),
-        initargs=(recording, features_dict_or_folder, original_labels, method, method_kwargs, max_threads_per_process),
-    ) as pool:
-        labels_set = np.setdiff1d(peak_labels, [-1])
-        current_max_label = np.max(labels_set) + 1
-        jobs = []
-        for label in labels_set:
-            peak_indices = np.flatnonzero(peak_labels == label)
-            if peak_indices.size > 0:
-                jobs.append(pool.submit(split_function_wrapper, peak_indices, 1))
-
-        if progress_bar:
-            iterator = tqdm(jobs, desc=f"split_clusters with {method}", total=len(labels_set))
-        else:
-            iterator = jobs
-
-        for res in iterator:
-            is_split, local_labels, peak_indices = res.result()
-            # print(is_split, local_labels, peak_indices)
-            if not is_split:
-                continue
-
-            mask = local_labels >= 0
-            peak_labels[peak_indices[mask]] = local_labels[mask] + current_max_label
-            peak_labels[peak_indices[~mask]] = local_labels[~mask]
-            split_count[peak_indices] += 1
-            current_max_label += np.max(local_labels[mask]) + 1
-
-            if recursive:
-                recursion_level = np.max(split_count[peak_indices])
-                if recursive_depth is not None:
-                    # stop reccursivity when recursive_depth is reach
-                    extra_ball = recursion_level < recursive_depth
+    shms = []
+    if isinstance(features_dict_or_folder, dict) and n_jobs > 1:
+        features_dict_or_folder, shms = share_features(features_dict_or_folder)
+
+    # every split job is identified by its index in these lists
+    job_num_splits = []
+    job_levels = []
+    job_results = []
+    job_children = []
+    job_run_times = []
+
+    try:
+        with Executor(
+            max_workers=n_jobs,
+            initializer=split_worker_init,
+            mp_context=get_context(method=mp_context),
+            initargs=(
+                recording,
+                features_dict_or_folder,
+                original_labels,
+                method,
+                method_kwargs,
+                max_threads_per_process,
+            ),
+        ) as pool:
+            pending = {}
+
+            def submit_job(peak_indices, num_splits):
+                # num_splits is the number of splits already undergone by these peaks
+                recursion_level = max(num_splits, 1)
+                job_index = len(job_levels)
+                job_num_splits.append(num_splits)
+                job_levels.append(recursion_level)
+                job_results.append(None)
+                job_children.append([])
+                job_run_times.append(np.nan)
+                pending[pool.submit(split_function_wrapper, peak_indices, recursion_level)] = job_index
+                return job_index
+
+            labels_set = np.setdiff1d(peak_labels, [-1])
+            root_jobs = []
+            for label in labels_set:
+                peak_indices = np.flatnonzero(peak_labels == label)
+                if peak_indices.size > 0:
+                    root_jobs.append(submit_job(peak_indices, 0))
+
+            if progress_bar:
+                pbar = tqdm(desc=f"split_clusters with {method}", total=len(root_jobs))
+
+            while len(pending) > 0:
+                if n_jobs == 1:
+                    # the mock pool computes on demand, in submission order
+                    done = [next(iter(pending))]
                 else:
-                    # reccurssive always
-                    extra_ball = True
-
-                if extra_ball:
-                    new_labels_set = np.setdiff1d(peak_labels[peak_indices], [-1])
-                    for label in new_labels_set:
-                        peak_indices = np.flatnonzero(peak_labels == label)
-                        if peak_indices.size > 0:
-                            # print('Relaunched', label, len(peak_indices), recursion_level)
-                            jobs.append(pool.submit(split_function_wrapper, peak_indices, recursion_level))
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    job_index = pending.pop(future)
+                    is_split, local_labels, peak_indices, run_time = future.result()
+                    job_results[job_index] = (is_split, local_labels, peak_indices)
+                    job_run_times[job_index] = run_time
+                    if progress_bar:
+                        pbar.update(1)
+
+                    if not (is_split and recursive):
+                        continue
+
+                    # all peaks of a job share the same split history, so this is their split count
+                    recursion_level = job_num_splits[job_index] + 1
+                    if recursive_depth is not None:
+                        # stop reccursivity when recursive_depth is reach
+                        extra_ball = recursion_level < recursive_depth
+                    else:
+                        # reccurssive always
+                        extra_ball = True
+
+                    if extra_ball:
+                        for local_label in np.unique(local_labels[local_labels >= 0]):
+                            child = submit_job(peak_indices[local_labels == local_label], recursion_level)
+                            job_children[job_index].append(child)
                             if progress_bar:
-                                iterator.total += 1
+                                pbar.total += 1
+                                pbar.refresh()
+
+            if progress_bar:
+                pbar.close()
+
+        if n_jobs == 1:
+            # the mock pool ran the worker initializer in this process, release the features
+            _ctx.clear()
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    # labels are given in a breadth first order of the split tree which make them independent of the
+    # order of completion of the jobs
+    current_max_label = np.max(labels_set) + 1
+    queue = deque(root_jobs)
+    split_order = []
+    while len(queue) > 0:
+        job_index = queue.popleft()
+        split_order.append(job_index)
+        is_split, local_labels, peak_indices = job_results[job_index]
+        if not is_split:
+            continue
+
+        mask = local_labels >= 0
+        peak_labels[peak_indices[mask]] = local_labels[mask] + current_max_label
+        peak_labels[peak_indices[~mask]] = local_labels[~mask]
+        split_count[peak_indices] += 1
+        current_max_label += np.max(local_labels[mask]) + 1
+        queue.extend(job_children[job_index])
 
+    outputs = (peak_labels,)
     if returns_split_count:
-        return peak_labels, split_count
+        outputs += (split_count,)
+    if returns_split_timings:
+        split_timings = np.zeros(len(split_order), dtype=_split_timing_dtype)
+        for i, job_index in enumerate(split_order):
+            is_split, local_labels, peak_indices = job_results[job_index]
+            split_timings[i] = (job_levels[job_index], peak_indices.size, is_split, job_run_times[job_index])
+        outputs += (split_timings,)
+
+    if len(outputs) == 1:
+        return outputs[0]
     else:
-        return peak_labels
+        return outputs
+
+
+_split_timing_dtype = [
+    ("recursion_level", "int64"),
+    ("num_peaks", "int64"),
+    ("is_split", "bool"),
+    ("run_time", "float64"),
+]
+
+
+def share_features(features_dict):
+    """
+    Copy the arrays of a features dict in shared memory.
+
+    Returns a dict that can be sent cheaply to worker processes, the arrays are replaced by
+    a (shm_name, shape, dtype) description, and the list of SharedMemory to close and unlink at the end.
+    """
+    from spikeinterface.core.core_tools import make_shared_array
+
+    shared_features = {}
+    shms = []
+    for name, value in features_dict.items():
+        if isinstance(value, np.ndarray):
+            arr, shm = make_shared_array(value.shape, value.dtype)
+            arr[:] = value
+            shared_features[name] = _SharedFeature(shm.name, value.shape, value.dtype)
+            shms.append(shm)
+        else:
+            shared_features[name] = value
+    return shared_features, shms
+
+
+class _SharedFeature:
+    def __init__(self, shm_name, shape, dtype):
+        self.shm_name = shm_name
+        self.shape = shape
+        self.dtype = dtype
 
 
 global _ctx
@@ -145,17 +270,34 @@ def split_worker_init(
     _ctx["method_kwargs"] = method_kwargs
     _ctx["method_class"] = split_methods_dict[method]
     _ctx["max_threads_per_process"] = max_threads_per_process
-    _ctx["features"] = FeaturesLoader.from_dict_or_folder(features_dict_or_folder)
+    if isinstance(features_dict_or_folder, dict):
+        from multiprocessing.shared_memory import SharedMemory
+
+        features = {}
+        # keep a reference to the SharedMemory, otherwise the buffer is released
+        _ctx["shms"] = []
+        for name, value in features_dict_or_folder.items():
+            if isinstance(value, _SharedFeature):
+                shm = SharedMemory(value.shm_name)
+                _ctx["shms"].append(shm)
+                value = np.ndarray(shape=value.shape, dtype=value.dtype, buffer=shm.buf)
+            features[name] = value
+        _ctx["features"] = features
+    else:
+        # memmaps are opened once per worker and not at every split
+        _ctx["features"] = FeaturesLoader(features_dict_or_folder, keep_memmaps=True)
     _ctx["peaks"] = _ctx["features"]["peaks"]
 
 
 def split_function_wrapper(peak_indices, recursion_level):
     global _ctx
+    t0 = time.perf_counter()
     with threadpool_limits(limits=_ctx["max_threads_per_process"]):
         is_split, local_labels = _ctx["method_class"].split(
             peak_indices, _ctx["peaks"], _ctx["features"], recursion_level, **_ctx["method_kwargs"]
         )
-    return is_split, local_labels, peak_indices
+    run_time = time.perf_counter() - t0
+    return is_split, local_labels, peak_indices, run_time
 
 
 class LocalFeatureClustering:
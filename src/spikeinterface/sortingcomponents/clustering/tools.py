@@ -20,10 +20,14 @@ class FeaturesLoader:
 
     preload
 
+    keep_memmaps: bool, default: False
+        Keep the memmaps opened at first access instead of opening the npy file at every access
+
     """
 
-    def __init__(self, feature_folder, preload=["peaks"]):
+    def __init__(self, feature_folder, preload=["peaks"], keep_memmaps=False):
         self.feature_folder = Path(feature_folder)
+        self.keep_memmaps = keep_memmaps
 
         self.file_feature = {}
         self.loaded_features = {}
@@ -38,7 +42,10 @@ class FeaturesLoader:
         if name in self.loaded_features:
             return self.loaded_features[name]
         else:
-            return np.load(self.file_feature[name], mmap_mode="r")
+            feature = np.load(self.file_feature[name], mmap_mode="r")
+            if self.keep_memmaps:
+                self.loaded_features[name] = feature
+            return feature
 
     @staticmethod
     def from_dict_or_folder(features_dict_or_folder):
@@ -9,7 +9,6 @@ from spikeinterface.core import get_noise_levels
 from spikeinterface.sortingcomponents.peak_detection import DetectPeakByChannel
 from spikeinterface.core.template import Templates
 
-
 spike_dtype = [
     ("sample_index", "int64"),
     ("channel_index", "int64"),
@@ -27,6 +26,14 @@ try:
 except ImportError:
     HAVE_TORCH = False
 
+try:
+    import numba
+    from numba import jit
+
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
 from .base import BaseTemplateMatching
 
 
@@ -132,6 +139,11 @@ class CircusOMPSVDPeeler(BaseTemplateMatching):
         The engine to use for the convolutions
     torch_device : string in ["cpu", "cuda", None]. Default "cpu"
         Controls torch device if the torch engine is selected
+    split_regions : bool, default: False
+        If True, templates that do not share any channel (for instance on different shanks)
+        are matched independently, each group on its own channels. The stopping criteria
+        are then applied per group, so a group does not stop when another one fails and
+        more spikes can be found than with a single global OMP.
     -----
     """
 
@@ -163,6 +175,7 @@ class CircusOMPSVDPeeler(BaseTemplateMatching):
         precomputed=None,
         engine="numpy",
         torch_device="cpu",
+        split_regions=False,
     ):
 
         BaseTemplateMatching.__init__(self, recording, templates, return_output=True, parents=None)
@@ -191,6 +204,8 @@ class CircusOMPSVDPeeler(BaseTemplateMatching):
         self.stop_criteria = stop_criteria
         self.max_failures = max_failures
         self.omp_min_sps = omp_min_sps
+        # number of channels of the omp_min_sps stop criterion, the one of the full recording for region peelers
+        self.omp_min_sps_num_channels = self.num_channels
         self.relative_error = relative_error
         self.rank = rank
 
@@ -210,6 +225,25 @@ class CircusOMPSVDPeeler(BaseTemplateMatching):
             self.unit_overlaps_tables[i] = np.zeros(self.num_templates, dtype=int)
             self.unit_overlaps_tables[i][self.unit_overlaps_indices[i]] = np.arange(len(self.unit_overlaps_indices[i]))
 
+        # templates that do not share any channel (e.g. on different shanks or probes) never interact
+        # during the OMP, so every group of overlapping templates can be matched on its own channels
+        self.region_peelers = []
+        if split_regions:
+            region_kwargs = dict(
+                stop_criteria=stop_criteria,
+                max_failures=max_failures,
+                omp_min_sps=omp_min_sps,
+                relative_error=relative_error,
+                rank=rank,
+                vicinity=vicinity,
+                engine=engine,
+                torch_device=torch_device,
+            )
+            self._prepare_regions(region_kwargs)
+
+        if HAVE_NUMBA and len(self.region_peelers) == 0:
+            self._prepare_flat_overlaps()
+
         self.margin = 2 * self.num_samples
         self.is_pushed = False
 
@@ -283,6 +317,78 @@ class CircusOMPSVDPeeler(BaseTemplateMatching):
         self.temporal = np.moveaxis(self.temporal, [0, 1, 2], [1, 2, 0])
         self.singular = self.singular.T[:, :, np.newaxis]
 
+    def _prepare_regions(self, region_kwargs):
+        """
+        Split the templates into spatial regions, i.e. the connected components of the template overlap graph.
+        When there are several regions, one peeler restricted to the templates and channels of each region
+        is built from the already computed SVD and overlaps.
+        The region peelers keep the number of channels of the full recording for the omp_min_sps threshold.
+        """
+        import scipy.sparse
+        from scipy.sparse.csgraph import connected_components
+
+        self.region_peelers = []
+        num_regions, region_labels = connected_components(scipy.sparse.csr_matrix(self.units_overlaps), directed=False)
+        if num_regions < 2:
+            return
+
+        if self.templates.sparsity is None:
+            sparsity_mask = np.ones((self.num_templates, self.num_channels), dtype=bool)
+        else:
+            sparsity_mask = self.templates.sparsity.mask
+
+        for region_index in range(num_regions):
+            template_inds = np.flatnonzero(region_labels == region_index)
+            channel_inds = np.flatnonzero(np.any(sparsity_mask[template_inds], axis=0))
+
+            # overlapping units are always in the same region so they can be remapped to region indices
+            precomputed = dict(
+                norms=self.norms[template_inds],
+                temporal=np.ascontiguousarray(self.temporal[:, template_inds]),
+                spatial=np.ascontiguousarray(self.spatial[:, template_inds][:, :, channel_inds]),
+                singular=np.ascontiguousarray(self.singular[:, template_inds]),
+                units_overlaps=self.units_overlaps[template_inds][:, template_inds],
+                unit_overlaps_indices={
+                    i: np.searchsorted(template_inds, self.unit_overlaps_indices[ind])
+                    for i, ind in enumerate(template_inds)
+                },
+                normed_templates=self.normed_templates[template_inds][:, :, channel_inds],
+                overlaps=[self.overlaps[ind] for ind in template_inds],
+            )
+            if isinstance(self.amplitudes, list):
+                amplitudes = self.amplitudes
+            else:
+                amplitudes = self.amplitudes[template_inds]
+            ignore_inds = np.flatnonzero(np.isin(template_inds, self.ignore_inds))
+
+            peeler = CircusOMPSVDPeeler(
+                self.recording.select_channels(self.recording.channel_ids[channel_inds]),
+                templates=self.templates.select_units(self.templates.unit_ids[template_inds]),
+                amplitudes=amplitudes,
+                ignore_inds=ignore_inds,
+                precomputed=precomputed,
+                **region_kwargs,
+            )
+            # same omp_min_sps threshold as without regions
+            peeler.omp_min_sps_num_channels = self.omp_min_sps_num_channels
+            self.region_peelers.append((template_inds, channel_inds, peeler))
+
+    def _prepare_flat_overlaps(self):
+        # flatten the overlaps in a csr-like layout for the numba OMP kernel: the rows of unit i are
+        # flat_overlaps[overlaps_ptr[i]:overlaps_ptr[i + 1]] and belong to the units overlaps_units[...]
+        num_overlaps = [len(self.unit_overlaps_indices[i]) for i in range(self.num_templates)]
+        self.overlaps_ptr = np.zeros(self.num_templates + 1, dtype=np.int64)
+        self.overlaps_ptr[1:] = np.cumsum(num_overlaps)
+        self.overlaps_units = np.concatenate([self.unit_overlaps_indices[i] for i in range(self.num_templates)])
+        self.overlaps_units = self.overlaps_units.astype(np.int64)
+        self.flat_overlaps = np.concatenate(
+            [np.asarray(self.overlaps[i], dtype=np.float32) for i in range(self.num_templates)], axis=0
+        )
+        # position of unit j in the overlaps of unit i, -1 when they do not overlap
+        self.overlaps_table = np.full((self.num_templates, self.num_templates), -1, dtype=np.int32)
+        for i in range(self.num_templates):
+            self.overlaps_table[i, self.unit_overlaps_indices[i]] = np.arange(num_overlaps[i])
+
     def _push_to_torch(self):
         if self.engine == "torch":
             self.spatial = torch.as_tensor(self.spatial, device=self.torch_device)
@@ -305,6 +411,16 @@ class CircusOMPSVDPeeler(BaseTemplateMatching):
         import scipy
         from scipy import ndimage
 
+        if len(self.region_peelers) > 0:
+            all_spikes = []
+            for template_inds, channel_inds, peeler in self.region_peelers:
+                spikes = peeler.compute_matching(traces[:, channel_inds], start_frame, end_frame, segment_index)
+                spikes["cluster_index"] = template_inds[spikes["cluster_index"]]
+                all_spikes.append(spikes)
+            spikes = np.concatenate(all_spikes)
+            order = np.argsort(spikes["sample_index"], kind="stable")
+            return spikes[order]
+
         if not self.is_pushed:
             self._push_to_torch()
 
@@ -368,7 +484,9 @@ class CircusOMPSVDPeeler(BaseTemplateMatching):
         is_in_vicinity = np.zeros(0, dtype=np.int32)
 
         if self.stop_criteria == "omp_min_sps":
-            stop_criteria = self.omp_min_sps * np.maximum(self.norms, np.sqrt(self.num_channels * self.num_samples))
+            stop_criteria = self.omp_min_sps * np.maximum(
+                self.norms, np.sqrt(self.omp_min_sps_num_channels * self.num_samples)
+            )
         elif self.stop_criteria == "max_failures":
             num_valids = 0
             nb_failures = self.max_failures
@@ -394,101 +512,123 @@ class CircusOMPSVDPeeler(BaseTemplateMatching):
             if len(peak_indices) == 0:
                 break
 
-            for peak_index in peak_indices:
-
-                best_cluster_ind = best_cluster_inds[0, peak_index]
-
-                if num_selection > 0:
-                    delta_t = selection[1] - peak_index
-                    idx = np.flatnonzero((delta_t < self.num_samples) & (delta_t > -self.num_samples))
-                    myline = neighbor_window + delta_t[idx]
-                    myindices = selection[0, idx]
-
-                    local_overlaps = self.overlaps[best_cluster_ind]
-                    overlapping_templates = self.unit_overlaps_indices[best_cluster_ind]
-                    table = self.unit_overlaps_tables[best_cluster_ind]
+            if HAVE_NUMBA:
+                M, num_selection = numba_omp_select_peaks(
+                    peak_indices,
+                    best_cluster_inds[0],
+                    scalar_products,
+                    full_sps,
+                    final_amplitudes,
+                    M,
+                    all_selections,
+                    num_selection,
+                    self.norms,
+                    self.flat_overlaps,
+                    self.overlaps_ptr,
+                    self.overlaps_units,
+                    self.overlaps_table,
+                    self.num_samples,
+                    self.vicinity,
+                    omp_tol,
+                )
+            else:
+                for peak_index in peak_indices:
 
-                    if num_selection == M.shape[0]:
-                        Z = np.zeros((2 * num_selection, 2 * num_selection), dtype=np.float32)
-                        Z[:num_selection, :num_selection] = M
-                        M = Z
+                    best_cluster_ind = best_cluster_inds[0, peak_index]
 
-                    mask = np.isin(myindices, overlapping_templates)
-                    a, b = myindices[mask], myline[mask]
-                    M[num_selection, idx[mask]] = local_overlaps[table[a], b]
+                    if num_selection > 0:
+                        delta_t = selection[1] - peak_index
+                        idx = np.flatnonzero((delta_t < self.num_samples) & (delta_t > -self.num_samples))
+                        myline = neighbor_window + delta_t[idx]
+                        myindices = selection[0, idx]
 
-                    if self.vicinity == 0:
-                        scipy.linalg.solve_triangular(
-                            M[:num_selection, :num_selection],
-                            M[num_selection, :num_selection],
-                            trans=0,
-                            lower=1,
-                            overwrite_b=True,
-                            check_finite=False,
-                        )
+                        local_overlaps = self.overlaps[best_cluster_ind]
+                        overlapping_templates = self.unit_overlaps_indices[best_cluster_ind]
+                        table = self.unit_overlaps_tables[best_cluster_ind]
 
-                        v = nrm2(M[num_selection, :num_selection]) ** 2
-                        Lkk = 1 - v
-                        if Lkk <= omp_tol:  # selected atoms are dependent
-                            break
-                        M[num_selection, num_selection] = np.sqrt(Lkk)
-                    else:
-                        is_in_vicinity = np.flatnonzero(np.abs(delta_t) < self.vicinity)
+                        if num_selection == M.shape[0]:
+                            Z = np.zeros((2 * num_selection, 2 * num_selection), dtype=np.float32)
+                            Z[:num_selection, :num_selection] = M
+                            M = Z
 
-                        if len(is_in_vicinity) > 0:
-                            L = M[is_in_vicinity, :][:, is_in_vicinity]
+                        mask = np.isin(myindices, overlapping_templates)
+                        a, b = myindices[mask], myline[mask]
+                        M[num_selection, idx[mask]] = local_overlaps[table[a], b]
 
-                            M[num_selection, is_in_vicinity] = scipy.linalg.solve_triangular(
-                                L,
-                                M[num_selection, is_in_vicinity],
+                        if self.vicinity == 0:
+                            scipy.linalg.solve_triangular(
+                                M[:num_selection, :num_selection],
+                                M[num_selection, :num_selection],
                                 trans=0,
                                 lower=1,
                                 overwrite_b=True,
                                 check_finite=False,
                             )
 
-                            v = nrm2(M[num_selection, is_in_vicinity]) ** 2
+                            v = nrm2(M[num_selection, :num_selection]) ** 2
                             Lkk = 1 - v
                             if Lkk <= omp_tol:  # selected atoms are dependent
                                 break
                             M[num_selection, num_selection] = np.sqrt(Lkk)
                         else:
-                            M[num_selection, num_selection] = 1.0
-                else:
-                    M[0, 0] = 1
+                            is_in_vicinity = np.flatnonzero(np.abs(delta_t) < self.vicinity)
+
+                            if len(is_in_vicinity) > 0:
+                                L = M[is_in_vicinity, :][:, is_in_vicinity]
+
+                                M[num_selection, is_in_vicinity] = scipy.linalg.solve_triangular(
+                                    L,
+                                    M[num_selection, is_in_vicinity],
+                                    trans=0,
+                                    lower=1,
+                                    overwrite_b=True,
+                                    check_finite=False,
+                                )
+
+                                v = nrm2(M[num_selection, is_in_vicinity]) ** 2
+                                Lkk = 1 - v
+                                if Lkk <= omp_tol:  # selected atoms are dependent
+                                    break
+                                M[num_selection, num_selection] = np.sqrt(Lkk)
+                            else:
+                                M[num_selection, num_selection] = 1.0
+                    else:
+                        M[0, 0] = 1
 
-                all_selections[:, num_selection] = [best_cluster_ind, peak_index]
-                num_selection += 1
+                    all_selections[:, num_selection] = [best_cluster_ind, peak_index]
+                    num_selection += 1
 
-                selection = all_selections[:, :num_selection]
-                res_sps = full_sps[selection[0], selection[1]]
+                    selection = all_selections[:, :num_selection]
+                    res_sps = full_sps[selection[0], selection[1]]
 
-                if self.vicinity == 0:
-                    new_amplitudes, _ = potrs(M[:num_selection, :num_selection], res_sps, lower=True, overwrite_b=False)
-                    sub_selection = selection
-                    new_amplitudes /= self.norms[sub_selection[0]]
-                else:
-                    is_in_vicinity = np.append(is_in_vicinity, num_selection - 1)
-                    all_amplitudes = np.append(all_amplitudes, np.float32(1))
-                    L = M[is_in_vicinity, :][:, is_in_vicinity]
-                    new_amplitudes, _ = potrs(L, res_sps[is_in_vicinity], lower=True, overwrite_b=False)
-                    sub_selection = selection[:, is_in_vicinity]
-                    new_amplitudes /= self.norms[sub_selection[0]]
-
-                diff_amplitudes = new_amplitudes - final_amplitudes[sub_selection[0], sub_selection[1]]
-                modified = np.flatnonzero(np.abs(diff_amplitudes) > omp_tol)
-                final_amplitudes[sub_selection[0], sub_selection[1]] = new_amplitudes
-
-                for i in modified:
-                    tmp_best, tmp_peak = sub_selection[:, i]
-                    diff_amp = diff_amplitudes[i] * self.norms[tmp_best]
-                    local_overlaps = self.overlaps[tmp_best]
-                    overlapping_templates = self.units_overlaps[tmp_best]
-                    tmp = tmp_peak - neighbor_window
-                    idx = [max(0, tmp), min(num_peaks, tmp_peak + self.num_samples)]
-                    tdx = [idx[0] - tmp, idx[1] - tmp]
-                    to_add = diff_amp * local_overlaps[:, tdx[0] : tdx[1]]
-                    scalar_products[overlapping_templates, idx[0] : idx[1]] -= to_add
+                    if self.vicinity == 0:
+                        new_amplitudes, _ = potrs(
+                            M[:num_selection, :num_selection], res_sps, lower=True, overwrite_b=False
+                        )
+                        sub_selection = selection
+                        new_amplitudes /= self.norms[sub_selection[0]]
+                    else:
+                        is_in_vicinity = np.append(is_in_vicinity, num_selection - 1)
+                        all_amplitudes = np.append(all_amplitudes, np.float32(1))
+                        L = M[is_in_vicinity, :][:, is_in_vicinity]
+                        new_amplitudes, _ = potrs(L, res_sps[is_in_vicinity], lower=True, overwrite_b=False)
+                        sub_selection = selection[:, is_in_vicinity]
+                        new_amplitudes /= self.norms[sub_selection[0]]
+
+                    diff_amplitudes = new_amplitudes - final_amplitudes[sub_selection[0], sub_selection[1]]
+                    modified = np.flatnonzero(np.abs(diff_amplitudes) > omp_tol)
+                    final_amplitudes[sub_selection[0], sub_selection[1]] = new_amplitudes
+
+                    for i in modified:
+                        tmp_best, tmp_peak = sub_selection[:, i]
+                        diff_amp = diff_amplitudes[i] * self.norms[tmp_best]
+                        local_overlaps = self.overlaps[tmp_best]
+                        overlapping_templates = self.units_overlaps[tmp_best]
+                        tmp = tmp_peak - neighbor_window
+                        idx = [max(0, tmp), min(num_peaks, tmp_peak + self.num_samples)]
+                        tdx = [idx[0] - tmp, idx[1] - tmp]
+                        to_add = diff_amp * local_overlaps[:, tdx[0] : tdx[1]]
+                        scalar_products[overlapping_templates, idx[0] : idx[1]] -= to_add
 
             # We stop when updates do not modify the chosen spikes anymore
             if self.stop_criteria == "omp_min_sps":
@@ -759,3 +899,131 @@ class CircusPeeler(BaseTemplateMatching):
         spikes = spikes[order]
 
         return spikes
+
+
+if HAVE_NUMBA:
+
+    @jit(nopython=True)
+    def numba_omp_select_peaks(
+        peak_indices,
+        best_cluster_inds,
+        scalar_products,
+        full_sps,
+        final_amplitudes,
+        M,
+        all_selections,
+        num_selection,
+        norms,
+        flat_overlaps,
+        overlaps_ptr,
+        overlaps_units,
+        overlaps_table,
+        num_samples,
+        vicinity,
+        omp_tol,
+    ):
+        """
+        numba implementation of one OMP iteration of CircusOMPSVDPeeler: every peak is added to the selection,
+        the Cholesky factor M is extended by one row, the amplitudes of the spikes in the vicinity are solved
+        again and only the scalar products touched by the modified amplitudes are updated.
+        Returns the (possibly enlarged) Cholesky factor and the new number of selected spikes.
+        """
+        neighbor_window = num_samples - 1
+        num_peaks = scalar_products.shape[1]
+        max_selection = num_selection + peak_indices.size
+        sub_selection = np.zeros(max_selection, dtype=np.int64)
+        z = np.zeros(max_selection, dtype=np.float32)
+        new_amplitudes = np.zeros(max_selection, dtype=np.float32)
+        diff_amplitudes = np.zeros(max_selection, dtype=np.float32)
+
+        for peak_index in peak_indices:
+            best_cluster_ind = best_cluster_inds[peak_index]
+
+            if num_selection > 0:
+                if num_selection == M.shape[0]:
+                    Z = np.zeros((2 * num_selection, 2 * num_selection), dtype=np.float32)
+                    Z[:num_selection, :num_selection] = M
+                    M = Z
+
+                # new row of the Cholesky factor from the overlaps with the selected spikes
+                for j in range(num_selection):
+                    delta_t = all_selections[1, j] - peak_index
+                    if -num_samples < delta_t < num_samples:
+                        k = overlaps_table[best_cluster_ind, all_selections[0, j]]
+                        if k >= 0:
+                            M[num_selection, j] = flat_overlaps[
+                                overlaps_ptr[best_cluster_ind] + k, neighbor_window + delta_t
+                            ]
+
+                num_sub = 0
+                for j in range(num_selection):
+                    if vicinity == 0 or abs(all_selections[1, j] - peak_index) < vicinity:
+                        sub_selection[num_sub] = j
+                        num_sub += 1
+
+                if num_sub > 0:
+                    # rank one update: forward substitution of the new row
+                    v = np.float32(0)
+                    for a in range(num_sub):
+                        ja = sub_selection[a]
+                        value = M[num_selection, ja]
+                        for b in range(a):
+                            value -= M[ja, sub_selection[b]] * M[num_selection, sub_selection[b]]
+                        value /= M[ja, ja]
+                        M[num_selection, ja] = value
+                        v += value * value
+                    Lkk = 1 - v
+                    if Lkk <= omp_tol:  # selected atoms are dependent
+                        break
+                    M[num_selection, num_selection] = np.sqrt(Lkk)
+                else:
+                    M[num_selection, num_selection] = 1.0
+            else:
+                num_sub = 0
+                M[0, 0] = 1
+
+            all_selections[0, num_selection] = best_cluster_ind
+            all_selections[1, num_selection] = peak_index
+            sub_selection[num_sub] = num_selection
+            num_sub += 1
+            num_selection += 1
+
+            # solve L.L^T x = b restricted to the vicinity
+            for a in range(num_sub):
+                ja = sub_selection[a]
+                value = full_sps[all_selections[0, ja], all_selections[1, ja]]
+                for b in range(a):
+                    value -= M[ja, sub_selection[b]] * z[b]
+                z[a] = value / M[ja, ja]
+            for a in range(num_sub - 1, -1, -1):
+                ja = sub_selection[a]
+                value = z[a]
+                for b in range(a + 1, num_sub):
+                    value -= M[sub_selection[b], ja] * new_amplitudes[b]
+                new_amplitudes[a] = value / M[ja, ja]
+
+            for a in range(num_sub):
+                ja = sub_selection[a]
+                unit_ind, spike_ind = all_selections[0, ja], all_selections[1, ja]
+                new_amplitudes[a] /= norms[unit_ind]
+                diff_amplitudes[a] = new_amplitudes[a] - final_amplitudes[unit_ind, spike_ind]
+            for a in range(num_sub):
+                ja = sub_selection[a]
+                final_amplitudes[all_selections[0, ja], all_selections[1, ja]] = new_amplitudes[a]
+
+            # local update of the scalar products around the modified spikes
+            for a in range(num_sub):
+                if abs(diff_amplitudes[a]) <= omp_tol:
+                    continue
+                ja = sub_selection[a]
+                tmp_best, tmp_peak = all_selections[0, ja], all_selections[1, ja]
+                diff_amp = diff_amplitudes[a] * norms[tmp_best]
+                tmp = tmp_peak - neighbor_window
+                i0 = max(0, tmp)
+                i1 = min(num_peaks, tmp_peak + num_samples)
+                for row in range(overlaps_ptr[tmp_best], overlaps_ptr[tmp_best + 1]):
+                    unit_ind = overlaps_units[row]
+                    for t in range(i0, i1):
+                        scalar_products[unit_ind, t] -= diff_amp * flat_overlaps[row, t - tmp]
+
+        return M, num_selection
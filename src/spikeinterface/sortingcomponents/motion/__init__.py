@@ -1,9 +1,11 @@
 from .motion_utils import Motion
 from .motion_estimation import estimate_motion
+from .dredge import OnlineMotionEstimator
 from .motion_interpolation import (
     correct_motion_on_peaks,
     interpolate_motion_on_traces,
     InterpolateMotionRecording,
     interpolate_motion,
+    DriftKernelCache,
 )
 from .motion_cleaner import clean_motion_vector
@@ -72,6 +72,7 @@ class DecentralizedRegistration:
         When not None the parwise discplament matrix is computed in a small time horizon.
         In short only pair of bins close in time.
         So the pariwaise matrix is super sparse and have values only the diagonal.
+        In that case only the pairs in the horizon are computed and the matrices are sparse (csr).
     convergence_method: "lsmr" | "lsqr_robust" | "gradient_descent", default: "lsmr"
         Which method to use to compute the global displacement vector from the pairwise matrix.
     robust_regression_sigma: float
@@ -185,12 +186,9 @@ class DecentralizedRegistration:
         if progress_bar:
             windows_iter = tqdm(windows_iter, desc="pairwise displacement")
         if spatial_prior:
-            all_pairwise_displacements = np.empty(
-                (len(non_rigid_windows), temporal_bins.size, temporal_bins.size), dtype=np.float64
-            )
-            all_pairwise_displacement_weights = np.empty(
-                (len(non_rigid_windows), temporal_bins.size, temporal_bins.size), dtype=np.float64
-            )
+            # one (dense or sparse) matrix per window
+            all_pairwise_displacements = []
+            all_pairwise_displacement_weights = []
         for i, win in enumerate(windows_iter):
             window_slice = np.flatnonzero(win > 1e-5)
             window_slice = slice(window_slice[0], window_slice[-1])
@@ -217,8 +215,8 @@ class DecentralizedRegistration:
             )
 
             if spatial_prior:
-                all_pairwise_displacements[i] = pairwise_displacement
-                all_pairwise_displacement_weights[i] = pairwise_displacement_weight
+                all_pairwise_displacements.append(pairwise_displacement)
+                all_pairwise_displacement_weights.append(pairwise_displacement_weight)
 
             if extra is not None:
                 extra["pairwise_displacement_list"].append(pairwise_displacement)
@@ -313,8 +311,12 @@ def compute_pairwise_displacement(
 ):
     """
     Compute pairwise displacement
+
+    When time_horizon_s is given (with method="conv"), only the pairs of time bins closer than the horizon
+    are computed, so the cost is O(T * horizon) instead of O(T^2).
+    In that case, pairwise_displacement and pairwise_displacement_weight are returned as sparse csr matrices.
     """
-    from scipy import linalg
+    from scipy import sparse
 
     if conv_engine is None:
         # use torch if installed
@@ -336,6 +338,8 @@ def compute_pairwise_displacement(
         band_width = int(np.ceil(time_horizon_s / bin_s))
         if band_width >= size:
             time_horizon_s = None
+    # only the pairs in the time horizon are computed and stored in a banded form
+    banded = method == "conv" and time_horizon_s is not None and time_horizon_s > 0
 
     if conv_engine == "torch":
         if torch_device is None:
@@ -359,13 +363,26 @@ def compute_pairwise_displacement(
             motion_hist_engine = torch.as_tensor(motion_hist, dtype=torch.float32, device=torch_device)
             window_engine = torch.as_tensor(window, dtype=torch.float32, device=torch_device)
 
-        pairwise_displacement = np.empty((size, size), dtype=np.float32)
-        correlation = np.empty((size, size), dtype=motion_hist.dtype)
+        if banded:
+            # banded form: column k of row i is the pair (i, i + k - (band_width - 1))
+            num_diags = 2 * band_width - 1
+            pairwise_displacement = np.zeros((size, num_diags), dtype=np.float32)
+            correlation = np.zeros((size, num_diags), dtype=motion_hist.dtype)
+        else:
+            pairwise_displacement = np.empty((size, size), dtype=np.float32)
+            correlation = np.empty((size, size), dtype=motion_hist.dtype)
 
         for i in xrange(0, size, batch_size):
+            i1 = min(i + batch_size, size)
+            if banded:
+                # only the templates in the horizon of the batch
+                j0 = max(i - band_width + 1, 0)
+                j1 = min(i1 + band_width - 1, size)
+            else:
+                j0, j1 = 0, size
             corr = normxcorr1d(
-                motion_hist_engine,
-                motion_hist_engine[i : i + batch_size],
+                motion_hist_engine[j0:j1],
+                motion_hist_engine[i:i1],
                 weights=window_engine,
                 padding=possible_displacement.size // 2,
                 conv_engine=conv_engine,
@@ -375,14 +392,20 @@ def compute_pairwise_displacement(
             if conv_engine == "torch":
                 max_corr, best_disp_inds = torch.max(corr, dim=2)
                 best_disp = possible_displacement[best_disp_inds.cpu()]
-                pairwise_displacement[i : i + batch_size] = best_disp
-                correlation[i : i + batch_size] = max_corr.cpu()
+                max_corr = max_corr.cpu().numpy()
             elif conv_engine == "numpy":
                 best_disp_inds = np.argmax(corr, axis=2)
-                max_corr = np.take_along_axis(corr, best_disp_inds[..., None], 2).squeeze()
+                max_corr = np.take_along_axis(corr, best_disp_inds[..., None], 2)[..., 0]
                 best_disp = possible_displacement[best_disp_inds]
-                pairwise_displacement[i : i + batch_size] = best_disp
-                correlation[i : i + batch_size] = max_corr
+
+            if banded:
+                rows, cols = np.nonzero(np.abs(np.arange(j0, j1)[None, :] - np.arange(i, i1)[:, None]) < band_width)
+                diags = cols + j0 - (rows + i) + band_width - 1
+                pairwise_displacement[rows + i, diags] = best_disp[rows, cols]
+                correlation[rows + i, diags] = max_corr[rows, cols]
+            else:
+                pairwise_displacement[i:i1] = best_disp
+                correlation[i:i1] = max_corr
 
         if corr_threshold is not None and corr_threshold > 0:
             which = correlation > corr_threshold
@@ -421,13 +444,17 @@ def compute_pairwise_displacement(
     elif weight_scale == "exp":
         pairwise_displacement_weight = np.exp((correlation - 1) / error_sigma)
 
-    # handle the time horizon by multiplying the weights by a
-    # matrix with the time horizon on its diagonal bands.
-    if method == "conv" and time_horizon_s is not None and time_horizon_s > 0:
-        horizon_matrix = linalg.toeplitz(
-            np.r_[np.ones(band_width, dtype=bool), np.zeros(size - band_width, dtype=bool)]
+    # handle the time horizon by converting the banded form to sparse matrices
+    # pairs out of the horizon have no weight
+    if banded:
+        I = np.repeat(np.arange(size), num_diags)
+        J = I + np.tile(np.arange(num_diags), size) - (band_width - 1)
+        in_range = (J >= 0) & (J < size)
+        I, J = I[in_range], J[in_range]
+        pairwise_displacement = sparse.csr_matrix((pairwise_displacement.ravel()[in_range], (I, J)), shape=(size, size))
+        pairwise_displacement_weight = sparse.csr_matrix(
+            (pairwise_displacement_weight.ravel()[in_range], (I, J)), shape=(size, size)
         )
-        pairwise_displacement_weight *= horizon_matrix
 
     return pairwise_displacement, pairwise_displacement_weight
 
@@ -453,7 +480,10 @@ def compute_global_displacement(
     Arguments
     ---------
     pairwise_displacement : time x time array
+        Dense or sparse matrix. For convergence_method="lsmr", this can also be a windows x time x time array
+        or a list of (dense or sparse) matrices, one per window.
     pairwise_displacement_weight : time x time array
+        Same type and shape as pairwise_displacement
     sparse_mask : time x time array
     convergence_method : str
         One of "gradient"
@@ -469,18 +499,10 @@ def compute_global_displacement(
         size = pairwise_displacement.shape[0]
 
         D = pairwise_displacement
-        if pairwise_displacement_weight is not None or sparse_mask is not None:
+        if pairwise_displacement_weight is not None or sparse_mask is not None or scipy.sparse.issparse(D):
             # weighted problem
-            if pairwise_displacement_weight is None:
-                pairwise_displacement_weight = np.ones_like(D)
-            if sparse_mask is None:
-                sparse_mask = np.ones_like(D)
-            W = pairwise_displacement_weight * sparse_mask
-
-            I, J = np.nonzero(W > 0)
-            Wij = W[I, J]
-            Dij = D[I, J]
-            W = csr_matrix((Wij, (I, J)), shape=W.shape)
+            I, J, Wij, Dij = _get_weighted_pairs(D, pairwise_displacement_weight, sparse_mask)
+            W = csr_matrix((Wij, (I, J)), shape=D.shape)
             WD = csr_matrix((Wij * Dij, (I, J)), shape=W.shape)
             fixed_terms = (W @ WD).diagonal() - (WD @ W).diagonal()
             diag_WW = (W @ W).diagonal()
@@ -503,7 +525,7 @@ def compute_global_displacement(
             def jac(p):
                 return fixed_terms + 2 * (size * p - p.sum())
 
-        res = minimize(fun=obj, jac=jac, x0=D.mean(axis=1), method="L-BFGS-B")
+        res = minimize(fun=obj, jac=jac, x0=_row_mean(D), method="L-BFGS-B")
         if not res.success:
             print("Global displacement gradient descent had an error")
         displacement = res.x
@@ -546,27 +568,19 @@ def compute_global_displacement(
         import gc
         from scipy import sparse
 
-        D = pairwise_displacement
-
-        # weighted problem
-        if pairwise_displacement_weight is None:
-            pairwise_displacement_weight = np.ones_like(D)
-        if sparse_mask is None:
-            sparse_mask = np.ones_like(D)
-        W = pairwise_displacement_weight * sparse_mask
-        if isinstance(W, scipy.sparse.csr_matrix):
-            W = W.astype(np.float32).toarray()
-            D = D.astype(np.float32).toarray()
-
-        assert D.shape == W.shape
-
         # first dimension is the windows dim, which could be empty in rigid case
-        # we expand dims so that below we can consider only the nonrigid case
-        if D.ndim == 2:
-            W = W[None]
-            D = D[None]
-        assert D.ndim == W.ndim == 3
-        B, T, T_ = D.shape
+        # we make list of windows so that below we can consider only the nonrigid case
+        # each window can be a dense or sparse matrix
+        D = pairwise_displacement
+        W = pairwise_displacement_weight
+        if scipy.sparse.issparse(D) or (isinstance(D, np.ndarray) and D.ndim == 2):
+            D = [D]
+            W = [W]
+        elif W is None:
+            W = [None] * len(D)
+        assert len(D) == len(W)
+        B = len(D)
+        T, T_ = D[0].shape
         assert T == T_
 
         # sparsify the problem
@@ -589,17 +603,17 @@ def compute_global_displacement(
         cannot_trim = []
         for Wb, Db in zip(W, D):
             # indices of active temporal pairs in this window
-            I, J = np.nonzero(Wb > 0)
+            I, J, Wij, Dij = _get_weighted_pairs(Db, Wb, sparse_mask)
             n_sampled = I.size
 
             # construct Kroneckers and sparse objective in this window
             pair_weights = np.ones(n_sampled)
             if soft_weights:
-                pair_weights = Wb[I, J]
+                pair_weights = Wij
             Mb = sparse.csr_matrix((pair_weights, (range(n_sampled), I)), shape=(n_sampled, T))
             Nb = sparse.csr_matrix((pair_weights, (range(n_sampled), J)), shape=(n_sampled, T))
             block_sparse_kron = Mb - Nb
-            block_disp_pairs = pair_weights * Db[I, J]
+            block_disp_pairs = pair_weights * Dij
             cannot_trim_block = np.ones_like(block_disp_pairs, dtype=bool)
 
             # add the temporal smoothness prior in this window
@@ -655,7 +669,7 @@ def compute_global_displacement(
         coefficients = coefficients.tocsr()
 
         # initialize at the column mean of pairwise displacements (in each window)
-        p0 = D.mean(axis=2).reshape(B * T)
+        p0 = np.concatenate([_row_mean(Db) for Db in D])
 
         # use LSMR to solve the whole problem || targets - coefficients @ motion ||^2
         iters = range(max(1, lsqr_robust_n_iter))
@@ -688,6 +702,50 @@ def compute_global_displacement(
     return np.squeeze(displacement)
 
 
+def _get_weighted_pairs(D, W=None, sparse_mask=None):
+    """
+    Return the indices, weights and displacements of the pairs with a positive weight
+    for a dense or sparse (time x time) pairwise displacement matrix.
+    """
+    import scipy.sparse
+
+    if scipy.sparse.issparse(D):
+        D = D.tocsr()
+        if W is None:
+            # weight 1 on the stored pairs
+            W = D.copy()
+            W.data[:] = 1
+        if sparse_mask is not None:
+            W = W.multiply(sparse_mask)
+        W = W.tocoo()
+        keep = W.data > 0
+        I, J, Wij = W.row[keep], W.col[keep], W.data[keep]
+        Dij = np.asarray(D[I, J]).ravel()
+    else:
+        if W is None:
+            W = np.ones_like(D)
+        if sparse_mask is not None:
+            W = W * sparse_mask
+        I, J = np.nonzero(W > 0)
+        Wij = W[I, J]
+        Dij = D[I, J]
+    return I, J, Wij, Dij
+
+
+def _row_mean(D):
+    """
+    Mean of each row of a dense matrix or of the stored values of each row of a sparse matrix.
+    """
+    import scipy.sparse
+
+    if scipy.sparse.issparse(D):
+        D = D.tocsr()
+        counts = np.maximum(np.diff(D.indptr), 1)
+        return np.asarray(D.sum(axis=1)).ravel() / counts
+    else:
+        return D.mean(axis=1)
+
+
 # normxcorr1d is now implemented in dredge
 # we keep the old version here but this will be removed soon
 
@@ -30,6 +30,7 @@ from tqdm.auto import trange
 
 from .motion_utils import (
     Motion,
+    Motion2dHistogramAccumulator,
     get_spatial_bin_edges,
     get_spatial_windows,
     get_window_domains,
@@ -221,10 +222,9 @@ def dredge_ap(
     dim = ["x", "y", "z"].index(direction)
     # @charlie: I removed amps/depths_um/times_s from the signature
     # preaks and peak_locations are more SI compatible
-    # the way to get then
-    amps = peak_amplitudes = peaks["amplitude"]
-    depths_um = peak_depths = peak_locations[direction]
-    times_s = peak_times = recording.sample_index_to_time(peaks["sample_index"])
+    # the way to get then is peaks["amplitude"], peak_locations[direction] and
+    # recording.sample_index_to_time(peaks["sample_index"]) but they are only needed by make_2d_motion_histogram()
+    # and peaks can also be a PeakPipelineStream
 
     thomas_kw = thomas_kw if thomas_kw is not None else {}
     xcorr_kw = xcorr_kw if xcorr_kw is not None else {}
@@ -682,6 +682,260 @@ def dredge_online_lfp(
 dredge_online_lfp.__doc__ = dredge_online_lfp.__doc__.format(DredgeLfpRegistration.params_doc)
 
 
+class OnlineMotionEstimator:
+    """
+    Online motion estimation from peaks, for recordings that are still being acquired.
+
+    Peaks (with their locations) are given batch by batch as time advances with `add_peaks()`.
+    Time is split into chunks of `chunk_len_s`: when a chunk is complete, its amplitude weighted motion
+    histogram is cross-correlated with itself and with the previous chunk, and the displacement of this
+    new chunk is solved given the displacement of the previous one, exactly like in `dredge_online_lfp()`.
+    Only the histograms of the current and previous chunks are kept in memory.
+
+    `get_motion()` returns a Motion object covering all solved chunks, which grows over time and can be used
+    by `InterpolateMotionRecording` to correct the data shortly after it is written.
+
+    This object is also a gather engine for `run_node_pipeline()` (`gather_mode=estimator`)
+    when the pipeline outputs are (peaks, peak_locations).
+
+    Parameters
+    ----------
+    recording : BaseRecording
+        The recording, used for the probe geometry and the sample to time conversion
+    direction : "x" | "y", default "y"
+        Dimension on which the motion is estimated. "y" is depth along the probe.
+    rigid : bool, default: False
+        If True, window-related arguments are ignored and we do rigid registration
+    win_shape, win_step_um, win_scale_um, win_margin_um : float
+        Nonrigid window-related arguments. See get_spatial_windows().
+    bin_um : float, default: 1.0
+        Spatial bin size in micrometers
+    bin_s : float, default: 1.0
+        Temporal bin size in seconds
+    hist_margin_um : float, default: 0.0
+        Margin in um of the histogram
+    chunk_len_s : float, default: 60.0
+        Length of the chunks in seconds. The motion is updated every chunk.
+    max_disp_um : number | None, default: None
+        Ceiling on the possible displacement estimates.
+    mincorr : float, default: 0.1
+        Minimum correlation between pairs of time bins such that they will be included
+        in the optimization of the displacement estimates.
+    mincorr_percentile, mincorr_percentile_nneighbs
+        If mincorr_percentile is set to a number in [0, 100], then mincorr will be replaced
+        by this percentile of the correlations of neighbors within mincorr_percentile_nneighbs
+        time bins of each other.
+    soft : bool, default: True
+        If True the weights are the squared correlations above mincorr, otherwise 1.
+    histogram_depth_smooth_um : None | float, default: 1
+        Optional gaussian smoother on histogram on depth axis.
+    avg_in_bin : bool, default: False
+        If True, average the amplitudes in each bin.
+    thomas_kw, xcorr_kw : dict | None
+        Low-level arguments of thomas_solve() and xcorr_windows(), for instance
+        xcorr_kw=dict(conv_engine="numpy") to run without torch
+    device : string or torch.device
+        Controls torch device
+    """
+
+    def __init__(
+        self,
+        recording,
+        direction="y",
+        rigid=False,
+        win_shape="gaussian",
+        win_step_um=400,
+        win_scale_um=450,
+        win_margin_um=None,
+        bin_um=1.0,
+        bin_s=1.0,
+        hist_margin_um=0.0,
+        chunk_len_s=60.0,
+        max_disp_um=None,
+        mincorr=0.1,
+        mincorr_percentile=None,
+        mincorr_percentile_nneighbs=20,
+        soft=True,
+        histogram_depth_smooth_um=1,
+        avg_in_bin=False,
+        thomas_kw=None,
+        xcorr_kw=None,
+        device=None,
+    ):
+        self.recording = recording
+        self.direction = direction
+        self.bin_um = bin_um
+        self.bin_s = bin_s
+        self.avg_in_bin = avg_in_bin
+        self.histogram_depth_smooth_um = histogram_depth_smooth_um
+        self.win_scale_um = win_scale_um
+        self.mincorr = mincorr
+        self.mincorr_percentile = mincorr_percentile
+        self.thomas_kw = thomas_kw if thomas_kw is not None else {}
+
+        self.num_bins_per_chunk = max(int(round(chunk_len_s / bin_s)), 1)
+        self.t_start = recording.sample_index_to_time(0)
+
+        dim = ["x", "y", "z"].index(direction)
+        contact_depths = recording.get_channel_locations()[:, dim]
+        self.spatial_bin_edges = get_spatial_bin_edges(recording, direction, hist_margin_um, bin_um)
+        spatial_bin_centers = 0.5 * (self.spatial_bin_edges[1:] + self.spatial_bin_edges[:-1])
+        self.windows, self.window_centers = get_spatial_windows(
+            contact_depths,
+            spatial_bin_centers,
+            rigid=rigid,
+            win_shape=win_shape,
+            win_step_um=win_step_um,
+            win_scale_um=win_scale_um,
+            win_margin_um=win_margin_um,
+            zero_threshold=1e-5,
+        )
+
+        xcorr_kw = xcorr_kw if xcorr_kw is not None else {}
+        self.full_xcorr_kw = dict(
+            rigid=rigid,
+            bin_um=bin_um,
+            max_disp_um=max_disp_um,
+            progress_bar=False,
+            device=device,
+            **xcorr_kw,
+        )
+        self.threshold_kw = dict(
+            mincorr_percentile_nneighbs=mincorr_percentile_nneighbs,
+            in_place=True,
+            soft=soft,
+        )
+
+        # solved chunks
+        self.displacements = []
+        self.temporal_bins_s = []
+        # the previous chunk for the online problem
+        self.prev_raster = None
+        # the current chunk
+        self.chunk_index = 0
+        self.num_chunk_peaks = 0
+        self.accumulator = self._make_accumulator()
+
+    def _make_accumulator(self):
+        first_bin = self.chunk_index * self.num_bins_per_chunk
+        temporal_bin_edges = self.t_start + self.bin_s * np.arange(first_bin, first_bin + self.num_bins_per_chunk + 1)
+        return Motion2dHistogramAccumulator(
+            self.recording,
+            weight_with_amplitude=True,
+            avg_in_bin=self.avg_in_bin,
+            direction=self.direction,
+            spatial_bin_edges=self.spatial_bin_edges,
+            depth_smooth_um=self.histogram_depth_smooth_um,
+            temporal_bin_edges=temporal_bin_edges,
+        )
+
+    def add_peaks(self, peaks, peak_locations):
+        """
+        Add a batch of peaks. Every chunk ending before the last peak is solved.
+        Peaks must come in time order: peaks of an already solved chunk are ignored.
+        """
+        if peaks.size == 0:
+            return
+        times = self.recording.sample_index_to_time(peaks["sample_index"])
+        chunk_inds = np.floor((times - self.t_start) / (self.num_bins_per_chunk * self.bin_s)).astype("int64")
+        for chunk_index in np.unique(chunk_inds):
+            if chunk_index < self.chunk_index:
+                continue
+            while self.chunk_index < chunk_index:
+                self.solve_chunk()
+            mask = chunk_inds == chunk_index
+            self.accumulator.add(peaks[mask], peak_locations[mask])
+            self.num_chunk_peaks += np.sum(mask)
+
+    def solve_chunk(self):
+        """
+        Solve the displacement of the current chunk and move to the next one.
+        """
+        motion_histogram, temporal_bin_edges, _ = self.accumulator.get_histogram()
+        raster = motion_histogram.T
+
+        if self.prev_raster is None:
+            Ds, Cs, max_disp_um = xcorr_windows(
+                raster, self.windows, self.spatial_bin_edges, self.win_scale_um, **self.full_xcorr_kw
+            )
+            self.full_xcorr_kw["max_disp_um"] = max_disp_um
+            # empty time bins have undefined correlation
+            np.nan_to_num(Cs, copy=False)
+            Ss, _ = threshold_correlation_matrix(
+                Cs, mincorr=self.mincorr, mincorr_percentile=self.mincorr_percentile, **self.threshold_kw
+            )
+            displacement, _ = thomas_solve(Ds, Ss, **self.thomas_kw)
+        else:
+            # cross-correlations between prev/cur chunks
+            Ds10, Cs10, _ = xcorr_windows(
+                raster,
+                self.windows,
+                self.spatial_bin_edges,
+                self.win_scale_um,
+                raster_b=self.prev_raster,
+                **self.full_xcorr_kw,
+            )
+            # cross-correlation in current chunk
+            Ds1, Cs1, _ = xcorr_windows(
+                raster, self.windows, self.spatial_bin_edges, self.win_scale_um, **self.full_xcorr_kw
+            )
+            np.nan_to_num(Cs10, copy=False)
+            np.nan_to_num(Cs1, copy=False)
+            Ss1, mincorr1 = threshold_correlation_matrix(
+                Cs1, mincorr=self.mincorr, mincorr_percentile=self.mincorr_percentile, **self.threshold_kw
+            )
+            Ss10, _ = threshold_correlation_matrix(Cs10, mincorr=mincorr1, **self.threshold_kw)
+            displacement, _ = thomas_solve(
+                Ds1,
+                Ss1,
+                P_prev=self.displacements[-1],
+                Ds_curprev=Ds10,
+                Us_curprev=Ss10,
+                Ds_prevcur=-Ds10.transpose(0, 2, 1),
+                Us_prevcur=Ss10.transpose(0, 2, 1),
+                **self.thomas_kw,
+            )
+
+        self.displacements.append(displacement.astype("float32"))
+        self.temporal_bins_s.append(0.5 * (temporal_bin_edges[1:] + temporal_bin_edges[:-1]))
+        self.prev_raster = raster
+
+        self.chunk_index += 1
+        self.num_chunk_peaks = 0
+        self.accumulator = self._make_accumulator()
+
+    def flush(self):
+        """
+        Solve the current chunk if it has some peaks, for instance at the end of the recording.
+        """
+        if self.num_chunk_peaks > 0:
+            self.solve_chunk()
+
+    def get_motion(self):
+        """
+        Returns
+        -------
+        motion : Motion | None
+            The motion of all solved chunks, None if no chunk is solved yet.
+        """
+        if len(self.displacements) == 0:
+            return None
+        displacement = np.concatenate(self.displacements, axis=1).T
+        temporal_bins_s = np.concatenate(self.temporal_bins_s)
+        return Motion([displacement], [temporal_bins_s], self.window_centers, direction=self.direction)
+
+    def __call__(self, res):
+        # gather engine api
+        if res is None:
+            return
+        peaks, peak_locations = res
+        self.add_peaks(peaks, peak_locations)
+
+    def finalize_buffers(self, squeeze_output=False):
+        self.flush()
+        return self
+
+
 # -- functions from dredgelib (zone forbiden for sam)
 
 DEFAULT_LAMBDA_T = 1.0
@@ -965,16 +1219,30 @@ def xcorr_windows(
     normalized=True,
     masks=None,
     device=None,
+    conv_engine="torch",
 ):
     """Main computational function
 
     Compute pairwise (time x time) maximum cross-correlation and displacement
     matrices in each nonrigid window.
+    With conv_engine="numpy", torch is not needed and device is ignored.
     """
-    import torch
+    if conv_engine == "torch":
+        import torch
 
-    if device is None:
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        if device is None:
+            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+        def as_array(array):
+            return torch.as_tensor(array, dtype=torch.float, device=device)
+
+    elif conv_engine == "numpy":
+
+        def as_array(array):
+            return np.asarray(array, dtype=np.float32)
+
+    else:
+        raise ValueError(f"Unknown conv_engine {conv_engine}")
 
     if max_disp_um is None:
         if rigid:
@@ -989,18 +1257,18 @@ def xcorr_windows(
 
     assert D == D_
 
-    # torch versions on device
-    windows_ = torch.as_tensor(windows, dtype=torch.float, device=device)
-    raster_a_ = torch.as_tensor(raster_a, dtype=torch.float, device=device)
+    # float32 versions, on device for the torch engine
+    windows_ = as_array(windows)
+    raster_a_ = as_array(raster_a)
     if raster_b is not None:
         assert raster_b.shape[0] == D
         T1 = raster_b.shape[1]
-        raster_b_ = torch.as_tensor(raster_b, dtype=torch.float, device=device)
+        raster_b_ = as_array(raster_b)
     else:
         T1 = T0
         raster_b_ = raster_a_
     if masks is not None:
-        masks = torch.as_tensor(masks, dtype=torch.float, device=device)
+        masks = as_array(masks)
 
     # estimate each window's displacement
     Ds = np.zeros((B, T0, T1), dtype=np.float32)
@@ -1015,7 +1283,7 @@ def xcorr_windows(
         b_low = max(0, targ_low)
         targ_high = slices[b].stop + max_disp_bins
         b_high = min(D, targ_high)
-        padding = max(b_low - targ_low, targ_high - b_high)
+        padding = int(max(b_low - targ_low, targ_high - b_high))
 
         # arithmetic to compute the lags in um corresponding to
         # corr argmaxes
@@ -1035,6 +1303,7 @@ def xcorr_windows(
             centered=centered,
             normalized=normalized,
             max_dt_bins=max_dt_bins,
+            conv_engine=conv_engine,
         )
 
     return Ds, Cs, max_disp_um
@@ -1053,6 +1322,7 @@ def calc_corr_decent_pair(
     possible_displacement=None,
     max_dt_bins=None,
     device=None,
+    conv_engine="torch",
 ):
     """Weighted pairwise cross-correlation
 
@@ -1075,10 +1345,10 @@ def calc_corr_decent_pair(
     disp : int
         Maximum displacement
     device : torch device
+    conv_engine : "torch" | "numpy"
+        What library to use for computing cross-correlations, see normxcorr1d()
     Returns: D, C: TxT arrays
     """
-    import torch
-
     D, Ta = raster_a.shape
     D_, Tb = raster_b.shape
 
@@ -1094,15 +1364,21 @@ def calc_corr_decent_pair(
         assert possible_displacement is not None
         assert disp is not None
 
-    # pick torch device if unset
-    if device is None:
-        device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+    if conv_engine == "torch":
+        import torch
 
-    # process rasters into the tensors we need for conv2ds below
-    # convert to TxD device floats
-    raster_a = torch.as_tensor(raster_a.T, dtype=torch.float32, device=device)
-    # normalize over depth for normalized (uncentered) xcorrs
-    raster_b = torch.as_tensor(raster_b.T, dtype=torch.float32, device=device)
+        # pick torch device if unset
+        if device is None:
+            device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+
+        # process rasters into the tensors we need for conv2ds below
+        # convert to TxD device floats
+        raster_a = torch.as_tensor(raster_a.T, dtype=torch.float32, device=device)
+        # normalize over depth for normalized (uncentered) xcorrs
+        raster_b = torch.as_tensor(raster_b.T, dtype=torch.float32, device=device)
+    else:
+        raster_a = np.ascontiguousarray(raster_a.T, dtype=np.float32)
+        raster_b = np.ascontiguousarray(raster_b.T, dtype=np.float32)
 
     D = np.zeros((Ta, Tb), dtype=np.float32)
     C = np.zeros((Ta, Tb), dtype=np.float32)
@@ -1122,11 +1398,17 @@ def calc_corr_decent_pair(
                 padding=disp,
                 normalized=normalized,
                 centered=centered,
+                conv_engine=conv_engine,
             )
-            max_corr, best_disp_inds = torch.max(corr, dim=2)
-            best_disp = possible_displacement[best_disp_inds.cpu()]
+            if conv_engine == "torch":
+                max_corr, best_disp_inds = torch.max(corr, dim=2)
+                max_corr, best_disp_inds = max_corr.cpu(), best_disp_inds.cpu()
+            else:
+                best_disp_inds = np.argmax(corr, axis=2)
+                max_corr = np.take_along_axis(corr, best_disp_inds[..., None], axis=2)[..., 0]
+            best_disp = possible_displacement[best_disp_inds]
             D[i : i + batch_size, j : j + batch_size] = best_disp.T
-            C[i : i + batch_size, j : j + batch_size] = max_corr.cpu().T
+            C[i : i + batch_size, j : j + batch_size] = max_corr.T
 
     return D, C
 
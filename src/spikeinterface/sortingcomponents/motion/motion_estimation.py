@@ -7,7 +7,7 @@ import numpy as np
 from spikeinterface.sortingcomponents.tools import make_multi_method_doc
 
 
-from .motion_utils import Motion, get_spatial_windows, get_spatial_bin_edges
+from .motion_utils import Motion, get_spatial_windows, get_spatial_bin_edges, PeakPipelineStream
 from .decentralized import DecentralizedRegistration
 from .iterative_template import IterativeTemplateRegistration
 from .dredge import DredgeLfpRegistration, DredgeApRegistration
@@ -43,12 +43,14 @@ def estimate_motion(
     ----------
     recording : BaseRecording
         The recording extractor
-    peaks : numpy array
+    peaks : numpy array | PeakPipelineStream
         Peak vector (complex dtype).
         Needed for decentralized and iterative_template methods.
-    peak_locations : numpy array
+        A PeakPipelineStream (detection + localization nodes) can be given instead: the peaks are then
+        binned into the motion histogram chunk by chunk and never stored in memory.
+    peak_locations : numpy array | None
         Complex dtype with "x", "y", "z" fields
-        Needed for decentralized and iterative_template methods.
+        Needed for decentralized and iterative_template methods. None when peaks is a PeakPipelineStream.
     direction : "x" | "y" | "z", default: "y"
         Dimension on which the motion is estimated. "y" is depth along the probe.
 
@@ -99,7 +101,7 @@ def estimate_motion(
     method_class = estimate_motion_methods[method]
 
     if method_class.need_peak_location:
-        if peaks is None or peak_locations is None:
+        if peaks is None or (peak_locations is None and not isinstance(peaks, PeakPipelineStream)):
             raise ValueError(f"estimate_motion: the method {method} need peaks and peak_locations")
 
     if extra_outputs:
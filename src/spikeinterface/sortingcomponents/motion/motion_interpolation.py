@@ -1,11 +1,18 @@
 from __future__ import annotations
 
 import numpy as np
-from spikeinterface.core.core_tools import define_function_from_class
+from spikeinterface.core.core_tools import define_function_from_class, convert_string_to_bytes
 from spikeinterface.preprocessing import get_spatial_interpolation_kernel
 from spikeinterface.preprocessing.basepreprocessor import BasePreprocessor, BasePreprocessorSegment
 from spikeinterface.preprocessing.filter import fix_dtype
 
+try:
+    import numba
+
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
 
 def correct_motion_on_peaks(peaks, peak_locations, motion, recording) -> np.ndarray:
     """
@@ -57,6 +64,7 @@ def interpolate_motion_on_traces(
     spatial_interpolation_method="kriging",
     spatial_interpolation_kwargs={},
     dtype=None,
+    kernel_cache=None,
 ):
     """
     Apply inverse motion with spatial interpolation on traces.
@@ -88,6 +96,10 @@ def interpolate_motion_on_traces(
         specific option for the interpolation method
     dtype : np.dtype, default: None
         The dtype of the traces. If None, interhits from traces snippet
+    kernel_cache : DriftKernelCache or None, default: None
+        If not None, the drift kernels are stored in this cache by time bin and re-used by later calls.
+        The cache must always be used with the same channel locations, motion, segment, time bins and
+        interpolation parameters.
 
     Returns
     -------
@@ -116,8 +128,6 @@ def interpolate_motion_on_traces(
         channel_inds = np.asarray(channel_inds)
         traces_corrected = np.zeros((traces.shape[0], channel_inds.size), dtype=traces.dtype)
 
-    total_num_chans = channel_locations.shape[0]
-
     # -- determine the blocks of frames that will land in the same interpolation time bin
     time_bins = interpolation_time_bin_centers_s
     if time_bins is None:
@@ -135,76 +145,185 @@ def interpolate_motion_on_traces(
     bins_here = np.arange(bin_inds[0], bin_inds[-1] + 1)
 
     # inperpolation kernel will be the same per temporal bin
-    interp_times = np.empty(total_num_chans)
     current_start_index = 0
     for bin_ind in bins_here:
-        bin_time = time_bins[bin_ind]
-        interp_times.fill(bin_time)
-        channel_motions = motion.get_displacement_at_time_and_depth(
-            interp_times,
-            channel_locations[:, motion.dim],
-            segment_index=segment_index,
-        )
-        channel_locations_moved = channel_locations.copy()
-        channel_locations_moved[:, motion.dim] += channel_motions
-
-        if channel_inds is not None:
-            channel_locations_moved = channel_locations_moved[channel_inds]
-
-        drift_kernel = get_spatial_interpolation_kernel(
-            channel_locations,
-            channel_locations_moved,
-            dtype=dtype,
-            method=spatial_interpolation_method,
-            **spatial_interpolation_kwargs,
-        )
-
-        # keep this for DEBUG
-        # import matplotlib.pyplot as plt
-        # fig, ax = plt.subplots()
-        # ax.matshow(drift_kernel)
-        # ax.set_title(f"bin_ind {bin_ind} - {bin_time}s - {spatial_interpolation_method}")
-        # plt.show()
+        drift_kernel = None
+        if kernel_cache is not None:
+            drift_kernel = kernel_cache.get(bin_ind)
+        if drift_kernel is None:
+            drift_kernel = _get_drift_kernel(
+                time_bins[bin_ind],
+                channel_locations,
+                motion,
+                segment_index,
+                channel_inds,
+                spatial_interpolation_method,
+                spatial_interpolation_kwargs,
+                dtype,
+            )
+            drift_kernel = _make_applicable_kernel(drift_kernel)
+            if kernel_cache is not None:
+                kernel_cache.add(bin_ind, drift_kernel)
 
         # quickly find the end of this bin, which is also the start of the next
         next_start_index = current_start_index + np.searchsorted(
             bin_inds[current_start_index:], bin_ind + 1, side="left"
         )
         in_bin = slice(current_start_index, next_start_index)
-
-        # here we use a simple np.matmul even if dirft_kernel can be super sparse.
-        # because the speed for a sparse matmul is not so good when we disable multi threaad (due multi processing
-        # in ChunkRecordingExecutor)
-        np.matmul(traces[in_bin], drift_kernel, out=traces_corrected[in_bin])
+        _apply_drift_kernel(traces[in_bin], drift_kernel, traces_corrected[in_bin])
         current_start_index = next_start_index
 
     return traces_corrected
 
 
-# if HAVE_NUMBA:
-#     # @numba.jit(parallel=False)
-#     @numba.jit(parallel=True)
-#     def my_sparse_dot(data_in, data_out, sparse_chans, weights):
-#         """
-#         Experimental home made sparse dot.
-#         Faster when use prange but with multiprocessing it is not a good idea.
-#         Custum sparse dot
-#         data_in: num_sample, num_chan_in
-#         data_out: num_sample, num_chan_out
-#         sparse_chans: num_chan_out, num_sparse
-#         weights: num_chan_out, num_sparse
-#         """
-#         num_samples = data_in.shape[0]
-#         num_chan_out = data_out.shape[1]
-#         num_sparse = sparse_chans.shape[1]
-#         # for sample_index in range(num_samples):
-#         for sample_index in numba.prange(num_samples):
-#             for out_chan in range(num_chan_out):
-#                 v = 0
-#                 for i in range(num_sparse):
-#                     in_chan = sparse_chans[out_chan, i]
-#                     v +=  weights[out_chan, i] * data_in[sample_index, in_chan]
-#                 data_out[sample_index, out_chan] = v
+def _get_drift_kernel(
+    bin_time,
+    channel_locations,
+    motion,
+    segment_index,
+    channel_inds,
+    spatial_interpolation_method,
+    spatial_interpolation_kwargs,
+    dtype,
+):
+    """
+    Dense drift kernel (num_channels, num_channels_out) for one interpolation time bin.
+    """
+    total_num_chans = channel_locations.shape[0]
+    interp_times = np.full(total_num_chans, bin_time)
+    channel_motions = motion.get_displacement_at_time_and_depth(
+        interp_times,
+        channel_locations[:, motion.dim],
+        segment_index=segment_index,
+    )
+    channel_locations_moved = channel_locations.copy()
+    channel_locations_moved[:, motion.dim] += channel_motions
+
+    if channel_inds is not None:
+        channel_locations_moved = channel_locations_moved[channel_inds]
+
+    drift_kernel = get_spatial_interpolation_kernel(
+        channel_locations,
+        channel_locations_moved,
+        dtype=dtype,
+        method=spatial_interpolation_method,
+        **spatial_interpolation_kwargs,
+    )
+
+    # keep this for DEBUG
+    # import matplotlib.pyplot as plt
+    # fig, ax = plt.subplots()
+    # ax.matshow(drift_kernel)
+    # ax.set_title(f"{bin_time}s - {spatial_interpolation_method}")
+    # plt.show()
+
+    return drift_kernel
+
+
+# a kernel is applied with the sparse dot when the fraction of non zeros is below this
+_sparse_kernel_max_density = 0.1
+
+
+def _make_applicable_kernel(drift_kernel):
+    """
+    Convert a dense drift kernel to the form used by `_apply_drift_kernel()`:
+    the dense array itself, or a tuple (indptr, indices, weights) in CSR form over output channels
+    when the kernel is sparse enough ("idw", "nearest", or "kriging" with `sparse_thresh`).
+    """
+    num_nonzeros = np.count_nonzero(drift_kernel)
+    if not HAVE_NUMBA or num_nonzeros > _sparse_kernel_max_density * drift_kernel.size:
+        return drift_kernel
+
+    # csr over output channels = csc of the (in, out) kernel
+    kernel_t = drift_kernel.T
+    out_chans, in_chans = np.nonzero(kernel_t)
+    indptr = np.zeros(kernel_t.shape[0] + 1, dtype="int64")
+    np.cumsum(np.bincount(out_chans, minlength=kernel_t.shape[0]), out=indptr[1:])
+    indices = in_chans.astype("int64")
+    weights = kernel_t[out_chans, in_chans]
+    return (indptr, indices, weights)
+
+
+def _get_kernel_nbytes(drift_kernel):
+    if isinstance(drift_kernel, tuple):
+        return sum(array.nbytes for array in drift_kernel)
+    return drift_kernel.nbytes
+
+
+def _apply_drift_kernel(traces, drift_kernel, traces_corrected):
+    if isinstance(drift_kernel, tuple):
+        indptr, indices, weights = drift_kernel
+        _sparse_dot(traces, indptr, indices, weights, traces_corrected)
+    else:
+        # here we use a simple np.matmul for dense kernels: the speed for a sparse matmul is not so good
+        # when we disable multi threaad (due multi processing in ChunkRecordingExecutor)
+        np.matmul(traces, drift_kernel, out=traces_corrected)
+
+
+if HAVE_NUMBA:
+
+    @numba.jit(nopython=True, nogil=True, cache=True)
+    def _sparse_dot(data_in, indptr, indices, weights, data_out):
+        """
+        Custom sparse dot, single threaded because the traces are already processed in parallel by chunks.
+        data_in: num_sample, num_chan_in
+        data_out: num_sample, num_chan_out
+        indptr, indices, weights: csr kernel with one row per output channel
+        """
+        num_samples = data_in.shape[0]
+        num_chan_out = data_out.shape[1]
+        for sample_index in range(num_samples):
+            row = data_in[sample_index]
+            for out_chan in range(num_chan_out):
+                v = 0.0
+                for i in range(indptr[out_chan], indptr[out_chan + 1]):
+                    v += weights[i] * row[indices[i]]
+                data_out[sample_index, out_chan] = v
+
+
+class DriftKernelCache:
+    """
+    Least recently used cache for the drift kernels of `interpolate_motion_on_traces()`, keyed by
+    interpolation time bin index. When the kernels exceed `max_size`, the least recently used are removed.
+
+    Parameters
+    ----------
+    max_size : str | int, default: "100M"
+        The maximum size of the cache in bytes or as a string (e.g. "100M", "2G")
+    """
+
+    def __init__(self, max_size="100M"):
+        from collections import OrderedDict
+        from threading import Lock
+
+        self.max_size = convert_string_to_bytes(max_size) if isinstance(max_size, str) else int(max_size)
+        # bin index > kernel, the least recently used first
+        self._lru = OrderedDict()
+        self._current_size = 0
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._lru)
+
+    def get(self, bin_ind):
+        with self._lock:
+            drift_kernel = self._lru.get(bin_ind)
+            if drift_kernel is not None:
+                self._lru.move_to_end(bin_ind)
+            return drift_kernel
+
+    def add(self, bin_ind, drift_kernel):
+        size = _get_kernel_nbytes(drift_kernel)
+        if size > self.max_size:
+            return
+        with self._lock:
+            if bin_ind in self._lru:
+                return
+            self._lru[bin_ind] = drift_kernel
+            self._current_size += size
+            while self._current_size > self.max_size:
+                _, removed = self._lru.popitem(last=False)
+                self._current_size -= _get_kernel_nbytes(removed)
 
 
 def _get_closest_ind(array, values):
@@ -276,6 +395,13 @@ class InterpolateMotionRecording(BasePreprocessor):
         Interpolation needs to convert to a floating dtype. If dtype is supplied, that will be used.
         If the input recording is already floating and dtype=None, then its dtype is used by default.
         If the input recording is integer, then float32 is used by default.
+    kernel_cache_size : str | int | None, default: "100M"
+        Maximum size (in bytes or as a string, e.g. "100M") of the cache of drift kernels, split evenly between
+        the segments. Each kernel is computed once per time bin and re-used by all `get_traces()` calls, the least
+        recently used kernels are removed when the cache is full. Sparse kernels ("idw", "nearest" or "kriging"
+        with `sparse_thresh`) are stored and applied in sparse form. If None, kernels are not cached.
+        Note that with multiprocessing each worker has its own copy of the recording and then of the cache:
+        the memory used by the caches can reach n_jobs * kernel_cache_size.
     **spatial_interpolation_kwargs : dict
         Spatial interpolation kwargs for `interpolate_motion_on_traces`.
 
@@ -299,6 +425,7 @@ class InterpolateMotionRecording(BasePreprocessor):
         interpolation_time_bin_centers_s=None,
         interpolation_time_bin_size_s=None,
         dtype=None,
+        kernel_cache_size="100M",
         **spatial_interpolation_kwargs,
     ):
         # assert recording.get_num_segments() == 1, "correct_motion() is only available for single-segment recordings"
@@ -367,6 +494,16 @@ class InterpolateMotionRecording(BasePreprocessor):
             if interpolation_time_bin_size_s is None:
                 interpolation_time_bin_centers_s = motion.temporal_bins_s
 
+        # the cache size is for the whole recording
+        if kernel_cache_size is not None:
+            if isinstance(kernel_cache_size, str):
+                total_size = convert_string_to_bytes(kernel_cache_size)
+            else:
+                total_size = int(kernel_cache_size)
+            segment_kernel_cache_size = total_size // recording.get_num_segments()
+        else:
+            segment_kernel_cache_size = None
+
         for segment_index, parent_segment in enumerate(recording._recording_segments):
             # finish the per-segment part of the time bin logic
             if interpolation_time_bin_centers_s is None:
@@ -388,6 +525,7 @@ class InterpolateMotionRecording(BasePreprocessor):
                 segment_index,
                 segment_interpolation_time_bins_s,
                 dtype=dtype_,
+                kernel_cache_size=segment_kernel_cache_size,
             )
             self.add_recording_segment(rec_segment)
 
@@ -405,6 +543,7 @@ class InterpolateMotionRecording(BasePreprocessor):
             num_closest=num_closest,
             interpolation_time_bin_centers_s=interpolation_time_bin_centers_s,
             dtype=dtype_.str,
+            kernel_cache_size=kernel_cache_size,
         )
         self._kwargs.update(spatial_interpolation_kwargs)
 
@@ -421,6 +560,7 @@ class InterpolateMotionRecordingSegment(BasePreprocessorSegment):
         segment_index,
         interpolation_time_bin_centers_s,
         dtype="float32",
+        kernel_cache_size="100M",
     ):
         BasePreprocessorSegment.__init__(self, parent_recording_segment)
         self.channel_locations = channel_locations
@@ -431,6 +571,7 @@ class InterpolateMotionRecordingSegment(BasePreprocessorSegment):
         self.interpolation_time_bin_centers_s = interpolation_time_bin_centers_s
         self.dtype = dtype
         self.motion = motion
+        self.kernel_cache = DriftKernelCache(kernel_cache_size) if kernel_cache_size is not None else None
 
     def get_traces(self, start_frame, end_frame, channel_indices):
         if self.time_vector is not None:
@@ -454,6 +595,7 @@ class InterpolateMotionRecordingSegment(BasePreprocessorSegment):
             spatial_interpolation_method=self.spatial_interpolation_method,
             spatial_interpolation_kwargs=self.spatial_interpolation_kwargs,
             interpolation_time_bin_centers_s=self.interpolation_time_bin_centers_s,
+            kernel_cache=self.kernel_cache,
         )
 
         if channel_indices is not None:
@@ -399,6 +399,183 @@ def get_spatial_bin_edges(recording, direction, hist_margin_um, bin_um):
     return spatial_bins
 
 
+class PeakPipelineStream:
+    """
+    Lazy replacement of the `peaks` array for the motion histograms.
+
+    The node pipeline (a peak detector followed by a localization node, both with return_output=True)
+    is only run when a motion histogram is made, and its outputs are binned chunk by chunk.
+    Thus all peaks and peak locations are never stored in memory.
+    It can be given as `peaks` (with `peak_locations=None`) to `estimate_motion()`.
+
+    Parameters
+    ----------
+    nodes : list of PipelineNode
+        The nodes of the pipeline. The outputs must be (peaks, peak_locations).
+    job_kwargs : dict | None, default: None
+        The classical job_kwargs for run_node_pipeline()
+    job_name : str, default: "detect and localize"
+        The name of the pipeline used for the progress_bar
+    """
+
+    def __init__(self, nodes, job_kwargs=None, job_name="detect and localize"):
+        self.nodes = nodes
+        self.job_kwargs = job_kwargs if job_kwargs is not None else dict()
+        self.job_name = job_name
+
+    def accumulate(self, recording, accumulator):
+        from spikeinterface.core.node_pipeline import run_node_pipeline
+
+        return run_node_pipeline(
+            recording,
+            self.nodes,
+            self.job_kwargs,
+            job_name=self.job_name,
+            gather_mode=accumulator,
+            squeeze_output=False,
+        )
+
+
+def _get_bin_indices(values, bin_edges):
+    """
+    Bin indices with the same convention as np.histogramdd (the last bin includes its right edge).
+    Values outside the edges get -1.
+    """
+    inds = np.searchsorted(bin_edges, values, side="right") - 1
+    inds[values == bin_edges[-1]] = bin_edges.size - 2
+    inds[(inds < 0) | (inds >= bin_edges.size - 1)] = -1
+    return inds
+
+
+def _add_to_bins(histogram, bin_inds, weights=None):
+    """
+    Add counts (or weights) in place to the bins given by the tuple of index arrays `bin_inds`.
+    Only the range of the flat histogram touched by `bin_inds` is written, so the cost depends on the
+    span of the chunk and not on the size of the histogram.
+    """
+    flat_inds = np.ravel_multi_index(bin_inds, histogram.shape)
+    if flat_inds.size == 0:
+        return
+    lo, hi = np.min(flat_inds), np.max(flat_inds)
+    flat_histogram = histogram.reshape(-1)
+    flat_histogram[lo : hi + 1] += np.bincount(flat_inds - lo, weights=weights, minlength=hi - lo + 1)
+
+
+class Motion2dHistogramAccumulator:
+    """
+    Streaming version of `make_2d_motion_histogram()`.
+
+    Peaks are binned chunk by chunk with `add()` and only the histogram (and the bin counts when averaging)
+    is kept in memory. This object is also a gather engine for `run_node_pipeline()`
+    (`gather_mode=accumulator`) when the pipeline outputs are (peaks, peak_locations).
+
+    See `make_2d_motion_histogram()` for parameters.
+    `temporal_bin_edges` can be given to bin only a part of the recording (for instance in online estimation).
+    """
+
+    def __init__(
+        self,
+        recording,
+        weight_with_amplitude=False,
+        avg_in_bin=True,
+        direction="y",
+        bin_s=1.0,
+        bin_um=2.0,
+        hist_margin_um=50,
+        spatial_bin_edges=None,
+        depth_smooth_um=None,
+        time_smooth_s=None,
+        temporal_bin_edges=None,
+    ):
+        if temporal_bin_edges is None:
+            n_samples = recording.get_num_samples()
+            mint_s = recording.sample_index_to_time(0)
+            maxt_s = recording.sample_index_to_time(n_samples - 1)
+            temporal_bin_edges = np.arange(mint_s, maxt_s + bin_s, bin_s)
+        self.temporal_bin_edges = temporal_bin_edges
+        if spatial_bin_edges is None:
+            spatial_bin_edges = get_spatial_bin_edges(recording, direction, hist_margin_um, bin_um)
+        else:
+            bin_um = spatial_bin_edges[1] - spatial_bin_edges[0]
+        self.spatial_bin_edges = spatial_bin_edges
+
+        self.recording = recording
+        self.weight_with_amplitude = weight_with_amplitude
+        self.avg_in_bin = avg_in_bin
+        self.direction = direction
+        self.bin_s = bin_s
+        self.bin_um = bin_um
+        self.depth_smooth_um = depth_smooth_um
+        self.time_smooth_s = time_smooth_s
+
+        shape = (self.temporal_bin_edges.size - 1, self.spatial_bin_edges.size - 1)
+        self.histogram = np.zeros(shape, dtype="float64")
+        if weight_with_amplitude and avg_in_bin:
+            self.bin_counts = np.zeros(shape, dtype="float64")
+        else:
+            self.bin_counts = None
+
+    def add(self, peaks, peak_locations):
+        # only the bins touched by the chunk are updated
+        times = self.recording.sample_index_to_time(peaks["sample_index"])
+        temporal_inds = _get_bin_indices(times, self.temporal_bin_edges)
+        spatial_inds = _get_bin_indices(peak_locations[self.direction], self.spatial_bin_edges)
+        keep = (temporal_inds >= 0) & (spatial_inds >= 0)
+        bin_inds = (temporal_inds[keep], spatial_inds[keep])
+
+        if self.weight_with_amplitude:
+            weights = np.abs(peaks["amplitude"][keep]).astype("float64")
+        else:
+            weights = None
+
+        _add_to_bins(self.histogram, bin_inds, weights=weights)
+        if self.bin_counts is not None:
+            _add_to_bins(self.bin_counts, bin_inds)
+
+    def __call__(self, res):
+        # gather engine api
+        if res is None:
+            return
+        peaks, peak_locations = res
+        self.add(peaks, peak_locations)
+
+    def finalize_buffers(self, squeeze_output=False):
+        return self
+
+    def get_histogram(self):
+        """
+        Returns
+        -------
+        motion_histogram
+            2d np.array with motion histogram (num_temporal_bins, num_spatial_bins)
+        temporal_bin_edges
+            1d array with temporal bin edges
+        spatial_bin_edges
+            1d array with spatial bin edges
+        """
+        motion_histogram = self.histogram
+
+        # average amplitude in each bin
+        if self.bin_counts is not None:
+            bin_counts = self.bin_counts.copy()
+            bin_counts[bin_counts == 0] = 1
+            motion_histogram = motion_histogram / bin_counts
+
+        from scipy.ndimage import gaussian_filter1d
+
+        if self.depth_smooth_um is not None:
+            motion_histogram = gaussian_filter1d(
+                motion_histogram, self.depth_smooth_um / self.bin_um, axis=1, mode="constant"
+            )
+
+        if self.time_smooth_s is not None:
+            motion_histogram = gaussian_filter1d(
+                motion_histogram, self.time_smooth_s / self.bin_s, axis=0, mode="constant"
+            )
+
+        return motion_histogram, self.temporal_bin_edges, self.spatial_bin_edges
+
+
 def make_2d_motion_histogram(
     recording,
     peaks,
@@ -420,10 +597,10 @@ def make_2d_motion_histogram(
     ----------
     recording : BaseRecording
         The input recording
-    peaks : np.array
-        The peaks array
-    peak_locations : np.array
-        Array with peak locations
+    peaks : np.array | PeakPipelineStream
+        The peaks array or a PeakPipelineStream which is binned chunk by chunk
+    peak_locations : np.array | None
+        Array with peak locations. None when peaks is a PeakPipelineStream.
     weight_with_amplitude : bool, default: False
         If True, motion histogram is weighted by amplitudes
     avg_in_bin : bool, default True
@@ -456,41 +633,169 @@ def make_2d_motion_histogram(
     spatial_bin_edges
         1d array with spatial bin edges
     """
-    n_samples = recording.get_num_samples()
-    mint_s = recording.sample_index_to_time(0)
-    maxt_s = recording.sample_index_to_time(n_samples - 1)
-    temporal_bin_edges = np.arange(mint_s, maxt_s + bin_s, bin_s)
-    if spatial_bin_edges is None:
-        spatial_bin_edges = get_spatial_bin_edges(recording, direction, hist_margin_um, bin_um)
+    accumulator = Motion2dHistogramAccumulator(
+        recording,
+        weight_with_amplitude=weight_with_amplitude,
+        avg_in_bin=avg_in_bin,
+        direction=direction,
+        bin_s=bin_s,
+        bin_um=bin_um,
+        hist_margin_um=hist_margin_um,
+        spatial_bin_edges=spatial_bin_edges,
+        depth_smooth_um=depth_smooth_um,
+        time_smooth_s=time_smooth_s,
+    )
+    if isinstance(peaks, PeakPipelineStream):
+        peaks.accumulate(recording, accumulator)
     else:
-        bin_um = spatial_bin_edges[1] - spatial_bin_edges[0]
+        accumulator.add(peaks, peak_locations)
 
-    arr = np.zeros((peaks.size, 2), dtype="float64")
-    arr[:, 0] = recording.sample_index_to_time(peaks["sample_index"])
-    arr[:, 1] = peak_locations[direction]
+    return accumulator.get_histogram()
 
-    if weight_with_amplitude:
-        weights = np.abs(peaks["amplitude"])
-    else:
-        weights = None
 
-    motion_histogram, edges = np.histogramdd(arr, bins=(temporal_bin_edges, spatial_bin_edges), weights=weights)
+class Motion3dHistogramAccumulator:
+    """
+    Streaming version of `make_3d_motion_histograms()`.
 
-    # average amplitude in each bin
-    if weight_with_amplitude and avg_in_bin:
-        bin_counts, _ = np.histogramdd(arr, bins=(temporal_bin_edges, spatial_bin_edges))
-        bin_counts[bin_counts == 0] = 1
-        motion_histogram = motion_histogram / bin_counts
+    The amplitude axis is normalized with the log of the min and max absolute amplitudes.
+    When `amplitude_range` is given, this is exactly the same as `make_3d_motion_histograms()`.
+    Otherwise the range is only known at the end: the peaks are counted on a fine log10 amplitude grid
+    (of step `amp_log10_step`) which is merged into the `num_amp_bins` amplitude bins in `get_histogram()`.
+    These fine counts are sparse (only the non empty (time, space, amplitude) bins are kept, per temporal bin),
+    so the memory does not depend on the amplitude range.
+    Peaks very close to an amplitude bin border can then fall in the neighbor bin.
 
-    from scipy.ndimage import gaussian_filter1d
+    This object is also a gather engine for `run_node_pipeline()` (`gather_mode=accumulator`)
+    when the pipeline outputs are (peaks, peak_locations).
 
-    if depth_smooth_um is not None:
-        motion_histogram = gaussian_filter1d(motion_histogram, depth_smooth_um / bin_um, axis=1, mode="constant")
+    See `make_3d_motion_histograms()` for the other parameters.
 
-    if time_smooth_s is not None:
-        motion_histogram = gaussian_filter1d(motion_histogram, time_smooth_s / bin_s, axis=0, mode="constant")
+    Parameters
+    ----------
+    amplitude_range : tuple | None, default: None
+        The (min, max) absolute amplitudes used for the amplitude normalization.
+    amp_log10_step : float, default: 0.005
+        The step of the fine amplitude grid in log10 units. Used only when amplitude_range is None.
+    """
+
+    def __init__(
+        self,
+        recording,
+        direction="y",
+        bin_s=1.0,
+        bin_um=2.0,
+        hist_margin_um=50,
+        num_amp_bins=20,
+        log_transform=True,
+        spatial_bin_edges=None,
+        amplitude_range=None,
+        amp_log10_step=0.005,
+    ):
+        n_samples = recording.get_num_samples()
+        mint_s = recording.sample_index_to_time(0)
+        maxt_s = recording.sample_index_to_time(n_samples - 1)
+        self.temporal_bin_edges = np.arange(mint_s, maxt_s + bin_s, bin_s)
+        if spatial_bin_edges is None:
+            spatial_bin_edges = get_spatial_bin_edges(recording, direction, hist_margin_um, bin_um)
+        self.spatial_bin_edges = spatial_bin_edges
+
+        self.recording = recording
+        self.direction = direction
+        self.num_amp_bins = num_amp_bins
+        self.log_transform = log_transform
+        self.amplitude_range = amplitude_range
+        self.amp_log10_step = amp_log10_step
+
+        self.min_log_amp = np.inf
+        self.max_log_amp = -np.inf
+        shape = (self.temporal_bin_edges.size - 1, self.spatial_bin_edges.size - 1)
+        if amplitude_range is None:
+            # sparse fine counts: temporal bin index -> (keys, counts)
+            # with key = fine_amp_index * num_spatial_bins + spatial_index
+            self.fine_counts = {}
+            self.histograms = None
+        else:
+            self.histograms = np.zeros(shape + (num_amp_bins,), dtype="float64")
+
+    def add(self, peaks, peak_locations):
+        if peaks.size == 0:
+            return
+
+        log_amps = np.log10(np.abs(peaks["amplitude"]))
+        self.min_log_amp = min(self.min_log_amp, np.min(log_amps))
+        self.max_log_amp = max(self.max_log_amp, np.max(log_amps))
+
+        times = self.recording.sample_index_to_time(peaks["sample_index"])
+        temporal_inds = _get_bin_indices(times, self.temporal_bin_edges)
+        spatial_inds = _get_bin_indices(peak_locations[self.direction], self.spatial_bin_edges)
+
+        if self.amplitude_range is None:
+            keep = (temporal_inds >= 0) & (spatial_inds >= 0)
+            if not np.any(keep):
+                return
+            temporal_inds = temporal_inds[keep]
+            num_spatial_bins = self.spatial_bin_edges.size - 1
+            fine_inds = np.floor(log_amps[keep] / self.amp_log10_step).astype("int64")
+            keys = fine_inds * num_spatial_bins + spatial_inds[keep]
+
+            # only the temporal bins touched by the chunk are merged
+            order = np.lexsort((keys, temporal_inds))
+            temporal_inds, keys = temporal_inds[order], keys[order]
+            splits = np.flatnonzero(np.diff(temporal_inds)) + 1
+            for t_keys, t_ind in zip(np.split(keys, splits), temporal_inds[np.r_[0, splits]]):
+                new_keys, new_counts = np.unique(t_keys, return_counts=True)
+                if t_ind in self.fine_counts:
+                    prev_keys, prev_counts = self.fine_counts[t_ind]
+                    new_keys, inverse = np.unique(np.concatenate([prev_keys, new_keys]), return_inverse=True)
+                    new_counts = np.bincount(inverse, weights=np.concatenate([prev_counts, new_counts]))
+                self.fine_counts[t_ind] = (new_keys, new_counts.astype("int64"))
+        else:
+            # log amplitudes and scale between 0-1
+            min_peak_amp, max_peak_amp = self.amplitude_range
+            norm_amps = (log_amps - np.log10(min_peak_amp)) / (np.log10(max_peak_amp) - np.log10(min_peak_amp))
+            amplitude_inds = _get_bin_indices(norm_amps, np.linspace(0, 1, self.num_amp_bins + 1))
+            keep = (temporal_inds >= 0) & (spatial_inds >= 0) & (amplitude_inds >= 0)
+            _add_to_bins(self.histograms, (temporal_inds[keep], spatial_inds[keep], amplitude_inds[keep]))
+
+    def __call__(self, res):
+        # gather engine api
+        if res is None:
+            return
+        peaks, peak_locations = res
+        self.add(peaks, peak_locations)
+
+    def finalize_buffers(self, squeeze_output=False):
+        return self
+
+    def get_histogram(self):
+        """
+        Returns
+        -------
+        motion_histograms
+            3d np.array with motion histogram (num_temporal_bins, num_spatial_bins, num_amp_bins)
+        temporal_bin_edges
+            1d array with temporal bin edges
+        spatial_bin_edges
+            1d array with spatial bin edges
+        """
+        if self.amplitude_range is None:
+            # merge the fine amplitude counts into num_amp_bins using the final log amplitude range
+            num_spatial_bins = self.spatial_bin_edges.size - 1
+            shape = (self.temporal_bin_edges.size - 1, num_spatial_bins, self.num_amp_bins)
+            motion_histograms = np.zeros(shape, dtype="float64")
+            for t_ind, (keys, counts) in self.fine_counts.items():
+                fine_inds, spatial_inds = np.divmod(keys, num_spatial_bins)
+                fine_centers = (fine_inds + 0.5) * self.amp_log10_step
+                norm = (fine_centers - self.min_log_amp) / (self.max_log_amp - self.min_log_amp)
+                amp_inds = np.clip(np.floor(norm * self.num_amp_bins).astype("int64"), 0, self.num_amp_bins - 1)
+                np.add.at(motion_histograms[t_ind], (spatial_inds, amp_inds), counts)
+        else:
+            motion_histograms = self.histograms
 
-    return motion_histogram, temporal_bin_edges, spatial_bin_edges
+        if self.log_transform:
+            motion_histograms = np.log2(1 + motion_histograms)
+
+        return motion_histograms, self.temporal_bin_edges, self.spatial_bin_edges
 
 
 def make_3d_motion_histograms(
@@ -514,10 +819,11 @@ def make_3d_motion_histograms(
     ----------
     recording : BaseRecording
         The input recording
-    peaks : np.array
-        The peaks array
-    peak_locations : np.array
-        Array with peak locations
+    peaks : np.array | PeakPipelineStream
+        The peaks array or a PeakPipelineStream which is binned chunk by chunk.
+        In that case, the amplitude range is not known in advance, see Motion3dHistogramAccumulator.
+    peak_locations : np.array | None
+        Array with peak locations. None when peaks is a PeakPipelineStream.
     direction : "x" | "y" | "z", default: "y"
         The depth direction
     bin_s : float, default: 1.0
@@ -541,38 +847,26 @@ def make_3d_motion_histograms(
     spatial_bin_edges
         1d array with spatial bin edges
     """
-    n_samples = recording.get_num_samples()
-    mint_s = recording.sample_index_to_time(0)
-    maxt_s = recording.sample_index_to_time(n_samples - 1)
-    temporal_bin_edges = np.arange(mint_s, maxt_s + bin_s, bin_s)
-    if spatial_bin_edges is None:
-        spatial_bin_edges = get_spatial_bin_edges(recording, direction, hist_margin_um, bin_um)
-
-    # pre-compute abs amplitude and ranges for scaling
-    amplitude_bin_edges = np.linspace(0, 1, num_amp_bins + 1)
-    abs_peaks = np.abs(peaks["amplitude"])
-    max_peak_amp = np.max(abs_peaks)
-    min_peak_amp = np.min(abs_peaks)
-    # log amplitudes and scale between 0-1
-    abs_peaks_log_norm = (np.log10(abs_peaks) - np.log10(min_peak_amp)) / (
-        np.log10(max_peak_amp) - np.log10(min_peak_amp)
-    )
-
-    arr = np.zeros((peaks.size, 3), dtype="float64")
-    arr[:, 0] = recording.sample_index_to_time(peaks["sample_index"])
-    arr[:, 1] = peak_locations[direction]
-    arr[:, 2] = abs_peaks_log_norm
-
-    motion_histograms, edges = np.histogramdd(
-        arr,
-        bins=(
-            temporal_bin_edges,
-            spatial_bin_edges,
-            amplitude_bin_edges,
-        ),
+    if isinstance(peaks, PeakPipelineStream):
+        amplitude_range = None
+    else:
+        abs_peaks = np.abs(peaks["amplitude"])
+        amplitude_range = (np.min(abs_peaks), np.max(abs_peaks))
+
+    accumulator = Motion3dHistogramAccumulator(
+        recording,
+        direction=direction,
+        bin_s=bin_s,
+        bin_um=bin_um,
+        hist_margin_um=hist_margin_um,
+        num_amp_bins=num_amp_bins,
+        log_transform=log_transform,
+        spatial_bin_edges=spatial_bin_edges,
+        amplitude_range=amplitude_range,
     )
+    if isinstance(peaks, PeakPipelineStream):
+        peaks.accumulate(recording, accumulator)
+    else:
+        accumulator.add(peaks, peak_locations)
 
-    if log_transform:
-        motion_histograms = np.log2(1 + motion_histograms)
-
-    return motion_histograms, temporal_bin_edges, spatial_bin_edges
+    return accumulator.get_histogram()
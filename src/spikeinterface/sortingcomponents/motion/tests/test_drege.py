@@ -1,9 +1,69 @@
 import pytest
+import numpy as np
+
+from spikeinterface.core import generate_recording
+from spikeinterface.sortingcomponents.motion import OnlineMotionEstimator
 
 
 def test_dredge_online_lfp():
     pass
 
 
+def _check_online_motion_estimator(xcorr_kw=None):
+    recording = generate_recording(num_channels=32, durations=[240.0], sampling_frequency=1000.0, seed=2205)
+    depths = recording.get_channel_locations()[:, 1]
+    fs = recording.get_sampling_frequency()
+
+    # fake peaks of 40 units with a sinusoidal drift
+    rng = np.random.default_rng(seed=2205)
+    num_peaks = 100000
+    times = np.sort(rng.uniform(0, 240.0, num_peaks))
+    drift = 10.0 * np.sin(2 * np.pi * times / 120.0)
+    unit_depths = rng.uniform(depths.min(), depths.max(), 40)
+    unit_amplitudes = rng.uniform(30.0, 300.0, 40)
+    unit_inds = rng.integers(0, 40, num_peaks)
+    peaks = np.zeros(num_peaks, dtype=[("sample_index", "int64"), ("amplitude", "float64")])
+    peaks["sample_index"] = (times * fs).astype("int64")
+    peaks["amplitude"] = -unit_amplitudes[unit_inds]
+    peak_locations = np.zeros(num_peaks, dtype=[("x", "float64"), ("y", "float64")])
+    peak_locations["y"] = unit_depths[unit_inds] + drift + rng.normal(0, 2.0, num_peaks)
+
+    estimator = OnlineMotionEstimator(
+        recording, rigid=True, chunk_len_s=30.0, bin_s=2.0, max_disp_um=30.0, xcorr_kw=xcorr_kw
+    )
+    assert estimator.get_motion() is None
+
+    num_bins = []
+    for batch in np.array_split(np.arange(num_peaks), 17):
+        # the gather api
+        estimator((peaks[batch], peak_locations[batch]))
+        motion = estimator.get_motion()
+        if motion is not None:
+            num_bins.append(motion.temporal_bins_s[0].size)
+    estimator.finalize_buffers()
+
+    # the motion grows chunk by chunk
+    assert np.all(np.diff(num_bins) >= 0)
+    motion = estimator.get_motion()
+    temporal_bins_s = motion.temporal_bins_s[0]
+    assert temporal_bins_s.size == 120
+    assert motion.displacement[0].shape == (120, 1)
+
+    displacement = motion.displacement[0][:, 0]
+    true_displacement = 10.0 * np.sin(2 * np.pi * temporal_bins_s / 120.0)
+    error = (displacement - displacement.mean()) - (true_displacement - true_displacement.mean())
+    assert np.max(np.abs(error)) < 3.0
+
+
+def test_online_motion_estimator():
+    pytest.importorskip("torch")
+    _check_online_motion_estimator()
+
+
+def test_online_motion_estimator_numpy_xcorr():
+    # the numpy engine of the cross-correlations does not need torch
+    _check_online_motion_estimator(xcorr_kw=dict(conv_engine="numpy"))
+
+
 if __name__ == "__main__":
-    pass
+    test_online_motion_estimator()
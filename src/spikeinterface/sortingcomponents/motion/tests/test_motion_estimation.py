@@ -4,11 +4,11 @@ import numpy as np
 import pytest
 from spikeinterface.core.node_pipeline import ExtractDenseWaveforms
 from spikeinterface.sortingcomponents.motion import estimate_motion
-from spikeinterface.sortingcomponents.peak_detection import detect_peaks
+from spikeinterface.sortingcomponents.motion.motion_utils import PeakPipelineStream
+from spikeinterface.sortingcomponents.peak_detection import detect_peaks, DetectPeakLocallyExclusive
 from spikeinterface.sortingcomponents.peak_localization import LocalizeCenterOfMass
 from spikeinterface.sortingcomponents.tests.common import make_dataset
 
-
 DEBUG = False
 
 if DEBUG:
@@ -230,6 +230,67 @@ def test_estimate_motion(dataset):
         np.testing.assert_array_almost_equal(motion0.displacement, motion1.displacement)
 
 
+def test_estimate_motion_peak_pipeline_stream(dataset):
+    recording, recording_with_times, sorting, cache_folder = dataset
+
+    peaks = np.load(cache_folder / "dataset_peaks.npy")
+    peak_locations = np.load(cache_folder / "dataset_peak_locations.npy")
+
+    # same detection and localization as setup_dataset_and_peaks() but peaks are never gathered
+    node0 = DetectPeakLocallyExclusive(recording, peak_sign="neg", detect_threshold=5, exclude_sweep_ms=0.1)
+    node1 = ExtractDenseWaveforms(recording, parents=[node0], ms_before=0.1, ms_after=0.3, return_output=False)
+    node2 = LocalizeCenterOfMass(recording, parents=[node0, node1], radius_um=60.0)
+    peak_stream = PeakPipelineStream([node0, node1, node2], job_kwargs=dict(chunk_size=10000))
+
+    kwargs = dict(method="decentralized", rigid=False, win_step_um=50, win_scale_um=100, conv_engine="numpy")
+    motion, extra = estimate_motion(recording, peaks, peak_locations, extra_outputs=True, **kwargs)
+    motion2, extra2 = estimate_motion(recording, peak_stream, None, extra_outputs=True, **kwargs)
+    np.testing.assert_array_almost_equal(extra["motion_histogram"], extra2["motion_histogram"])
+    np.testing.assert_array_almost_equal(motion.displacement[0], motion2.displacement[0])
+
+
+def test_compute_pairwise_displacement_time_horizon():
+    from spikeinterface.sortingcomponents.motion.decentralized import (
+        compute_pairwise_displacement,
+        compute_global_displacement,
+    )
+
+    rng = np.random.default_rng(seed=2205)
+    num_bins, num_depths = 80, 40
+    drift = np.cumsum(rng.normal(0, 0.3, num_bins))
+    profile = rng.random(num_depths * 3)
+    motion_hist = np.stack(
+        [np.interp(np.arange(num_depths) + 40 + d, np.arange(num_depths * 3), profile) for d in drift]
+    )
+    motion_hist = motion_hist.astype("float32")
+    window = np.ones(num_depths, dtype="float32")
+
+    kwargs = dict(bin_um=1.0, window=window, conv_engine="numpy", batch_size=8, max_displacement_um=10, bin_s=1.0)
+    full_displacement, full_weight = compute_pairwise_displacement(motion_hist, **kwargs)
+    displacement, weight = compute_pairwise_displacement(motion_hist, time_horizon_s=10.0, **kwargs)
+
+    # banded: only pairs in the horizon are computed
+    assert displacement.shape == weight.shape == (num_bins, num_bins)
+    I, J = weight.nonzero()
+    assert np.all(np.abs(I - J) < 10)
+    in_horizon = np.abs(np.arange(num_bins)[:, None] - np.arange(num_bins)[None, :]) < 10
+    np.testing.assert_array_equal(weight.toarray(), full_weight * in_horizon)
+    np.testing.assert_array_equal(displacement.toarray()[in_horizon], full_displacement[in_horizon])
+
+    # the solvers directly use the sparse form
+    for convergence_method in ("lsmr", "gradient_descent", "lsqr_robust"):
+        motion = compute_global_displacement(displacement, weight, convergence_method=convergence_method)
+        motion_dense = compute_global_displacement(
+            full_displacement, full_weight * in_horizon, convergence_method=convergence_method
+        )
+        assert motion.shape == (num_bins,)
+        np.testing.assert_allclose(motion - motion.mean(), motion_dense - motion_dense.mean(), atol=0.05)
+
+    # one sparse matrix per window
+    motion = compute_global_displacement([displacement, displacement], [weight, weight], spatial_prior=True)
+    assert motion.shape == (num_bins, 2)
+
+
 if __name__ == "__main__":
     import tempfile
 
@@ -237,3 +298,5 @@ if __name__ == "__main__":
         cache_folder = Path(tmpdirname)
     args = setup_dataset_and_peaks(cache_folder)
     test_estimate_motion(args)
+    test_estimate_motion_peak_pipeline_stream(args)
+    test_compute_pairwise_displacement_time_horizon()
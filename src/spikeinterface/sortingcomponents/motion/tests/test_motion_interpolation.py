@@ -5,6 +5,7 @@ import pytest
 import spikeinterface.core as sc
 from spikeinterface import download_dataset
 from spikeinterface.sortingcomponents.motion.motion_interpolation import (
+    DriftKernelCache,
     InterpolateMotionRecording,
     correct_motion_on_peaks,
     interpolate_motion,
@@ -145,6 +146,52 @@ def test_InterpolateMotionRecording():
     # plt.show()
 
 
+def test_interpolate_motion_kernel_cache():
+    rec, sorting = make_dataset()
+    motion = make_fake_motion(rec)
+    channel_locations = rec.get_channel_locations()
+    traces = rec.get_traces(segment_index=0, start_frame=0, end_frame=30000)
+    times = rec.get_times()[0:30000]
+
+    for method in ("kriging", "idw", "nearest"):
+        kwargs = dict(spatial_interpolation_method=method, spatial_interpolation_kwargs={"force_extrapolate": True})
+        traces_corrected = interpolate_motion_on_traces(traces, times, channel_locations, motion, **kwargs)
+
+        kernel_cache = DriftKernelCache()
+        for _ in range(2):
+            traces_cached = interpolate_motion_on_traces(
+                traces, times, channel_locations, motion, kernel_cache=kernel_cache, **kwargs
+            )
+            assert len(kernel_cache) == 2
+            np.testing.assert_allclose(traces_cached, traces_corrected, rtol=1e-5, atol=1e-5)
+
+    # sparse kernels are stored in csr form
+    kernel_cache = DriftKernelCache()
+    interpolate_motion_on_traces(
+        traces, times, channel_locations, motion, spatial_interpolation_method="nearest", kernel_cache=kernel_cache
+    )
+    assert all(isinstance(kernel, tuple) for kernel in kernel_cache._lru.values())
+
+    # the least recently used kernels are removed
+    kernel_cache = DriftKernelCache(max_size=channel_locations.shape[0] ** 2 * 4)
+    interpolate_motion_on_traces(traces, times, channel_locations, motion, kernel_cache=kernel_cache)
+    assert len(kernel_cache) == 1
+
+    rec_cached = InterpolateMotionRecording(rec, motion, border_mode="force_zeros")
+    rec_not_cached = InterpolateMotionRecording(rec, motion, border_mode="force_zeros", kernel_cache_size=None)
+    for start_frame in (0, 10000, 5000):
+        traces_cached = rec_cached.get_traces(start_frame=start_frame, end_frame=start_frame + 20000)
+        traces_not_cached = rec_not_cached.get_traces(start_frame=start_frame, end_frame=start_frame + 20000)
+        np.testing.assert_allclose(traces_cached, traces_not_cached, rtol=1e-5, atol=1e-5)
+    assert len(rec_cached._recording_segments[0].kernel_cache) > 0
+
+    # the cache size is for the whole recording
+    rec_cached = InterpolateMotionRecording(rec, motion, border_mode="force_zeros", kernel_cache_size="10M")
+    num_segments = rec.get_num_segments()
+    for segment in rec_cached._recording_segments:
+        assert segment.kernel_cache.max_size == 10_000_000 // num_segments
+
+
 if __name__ == "__main__":
     # test_correct_motion_on_peaks()
     # test_interpolate_motion_on_traces()
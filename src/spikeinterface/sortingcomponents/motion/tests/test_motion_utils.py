@@ -1,10 +1,18 @@
 import pickle
 import shutil
+import tracemalloc
 from pathlib import Path
 
 import numpy as np
 import pytest
-from spikeinterface.sortingcomponents.motion.motion_utils import Motion
+from spikeinterface.sortingcomponents.motion.motion_utils import (
+    Motion,
+    Motion2dHistogramAccumulator,
+    Motion3dHistogramAccumulator,
+    make_2d_motion_histogram,
+    make_3d_motion_histograms,
+)
+from spikeinterface.core import generate_recording
 from spikeinterface.generation import make_one_displacement_vector
 
 if hasattr(pytest, "global_test_folder"):
@@ -82,5 +90,94 @@ def test_Motion():
     assert motion == motion2
 
 
+def test_motion_histogram_accumulators():
+    recording = generate_recording(num_channels=16, durations=[20.0], seed=2205)
+    rng = np.random.default_rng(seed=2205)
+    num_peaks = 20000
+    peaks = np.zeros(num_peaks, dtype=[("sample_index", "int64"), ("amplitude", "float64")])
+    peaks["sample_index"] = np.sort(rng.integers(0, recording.get_num_samples(), num_peaks))
+    peaks["amplitude"] = -(10 ** rng.uniform(1.5, 3.0, num_peaks))
+    peak_locations = np.zeros(num_peaks, dtype=[("x", "float64"), ("y", "float64")])
+    peak_locations["y"] = rng.uniform(0.0, 300.0, num_peaks)
+    chunks = np.array_split(np.arange(num_peaks), 7)
+
+    for kwargs in [dict(), dict(weight_with_amplitude=True, depth_smooth_um=5.0, time_smooth_s=2.0)]:
+        histogram, temporal_bin_edges, spatial_bin_edges = make_2d_motion_histogram(
+            recording, peaks, peak_locations, **kwargs
+        )
+        accumulator = Motion2dHistogramAccumulator(recording, **kwargs)
+        for chunk in chunks:
+            # the gather api
+            accumulator((peaks[chunk], peak_locations[chunk]))
+        histogram2, temporal_bin_edges2, spatial_bin_edges2 = accumulator.get_histogram()
+        np.testing.assert_array_almost_equal(histogram, histogram2)
+        np.testing.assert_array_equal(temporal_bin_edges, temporal_bin_edges2)
+        np.testing.assert_array_equal(spatial_bin_edges, spatial_bin_edges2)
+
+    histograms, _, _ = make_3d_motion_histograms(recording, peaks, peak_locations, log_transform=False)
+    # the amplitude range is known: exact
+    abs_amps = np.abs(peaks["amplitude"])
+    accumulator = Motion3dHistogramAccumulator(
+        recording, log_transform=False, amplitude_range=(np.min(abs_amps), np.max(abs_amps))
+    )
+    for chunk in chunks:
+        accumulator.add(peaks[chunk], peak_locations[chunk])
+    np.testing.assert_array_equal(histograms, accumulator.get_histogram()[0])
+
+    # the amplitude range is unknown: only a few peaks close to bin borders can move to the neighbor bin
+    accumulator = Motion3dHistogramAccumulator(recording, log_transform=False)
+    for chunk in chunks:
+        accumulator.add(peaks[chunk], peak_locations[chunk])
+    histograms2 = accumulator.get_histogram()[0]
+    assert histograms2.shape == histograms.shape
+    assert histograms2.sum() == num_peaks
+    np.testing.assert_array_equal(histograms.sum(axis=2), histograms2.sum(axis=2))
+    assert np.abs(histograms - histograms2).sum() / 2 < 0.05 * num_peaks
+
+    # no peak inside the bins
+    accumulator = Motion3dHistogramAccumulator(recording, log_transform=False)
+    accumulator.add(peaks[:3], np.full(3, 1e5, dtype=peak_locations.dtype))
+    assert len(accumulator.fine_counts) == 0
+
+
+def test_motion_histogram_accumulators_add_memory():
+    # the memory used by one add() depends on the chunk and not on the recording duration
+    rng = np.random.default_rng(seed=2205)
+    num_peaks = 5000
+    peaks = np.zeros(num_peaks, dtype=[("sample_index", "int64"), ("amplitude", "float64")])
+    peak_locations = np.zeros(num_peaks, dtype=[("x", "float64"), ("y", "float64")])
+    peak_locations["y"] = rng.uniform(0.0, 300.0, num_peaks)
+    peaks["amplitude"] = -(10 ** rng.uniform(1.5, 3.0, num_peaks))
+
+    # short recordings with fine temporal bins: the long histograms have 30 times more bins
+    # than the short ones while staying small (a few MB)
+    bin_s = 0.05
+    add_memory = {}
+    for duration in (10.0, 300.0):
+        recording = generate_recording(num_channels=4, durations=[duration], seed=2205)
+        # one second of peaks in the middle of the recording
+        start = int(recording.get_num_samples() // 2)
+        peaks["sample_index"] = np.sort(rng.integers(start, start + int(recording.sampling_frequency), num_peaks))
+        accumulators = [
+            Motion2dHistogramAccumulator(recording, weight_with_amplitude=True, bin_s=bin_s),
+            Motion3dHistogramAccumulator(recording, bin_s=bin_s, num_amp_bins=5),
+            Motion3dHistogramAccumulator(recording, bin_s=bin_s, num_amp_bins=5, amplitude_range=(10**1.5, 10**3.0)),
+        ]
+        if duration == 300.0:
+            # a temporary of the size of the full histogram in add() would be detected
+            assert accumulators[0].histogram.nbytes > 1_000_000
+        add_memory[duration] = []
+        for accumulator in accumulators:
+            tracemalloc.start()
+            accumulator.add(peaks, peak_locations)
+            add_memory[duration].append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    for short_memory, long_memory in zip(add_memory[10.0], add_memory[300.0]):
+        assert long_memory < 2 * short_memory + 100_000
+
+
 if __name__ == "__main__":
     test_Motion()
+    test_motion_histogram_accumulators()
+    test_motion_histogram_accumulators_add_memory()
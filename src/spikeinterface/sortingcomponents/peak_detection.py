@@ -671,6 +671,16 @@ class DetectPeakMatchedFiltering(PeakDetector):
 
         self.weights = self.weights.reshape(self.num_templates * self.num_z_factors, -1)
         self.weights = csr_matrix(self.weights)
+        # with peak_sign="both" the second half of the templates are the negative of the first half,
+        # so only the first half is convolved
+        self._half_weights = None
+        if peak_sign == "both":
+            z_offsets = np.arange(self.num_z_factors)[:, None] * self.num_templates
+            half_inds = (z_offsets + np.arange(self.num_channels)[None, :]).ravel()
+            self._half_weights = self.weights[half_inds]
+        # cache of the prototype spectrum by fft length
+        self._prototype_spectra = {}
+
         random_data = get_random_data_chunks(recording, return_scaled=False, **random_chunk_kwargs)
         conv_random_data = self.get_convolved_traces(random_data)
         medians = np.median(conv_random_data, axis=1)
@@ -690,7 +700,7 @@ class DetectPeakMatchedFiltering(PeakDetector):
 
         assert HAVE_NUMBA, "You need to install numba"
         conv_traces = self.get_convolved_traces(traces)
-        conv_traces /= self.abs_thresholds[:, None]
+        conv_traces /= self.abs_thresholds[:, None].astype(conv_traces.dtype)
         conv_traces = conv_traces[:, self.conv_margin : -self.conv_margin]
         traces_center = conv_traces[:, self.exclude_sweep_size : -self.exclude_sweep_size]
 
@@ -740,12 +750,36 @@ class DetectPeakMatchedFiltering(PeakDetector):
         return (local_peaks,)
 
     def get_convolved_traces(self, traces):
-        from scipy.signal import oaconvolve
-
-        tmp = oaconvolve(self.prototype[None, :], traces.T, axes=1, mode="valid")
-        scalar_products = self.weights.dot(tmp)
+        tmp = self._convolve_prototype(traces)
+        if self._half_weights is None:
+            scalar_products = self.weights.dot(tmp)
+        else:
+            half_products = self._half_weights.dot(tmp)
+            half_products = half_products.reshape(self.num_z_factors, -1, tmp.shape[1])
+            scalar_products = np.concatenate((half_products, -half_products), axis=1)
+            scalar_products = scalar_products.reshape(-1, tmp.shape[1])
         return scalar_products
 
+    def _convolve_prototype(self, traces):
+        """
+        Convolve each channel with the prototype ("valid" mode) in the Fourier domain, the spectrum
+        of the prototype being cached for each fft length (i.e. for each chunk size).
+        """
+        import scipy.fft
+
+        num_samples = traces.shape[0]
+        prototype_size = self.prototype.size
+        # a circular convolution of size >= num_samples is exact on the "valid" part
+        nfft = scipy.fft.next_fast_len(num_samples, real=True)
+        dtype = np.float64 if traces.dtype == np.float64 else np.float32
+        spectrum = self._prototype_spectra.get((nfft, dtype))
+        if spectrum is None:
+            spectrum = scipy.fft.rfft(self.prototype.astype(dtype), nfft)
+            self._prototype_spectra[(nfft, dtype)] = spectrum
+        traces_spectrum = scipy.fft.rfft(traces.T, nfft, axis=1)
+        traces_spectrum *= spectrum
+        return scipy.fft.irfft(traces_spectrum, nfft, axis=1)[:, prototype_size - 1 : num_samples]
+
 
 class DetectPeakLocallyExclusiveTorch(PeakDetectorWrapper):
     """Detect peaks using the "locally exclusive" method with pytorch."""
@@ -28,8 +28,8 @@ from ..postprocessing.unit_locations import (
 
 from ..postprocessing.localization_tools import (
     make_radial_order_parents,
-    solve_monopolar_triangulation,
-    enforce_decrease_shells_data,
+    solve_monopolar_triangulation_batch,
+    enforce_decrease_shells_data_batch,
     get_grid_convolution_templates_and_weights,
 )
 
@@ -296,28 +296,37 @@ class LocalizeMonopolarTriangulation(PipelineNode):
     def compute(self, traces, peaks, waveforms):
         peak_locations = np.zeros(peaks.size, dtype=self._dtype)
 
-        for i, peak in enumerate(peaks):
-            sample_index = peak["sample_index"]
-            chan_mask = self.neighbours_mask[peak["channel_index"], :]
-            chan_inds = np.flatnonzero(chan_mask)
-            local_contact_locations = self.contact_locations[chan_inds, :]
+        # features are gathered by main channel (same neighborhood) and all peaks are solved in one batch
+        max_num_channels = np.max(np.sum(self.neighbours_mask, axis=1))
+        all_wf_data = np.zeros((peaks.size, max_num_channels), dtype="float64")
+        all_local_contact_locations = np.zeros((peaks.size, max_num_channels, 2), dtype="float64")
+        channel_mask = np.zeros((peaks.size, max_num_channels), dtype=bool)
+        for main_chan in np.unique(peaks["channel_index"]):
+            (peak_inds,) = np.nonzero(peaks["channel_index"] == main_chan)
+            chan_inds = np.flatnonzero(self.neighbours_mask[main_chan, :])
+            num_chans = chan_inds.size
 
-            wf = waveforms[i, :][:, chan_inds]
+            wfs = waveforms[peak_inds][:, :, chan_inds]
             if self.feature == "ptp":
-                wf_data = np.ptp(wf, axis=0)
+                wf_data = np.ptp(wfs, axis=1)
             elif self.feature == "energy":
-                wf_data = np.linalg.norm(wf, axis=0)
+                wf_data = np.linalg.norm(wfs, axis=1)
             elif self.feature == "peak_voltage":
-                wf_data = np.abs(wf[self.nbefore])
+                wf_data = np.abs(wfs[:, self.nbefore])
+            wf_data = wf_data.astype("float64")
 
             if self.enforce_decrease_radial_parents is not None:
-                enforce_decrease_shells_data(
-                    wf_data, peak["channel_index"], self.enforce_decrease_radial_parents, in_place=True
-                )
+                enforce_decrease_shells_data_batch(wf_data, main_chan, self.enforce_decrease_radial_parents)
 
-            peak_locations[i] = solve_monopolar_triangulation(
-                wf_data, local_contact_locations, self.max_distance_um, self.optimizer
-            )
+            all_wf_data[peak_inds, :num_chans] = wf_data
+            all_local_contact_locations[peak_inds, :num_chans] = self.contact_locations[chan_inds, :]
+            channel_mask[peak_inds, :num_chans] = True
+
+        locations = solve_monopolar_triangulation_batch(
+            all_wf_data, all_local_contact_locations, channel_mask, self.max_distance_um, self.optimizer
+        )
+        for i, name in enumerate(self._dtype.names):
+            peak_locations[name] = locations[:, i]
 
         return peak_locations
 
@@ -10,5 +10,51 @@ def test_merge():
     pass
 
 
+def test_agglomerate_sparse_pairs():
+    pytest.importorskip("networkx")
+    import scipy.sparse
+    from spikeinterface.sortingcomponents.clustering.merge import agglomerate_pairs, resolve_final_shifts
+
+    labels_set = [2, 5, 7, 9, 11, 14]
+    n = len(labels_set)
+    pair_mask = np.zeros((n, n), dtype="bool")
+    pair_shift = np.zeros((n, n), dtype="int64")
+    pair_values = np.zeros((n, n), dtype="float64")
+    # 2-5-7 is a chain (not a clique) and 11-14 a simple pair
+    for ind0, ind1, shift in [(0, 1, 1), (1, 2, -2), (4, 5, 3)]:
+        pair_mask[ind0, ind1] = True
+        pair_shift[ind0, ind1] = shift
+        pair_values[ind0, ind1] = 0.5
+
+    dense_merges = agglomerate_pairs(labels_set, pair_mask, pair_values, connection_mode="partial")
+    sparse_merges = agglomerate_pairs(
+        labels_set, scipy.sparse.csr_matrix(pair_mask), scipy.sparse.csr_matrix(pair_values), connection_mode="partial"
+    )
+    dense_merges = sorted([list(merge) for merge in dense_merges])
+    sparse_merges = sorted([list(merge) for merge in sparse_merges])
+    assert sparse_merges == dense_merges == [[2, 5, 7], [11, 14]]
+
+    merges = [np.array(merge) for merge in sparse_merges]
+    dense_shifts = resolve_final_shifts(labels_set, merges, pair_mask, pair_shift)
+    sparse_shifts = resolve_final_shifts(
+        labels_set, merges, scipy.sparse.csr_matrix(pair_mask), scipy.sparse.csr_matrix(pair_shift)
+    )
+    for shifts0, shifts1 in zip(dense_shifts, sparse_shifts):
+        assert np.array_equal(shifts0, shifts1)
+
+
+def test_get_pair_batch_size():
+    from spikeinterface.sortingcomponents.clustering.merge import _get_pair_batch_size
+
+    # many pairs: capped by pair_batch_size
+    assert _get_pair_batch_size(100_000, 8, 100) == 100
+    # few pairs: every worker gets several batches
+    batch_size = _get_pair_batch_size(200, 8, 100)
+    assert batch_size < 100
+    assert int(np.ceil(200 / batch_size)) >= 8 * 4
+    assert _get_pair_batch_size(3, 8, 100) == 1
+    assert _get_pair_batch_size(0, 8, 100) == 1
+
+
 if __name__ == "__main__":
     test_merge()
@@ -363,6 +363,21 @@ def test_detect_peaks_locally_exclusive_matched_filtering(recording, job_kwargs)
         plt.show()
 
 
+def test_matched_filtering_convolved_traces(recording):
+    from scipy.signal import oaconvolve
+    from spikeinterface.sortingcomponents.peak_detection import DetectPeakMatchedFiltering
+
+    t = np.arange(-30, 30)
+    prototype = -np.exp(-(t**2) / 40.0) + 0.3 * np.exp(-(t**2) / 400.0)
+    traces = recording.get_traces(start_frame=0, end_frame=10000)
+    for peak_sign in ("neg", "both"):
+        node = DetectPeakMatchedFiltering(recording, prototype=prototype, ms_before=1.0, peak_sign=peak_sign)
+        expected = node.weights.dot(oaconvolve(node.prototype[None, :], traces.T, axes=1, mode="valid"))
+        conv_traces = node.get_convolved_traces(traces)
+        assert conv_traces.shape == expected.shape
+        assert np.allclose(conv_traces, expected, atol=1e-5 * np.max(np.abs(expected)))
+
+
 detection_classes = [
     DetectPeakByChannel,
     DetectPeakByChannelTorch,
@@ -1,13 +1,108 @@
+import os
+from multiprocessing.shared_memory import SharedMemory
+
 import pytest
 import numpy as np
 
+from spikeinterface.core import generate_recording
+from spikeinterface.sortingcomponents.clustering import split
 from spikeinterface.sortingcomponents.clustering.split import split_clusters
 
-# no proper test at the moment this is used in tridesclous2
+# this is used in tridesclous2, here only a toy case is tested
+
+
+def make_split_dataset():
+    recording = generate_recording(num_channels=4, durations=[1.0], seed=0)
+    num_channels = recording.get_num_channels()
+
+    # two well separated groups of peaks detected on the same channel
+    rng = np.random.default_rng(seed=2205)
+    num_peaks = 400
+    peaks = np.zeros(num_peaks, dtype=[("sample_index", "int64"), ("channel_index", "int64")])
+    peaks["sample_index"] = np.arange(num_peaks) * 50
+    sparse_tsvd = rng.normal(size=(num_peaks, 3, num_channels)).astype("float32")
+    sparse_tsvd[num_peaks // 2 :] += 20.0
+    features = dict(peaks=peaks, sparse_tsvd=sparse_tsvd)
+
+    sparse_mask = np.ones((num_channels, num_channels), dtype=bool)
+    method_kwargs = dict(
+        clusterer="hdbscan",
+        clusterer_kwargs={"min_cluster_size": 50, "allow_single_cluster": True},
+        feature_name="sparse_tsvd",
+        neighbours_mask=sparse_mask,
+        waveforms_sparse_mask=sparse_mask,
+        min_size_split=50,
+        n_pca_features=2,
+    )
+    return recording, peaks, features, method_kwargs
 
 
 def test_split():
-    pass
+    pytest.importorskip("hdbscan")
+    pytest.importorskip("sklearn")
+
+    recording, peaks, features, method_kwargs = make_split_dataset()
+    num_peaks = peaks.size
+
+    peak_labels, split_count, split_timings = split_clusters(
+        peaks["channel_index"],
+        recording,
+        features,
+        method="local_feature_clustering",
+        method_kwargs=method_kwargs,
+        recursive=True,
+        recursive_depth=3,
+        returns_split_count=True,
+        returns_split_timings=True,
+        n_jobs=1,
+    )
+
+    labels_0 = np.setdiff1d(peak_labels[: num_peaks // 2], [-1])
+    labels_1 = np.setdiff1d(peak_labels[num_peaks // 2 :], [-1])
+    assert labels_0.size == 1 and labels_1.size == 1
+    assert labels_0[0] != labels_1[0]
+    assert np.all(split_count == 1)
+
+    # the first split and one attempt for each of the two children
+    assert split_timings.size == 3
+    assert split_timings["is_split"][0]
+    assert split_timings["num_peaks"][0] == num_peaks
+    assert np.all(split_timings["recursion_level"] == 1)
+    assert np.all(split_timings["run_time"] > 0)
+
+
+def test_split_shared_features(monkeypatch):
+    pytest.importorskip("hdbscan")
+    pytest.importorskip("sklearn")
+
+    recording, peaks, features, method_kwargs = make_split_dataset()
+    kwargs = dict(method="local_feature_clustering", method_kwargs=method_kwargs, recursive=True, recursive_depth=3)
+
+    labels_one_job = split_clusters(peaks["channel_index"], recording, features, n_jobs=1, **kwargs)
+
+    # keep track of the shared memory created for the workers
+    shm_names = []
+    original_share_features = split.share_features
+
+    def share_features(features_dict):
+        shared_features, shms = original_share_features(features_dict)
+        shm_names.extend(shm.name for shm in shms)
+        return shared_features, shms
+
+    monkeypatch.setattr(split, "share_features", share_features)
+    # n_jobs is limited by the number of cpus
+    monkeypatch.setattr(os, "cpu_count", lambda: 2)
+
+    labels_two_jobs = split_clusters(
+        peaks["channel_index"], recording, features, n_jobs=2, mp_context="spawn", **kwargs
+    )
+    np.testing.assert_array_equal(labels_one_job, labels_two_jobs)
+
+    # the shared features are unlinked at the end
+    assert len(shm_names) == len(features)
+    for shm_name in shm_names:
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(shm_name)
 
 
 if __name__ == "__main__":
@@ -8,7 +8,6 @@ from spikeinterface.sortingcomponents.matching import find_spikes_from_templates
 
 from spikeinterface.sortingcomponents.tests.common import make_dataset
 
-
 # job_kwargs = dict(n_jobs=-1, chunk_duration="500ms", progress_bar=True)
 job_kwargs = dict(n_jobs=1, chunk_duration="500ms", progress_bar=True)
 
@@ -85,6 +84,92 @@ def test_find_spikes_from_templates(method, sorting_analyzer):
         # plt.show()
 
 
+def test_circus_omp_numba_kernel(sorting_analyzer, monkeypatch):
+    from spikeinterface.sortingcomponents.matching import circus
+
+    if not circus.HAVE_NUMBA:
+        pytest.skip("numba is not installed")
+
+    recording = sorting_analyzer.recording
+    templates = sorting_analyzer.get_extension("templates").get_data(outputs="Templates")
+    sparsity = compute_sparsity(sorting_analyzer, method="snr", threshold=0.5)
+    templates = templates.to_sparse(sparsity)
+
+    peeler = circus.CircusOMPSVDPeeler(recording, templates=templates)
+    traces = recording.get_traces(start_frame=0, end_frame=int(recording.sampling_frequency)).astype("float32")
+    spikes = peeler.compute_matching(traces, 0, traces.shape[0], 0)
+
+    # the pure numpy OMP loop must select the same spikes
+    monkeypatch.setattr(circus, "HAVE_NUMBA", False)
+    spikes_numpy = peeler.compute_matching(traces, 0, traces.shape[0], 0)
+    assert spikes.size > 0
+    assert np.array_equal(spikes["sample_index"], spikes_numpy["sample_index"])
+    assert np.array_equal(spikes["cluster_index"], spikes_numpy["cluster_index"])
+    assert np.allclose(spikes["amplitude"], spikes_numpy["amplitude"], atol=1e-5)
+
+
+def get_two_shanks_templates(sorting_analyzer):
+    from spikeinterface.core import ChannelSparsity
+
+    recording = sorting_analyzer.recording
+    templates = sorting_analyzer.get_extension("templates").get_data(outputs="Templates")
+    sparsity = compute_sparsity(sorting_analyzer, method="snr", threshold=0.5)
+
+    # mimic two shanks: every template only lives on the half of the probe of its main channel
+    depths = recording.get_channel_locations()[:, 1]
+    shanks = (depths > np.median(depths)).astype(int)
+    main_channels = np.argmax(np.ptp(templates.templates_array, axis=1), axis=1)
+    mask = sparsity.mask & (shanks[None, :] == shanks[main_channels][:, None])
+    templates = templates.to_sparse(ChannelSparsity(mask, templates.unit_ids, recording.channel_ids))
+    return templates, mask, shanks[main_channels]
+
+
+def test_circus_omp_regions(sorting_analyzer):
+    from spikeinterface.sortingcomponents.matching.circus import CircusOMPSVDPeeler
+
+    recording = sorting_analyzer.recording
+    templates, mask, template_shanks = get_two_shanks_templates(sorting_analyzer)
+
+    peeler = CircusOMPSVDPeeler(recording, templates=templates, split_regions=True)
+    assert len(peeler.region_peelers) == len(np.unique(template_shanks))
+    all_template_inds = np.concatenate([template_inds for template_inds, _, _ in peeler.region_peelers])
+    assert np.array_equal(np.sort(all_template_inds), np.arange(templates.num_units))
+
+    traces = recording.get_traces(start_frame=0, end_frame=int(recording.sampling_frequency)).astype("float32")
+    spikes = peeler.compute_matching(traces, 0, traces.shape[0], 0)
+    assert spikes.size > 0
+    assert np.all(np.diff(spikes["sample_index"]) >= 0)
+    for template_inds, channel_inds, _ in peeler.region_peelers:
+        # each region is matched on the channels of its own templates only
+        assert not np.any(mask[template_inds][:, np.setdiff1d(np.arange(recording.get_num_channels()), channel_inds)])
+
+
+@pytest.mark.parametrize("stop_criteria", ["max_failures", "omp_min_sps"])
+def test_circus_omp_regions_vs_global(sorting_analyzer, stop_criteria):
+    from spikeinterface.sortingcomponents.matching.circus import CircusOMPSVDPeeler
+
+    recording = sorting_analyzer.recording
+    templates, _, _ = get_two_shanks_templates(sorting_analyzer)
+    traces = recording.get_traces(start_frame=0, end_frame=int(recording.sampling_frequency)).astype("float32")
+
+    # regions are opt-in
+    global_peeler = CircusOMPSVDPeeler(recording, templates=templates, stop_criteria=stop_criteria)
+    assert len(global_peeler.region_peelers) == 0
+    global_spikes = global_peeler.compute_matching(traces, 0, traces.shape[0], 0)
+    assert global_spikes.size > 0
+
+    peeler = CircusOMPSVDPeeler(recording, templates=templates, stop_criteria=stop_criteria, split_regions=True)
+    assert len(peeler.region_peelers) > 1
+    spikes = peeler.compute_matching(traces, 0, traces.shape[0], 0)
+
+    # the stopping criteria are applied per region: a region keeps going when another one stops, so the
+    # region peeler finds (nearly) all the spikes of the global one and can find more
+    keys = set(zip(spikes["cluster_index"], spikes["sample_index"]))
+    global_keys = set(zip(global_spikes["cluster_index"], global_spikes["sample_index"]))
+    assert len(keys) >= len(global_keys)
+    assert len(keys & global_keys) >= 0.9 * len(global_keys)
+
+
 if __name__ == "__main__":
     sorting_analyzer = get_sorting_analyzer()
     # method = "naive"